@@ -4,14 +4,18 @@ from person_reference import PersonReference
 
 
 class AccountHandler:
-    def __init__(self, sfpu: SalesforcePersonUpdates):
+    # person_reference: a Person Reference API client to use instead of making one (like the benchmark's simulator)
+    def __init__(self, sfpu: SalesforcePersonUpdates, person_reference=None):
         self.sfpu = sfpu
+        self.person_reference = person_reference
 
     def accounts_data_load(self):
         logger.info(f"Starting account data load")
 
         # using the pds_key here because it's the same key
-        person_reference = PersonReference(apikey=self.sfpu.app_config.pds_apikey)
+        person_reference = self.person_reference
+        if person_reference is None:
+            person_reference = PersonReference(apikey=self.sfpu.app_config.pds_apikey)
 
         record_type_ids = self.sfpu.hsf.get_record_type_ids('Account')
 
@@ -65,7 +69,7 @@ class AccountHandler:
                 continue
 
             external_id = account_config['Id']['salesforce']
-            source_id = account_config['Id']['source']
+            source_id = account_config['Id'].get('source', account_config['Id'].get(source_type))
 
             # need a wrapper for the config to work with "legacy" methods that expect more full (and flat) configs
             account_config_wrapper = {
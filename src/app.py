@@ -1,8 +1,11 @@
 from common import isTaskRunning, setTaskRunning, logger, stack, AppConfig
 from salesforce_person_updates import SalesforcePersonUpdates
 from account_handler import AccountHandler
+from bulk_governor import bulk_job_governor
+from metrics import metrics
 
 import os
+import sys
 import json
 import time
 from datetime import datetime
@@ -56,9 +59,22 @@ else:
 pds_batch_size_override = os.getenv("PDS_BATCH_SIZE") or None
 batch_size_override = os.getenv("BATCH_SIZE") or None
 batch_thread_count_override = os.getenv("BATCH_THREAD_COUNT") or None
+# resume a full-person-load from its last checkpoint (either `RESUME=True` or `app.py --resume`)
+resume = "--resume" in sys.argv or os.getenv("RESUME") == "True"
 LOCAL = os.getenv("LOCAL") or False
 ####################################
 
+# the benchmark runs against the simulators (with its own SalesforcePersonUpdates for each scale), so it doesn't need the rest
+if action == "benchmark":
+    from benchmark import run_benchmark
+    run_benchmark()
+    sys.exit(0)
+elif action == "microbenchmark":
+    from microbenchmark import run_microbenchmark
+    results = run_microbenchmark()
+    # a regression fails the run (for CI)
+    sys.exit(1 if any(comparison['regression'] for comparison in results.get('comparison', [])) else 0)
+
 stop_reason = None
 try:
     sfpu = None
@@ -123,7 +139,7 @@ try:
         # disabling updates_ony for now
         updates_only = False
 
-        sfpu.full_people_data_load(updates_only=updates_only)
+        sfpu.full_people_data_load(updates_only=updates_only, resume=resume)
         sfpu.cleanup_updateds()
 
     elif action == 'person-updates':
@@ -167,7 +183,8 @@ try:
 
         # delete them
         ids = [{'Id': record['Id']} for record in result['records']]
-        sfpu.hsf.sf.bulk.hed__Affiliation__c.delete(ids)
+        with bulk_job_governor.job('hed__Affiliation__c'):
+            sfpu.hsf.sf.bulk.hed__Affiliation__c.delete(ids)
 
         if len(ids) > 0:
             logger.warning(f"Deleted {len(ids)} unaffiliated Affiliation records")
@@ -236,7 +253,8 @@ try:
                 # delete them all
                 ids = [{'Id': record['Id']} for record in result['records']]
                 logger.warning(f"attempting delete")
-                sfpu.hsf.sf.bulk.__getattr__(object_name).delete(ids)
+                with bulk_job_governor.job(object_name):
+                    sfpu.hsf.sf.bulk.__getattr__(object_name).delete(ids)
                 logger.warning(f"delete complete")
 
         logger.info(f"delete-all-data action finished")
@@ -248,7 +266,8 @@ try:
         # delete them all
         ids = [{'Id': record['Id']} for record in result['records']]
         logger.warning(f"attempting delete")
-        sfpu.hsf.sf.bulk.__getattr__('Account').delete(ids)
+        with bulk_job_governor.job('Account'):
+            sfpu.hsf.sf.bulk.__getattr__('Account').delete(ids)
         logger.warning(f"delete complete")
 
         logger.info(f"delete-account-data action finished")
@@ -275,7 +294,7 @@ try:
     elif action == "duplicate-check":
         logger.info(f"duplicate-check action called")
 
-        sfpu.check_for_duplicates()
+        sfpu.full_duplicate_check()
 
         logger.info(f"duplicate-check action finished")
     elif action == "test":
@@ -295,6 +314,10 @@ except Exception as e:
     raise e
 
 finally:
+    bulk_job_governor.log_summary()
+    metrics.log_summary()
+    metrics.close()
+
     if not stack == "developer":
 
         action = os.getenv("action", None)
@@ -305,6 +328,8 @@ finally:
             setTaskRunning(sfpu.app_config, False)
 
             logger.info(f"Salesforce instance: {salesforce_id}: Action: {action} completed. {stop_reason}")
+            # make sure the queued salesforce logs get out before the task is stopped
+            sfpu.close_logging()
             sfpu.app_config.stop_task_with_reason(f"Salesforce instance: {salesforce_id}: Action: {action} completed. {stop_reason}")
         else:
             app_config = AppConfig(id=salesforce_id, table_name=table_name)
@@ -0,0 +1,303 @@
+from common import logger, AppConfig, get_state_dir
+from salesforce import HarvardSalesforce
+from salesforce_person_updates import SalesforcePersonUpdates
+from account_handler import AccountHandler
+from salesforce_simulator import SalesforceSimulator, schema_from_config
+from pds_simulator import PersonGenerator, PDSSimulator, ReferenceSimulator
+from metrics import metrics
+
+import os
+import json
+import platform
+import resource
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+import psutil
+import pytz
+
+
+benchmark_scenarios = ["full_load", "updates", "cleanup", "accounts"]
+benchmark_scales = [10000, 100000, 1000000]
+
+
+class PeakMemory():
+    # samples the process's RSS in the background while in the with block, for the peak (in MB)
+    def __init__(self, interval: float=0.05):
+        self.interval = interval
+        self.peak_mb = 0.0
+        self._process = psutil.Process()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._sample()
+        self._thread = threading.Thread(target=self._run, name="benchmark-memory", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stop.set()
+        self._thread.join()
+        self._sample()
+        return False
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def _sample(self):
+        self.peak_mb = max(self.peak_mb, self._process.memory_info().rss / (1024 * 1024))
+
+
+class Benchmark():
+    """
+    Runs the person (and account) loads end to end against the Salesforce and PDS simulators at each scale
+      (the number of people in the PDS), with everything else the same as a real run (the env options still apply)
+
+    The scenarios run in order for each scale, on the same simulated Salesforce (like they would in a real org):
+      full_load: people_data_load with the configured pds_query (into an empty org)
+      updates: update_people_data_load for the people updated today (and the ones that no longer fit the conditions)
+      cleanup: cleanup_updateds
+      accounts: AccountHandler.accounts_data_load with `scale` departments
+
+    Each scenario's result has the records per second, the cpu time, the peak RSS while it ran, the calls made to each API
+      (and the time they would have taken with the simulators' latency models), and the count/percentiles of each metric
+      (the pipeline stages, transforms, bulk upserts, etc)
+    The simulated Salesforce is "lean" (see SalesforceSimulator) so its memory doesn't drown out the app's at 1M,
+      but the peak RSS still includes the simulators
+    """
+    def __init__(self, scales: list=None, scenarios: list=None, seed: int=0, output: str=None, baseline: str=None, threshold: float=0.2, salesforce_options: dict=None, pds_options: dict=None):
+        self.scales = scales or benchmark_scales
+        self.scenarios = scenarios or benchmark_scenarios
+        self.seed = seed
+        self.output = output
+        self.baseline = baseline
+        self.threshold = threshold
+        self.salesforce_options = salesforce_options or {}
+        self.pds_options = pds_options or {}
+
+        unknown = [scenario for scenario in self.scenarios if scenario not in benchmark_scenarios]
+        if len(unknown) > 0:
+            raise ValueError(f"Error: unknown benchmark scenarios {unknown} (the scenarios are {benchmark_scenarios})")
+
+    def run(self) -> dict:
+        results = {
+            "started": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": self.seed,
+            "scales": self.scales,
+            "scenarios": self.scenarios,
+            "results": []
+        }
+
+        metrics_enabled = metrics.enabled
+        metrics.enabled = True
+        try:
+            for scale in self.scales:
+                results['results'].extend(self.run_scale(scale))
+        finally:
+            metrics.close()
+            metrics.enabled = metrics_enabled
+
+        # the peak for the whole process (the scales' peaks are in their results)
+        results['max_rss_mb'] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+        if self.baseline:
+            with open(self.baseline) as f:
+                results['comparison'] = compare_results(json.load(f), results, threshold=self.threshold)
+
+        self.write(results)
+        self.log(results)
+        return results
+
+    def run_scale(self, scale: int) -> list:
+        # the simulated runs keep their state (the id index, fingerprints, describe cache) in a directory of their own,
+        #   so they don't use the real org's state (or overwrite it with what was pushed to the simulator)
+        with tempfile.TemporaryDirectory() as state_dir:
+            logger.info(f"Benchmark: setting up {scale} people")
+            (sfpu, salesforce, pds_clients, generator) = self.setup(scale, state_dir=state_dir)
+
+            # everyone the generator updated "today" is after the watermark (and it's the same day, so there's no cleanup in the updates)
+            watermark = generator.now.replace(hour=0, minute=0, second=0)
+
+            def full_load():
+                return sfpu.people_data_load()
+
+            def updates():
+                action = sfpu.action
+                # the updated ids are only kept for person-updates
+                sfpu.action = 'person-updates'
+                sfpu.updated_ids = []
+                try:
+                    sfpu.update_people_data_load(watermark=watermark)
+                finally:
+                    sfpu.action = action
+
+            def cleanup():
+                sfpu.cleanup_updateds()
+
+            def accounts():
+                if 'Account' not in sfpu.app_config.config:
+                    raise Exception(f"Error: there's no Account in the config")
+                AccountHandler(sfpu, person_reference=ReferenceSimulator(generator, department_count=scale)).accounts_data_load()
+                return scale
+
+            functions = {"full_load": full_load, "updates": updates, "cleanup": cleanup, "accounts": accounts}
+            results = []
+            for scenario in self.scenarios:
+                results.append(self.run_scenario(scenario, scale, functions[scenario], salesforce, pds_clients))
+            return results
+
+    def setup(self, scale: int, state_dir: str=None) -> tuple:
+        # the generator's "now" is the end of today, so the people updated in the last day were all updated today
+        today = datetime.now(pytz.timezone('US/Eastern')).replace(tzinfo=None)
+        generator = PersonGenerator(population=scale, seed=self.seed, now=today.replace(hour=23, minute=59, second=59, microsecond=0))
+
+        app_config = AppConfig(id=None, table_name=None, local=True)
+        salesforce_options = {"seed": self.seed, "real_time": False, "lean": True}
+        salesforce_options.update(self.salesforce_options)
+        salesforce = SalesforceSimulator(schema=schema_from_config(app_config.config), **salesforce_options)
+        hsf = HarvardSalesforce(domain="simulator", username="benchmark", password=None, sf=salesforce)
+
+        pds_options = {"real_time": False, "batch_size": int(os.getenv("PDS_BATCH_SIZE") or 500)}
+        pds_options.update(self.pds_options)
+        pds_clients = [PDSSimulator(generator=generator, **pds_options)]
+
+        # the state is set up with the STATE_DIR when the SalesforcePersonUpdates is made
+        #   (the metrics and the results still go to the real one)
+        real_state_dir = os.environ.get("STATE_DIR")
+        if state_dir is not None:
+            os.environ["STATE_DIR"] = state_dir
+        try:
+            sfpu = SalesforcePersonUpdates(local="True", hsf=hsf, pds_client=pds_clients[0])
+        finally:
+            if real_state_dir is None:
+                os.environ.pop("STATE_DIR", None)
+            else:
+                os.environ["STATE_DIR"] = real_state_dir
+
+        # the cleanup's lookup threads each get their own (simulated) PDS client
+        def new_pds_client(batch_size: int=None):
+            client = PDSSimulator(generator=generator, **dict(pds_options, batch_size=batch_size or pds_options['batch_size']))
+            pds_clients.append(client)
+            return client
+        sfpu.new_pds_client = new_pds_client
+
+        return (sfpu, salesforce, pds_clients, generator)
+
+    def run_scenario(self, scenario: str, scale: int, function, salesforce: SalesforceSimulator, pds_clients: list) -> dict:
+        logger.info(f"Benchmark: {scenario} with {scale} people")
+        metrics.reset()
+        salesforce_calls = Counter(salesforce.calls)
+        salesforce_seconds = salesforce.simulated_seconds
+        pds_calls = _pds_calls(pds_clients)
+        pds_seconds = sum(client.simulated_seconds for client in pds_clients)
+
+        result = {"scale": scale, "scenario": scenario}
+        started = time.perf_counter()
+        cpu_started = time.process_time()
+        with PeakMemory() as memory:
+            try:
+                records = function()
+            except Exception as e:
+                logger.error(f"Benchmark: {scenario} with {scale} people failed: {e}")
+                result['error'] = str(e)
+                records = None
+        seconds = time.perf_counter() - started
+
+        pds_calls = _pds_calls(pds_clients) - pds_calls
+        if records is None:
+            # the people the PDS gave us
+            records = pds_calls['results']
+
+        result.update({
+            "records": records,
+            "seconds": round(seconds, 3),
+            "records_per_sec": round(records / seconds, 1) if records and seconds > 0 else None,
+            "cpu_seconds": round(time.process_time() - cpu_started, 3),
+            "peak_rss_mb": round(memory.peak_mb, 1),
+            "api_calls": {
+                "salesforce": dict(Counter(salesforce.calls) - salesforce_calls),
+                "pds": dict(pds_calls)
+            },
+            "simulated_api_seconds": {
+                "salesforce": round(salesforce.simulated_seconds - salesforce_seconds, 3),
+                "pds": round(sum(client.simulated_seconds for client in pds_clients) - pds_seconds, 3)
+            },
+            "salesforce_records": {object_name: salesforce.count(object_name) for object_name in salesforce.records},
+            "stages": metrics.summary()
+        })
+        return result
+
+    def write(self, results: dict):
+        filename = self.output
+        if not filename:
+            filename = os.path.join(get_state_dir(), f"benchmark_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        results['output'] = filename
+        logger.info(f"Benchmark results written to {filename}")
+
+    def log(self, results: dict):
+        for result in results['results']:
+            if 'error' in result:
+                logger.warning(f"Benchmark {result['scenario']} ({result['scale']}): failed: {result['error']}")
+                continue
+            logger.info(f"Benchmark {result['scenario']} ({result['scale']}): {result['records']} records in {result['seconds']:.1f}s ({result['records_per_sec']} records/sec), cpu {result['cpu_seconds']:.1f}s, peak RSS {result['peak_rss_mb']} MB, api calls: {result['api_calls']}")
+        for comparison in results.get('comparison', []):
+            if comparison['regression']:
+                logger.warning(f"Benchmark regression: {comparison['scenario']} ({comparison['scale']}): {comparison['records_per_sec']} records/sec, was {comparison['baseline_records_per_sec']} ({comparison['change']:+.0%})")
+
+
+def compare_results(baseline: dict, results: dict, threshold: float=0.2) -> list:
+    """
+    Compares the records per second of each (scale, scenario) to a baseline (an earlier benchmark's results)
+    A scenario that's more than threshold (a fraction) slower than the baseline is a regression
+    """
+    baseline_rates = {(result['scale'], result['scenario']): result.get('records_per_sec') for result in baseline.get('results', [])}
+    comparisons = []
+    for result in results['results']:
+        baseline_rate = baseline_rates.get((result['scale'], result['scenario']))
+        rate = result.get('records_per_sec')
+        if not baseline_rate or not rate:
+            continue
+        change = rate / baseline_rate - 1
+        comparisons.append({
+            "scale": result['scale'],
+            "scenario": result['scenario'],
+            "records_per_sec": rate,
+            "baseline_records_per_sec": baseline_rate,
+            "change": round(change, 3),
+            "regression": change < -threshold
+        })
+    return comparisons
+
+
+def run_benchmark() -> dict:
+    # the benchmark action, set up from the env (see the README)
+    scales = [int(scale) for scale in (os.getenv("BENCHMARK_SCALES") or "").split(",") if scale.strip()]
+    scenarios = [scenario.strip() for scenario in (os.getenv("BENCHMARK_SCENARIOS") or "").split(",") if scenario.strip()]
+    benchmark = Benchmark(
+        scales=scales or None,
+        scenarios=scenarios or None,
+        seed=int(os.getenv("BENCHMARK_SEED") or 0),
+        output=os.getenv("BENCHMARK_OUTPUT") or None,
+        baseline=os.getenv("BENCHMARK_BASELINE") or None,
+        threshold=float(os.getenv("BENCHMARK_REGRESSION_THRESHOLD") or 0.2)
+    )
+    return benchmark.run()
+
+
+def _pds_calls(pds_clients: list) -> Counter:
+    calls = Counter()
+    for client in list(pds_clients):
+        calls.update(client.calls)
+    return calls
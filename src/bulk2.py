@@ -0,0 +1,256 @@
+from common import logger
+from bulk_governor import bulk_job_governor
+
+import csv
+import io
+import json
+import time
+from collections import deque
+from datetime import datetime, date
+
+
+# Bulk API 2.0 sets a field to null with this (an empty value leaves the field alone)
+NULL_VALUE = "#N/A"
+
+
+def flatten_record(record: dict, prefix: str="") -> dict:
+    """
+    Flattens a record into CSV columns
+    References (like {"Contact__r": {"personKey__c": "1"}}) become Contact__r.personKey__c
+    """
+    flat = {}
+    for key, value in record.items():
+        if isinstance(value, dict):
+            flat.update(flatten_record(value, prefix=f"{prefix}{key}."))
+        else:
+            flat[f"{prefix}{key}"] = csv_value(value)
+    return flat
+
+
+def csv_value(value) -> str:
+    if value is None:
+        return NULL_VALUE
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (list, tuple)):
+        # multi-select picklists
+        return ";".join(str(v) for v in value)
+    return str(value)
+
+
+def parse_error(error: str) -> dict:
+    """
+    Bulk API 2.0 errors (sf__Error) look like STATUS_CODE:message:fields (fields is -- if there aren't any)
+    This turns them into the classic Bulk API's error format
+    """
+    (status_code, _, rest) = error.partition(":")
+    message = rest
+    fields = []
+    if ":" in rest:
+        (message, _, field_string) = rest.rpartition(":")
+        if field_string != "--":
+            fields = [field for field in field_string.split(",") if field]
+    return {
+        "statusCode": status_code,
+        "message": message,
+        "fields": fields
+    }
+
+
+class Bulk2Ingest():
+    """
+    Upserts with Bulk API 2.0 ingest jobs (CSV) instead of the classic Bulk API (JSON)
+
+    upsert() returns the results in the same format as simple_salesforce's classic bulk upsert
+      (one {"success", "created", "id", "errors"} per record, in the same order as the data),
+      so pushBulk handles them the same way
+    The data is split into jobs by size (a job's CSV can't be more than 150 MB) and record count
+    Each job holds a bulk job governor slot while it's running
+    """
+    def __init__(self, sf, max_bytes: int=100 * 1024 * 1024, max_records: int=150000, poll_interval: float=2, max_poll_interval: float=10, timeout: float=60 * 60):
+        self.sf = sf
+        # the 150 MB limit is on the base64 encoded upload, so leave room for that
+        self.max_bytes = max_bytes
+        self.max_records = max_records
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+
+    def upsert(self, object_name: str, data: list, external_id_field: str) -> list:
+        responses = []
+        for (chunk_start, chunk) in self.chunks(data):
+            with bulk_job_governor.job(object_name):
+                responses.extend(self.run_job(object_name, chunk, external_id_field))
+            logger.debug(f"Bulk API 2.0 upsert to {object_name}: records {chunk_start}-{chunk_start + len(chunk)} done")
+        return responses
+
+    def chunks(self, data: list):
+        """
+        Yields (start index, records) for each chunk of data that fits in a job
+        """
+        chunk = []
+        chunk_start = 0
+        chunk_bytes = 0
+        for index, record in enumerate(data):
+            # a rough (but safe) size, the header is only sent once
+            record_bytes = len(json.dumps(record, default=str).encode("utf-8"))
+            if len(chunk) > 0 and (chunk_bytes + record_bytes > self.max_bytes or len(chunk) >= self.max_records):
+                yield (chunk_start, chunk)
+                chunk = []
+                chunk_start = index
+                chunk_bytes = 0
+            chunk.append(record)
+            chunk_bytes += record_bytes
+        if len(chunk) > 0:
+            yield (chunk_start, chunk)
+
+    def to_csv(self, records: list) -> tuple:
+        """
+        Returns (columns, csv string) for the records
+        A column a record doesn't have is left empty (so that field isn't touched for that record)
+        """
+        flat_records = [flatten_record(record) for record in records]
+        columns = []
+        seen = set()
+        for flat_record in flat_records:
+            for column in flat_record.keys():
+                if column not in seen:
+                    seen.add(column)
+                    columns.append(column)
+
+        output = io.StringIO()
+        writer = csv.DictWriter(output, fieldnames=columns, lineterminator="\n", restval="")
+        writer.writeheader()
+        writer.writerows(flat_records)
+        return (columns, output.getvalue())
+
+    def run_job(self, object_name: str, records: list, external_id_field: str) -> list:
+        job_id = self.submit_job(object_name, records, external_id_field)
+
+        status = self.wait_for_job(job_id)
+        self.check_status(status, object_name)
+
+        return self.get_results(job_id, records, external_id_field)
+
+    def submit_job(self, object_name: str, records: list, external_id_field: str) -> str:
+        """
+        Creates the job, uploads the records and closes it (so Salesforce starts on it)
+        Returns the job id without waiting for the job
+        """
+        (columns, csv_data) = self.to_csv(records)
+
+        job = self.sf.restful("jobs/ingest", method="POST", data=json.dumps({
+            "object": object_name,
+            "externalIdFieldName": external_id_field,
+            "contentType": "CSV",
+            "operation": "upsert",
+            "lineEnding": "LF"
+        }))
+        job_id = job['id']
+        logger.debug(f"Bulk API 2.0 job {job_id} for {object_name} with {len(records)} records")
+
+        try:
+            self._request("PUT", f"jobs/ingest/{job_id}/batches", data=csv_data.encode("utf-8"), content_type="text/csv")
+        except Exception as e:
+            self.sf.restful(f"jobs/ingest/{job_id}", method="PATCH", data=json.dumps({"state": "Aborted"}))
+            raise e
+        # the CSV can be let go of while the job runs
+        del csv_data
+        self.sf.restful(f"jobs/ingest/{job_id}", method="PATCH", data=json.dumps({"state": "UploadComplete"}))
+        return job_id
+
+    def get_status(self, job_id: str) -> dict:
+        return self.sf.restful(f"jobs/ingest/{job_id}")
+
+    def is_finished(self, status: dict) -> bool:
+        return status['state'] in ['JobComplete', 'Failed', 'Aborted']
+
+    def check_status(self, status: dict, object_name: str):
+        # a job that failed before it processed anything has no results to go through
+        if status['state'] == 'Failed' and int(status.get('numberRecordsProcessed') or 0) == 0:
+            raise Exception(f"Error: Bulk API 2.0 job {status.get('id')} for {object_name} failed: {status.get('errorMessage')}")
+
+    def wait_for_job(self, job_id: str) -> dict:
+        start = time.monotonic()
+        poll_interval = self.poll_interval
+        while True:
+            status = self.get_status(job_id)
+            if self.is_finished(status):
+                return status
+            if time.monotonic() - start > self.timeout:
+                raise TimeoutError(f"Bulk API 2.0 job {job_id} did not finish in {self.timeout} seconds (state: {status['state']})")
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, self.max_poll_interval)
+
+    def get_results(self, job_id: str, records: list, external_id_field: str) -> list:
+        """
+        The result CSVs aren't in the same order as the upload, so they're matched back to the records by the external id
+        (records with the same external id are matched in order)
+        """
+        indexes = {}
+        for index, record in enumerate(records):
+            indexes.setdefault(str(record.get(external_id_field)), deque()).append(index)
+
+        responses = [None] * len(records)
+
+        def match(row: dict) -> int:
+            matching = indexes.get(row.get(external_id_field, ""))
+            if not matching:
+                logger.warning(f"Warning: Bulk API 2.0 job {job_id} result didn't match a record: {row}")
+                return None
+            return matching.popleft()
+
+        for row in self._stream_csv(f"jobs/ingest/{job_id}/successfulResults"):
+            index = match(row)
+            if index is not None:
+                responses[index] = {
+                    "success": True,
+                    "created": row.get('sf__Created') == "true",
+                    "id": row.get('sf__Id'),
+                    "errors": []
+                }
+
+        for row in self._stream_csv(f"jobs/ingest/{job_id}/failedResults"):
+            index = match(row)
+            if index is not None:
+                responses[index] = {
+                    "success": False,
+                    "created": False,
+                    "id": row.get('sf__Id') or None,
+                    "errors": [parse_error(row.get('sf__Error') or "UNKNOWN_EXCEPTION:no error returned:--")]
+                }
+
+        # anything else wasn't processed (the job failed or was aborted part of the way through)
+        for index, response in enumerate(responses):
+            if response is None:
+                responses[index] = {
+                    "success": False,
+                    "created": False,
+                    "id": None,
+                    "errors": [{"statusCode": "UNPROCESSED_RECORD", "message": f"record was not processed by job {job_id}", "fields": []}]
+                }
+        return responses
+
+    def _stream_csv(self, path: str):
+        # the results are read a line at a time, they're never all in memory as text
+        response = self._request("GET", path, stream=True, content_type="text/csv")
+        if response.encoding is None:
+            response.encoding = "utf-8"
+        try:
+            lines = response.iter_lines(decode_unicode=True)
+            # iter_lines drops the line endings, the csv reader needs them for values with line breaks in them
+            for row in csv.DictReader(line + "\n" for line in lines if line is not None):
+                yield row
+        finally:
+            response.close()
+
+    def _request(self, method: str, path: str, content_type: str, **kwargs):
+        headers = dict(self.sf.headers)
+        headers['Content-Type'] = content_type
+        headers['Accept'] = "text/csv" if method == "GET" else "application/json"
+        response = self.sf.session.request(method, self.sf.base_url + path, headers=headers, **kwargs)
+        if response.status_code >= 300:
+            raise Exception(f"Error: Bulk API 2.0 {method} {path} failed ({response.status_code}): {response.text}")
+        return response
@@ -0,0 +1,109 @@
+from common import logger
+from metrics import metrics as run_metrics
+
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+
+class BulkJobGovernor():
+    """
+    Limits how many Salesforce Bulk API jobs this process runs at once
+
+    Salesforce will only work on a handful of bulk jobs at a time (5, as far as I've seen) and the rest sit in its queue,
+      where they contend for locks on the same Contacts. Every bulk call goes through job() so we keep at most
+      max_jobs running and the rest wait here instead.
+
+    Waiting jobs are queued per object and the objects take turns (round robin),
+      so a run of Contact jobs can't starve the branch objects (or the other way around).
+
+    Wait time (queued here) and run time (in Salesforce) are tracked per object, see summary()
+    """
+    def __init__(self, max_jobs: int=5):
+        if max_jobs < 1:
+            raise ValueError(f"Error: max_jobs must be at least 1 ({max_jobs})")
+        self.max_jobs = max_jobs
+        self.running_count = 0
+
+        self._condition = threading.Condition()
+        # object name -> queue of waiting tickets, in the order the objects get their next turn
+        self._waiting = OrderedDict()
+        self._metrics = {}
+
+    @contextmanager
+    def job(self, object_name: str):
+        wait_time = self.acquire(object_name)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            run_time = time.monotonic() - started
+            self.release(object_name, wait_time=wait_time, run_time=run_time)
+
+    def acquire(self, object_name: str) -> float:
+        """
+        Waits for a free job slot (and this object's turn), returns the number of seconds it waited
+        """
+        queued = time.monotonic()
+        ticket = object()
+        with self._condition:
+            if object_name not in self._waiting:
+                self._waiting[object_name] = deque()
+            self._waiting[object_name].append(ticket)
+
+            while not (self.running_count < self.max_jobs and self._is_next(object_name, ticket)):
+                self._condition.wait()
+
+            self._waiting[object_name].popleft()
+            if len(self._waiting[object_name]) == 0:
+                del self._waiting[object_name]
+            else:
+                # this object had its turn, let the other objects go first
+                self._waiting.move_to_end(object_name)
+
+            self.running_count += 1
+            # other objects might be able to go now too
+            self._condition.notify_all()
+
+        return time.monotonic() - queued
+
+    def release(self, object_name: str, wait_time: float=0, run_time: float=0):
+        with self._condition:
+            self.running_count -= 1
+
+            if object_name not in self._metrics:
+                self._metrics[object_name] = {
+                    "jobs": 0,
+                    "wait_seconds": 0.0,
+                    "run_seconds": 0.0,
+                    "max_wait_seconds": 0.0
+                }
+            metrics = self._metrics[object_name]
+            metrics['jobs'] += 1
+            metrics['wait_seconds'] += wait_time
+            metrics['run_seconds'] += run_time
+            metrics['max_wait_seconds'] = max(metrics['max_wait_seconds'], wait_time)
+
+            self._condition.notify_all()
+
+        run_metrics.observe("bulk_job_wait", wait_time, object=object_name)
+        run_metrics.observe("bulk_job_run", run_time, object=object_name)
+
+    def summary(self) -> dict:
+        with self._condition:
+            return {object_name: dict(metrics) for object_name, metrics in self._metrics.items()}
+
+    def log_summary(self):
+        for object_name, metrics in self.summary().items():
+            logger.info(f"Bulk jobs for {object_name}: {metrics['jobs']} jobs, waited {round(metrics['wait_seconds'], 1)}s (max {round(metrics['max_wait_seconds'], 1)}s), ran {round(metrics['run_seconds'], 1)}s")
+
+    def _is_next(self, object_name: str, ticket) -> bool:
+        next_object = next(iter(self._waiting))
+        return next_object == object_name and self._waiting[object_name][0] is ticket
+
+
+# there is one governor for the whole process, every HarvardSalesforce instance shares it
+bulk_job_limit = int(os.getenv("BULK_JOB_LIMIT") or 5)
+bulk_job_governor = BulkJobGovernor(max_jobs=bulk_job_limit)
@@ -0,0 +1,141 @@
+from common import logger, AppConfig
+
+import hashlib
+import json
+import threading
+import time
+
+
+class LoadCheckpoint():
+    """
+    Keeps track of how far a people load got, so a load that was killed can pick up where it left off
+
+    The position is tracked in PDS records (the order of the paginated query), not in batches:
+      - fetched_count is how far the PDS pagination got
+      - completed holds the ranges of records ([start, end)) that were pushed for each object
+    A range of records only needs to be processed again for the objects that don't cover it yet.
+    Using record ranges means a resumed run can use a different BATCH_SIZE.
+
+    The checkpoint is stored through the AppConfig (dynamo, or a local file when running locally)
+      and is only saved every save_interval seconds (and on save(force=True)) so we're not writing to dynamo for every batch.
+    """
+    def __init__(self, app_config: AppConfig, name: str, objects: list, save_interval: float=30):
+        self.app_config = app_config
+        self.name = name
+        self.objects = list(objects)
+        self.save_interval = save_interval
+
+        self.query_hash = None
+        self.total_count = None
+        self.fetched_count = 0
+        self.completed = {}
+
+        self._lock = threading.Lock()
+        self._last_saved = 0
+
+    def load(self) -> bool:
+        """
+        Loads the stored checkpoint, returns False if there isn't one
+        """
+        stored = self.app_config.get_checkpoint(self.name)
+        if not stored:
+            return False
+
+        self.query_hash = stored.get('query_hash')
+        self.total_count = stored.get('total_count')
+        self.fetched_count = stored.get('fetched_count', 0)
+        self.completed = {object_name: [list(r) for r in ranges] for object_name, ranges in stored.get('completed', {}).items()}
+        return True
+
+    def start(self, pds_query: dict, total_count: int):
+        """
+        Starts tracking a load of the pds_query
+        If a stored checkpoint was load()ed (a resume), its progress is only kept if it was for the same query and the same number of records,
+          otherwise the records could be in a different order and we'd skip the wrong ones
+        """
+        query_hash = hashlib.sha256(json.dumps(pds_query, sort_keys=True, default=str).encode()).hexdigest()
+
+        with self._lock:
+            if self.query_hash is not None:
+                if self.query_hash != query_hash:
+                    logger.warning(f"Warning: {self.name} checkpoint is for a different query, starting from the beginning")
+                    self._reset()
+                elif self.total_count != total_count:
+                    logger.warning(f"Warning: {self.name} checkpoint total_count ({self.total_count}) does not match the current total_count ({total_count}), starting from the beginning")
+                    self._reset()
+                else:
+                    logger.info(f"Resuming {self.name} from checkpoint: fetched {self.fetched_count}/{total_count}, completed: {self.summary()}")
+            else:
+                self._reset()
+
+            self.query_hash = query_hash
+            self.total_count = total_count
+
+        self.save(force=True)
+
+    def fetched(self, count: int):
+        with self._lock:
+            self.fetched_count = max(self.fetched_count, count)
+        self.save()
+
+    def completed_objects(self, start: int, end: int) -> list:
+        """
+        Returns the objects that have already been pushed for all of the records in [start, end)
+        """
+        with self._lock:
+            return [object_name for object_name in self.objects if self._covers(self.completed.get(object_name, []), start, end)]
+
+    def is_complete(self, start: int, end: int) -> bool:
+        return len(self.completed_objects(start, end)) == len(self.objects)
+
+    def complete(self, object_name: str, start: int, end: int):
+        """
+        Marks the records in [start, end) as pushed for this object
+        """
+        with self._lock:
+            ranges = self.completed.setdefault(object_name, [])
+            ranges.append([start, end])
+            ranges.sort()
+            # merge the ranges that touch or overlap
+            merged = [ranges[0]]
+            for range_start, range_end in ranges[1:]:
+                if range_start <= merged[-1][1]:
+                    merged[-1][1] = max(merged[-1][1], range_end)
+                else:
+                    merged.append([range_start, range_end])
+            self.completed[object_name] = merged
+        self.save()
+
+    def summary(self) -> dict:
+        # the number of records completed for each object
+        return {object_name: sum(end - start for start, end in ranges) for object_name, ranges in self.completed.items()}
+
+    def save(self, force: bool=False):
+        with self._lock:
+            if not force and time.monotonic() - self._last_saved < self.save_interval:
+                return
+            checkpoint = {
+                "query_hash": self.query_hash,
+                "total_count": self.total_count,
+                "fetched_count": self.fetched_count,
+                "completed": self.completed
+            }
+            self._last_saved = time.monotonic()
+            self.app_config.save_checkpoint(self.name, checkpoint)
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+        self.app_config.clear_checkpoint(self.name)
+
+    def _reset(self):
+        self.query_hash = None
+        self.total_count = None
+        self.fetched_count = 0
+        self.completed = {}
+
+    def _covers(self, ranges: list, start: int, end: int) -> bool:
+        for range_start, range_end in ranges:
+            if range_start <= start and end <= range_end:
+                return True
+        return False
@@ -6,6 +6,8 @@ import urllib
 import json
 import boto3
 import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
 from datetime import datetime, timedelta
 import pytz
 
@@ -34,6 +36,23 @@ stream_handler.setFormatter(formatter)
 logger.addHandler(stream_handler)
 
 
+#============================================================================================
+# local state
+#============================================================================================
+def get_state_dir() -> str:
+    # the indexes, fingerprints, caches, metrics (and local checkpoints) are kept in the STATE_DIR
+    return os.getenv("STATE_DIR") or ".state"
+
+
+def write_json_atomic(filename: str, data):
+    # write to a temp file first so a kill in the middle of the write doesn't leave half a file
+    #   (the temp file is per process, so processes writing the same file don't step on each other's temp files)
+    temp_filename = f"{filename}.{os.getpid()}.tmp"
+    with open(temp_filename, 'w') as f:
+        json.dump(data, f)
+    os.replace(temp_filename, filename)
+
+
 
 #============================================================================================
 # AppConfig
@@ -276,7 +295,82 @@ class AppConfig():
             except Exception as e:
                 logger.error(f"Error: failiure to update dynamo table {self.table_name} with watermarks {string_watermarks}")
                 raise e
-            
+
+    # checkpoints are stored as json strings on the config's dynamo item (ex: checkpoint_full_person_load)
+    #   or in a json file in the STATE_DIR when running locally
+    def get_checkpoint(self, name):
+        try:
+            if self.local:
+                checkpoint_filename = self.get_checkpoint_filename(name)
+                if not os.path.exists(checkpoint_filename):
+                    return None
+                with open(checkpoint_filename) as f:
+                    return json.load(f)
+
+            dynamo = boto3.client('dynamodb')
+            response = dynamo.get_item(
+                Key={
+                    'id': {'S': self.id},
+                    'name': {'S': self.name}
+                },
+                TableName=self.table_name
+            )
+            checkpoint = response.get('Item', {}).get(f"checkpoint_{name}")
+            if checkpoint is None:
+                return None
+            return json.loads(checkpoint.get('S'))
+        except Exception as e:
+            logger.error(f"Error: failure to get checkpoint {name} for id:{self.id} on table: {self.table_name}")
+            raise e
+
+    def save_checkpoint(self, name, checkpoint: dict):
+        try:
+            if self.local:
+                checkpoint_filename = self.get_checkpoint_filename(name)
+                os.makedirs(os.path.dirname(checkpoint_filename), exist_ok=True)
+                write_json_atomic(checkpoint_filename, checkpoint)
+                return
+
+            dynamodb = boto3.resource('dynamodb')
+            table = dynamodb.Table(self.table_name)
+            table.update_item(
+                Key={
+                    'id': self.id,
+                    'name': self.name
+                },
+                UpdateExpression='SET #checkpoint = :val',
+                ExpressionAttributeNames={'#checkpoint': f"checkpoint_{name}"},
+                ExpressionAttributeValues={':val': json.dumps(checkpoint)}
+            )
+        except Exception as e:
+            logger.error(f"Error: failure to save checkpoint {name} for id:{self.id} on table: {self.table_name}")
+            raise e
+
+    def clear_checkpoint(self, name):
+        try:
+            if self.local:
+                checkpoint_filename = self.get_checkpoint_filename(name)
+                if os.path.exists(checkpoint_filename):
+                    os.remove(checkpoint_filename)
+                return
+
+            dynamodb = boto3.resource('dynamodb')
+            table = dynamodb.Table(self.table_name)
+            table.update_item(
+                Key={
+                    'id': self.id,
+                    'name': self.name
+                },
+                UpdateExpression='REMOVE #checkpoint',
+                ExpressionAttributeNames={'#checkpoint': f"checkpoint_{name}"}
+            )
+        except Exception as e:
+            logger.error(f"Error: failure to clear checkpoint {name} for id:{self.id} on table: {self.table_name}")
+            raise e
+
+    def get_checkpoint_filename(self, name):
+        return os.path.join(get_state_dir(), f"{self.id or 'local'}_{name}_checkpoint.json")
+
     def get_task_info(self):
         """
         Retrieves info about the ECS task from the environment URI
@@ -398,14 +492,90 @@ def get_all_config_ids(table_name):
         raise e
     
     
-class ThreadExcept(threading.Thread):
-    def __init__(self, target, args):
-        super().__init__(target=target, args=args)
-        self.exception = None
+class BatchExecutor():
+    """
+    A bounded pool of worker threads for running batch jobs (with futures)
 
-    def run(self):
-        try:
-            if self._target:
-                self._target(*self._args)
-        except Exception as e:
-            self.exception = e
\ No newline at end of file
+    submit() blocks (without spinning) until a worker is free, so there are never more than 
+      max_workers jobs queued or running and a free slot is refilled as soon as a job finishes.
+    The first exception raised by a job cancels the jobs that haven't started yet (fail fast)
+      and is re-raised in the calling thread by submit(), wait() or raise_if_failed().
+    """
+    def __init__(self, max_workers: int, name: str="batch"):
+        self.max_workers = max_workers
+        self.name = name
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._condition = threading.Condition()
+        self._futures = set()
+        self._exception = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # if we're leaving because of an error, don't start anything else
+        self.shutdown(wait=exc_type is None, cancel_futures=exc_type is not None)
+        return False
+
+    @property
+    def running_count(self) -> int:
+        with self._condition:
+            return len(self._futures)
+
+    def submit(self, target, *args, callback=None, **kwargs) -> Future:
+        """
+        Runs target(*args, **kwargs) on a worker, waiting for a free worker first
+        callback (optional) is called with the finished future
+        """
+        with self._condition:
+            while len(self._futures) >= self.max_workers and self._exception is None:
+                self._condition.wait()
+            self._raise_if_failed()
+
+            future = self._pool.submit(target, *args, **kwargs)
+            self._futures.add(future)
+
+        future.add_done_callback(self._job_done)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def wait(self, timeout: float=None):
+        """
+        Waits for all submitted jobs to finish, raising the first job exception as soon as it happens
+        Raises a TimeoutError if the jobs are not done within timeout seconds
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+
+        with self._condition:
+            while len(self._futures) > 0 and self._exception is None:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise TimeoutError(f"{len(self._futures)} {self.name} jobs did not finish within {timeout} seconds")
+                self._condition.wait(remaining)
+            self._raise_if_failed()
+
+    def raise_if_failed(self):
+        with self._condition:
+            self._raise_if_failed()
+
+    def shutdown(self, wait: bool=True, cancel_futures: bool=False):
+        self._pool.shutdown(wait=wait, cancel_futures=cancel_futures)
+
+    def _raise_if_failed(self):
+        if self._exception is not None:
+            raise self._exception
+
+    def _job_done(self, future: Future):
+        with self._condition:
+            self._futures.discard(future)
+            if not future.cancelled() and future.exception() is not None and self._exception is None:
+                self._exception = future.exception()
+                # fail fast: anything that hasn't started yet won't
+                for pending in list(self._futures):
+                    pending.cancel()
+            self._condition.notify_all()
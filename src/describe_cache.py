@@ -0,0 +1,175 @@
+from common import logger, get_state_dir, write_json_atomic
+
+import os
+import json
+import hashlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from simple_salesforce import exceptions
+
+
+class DescribeCache():
+    """
+    A cache of the describe() metadata we use for each object (fields and record types)
+
+    getTypeMap, validateConfig and get_record_type_ids all get their descriptions from here,
+      so each object is only described once per run (and the objects that aren't cached yet are described in parallel)
+
+    With a ttl_hours, the descriptions are also kept on disk (in the STATE_DIR) between runs:
+      - a description younger than ttl_hours is used as is (no call to Salesforce)
+      - an older one is checked with If-Modified-Since, so an unchanged object is a (cheap) 304 instead of a full describe
+    The file is per org (name) and only used if it's for the same instance and API version
+    """
+    def __init__(self, sf, name: str="salesforce", state_dir: str=None, ttl_hours: float=0, max_workers: int=5):
+        self.sf = sf
+        self.name = name
+        self.state_dir = state_dir or get_state_dir()
+        self.ttl_hours = ttl_hours
+        self.max_workers = max_workers
+
+        # object name -> {"fetched": epoch seconds, "fingerprint": hash of the description, "fields": [...], "recordTypeInfos": [...]}
+        self.descriptions = {}
+        # object name -> (field names, relationship names)
+        self._name_sets = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.describe_count = 0
+        self.not_modified_count = 0
+
+    @property
+    def persisted(self) -> bool:
+        return self.ttl_hours is not None and self.ttl_hours > 0
+
+    def get(self, object_name: str) -> dict:
+        self._load()
+        with self._lock:
+            description = self.descriptions.get(object_name)
+        if description is None or not self._is_fresh(description):
+            description = self._describe(object_name, description)
+        return description
+
+    def prefetch(self, object_names: list):
+        """
+        Makes sure all of these objects are described, describing the ones that aren't (fresh) in parallel
+        """
+        self._load()
+        with self._lock:
+            needed = [object_name for object_name in object_names if object_name not in self.descriptions or not self._is_fresh(self.descriptions[object_name])]
+        if len(needed) == 0:
+            return
+
+        with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(needed))), thread_name_prefix="describe") as executor:
+            # list() so the first error is raised here
+            list(executor.map(self.get, needed))
+        self.save()
+
+    def field_names(self, object_name: str) -> set:
+        return self._get_name_sets(object_name)[0]
+
+    def relationship_names(self, object_name: str) -> set:
+        return self._get_name_sets(object_name)[1]
+
+    def save(self):
+        if not self.persisted:
+            return
+        os.makedirs(self.state_dir, exist_ok=True)
+        filename = self._filename()
+        with self._lock:
+            cache = {
+                "instance": self._instance(),
+                "descriptions": self.descriptions
+            }
+            write_json_atomic(filename, cache)
+
+    def _get_name_sets(self, object_name: str) -> tuple:
+        description = self.get(object_name)
+        with self._lock:
+            name_sets = self._name_sets.get(object_name)
+            if name_sets is None or name_sets[2] != description['fingerprint']:
+                name_sets = (
+                    {field['name'] for field in description['fields']},
+                    {field['relationshipName'] for field in description['fields'] if field.get('relationshipName')},
+                    description['fingerprint']
+                )
+                self._name_sets[object_name] = name_sets
+        return name_sets
+
+    def _is_fresh(self, description: dict) -> bool:
+        # without a ttl, a description is good for as long as this process runs
+        if not self.persisted:
+            return True
+        return time.time() - description['fetched'] < self.ttl_hours * 60 * 60
+
+    def _describe(self, object_name: str, cached: dict=None) -> dict:
+        headers = None
+        if cached is not None:
+            headers = {"If-Modified-Since": formatdate(cached['fetched'], usegmt=True)}
+        try:
+            description = self.sf.__getattr__(object_name).describe(headers=headers)
+        except exceptions.SalesforceError as e:
+            if cached is not None and e.status == 304:
+                # unchanged since we cached it
+                with self._lock:
+                    cached['fetched'] = time.time()
+                    self.not_modified_count += 1
+                return cached
+            raise e
+
+        # only what we use is kept
+        fields = [
+            {
+                "name": field['name'],
+                "type": field['type'],
+                "updateable": field['updateable'],
+                "length": field['length'],
+                "externalId": field['externalId'],
+                "relationshipName": field.get('relationshipName')
+            }
+            for field in description.get('fields')
+        ]
+        record_types = [
+            {"name": record_type['name'], "recordTypeId": record_type['recordTypeId']}
+            for record_type in description.get('recordTypeInfos') or []
+        ]
+        fingerprint = hashlib.sha256(json.dumps([fields, record_types], sort_keys=True, default=str).encode("utf-8")).hexdigest()
+        entry = {
+            "fetched": time.time(),
+            "fingerprint": fingerprint,
+            "fields": fields,
+            "recordTypeInfos": record_types
+        }
+        with self._lock:
+            if cached is not None and cached['fingerprint'] != fingerprint:
+                logger.info(f"{object_name} metadata changed since it was cached")
+            self.descriptions[object_name] = entry
+            self.describe_count += 1
+        return entry
+
+    def _load(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            self._loaded = True
+            if not self.persisted or not os.path.exists(self._filename()):
+                return
+            try:
+                with open(self._filename()) as f:
+                    cache = json.load(f)
+            except Exception as e:
+                logger.warning(f"Warning: unable to read the describe cache ({e}), objects will be described again")
+                return
+            if cache.get('instance') != self._instance():
+                logger.info(f"Describe cache is for another instance ({cache.get('instance')}), not using it")
+                return
+            self.descriptions = cache.get('descriptions') or {}
+
+    def _instance(self) -> str:
+        return f"{getattr(self.sf, 'sf_instance', '')}/v{getattr(self.sf, 'sf_version', '')}"
+
+    def _filename(self) -> str:
+        return os.path.join(self.state_dir, f"{self.name}_describe_cache.json")
@@ -0,0 +1,122 @@
+from common import logger, BatchExecutor
+
+import threading
+
+
+class DuplicateReport():
+    """
+    The duplicate external ids found on each object
+
+    For each object:
+      - external_id: the external id field that was checked
+      - record_count: the number of records with an external id
+      - groups: {external id value: {"keeper": Id, "losers": [Id, ...]}} for each external id on more than one record
+        the keeper is the most recently modified record, the losers are the rest (most recent first)
+
+    The remove actions use the losers from here, so they don't need to query for them again
+    """
+    def __init__(self):
+        self.objects = {}
+        self._lock = threading.Lock()
+
+    def add_object(self, object_name: str, external_id: str, record_count: int, groups: dict):
+        with self._lock:
+            self.objects[object_name] = {
+                "external_id": external_id,
+                "record_count": record_count,
+                "groups": groups
+            }
+
+    def has(self, object_name: str) -> bool:
+        return object_name in self.objects
+
+    def groups(self, object_name: str) -> dict:
+        return self.objects[object_name]['groups']
+
+    def losers(self, object_name: str) -> list:
+        # the Ids of the records that aren't the keeper for their external id
+        losers = []
+        for group in self.objects[object_name]['groups'].values():
+            losers.extend(group['losers'])
+        return losers
+
+    def summary(self) -> dict:
+        return {
+            object_name: {
+                "records": report['record_count'],
+                "duplicated_external_ids": len(report['groups']),
+                "duplicate_records": sum(len(group['losers']) for group in report['groups'].values())
+            }
+            for object_name, report in self.objects.items()
+        }
+
+    def to_dict(self) -> dict:
+        return dict(self.objects)
+
+
+class DuplicateDetector():
+    """
+    Finds records that share an external id
+
+    The records are streamed a page at a time (query_all_iter) into a dict keyed by the external id,
+      so nothing but the Ids we need to keep track of is held in memory
+    Objects are checked at the same time, on max_workers threads
+    """
+    def __init__(self, hsf, max_workers: int=3):
+        self.hsf = hsf
+        self.max_workers = max_workers
+
+    def detect_object(self, object_name: str, external_id: str) -> tuple:
+        """
+        Returns (record_count, groups) for this object, see DuplicateReport for what groups looks like
+        """
+        # most recently modified first, so the first record we see for an external id is the keeper
+        select_string = f"SELECT Id, {external_id}, LastModifiedDate FROM {object_name} WHERE {external_id} != null ORDER BY LastModifiedDate DESC"
+        logger.info(f"Checking {object_name} for duplicate {external_id} values")
+
+        keepers = {}
+        groups = {}
+        record_count = 0
+        try:
+            for record in self.hsf.sf.query_all_iter(select_string):
+                record_count += 1
+                value = record[external_id]
+                if value not in keepers:
+                    keepers[value] = record['Id']
+                elif value in groups:
+                    groups[value]['losers'].append(record['Id'])
+                else:
+                    groups[value] = {
+                        "keeper": keepers[value],
+                        "losers": [record['Id']]
+                    }
+        except Exception as e:
+            logger.error(f"Error checking {object_name} for duplicates: {e} with {select_string}")
+            raise e
+
+        logger.info(f"Found {sum(len(group['losers']) for group in groups.values())} {object_name} with duplicate external ids ({len(groups)} external ids, {record_count} records)")
+        return (record_count, groups)
+
+    def detect(self, objects: dict, report: DuplicateReport=None) -> DuplicateReport:
+        """
+        objects is a dict of object name -> external id field
+        Returns a DuplicateReport for all of them (added to report if one is passed in)
+        """
+        if report is None:
+            report = DuplicateReport()
+
+        def detect_into_report(object_name, external_id):
+            (record_count, groups) = self.detect_object(object_name, external_id)
+            report.add_object(object_name, external_id, record_count, groups)
+
+        if self.max_workers <= 1 or len(objects) <= 1:
+            for object_name, external_id in objects.items():
+                detect_into_report(object_name, external_id)
+            return report
+
+        with BatchExecutor(max_workers=self.max_workers, name="duplicates") as executor:
+            for object_name, external_id in objects.items():
+                executor.submit(detect_into_report, object_name, external_id)
+            executor.wait()
+
+        return report
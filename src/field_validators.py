@@ -0,0 +1,199 @@
+from common import logger
+
+import re
+from datetime import datetime, date
+
+
+# These are HarvardSalesforce.validate's checks, built once for each (object, field) from its type data
+#   (type, updateable, length) instead of looking them up and going through the types for every value.
+# A validator is called with (value, identifier) and returns what validate returns for that field.
+
+_phone_pattern = re.compile(r"^\+?[\d\s\(\)\-]+$")
+_email_pattern = re.compile(r"[^@]+@[^@]+\.[^@]+")
+# the usual date / datetime formats, anything else goes through strptime
+_date_pattern = re.compile(r"^(\d{4})-(\d{2})-(\d{2})$", re.ASCII)
+_datetime_pattern = re.compile(r"^(\d{4})-(\d{2})-(\d{2})T(\d{2}):(\d{2}):(\d{2})$", re.ASCII)
+
+_min_date = date(1700, 1, 1)
+_max_date = date(2400, 1, 1)
+
+
+def build_validator(object_name: str, field_name: str, field_data: dict):
+    """
+    Returns the validator for a field from its type data (a field of HarvardSalesforce.type_data)
+    """
+    if 'type' not in field_data:
+        raise Exception(f"Error: field ({field_name}) does not have an associated `type`")
+    if 'updateable' not in field_data:
+        raise Exception(f"Error: field ({field_name}) does not have an associated `updateable`")
+
+    field_type = field_data['type']
+    is_boolean = field_type in ["boolean"]
+    # `Id` isn't something we can even try to edit, but it's allowed through
+    editable = field_data['updateable'] or field_name == "Id"
+    convert = _converter(object_name, field_name, field_type, field_data)
+
+    def validator(value, identifier):
+        if value is None:
+            return False if is_boolean else None
+
+        # NOTE: this handles empty DotMaps
+        if not is_boolean and not value and value != False:
+            return None
+
+        if not isinstance(value, (str, bool, int)):
+            logger.error(f"Error: value ({value}) for {object_name}.{field_name} is not a valid type ({type(value)}). Identifier: {identifier}")
+            return None
+
+        if not editable:
+            raise Exception(f"Error: field ({object_name}.{field_name}) is not editable")
+
+        return convert(value, identifier)
+
+    return validator
+
+
+def build_column_validator(object_name: str, field_name: str, field_data: dict, validator=None):
+    """
+    Returns a function that validates a whole column of values for a field: (values, identifiers) -> validated values
+    The results are the same as the field's validator for each value, but the usual values
+      (a non-empty string for a text, picklist or id field, a bool for a boolean field) are done right in the loop
+    """
+    if validator is None:
+        validator = build_validator(object_name, field_name, field_data)
+
+    field_type = field_data['type']
+    editable = field_data['updateable'] or field_name == "Id"
+
+    if editable and field_type in ["textarea", "string", "url"]:
+        length = field_data['length']
+
+        def validate_column(values: list, identifiers: list) -> list:
+            return [(value if len(value) <= length else value[:length]) if type(value) is str and value else validator(value, identifier) for value, identifier in zip(values, identifiers)]
+    elif editable and field_type in ["picklist", "multipicklist", "id", "reference"]:
+        def validate_column(values: list, identifiers: list) -> list:
+            return [value if type(value) is str and value else validator(value, identifier) for value, identifier in zip(values, identifiers)]
+    elif editable and field_type in ["boolean"]:
+        def validate_column(values: list, identifiers: list) -> list:
+            return [value if type(value) is bool else validator(value, identifier) for value, identifier in zip(values, identifiers)]
+    else:
+        def validate_column(values: list, identifiers: list) -> list:
+            return [validator(value, identifier) for value, identifier in zip(values, identifiers)]
+    return validate_column
+
+
+def _converter(object_name: str, field_name: str, field_type: str, field_data: dict):
+    # the conversion for the field's type (the values are already known to be str, bool or int)
+    if field_type in ["textarea", "string", "url"]:
+        length = field_data['length']
+
+        def convert(value, identifier):
+            if isinstance(value, bool):
+                return 1 if value else 0
+            value = str(value)
+            if len(value) > length:
+                value = value[:length]
+            return value
+        return convert
+
+    if field_type in ["picklist", "multipicklist"]:
+        # not really sure I want to validate what the picklist values are
+        return lambda value, identifier: str(value)
+
+    if field_type in ["phone"]:
+        def convert(value, identifier):
+            # a possible leading +, numbers, spaces, parens and dashes
+            if _phone_pattern.match(value):
+                return str(value)
+            logger.warning(f"Warning: {value} is not a valid phone number. Identifier: {identifier}")
+            return None
+        return convert
+
+    if field_type in ["email"]:
+        def convert(value, identifier):
+            if _email_pattern.match(value):
+                return str(value)
+            logger.warning(f"Warning: {value} is not a valid email. Identifier: {identifier}")
+            return None
+        return convert
+
+    if field_type in ["id", "reference"]:
+        return lambda value, identifier: value
+
+    if field_type in ["date"]:
+        return _convert_date
+
+    if field_type in ["datetime"]:
+        return _convert_datetime
+
+    if field_type in ["double"]:
+        def convert(value, identifier):
+            try:
+                if bool(value) == False:
+                    return None
+                return float(value)
+            except ValueError as e:
+                logger.error(f"Error converting {object_name}.{field_name} ({value}) to double/float: {e}. Identifier: {identifier}")
+                return None
+        return convert
+
+    if field_type in ["boolean"]:
+        return lambda value, identifier: value if isinstance(value, bool) else False
+
+    def convert(value, identifier):
+        logger.error(f"Error: unhandled field_type: {field_type}. Please check config and target Salesforce instance")
+        return None
+    return convert
+
+
+def _convert_date(value, identifier):
+    # NOTE: Salesforce only liked dates from the year of our lord 1700-2400
+    #       Salesforce also wants the date in an iso-8861 string
+    #       It does not handle datetime as a date, so the 00:00:00 needs to be stripped off of datetimes
+    value = value.split("T")[0].split(" ")[0]
+    match = _date_pattern.match(value)
+    if match:
+        try:
+            valid_date = date(int(match[1]), int(match[2]), int(match[3]))
+        except ValueError:
+            valid_date = None
+        if valid_date is not None and _min_date <= valid_date <= _max_date:
+            return value
+    try:
+        if value:
+            valid_date = datetime.strptime(value, '%Y-%m-%d').date()
+            if not (_min_date <= valid_date <= _max_date):
+                logger.error(f"Error: date out of range: {value}. Indentifier: {identifier}")
+                return None
+    except ValueError as e:
+        logger.error(f"Error: {e}. Indentifier: {identifier}")
+        return None
+    return value
+
+
+def _convert_datetime(value, identifier):
+    match = _datetime_pattern.match(value) if isinstance(value, str) else None
+    if match:
+        try:
+            valid_datetime = datetime(*(int(piece) for piece in match.groups()))
+        except ValueError:
+            valid_datetime = None
+        if valid_datetime is not None and _min_date <= valid_datetime.date() <= _max_date:
+            return value
+    try:
+        if value:
+            # we want to try both formats for datetime
+            try:
+                valid_date = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S').date()
+            except:
+                value = value.replace(" ", "T")
+                value = value.split(".")[0]
+                value = value.split("Z")[0]
+                valid_date = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S').date()
+            if not (_min_date <= valid_date <= _max_date):
+                logger.error(f"Error: date out of range: {value}. Indentifier: {identifier}")
+                return None
+    except ValueError as e:
+        logger.error(f"Error: {e}. Indentifier: {identifier}")
+        return None
+    return value
@@ -0,0 +1,196 @@
+from common import logger, get_state_dir, write_json_atomic
+
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+
+def fingerprint(record: dict) -> str:
+    # a stable hash of the record's content (the same fields and values always give the same hash, in any order)
+    return hashlib.blake2b(json.dumps(record, sort_keys=True, default=str).encode("utf-8"), digest_size=16).hexdigest()
+
+
+def field_fingerprints(record: dict) -> dict:
+    # a (shorter) hash of each field's value, so we can tell which fields changed without keeping the values
+    return {field: hashlib.blake2b(json.dumps(value, sort_keys=True, default=str).encode("utf-8"), digest_size=8).hexdigest() for field, value in record.items()}
+
+
+class RecordFingerprints():
+    """
+    Keeps a hash of the last record successfully pushed for each (object, external id)
+    so a record that hasn't changed since can be left out of the next push
+
+    The PDS cacheUpdateDate changes when anything about a person changes, including things we don't map,
+      so most of the records an update (or full) load transforms are the same as what's already in Salesforce
+    - changed(): returns the records (of a list of records) that changed and counts the ones that didn't
+    - record(): is called with the records that were pushed successfully (from the bulk results)
+
+    Like the IdIndex, the hashes are kept on local disk (in the STATE_DIR) between runs with snapshot() and restore()
+    The hashes are forgotten after max_age_days, so every record is pushed again at least that often
+      (in case it was changed or deleted in Salesforce by something else)
+
+    With fields=True, a hash is kept for each field of each record instead, and changed() returns just the fields
+      of each record that are different from the last push (plus the external id), so the upserts only touch what changed
+    """
+    def __init__(self, name: str="salesforce", state_dir: str=None, max_age_days: int=7, fields: bool=False):
+        self.name = name
+        self.state_dir = state_dir or get_state_dir()
+        self.max_age_days = max_age_days
+        self.fields = fields
+
+        # object name -> {"external_id": field name, "fields": bool, "created": iso datetime, "hashes": {external id: hash (or {field: hash})}}
+        self.objects = {}
+        # object name -> {"checked": count, "skipped": count, "fields_checked": count, "fields_skipped": count}
+        self.counts = {}
+        self._lock = threading.Lock()
+
+    def changed(self, object_name: str, external_id: str, records: list) -> list:
+        """
+        Returns the records that are different from the last ones pushed (or that have never been pushed)
+        With fields, the records that have been pushed before only have the fields that changed (and the external id)
+        """
+        changed_records = []
+        field_count = 0
+        changed_field_count = 0
+        with self._lock:
+            hashes = self._hashes(object_name, external_id)
+            for record in records:
+                key = record.get(external_id)
+                if key is None or str(key) not in hashes:
+                    changed_records.append(record)
+                elif not self.fields:
+                    if hashes[str(key)] != fingerprint(record):
+                        changed_records.append(record)
+                else:
+                    pushed = hashes[str(key)]
+                    changed_fields = [field for field, field_hash in field_fingerprints(record).items() if field == external_id or pushed.get(field) != field_hash]
+                    field_count += len(record) - 1
+                    changed_field_count += len(changed_fields) - 1
+                    if len(changed_fields) > 1:
+                        changed_records.append({field: record[field] for field in changed_fields})
+
+            counts = self.counts.setdefault(object_name, {"checked": 0, "skipped": 0, "fields_checked": 0, "fields_skipped": 0})
+            counts['checked'] += len(records)
+            counts['skipped'] += len(records) - len(changed_records)
+            counts['fields_checked'] += field_count
+            counts['fields_skipped'] += field_count - changed_field_count
+
+        if len(changed_records) < len(records):
+            logger.debug(f"Skipping {len(records) - len(changed_records)} unchanged {object_name} records (of {len(records)})")
+        return changed_records
+
+    def record(self, object_name: str, external_id: str, records: list):
+        """
+        Remembers these records as pushed
+        With fields, the fields that weren't pushed (the ones that hadn't changed) keep their hashes
+        """
+        with self._lock:
+            hashes = self._hashes(object_name, external_id)
+            for record in records:
+                key = record.get(external_id)
+                if key is None:
+                    continue
+                if self.fields:
+                    hashes.setdefault(str(key), {}).update(field_fingerprints(record))
+                else:
+                    hashes[str(key)] = fingerprint(record)
+
+    def skip_rates(self) -> dict:
+        """
+        Returns object name -> {"checked", "skipped", "rate"} for everything checked so far
+          (with fields, also "fields_checked", "fields_skipped" and "fields_rate" for the records that had been pushed before)
+        """
+        with self._lock:
+            rates = {}
+            for object_name, counts in self.counts.items():
+                rates[object_name] = {
+                    "checked": counts['checked'],
+                    "skipped": counts['skipped'],
+                    "rate": round(counts['skipped'] / counts['checked'], 4) if counts['checked'] > 0 else 0
+                }
+                if self.fields:
+                    rates[object_name]['fields_checked'] = counts['fields_checked']
+                    rates[object_name]['fields_skipped'] = counts['fields_skipped']
+                    rates[object_name]['fields_rate'] = round(counts['fields_skipped'] / counts['fields_checked'], 4) if counts['fields_checked'] > 0 else 0
+            return rates
+
+    def log_summary(self):
+        for object_name, counts in self.skip_rates().items():
+            logger.info(f"Skipped {counts['skipped']} of {counts['checked']} unchanged {object_name} records ({counts['rate']:.1%})")
+            if self.fields:
+                logger.info(f"Skipped {counts['fields_skipped']} of {counts['fields_checked']} unchanged {object_name} fields ({counts['fields_rate']:.1%})")
+
+    def snapshot(self):
+        """
+        Writes the hashes to disk (one file per object)
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        with self._lock:
+            for object_name, fingerprints in self.objects.items():
+                filename = self._filename(object_name)
+                write_json_atomic(filename, fingerprints)
+        logger.debug(f"Saved record fingerprints to {self.state_dir}")
+
+    def restore(self, object_names: list) -> list:
+        """
+        Reads the hashes for these objects from disk (if they've been saved and aren't too old)
+        Returns the names of the objects that were restored
+        """
+        restored = []
+        for object_name in object_names:
+            filename = self._filename(object_name)
+            if not os.path.exists(filename):
+                continue
+            try:
+                with open(filename) as f:
+                    fingerprints = json.load(f)
+            except Exception as e:
+                logger.warning(f"Warning: unable to read the {object_name} record fingerprints ({e}), all of its records will be pushed")
+                continue
+
+            if fingerprints.get('fields', False) != self.fields:
+                logger.info(f"The {object_name} record fingerprints are for a different DELTA_PUSH mode, all of its records will be pushed")
+                continue
+
+            if datetime.fromisoformat(fingerprints['created']) < datetime.utcnow() - timedelta(days=self.max_age_days):
+                logger.info(f"The {object_name} record fingerprints are older than {self.max_age_days} days, all of its records will be pushed")
+                continue
+
+            with self._lock:
+                self.objects[object_name] = fingerprints
+            restored.append(object_name)
+        return restored
+
+    def clear(self, object_names: list) -> list:
+        """
+        Forgets the hashes for these objects (in memory and on disk)
+        For when records are pushed without them being recorded (with DELTA_PUSH off, or in the shards of a sharded load),
+          the stored hashes can't be trusted after that: a record that changed back to what was last recorded would be skipped
+        Returns the names of the objects that had hashes on disk
+        """
+        cleared = []
+        with self._lock:
+            for object_name in object_names:
+                self.objects.pop(object_name, None)
+                try:
+                    os.remove(self._filename(object_name))
+                    cleared.append(object_name)
+                except FileNotFoundError:
+                    pass
+        return cleared
+
+    def _hashes(self, object_name: str, external_id: str) -> dict:
+        # (with the lock held) a new external id field means the old hashes don't mean anything
+        if object_name not in self.objects or self.objects[object_name]['external_id'] != external_id:
+            self.objects[object_name] = {
+                "external_id": external_id,
+                "fields": self.fields,
+                "created": datetime.utcnow().isoformat(),
+                "hashes": {}
+            }
+        return self.objects[object_name]['hashes']
+
+    def _filename(self, object_name: str) -> str:
+        return os.path.join(self.state_dir, f"{self.name}_fingerprints_{object_name}.json")
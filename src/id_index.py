@@ -0,0 +1,162 @@
+from common import logger, get_state_dir, write_json_atomic
+
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+
+
+class IdIndex():
+    """
+    A local index of external id -> Salesforce Id for each object
+
+    Looking the ids up with SOQL (getUniqueIds) costs a query per 500 ids per object for every batch.
+    With the index, the lookups are done from memory and the index is kept up to date by:
+      - refresh(): querying only the records with a SystemModstamp after the last sync (including deleted records)
+      - update(): adding the ids of records we just created (from the push results)
+
+    The index is kept on local disk (in the STATE_DIR) between runs with snapshot() and restore(),
+      so after the first (full) refresh, a refresh only has to get what changed since the last run.
+    """
+    def __init__(self, hsf, name: str="salesforce", state_dir: str=None, max_age_days: int=14):
+        self.hsf = hsf
+        self.name = name
+        self.state_dir = state_dir or get_state_dir()
+        # deleted records only show up in a query (as IsDeleted) while they're in the recycle bin (~15 days),
+        #   so an index older than this is rebuilt instead of refreshed
+        self.max_age_days = max_age_days
+
+        # object name -> {"external_id": field name, "last_sync": SystemModstamp, "ids": {external id: Salesforce Id}}
+        self.objects = {}
+        # object name -> {Salesforce Id: external id}, so we can find an old external id when it changes
+        self._reverse = {}
+        self._lock = threading.Lock()
+
+    def has(self, object_name: str, external_id: str) -> bool:
+        with self._lock:
+            return object_name in self.objects and self.objects[object_name]['external_id'] == external_id
+
+    def lookup(self, object_name: str, external_ids: list) -> dict:
+        """
+        Returns a dict of external id -> Salesforce Id for the external ids that are in the index
+        """
+        with self._lock:
+            ids = self.objects[object_name]['ids']
+            return {str(external_id): ids[str(external_id)] for external_id in external_ids if str(external_id) in ids}
+
+    def update(self, object_name: str, id_map: dict):
+        """
+        Adds (or changes) external id -> Salesforce Id pairs, like the ones for records we just created
+        """
+        with self._lock:
+            if object_name not in self.objects:
+                return
+            for external_id, salesforce_id in id_map.items():
+                self._set(object_name, str(external_id), salesforce_id)
+
+    def refresh(self, object_name: str, external_id: str) -> int:
+        """
+        Brings the index for this object up to date with Salesforce
+        The first refresh (or a refresh after the external id changes) gets all of the records,
+          after that only the records changed (or deleted) since the last sync
+        Returns the number of records that came back
+        """
+        with self._lock:
+            if object_name not in self.objects or self.objects[object_name]['external_id'] != external_id:
+                self.objects[object_name] = {
+                    "external_id": external_id,
+                    "last_sync": None,
+                    "ids": {}
+                }
+                self._reverse[object_name] = {}
+            last_sync = self.objects[object_name]['last_sync']
+            if last_sync is not None and datetime.strptime(last_sync[:19], '%Y-%m-%dT%H:%M:%S') < datetime.utcnow() - timedelta(days=self.max_age_days):
+                logger.info(f"The {object_name} id index is older than {self.max_age_days} days, rebuilding it")
+                self.objects[object_name]['last_sync'] = None
+                self.objects[object_name]['ids'] = {}
+                self._reverse[object_name] = {}
+                last_sync = None
+
+        if last_sync is None:
+            logger.info(f"Building the {object_name} id index")
+            select_string = f"SELECT Id, {external_id}, SystemModstamp, IsDeleted FROM {object_name} WHERE {external_id} != null"
+        else:
+            logger.info(f"Refreshing the {object_name} id index with changes since {last_sync}")
+            # >= so records that changed in the same second as the last sync aren't missed (getting them twice is fine)
+            # SystemModstamps come back like 2024-02-14T05:00:00.000+0000 (UTC)
+            select_string = f"SELECT Id, {external_id}, SystemModstamp, IsDeleted FROM {object_name} WHERE SystemModstamp >= {last_sync[:19]}Z"
+
+        count = 0
+        newest = last_sync
+        try:
+            for record in self.hsf.sf.query_all_iter(select_string, include_deleted=True):
+                count += 1
+                with self._lock:
+                    if record.get('IsDeleted') or record.get(external_id) is None:
+                        self._remove(object_name, record['Id'])
+                    else:
+                        self._set(object_name, str(record[external_id]), record['Id'])
+                # SystemModstamps are all in the same (UTC) format, so they compare as strings
+                if newest is None or record['SystemModstamp'] > newest:
+                    newest = record['SystemModstamp']
+        except Exception as e:
+            logger.error(f"Error refreshing the {object_name} id index: {e} with {select_string}")
+            raise e
+
+        with self._lock:
+            self.objects[object_name]['last_sync'] = newest
+            size = len(self.objects[object_name]['ids'])
+        logger.info(f"{object_name} id index: {count} records changed, {size} ids")
+        return count
+
+    def snapshot(self):
+        """
+        Writes the index to disk (one file per object)
+        """
+        os.makedirs(self.state_dir, exist_ok=True)
+        with self._lock:
+            for object_name, index in self.objects.items():
+                filename = self._filename(object_name)
+                write_json_atomic(filename, index)
+        logger.debug(f"Saved id index snapshot to {self.state_dir}")
+
+    def restore(self, object_names: list) -> list:
+        """
+        Reads the index for these objects from disk (if they've been saved)
+        Returns the names of the objects that were restored
+        """
+        restored = []
+        for object_name in object_names:
+            filename = self._filename(object_name)
+            if not os.path.exists(filename):
+                continue
+            try:
+                with open(filename) as f:
+                    index = json.load(f)
+            except Exception as e:
+                logger.warning(f"Warning: unable to read the {object_name} id index ({e}), it will be rebuilt")
+                continue
+
+            with self._lock:
+                self.objects[object_name] = index
+                self._reverse[object_name] = {salesforce_id: external_id for external_id, salesforce_id in index['ids'].items()}
+            restored.append(object_name)
+        return restored
+
+    def _set(self, object_name: str, external_id: str, salesforce_id: str):
+        ids = self.objects[object_name]['ids']
+        reverse = self._reverse[object_name]
+        # the record's external id might have changed
+        old_external_id = reverse.get(salesforce_id)
+        if old_external_id is not None and old_external_id != external_id and ids.get(old_external_id) == salesforce_id:
+            del ids[old_external_id]
+        ids[external_id] = salesforce_id
+        reverse[salesforce_id] = external_id
+
+    def _remove(self, object_name: str, salesforce_id: str):
+        external_id = self._reverse[object_name].pop(salesforce_id, None)
+        if external_id is not None and self.objects[object_name]['ids'].get(external_id) == salesforce_id:
+            del self.objects[object_name]['ids'][external_id]
+
+    def _filename(self, object_name: str) -> str:
+        return os.path.join(self.state_dir, f"{self.name}_id_index_{object_name}.json")
@@ -0,0 +1,230 @@
+from common import logger
+from bulk_governor import bulk_job_governor
+from metrics import metrics
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+
+
+class TrackedJob():
+    # a Bulk API 2.0 job we're waiting on
+    def __init__(self, job_id: str, object_name: str, records: list, id_name: str, submission, wait_time: float, interval: float):
+        self.job_id = job_id
+        self.object_name = object_name
+        self.records = records
+        self.id_name = id_name
+        self.submission = submission
+        self.wait_time = wait_time
+        self.submitted = time.monotonic()
+        self.state = None
+        self.interval = interval
+        self.next_poll = self.submitted + interval
+        self.polls = 0
+
+
+class BulkSubmission():
+    # all of the jobs for one submit() (the data is split into jobs by size), done when they're all done
+    def __init__(self, object_name: str, on_done=None):
+        self.object_name = object_name
+        self.on_done = on_done
+        self.future = Future()
+        self.pending = 0
+        self.submitted_all = False
+        self.results = {"created": 0, "updated": 0, "errors": 0, "errored_data_batch": []}
+
+
+class BulkJobTracker():
+    """
+    Submits bulk upserts (Bulk API 2.0 jobs) and returns right away instead of waiting for them
+
+    A background thread polls the status of the jobs that are running:
+      - each job starts being polled every min_interval seconds,
+        the interval grows (by backoff) every time the job hasn't changed, up to max_interval
+        and goes back to min_interval when the job's state changes (like going from UploadComplete to InProgress)
+      - when a job is done, its results are downloaded (on one of result_workers threads)
+        and go through HarvardSalesforce.handle_bulk_responses, the same as a synchronous pushBulk
+        (so the counts are logged and duplicates are resolved the same way)
+
+    Each job holds a bulk job governor slot from submit until it's done, so submit() blocks when all of the slots are taken
+      (that keeps the number of jobs, and the records waiting on them, bounded)
+    """
+    def __init__(self, hsf, min_interval: float=1, max_interval: float=30, backoff: float=1.5, result_workers: int=2):
+        self.hsf = hsf
+        self.bulk2 = hsf.bulk2
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+
+        self._jobs = {}
+        self._submissions = set()
+        self._condition = threading.Condition()
+        self._stopping = False
+        self._results_executor = ThreadPoolExecutor(max_workers=result_workers, thread_name_prefix="bulk_results")
+        self._poller = threading.Thread(target=self._poll_jobs, name="bulk_poller", daemon=True)
+        self._poller.start()
+
+        self.polls = 0
+        self.completed_jobs = 0
+
+    def submit(self, object_name: str, data: list, id_name: str, on_done=None) -> Future:
+        """
+        Starts the upsert and returns a Future for when all of its results have been handled
+        The Future's result is the counts from handle_bulk_responses (created/updated/errors) for all of the jobs
+        on_done (optional) is called with the object name when it's done without an error
+        """
+        submission = BulkSubmission(object_name, on_done=on_done)
+        with self._condition:
+            self._submissions.add(submission)
+        if data is None or len(data) == 0:
+            self._finish_submission(submission)
+            return submission.future
+
+        try:
+            for (chunk_start, chunk) in self.bulk2.chunks(data):
+                wait_time = bulk_job_governor.acquire(object_name)
+                try:
+                    job_id = self.bulk2.submit_job(object_name, chunk, id_name)
+                except Exception as e:
+                    bulk_job_governor.release(object_name, wait_time=wait_time)
+                    raise e
+
+                logger.debug(f"Submitted {object_name} job {job_id} with {len(chunk)} records")
+                with self._condition:
+                    submission.pending += 1
+                    self._jobs[job_id] = TrackedJob(job_id, object_name, chunk, id_name, submission, wait_time, self.min_interval)
+                    self._condition.notify_all()
+        except Exception as e:
+            self._fail_submission(submission, e)
+            return submission.future
+
+        with self._condition:
+            submission.submitted_all = True
+            finished = submission.pending == 0
+        if finished:
+            self._finish_submission(submission)
+        return submission.future
+
+    def wait_all(self, timeout: float=None):
+        """
+        Waits for everything submitted so far to be done, raises the first error
+        """
+        deadline = None
+        if timeout is not None:
+            deadline = time.monotonic() + timeout
+        while True:
+            with self._condition:
+                submissions = list(self._submissions)
+            if len(submissions) == 0:
+                return
+            for submission in submissions:
+                remaining = None
+                if deadline is not None:
+                    remaining = max(0, deadline - time.monotonic())
+                # raises the submission's error (or a TimeoutError)
+                submission.future.result(timeout=remaining)
+                with self._condition:
+                    self._submissions.discard(submission)
+
+    @property
+    def running_count(self) -> int:
+        with self._condition:
+            return len(self._jobs)
+
+    def close(self):
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+        self._poller.join()
+        self._results_executor.shutdown(wait=True)
+
+        # anything still running is left to Salesforce, but its slot is given back and its submission failed
+        with self._condition:
+            abandoned = list(self._jobs.values())
+            self._jobs = {}
+        for job in abandoned:
+            logger.warning(f"Warning: stopped tracking {job.object_name} job {job.job_id} ({job.state})")
+            bulk_job_governor.release(job.object_name, wait_time=job.wait_time, run_time=time.monotonic() - job.submitted)
+            self._fail_submission(job.submission, Exception(f"Bulk job {job.job_id} was still running when the tracker closed"))
+        logger.info(f"Bulk job tracker: {self.completed_jobs} jobs, {self.polls} status checks")
+
+    def _poll_jobs(self):
+        while True:
+            with self._condition:
+                while not self._stopping:
+                    now = time.monotonic()
+                    due = [job for job in self._jobs.values() if job.next_poll <= now]
+                    if len(due) > 0:
+                        break
+                    # sleep until the next job is due (or something new is submitted)
+                    timeout = None
+                    if len(self._jobs) > 0:
+                        timeout = min(job.next_poll for job in self._jobs.values()) - now
+                    self._condition.wait(timeout)
+                if self._stopping:
+                    return
+
+            for job in due:
+                try:
+                    status = self.bulk2.get_status(job.job_id)
+                except Exception as e:
+                    # a failed status check is tried again on the next poll
+                    logger.warning(f"Warning: unable to check {job.object_name} job {job.job_id}: {e}")
+                    status = {"state": job.state}
+                self.polls += 1
+                job.polls += 1
+
+                if status.get('state') is not None and self.bulk2.is_finished(status):
+                    with self._condition:
+                        self._jobs.pop(job.job_id, None)
+                    run_time = time.monotonic() - job.submitted
+                    bulk_job_governor.release(job.object_name, wait_time=job.wait_time, run_time=run_time)
+                    self._results_executor.submit(self._handle_results, job, status)
+                    continue
+
+                # poll less often while nothing is changing
+                if status.get('state') != job.state:
+                    job.state = status.get('state')
+                    job.interval = self.min_interval
+                else:
+                    job.interval = min(job.interval * self.backoff, self.max_interval)
+                job.next_poll = time.monotonic() + job.interval
+
+    def _handle_results(self, job: TrackedJob, status: dict):
+        submission = job.submission
+        try:
+            with metrics.timer("bulk_results", records=len(job.records), object=job.object_name):
+                self.bulk2.check_status(status, job.object_name)
+                responses = self.bulk2.get_results(job.job_id, job.records, job.id_name)
+                results = self.hsf.handle_bulk_responses(job.object_name, job.records, responses, id_name=job.id_name)
+        except Exception as e:
+            logger.error(f"Error handling {job.object_name} job {job.job_id} results: {e}")
+            self._fail_submission(submission, e)
+            return
+
+        # the records are done with
+        job.records = None
+        with self._condition:
+            self.completed_jobs += 1
+            for key in ["created", "updated", "errors"]:
+                submission.results[key] += results[key]
+            submission.results['errored_data_batch'].extend(results['errored_data_batch'])
+            submission.pending -= 1
+            finished = submission.pending == 0 and submission.submitted_all
+        if finished:
+            self._finish_submission(submission)
+
+    def _finish_submission(self, submission: BulkSubmission):
+        if submission.future.done():
+            return
+        if submission.on_done is not None:
+            try:
+                submission.on_done(submission.object_name)
+            except Exception as e:
+                self._fail_submission(submission, e)
+                return
+        submission.future.set_result(submission.results)
+
+    def _fail_submission(self, submission: BulkSubmission, e: Exception):
+        if not submission.future.done():
+            submission.future.set_exception(e)
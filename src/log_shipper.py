@@ -0,0 +1,168 @@
+import json
+import queue
+import atexit
+import threading
+
+
+# NOTE: nothing in this file should use the logger
+#   the logger's formatter feeds this class, so logging from here will cause an infinite loop
+class SalesforceLogShipper:
+    """
+    Ships log records to a log object in Salesforce (huit__Log__c) in the background.
+
+    Records are put on a bounded in-memory queue by the logging formatter and a worker thread
+    sends them in batches through the sObject Collections endpoint (up to 200 records per call),
+    so a log line costs a queue put instead of a REST round trip.
+
+    Batches are sent when `batch_size` records are waiting or every `flush_interval` seconds,
+    whichever comes first. When the queue is full, records are dropped according to `overflow_policy`:
+        drop_newest: the incoming record is dropped (default)
+        drop_oldest: the oldest queued record is dropped to make room for the incoming one
+    Dropped records are counted and reported in a final log record when the shipper is closed.
+    """
+
+    # this is the max the sObject Collections endpoint will take in a single call
+    MAX_BATCH_SIZE = 200
+
+    def __init__(self, hsf, log_object="huit__Log__c", batch_size=200, flush_interval=5, max_queue_size=10000, overflow_policy="drop_newest"):
+        if overflow_policy not in ["drop_newest", "drop_oldest"]:
+            raise ValueError(f"Error: unknown overflow_policy ({overflow_policy}). Possible values are drop_newest and drop_oldest")
+
+        self.hsf = hsf
+        self.log_object = log_object
+        self.batch_size = max(1, min(int(batch_size), self.MAX_BATCH_SIZE))
+        self.flush_interval = float(flush_interval)
+        self.overflow_policy = overflow_policy
+
+        self.queue = queue.Queue(maxsize=int(max_queue_size))
+
+        self.shipped_count = 0
+        self.failed_count = 0
+        self.dropped_count = 0
+        # the last error we got shipping logs, the formatter can surface this in the stream logs
+        self.last_error = None
+
+        self._counter_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._stopping = threading.Event()
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="salesforce-log-shipper", daemon=True)
+        self._thread.start()
+
+        # make sure anything left on the queue gets out if the process exits without calling close()
+        atexit.register(self.close)
+
+    def enqueue(self, data: dict) -> bool:
+        """
+        Adds a log record (a dict of huit__Log__c field values) to the queue without blocking.
+        Returns False if the record was dropped.
+        """
+        if self._closed:
+            return False
+
+        try:
+            self.queue.put_nowait(data)
+        except queue.Full:
+            if self.overflow_policy == "drop_oldest":
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    self.queue.put_nowait(data)
+                except queue.Full:
+                    self._count_dropped(1)
+                    return False
+                self._count_dropped(1)
+            else:
+                self._count_dropped(1)
+                return False
+
+        if self.queue.qsize() >= self.batch_size:
+            self._flush_requested.set()
+        return True
+
+    def flush(self):
+        """
+        Sends everything currently on the queue. This is safe to call from any thread.
+        """
+        with self._flush_lock:
+            while True:
+                batch = []
+                while len(batch) < self.batch_size:
+                    try:
+                        batch.append(self.queue.get_nowait())
+                    except queue.Empty:
+                        break
+                if len(batch) == 0:
+                    break
+                self._send(batch)
+
+    def close(self, timeout=30):
+        """
+        Stops the worker thread after a final flush. Anything enqueued after this is dropped.
+        """
+        if self._closed:
+            return
+        self._closed = True
+
+        self._stopping.set()
+        self._flush_requested.set()
+        self._thread.join(timeout)
+
+        # anything that came in while the worker was finishing up
+        self.flush()
+
+        if self.dropped_count > 0:
+            self._send([{
+                "huit__Message__c": f"Dropped {self.dropped_count} log records because the log queue was full",
+                "huit__Source__c": "HUD",
+                "huit__Level__c": "WARNING",
+                "huit__RunId__c": None,
+                "huit__Datetime__c": None
+            }])
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._flush_requested.wait(timeout=self.flush_interval)
+            self._flush_requested.clear()
+            self.flush()
+
+    def _send(self, batch: list):
+        records = []
+        for data in batch:
+            record = {"attributes": {"type": self.log_object}}
+            record.update(data)
+            records.append(record)
+
+        payload = {
+            "allOrNone": False,
+            "records": records
+        }
+
+        try:
+            responses = self.hsf.sf.restful("composite/sobjects", method="POST", data=json.dumps(payload))
+        except Exception as e:
+            self.last_error = f"Logging failed for {len(batch)} records: {e}"
+            with self._counter_lock:
+                self.failed_count += len(batch)
+            return
+
+        shipped = 0
+        failed = 0
+        for response in responses or []:
+            if response.get('success'):
+                shipped += 1
+            else:
+                failed += 1
+                self.last_error = f"Logging failed: {response.get('errors')}"
+
+        with self._counter_lock:
+            self.shipped_count += shipped
+            self.failed_count += failed
+
+    def _count_dropped(self, count: int):
+        with self._counter_lock:
+            self.dropped_count += count
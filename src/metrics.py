@@ -0,0 +1,202 @@
+from common import logger, get_state_dir
+
+import os
+import json
+import math
+import threading
+import time
+
+
+class _Timer():
+    # times a with block and records it when the block is done
+    #   (set .records in the block for the number of records it handled)
+    __slots__ = ("metrics", "name", "labels", "records", "started")
+
+    def __init__(self, metrics, name: str, records: int, labels: dict):
+        self.metrics = metrics
+        self.name = name
+        self.labels = labels
+        self.records = records
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.metrics.observe(self.name, time.perf_counter() - self.started, records=self.records, **self.labels)
+        return False
+
+
+class _NullTimer():
+    # what timer() returns when the metrics are off, it does nothing
+    records = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_null_timer = _NullTimer()
+
+
+def percentile(values: list, percent: float) -> float:
+    # nearest rank percentile of already sorted values
+    if len(values) == 0:
+        return None
+    rank = max(1, math.ceil(percent / 100 * len(values)))
+    return values[rank - 1]
+
+
+class Metrics():
+    """
+    Timings (and other measurements) for finding out where the time goes in a run
+
+    Each measurement is a metric name, a value (seconds for timers), an optional number of records
+      and labels (like object or stage), for example:
+        with metrics.timer("transform", records=len(people)):
+            ...
+        metrics.observe("queue_depth", 2, stage="push")
+    Every measurement is written as a line of JSON to the file (METRICS_FILE, or STATE_DIR/metrics_<run id>.jsonl)
+      and summary() gives the count, total, and percentiles of each metric (by its labels) for the run
+
+    When it's off (the default), timer() returns a shared timer that does nothing and observe() returns right away,
+      so the instrumentation can stay in the hot paths
+    """
+    def __init__(self, enabled: bool=False, path: str=None, run_id: str=None):
+        self.enabled = enabled
+        self.path = path
+        self.run_id = run_id
+
+        # (name, labels) -> {"values": [...], "records": count}
+        self._series = {}
+        self._file = None
+        self._lock = threading.Lock()
+        self._accumulated = threading.local()
+
+    def timer(self, name: str, records: int=None, **labels):
+        if not self.enabled:
+            return _null_timer
+        return _Timer(self, name, records, labels)
+
+    def observe(self, name: str, value: float, records: int=None, **labels):
+        if not self.enabled:
+            return
+        event = {"ts": time.time(), "run_id": self.run_id, "metric": name, "value": value}
+        if records is not None:
+            event['records'] = records
+        event.update(labels)
+        line = json.dumps(event, default=str)
+
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"values": [], "records": 0}
+                self._series[key] = series
+            series['values'].append(value)
+            if records is not None:
+                series['records'] += records
+            self._write(line)
+
+    def accumulate(self, name: str, function):
+        """
+        Wraps a function that's called too often to record each call (like validate)
+          so its time adds up (per thread) until flush() records it as one measurement
+        """
+        if not self.enabled:
+            return function
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals = self._totals()
+                totals[name] = totals.get(name, 0.0) + time.perf_counter() - started
+        return timed
+
+    def flush(self, name: str, records: int=None, **labels):
+        # records the time accumulated (on this thread) since the last flush
+        if not self.enabled:
+            return
+        totals = self._totals()
+        self.observe(name, totals.pop(name, 0.0), records=records, **labels)
+
+    def summary(self) -> list:
+        """
+        Returns a summary of each metric (by its labels): count, total, mean, p50, p90, p99, max and records
+        """
+        with self._lock:
+            series = [(name, labels, sorted(data['values']), data['records']) for (name, labels), data in self._series.items()]
+
+        summaries = []
+        for (name, labels, values, records) in sorted(series, key=lambda item: (item[0], item[1])):
+            summary = {"metric": name}
+            summary.update(dict(labels))
+            summary.update({
+                "count": len(values),
+                "total": round(sum(values), 6),
+                "mean": round(sum(values) / len(values), 6),
+                "p50": round(percentile(values, 50), 6),
+                "p90": round(percentile(values, 90), 6),
+                "p99": round(percentile(values, 99), 6),
+                "max": round(values[-1], 6),
+                "records": records
+            })
+            summaries.append(summary)
+        return summaries
+
+    def reset(self):
+        # forgets the measurements so far (the file keeps them), so the next summary() is just what comes after
+        with self._lock:
+            self._series = {}
+        self._accumulated = threading.local()
+
+    def log_summary(self):
+        if not self.enabled:
+            return
+        for summary in self.summary():
+            labels = " ".join(f"{key}={value}" for key, value in summary.items() if key not in ["metric", "count", "total", "mean", "p50", "p90", "p99", "max", "records"])
+            logger.info(f"Metric {summary['metric']} {labels}: {summary['count']} times, total {summary['total']:.3f}, p50 {summary['p50']:.3f}, p90 {summary['p90']:.3f}, p99 {summary['p99']:.3f}, max {summary['max']:.3f}, {summary['records']} records")
+
+    def close(self):
+        """
+        Writes the run's summary to the file and closes it
+        """
+        if not self.enabled:
+            return
+        summary = self.summary()
+        with self._lock:
+            if len(summary) > 0:
+                self._write(json.dumps({"ts": time.time(), "run_id": self.run_id, "summary": summary}, default=str))
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+                logger.info(f"Metrics written to {self._filename()}")
+
+    def _totals(self) -> dict:
+        if not hasattr(self._accumulated, "totals"):
+            self._accumulated.totals = {}
+        return self._accumulated.totals
+
+    def _write(self, line: str):
+        # (with the lock held)
+        if self._file is None:
+            filename = self._filename()
+            directory = os.path.dirname(filename)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(filename, 'a')
+        self._file.write(line + "\n")
+
+    def _filename(self) -> str:
+        if self.path:
+            return self.path
+        return os.path.join(get_state_dir(), f"metrics_{self.run_id or 'run'}.jsonl")
+
+
+# there is one for the whole process, it's turned on with METRICS="True"
+metrics = Metrics(enabled=os.getenv("METRICS") == "True", path=os.getenv("METRICS_FILE") or None)
@@ -0,0 +1,267 @@
+from common import logger, get_state_dir
+from salesforce import HarvardSalesforce
+from transformer import SalesforceTransformer
+from salesforce_simulator import SalesforceSimulator, schema_from_config
+from pds_simulator import PersonGenerator, PDSSimulator
+
+import os
+import gc
+import copy
+import json
+import time
+import platform
+from datetime import datetime
+
+
+# a picklist for the microbenchmark's copy of the config (the example config doesn't have one)
+#   the object, the field and the field's config
+benchmark_picklist = ("HUDA__hud_Name__c", "HUDA__NAME_TYPE__c", {
+    "value": "names.personNameType.code",
+    "picklist": {
+        "Official": ["OFFICIAL"],
+        "Listing": ["LISTING"],
+        "Other": ["default"]
+    }
+})
+# the branched object for the branched (without its ref) and ref (with it) transforms
+benchmark_branched_object = "HUDA__hud_Name__c"
+
+
+class Microbenchmark():
+    """
+    Times the transformer's and the validator's hot paths on fixed synthetic fixtures:
+      the example config (plus a picklist), the example pds query and the same generated people every time (for the same seed)
+
+    Each case is run `repeat` times (with the garbage collector off, like timeit) and the best run is kept,
+      the result has the time per call and per record (person) in microseconds:
+        transform_flat: the Contact (flat, with `when`s on its branches)
+        transform_columns: the Contact, with the columnar transform (COLUMNAR_TRANSFORM)
+        transform_branched: the names without their Contact ref (and with the picklist)
+        transform_ref: the names with the Contact ref
+        transform_all: all of the pds objects
+        handle_when: the FirstName `when` (a list) and the Email `when` (single values) on each branch
+        picklist_transform: the (uncompiled) picklist lookup
+        key_in_nested_dict: each of the config's dotted references in each person
+        validate: every field of every transformed record
+    """
+    def __init__(self, people: int=500, seed: int=0, repeat: int=5):
+        self.people_count = people
+        self.seed = seed
+        self.repeat = repeat
+        self.setup()
+
+    def setup(self):
+        with open(_example_file('example_config.json')) as f:
+            config = json.load(f)
+        with open(_example_file('example_pds_query.json')) as f:
+            pds_query = json.load(f)
+
+        (object_name, field_name, field_config) = benchmark_picklist
+        config[object_name]['fields'][field_name] = field_config
+        self.config = config
+
+        salesforce = SalesforceSimulator(schema=schema_from_config(config), seed=self.seed, real_time=False)
+        self.hsf = HarvardSalesforce(domain="simulator", username="microbenchmark", password=None, sf=salesforce)
+        self.hsf.getTypeMap(list(config.keys()))
+        self.transformer = SalesforceTransformer(config=config, hsf=self.hsf)
+
+        # the people the pds query gives us (only the fields it asks for)
+        generator = PersonGenerator(population=self.people_count, seed=self.seed)
+        pds = PDSSimulator(generator=generator, batch_size=self.people_count)
+        self.people = pds.make_people(pds.search(pds_query)['results'])
+
+        pds_config = self.transformer.getSourceConfig('pds')
+        self.hashed_ids = {object_name: dict(ids) for object_name, ids in self.hsf.getUniqueIds(config=pds_config, source_data=self.people).items() if object_name in pds_config}
+
+        branched_config = copy.deepcopy(config[benchmark_branched_object])
+        branched_config['fields'] = {target: source for target, source in branched_config['fields'].items() if not (isinstance(source, dict) and 'ref' in source)}
+        self.branched_config = {benchmark_branched_object: branched_config}
+        self.ref_config = {benchmark_branched_object: config[benchmark_branched_object]}
+
+        # (when, branch name) for handle_when
+        contact_fields = config['Contact']['fields']
+        self.whens = [(contact_fields['FirstName']['when'], "names"), (contact_fields['Email']['when'], "emails")]
+
+        # the dotted references in the pds config for key_in_nested_dict
+        references = set()
+        for object_config in pds_config.values():
+            for source in object_config['fields'].values():
+                if isinstance(source, dict):
+                    source = source.get('value')
+                if isinstance(source, str) and "." in source:
+                    references.add(source)
+        self.references = sorted(references)
+
+        # every field of every transformed record, for validate
+        self.validations = []
+        for records in self._transform(source_name='pds').values():
+            for record in records:
+                object_name = next(iter(record))
+                for field, value in record[object_name].items():
+                    if isinstance(value, dict) or field not in self.hsf.type_data[object_name]:
+                        continue
+                    self.validations.append((object_name, field, value))
+
+    def _transform(self, **kwargs) -> dict:
+        # like SalesforcePersonUpdates.transform_people, but without the metrics
+        data = {}
+        for record in self.transformer.transform(source_data=self.people, hashed_ids=self.hashed_ids, **kwargs):
+            for object_name in record:
+                data.setdefault(object_name, []).append(record)
+        return data
+
+    def cases(self) -> list:
+        """
+        Returns the cases: (name, function, calls)
+        """
+        transformer = self.transformer
+        people = self.people
+
+        def handle_when():
+            for person in people:
+                for (when, branch_name) in self.whens:
+                    best_branch = None
+                    for branch in person[branch_name]:
+                        if transformer.handle_when(when, branch, best_branch):
+                            best_branch = branch
+        when_calls = sum(len(person[branch_name]) for person in people for (when, branch_name) in self.whens)
+
+        (object_name, field_name, field_config) = benchmark_picklist
+        picklist_values = [name.personNameType.code for person in people for name in person.names]
+
+        def picklist_transform():
+            for value in picklist_values:
+                transformer.picklist_transform(object_name, field_name, value)
+
+        def key_in_nested_dict():
+            for person in people:
+                for reference in self.references:
+                    transformer.key_in_nested_dict(reference, person)
+
+        def validate():
+            for (validate_object, field, value) in self.validations:
+                self.hsf.validate(object=validate_object, field=field, value=value, identifier=None)
+
+        return [
+            ("transform_flat", lambda: self._transform(target_object='Contact'), 1),
+            ("transform_columns", lambda: transformer.transform_columns(people, 'Contact'), 1),
+            ("transform_branched", lambda: self._transform(source_config=self.branched_config, source_name='pds'), 1),
+            ("transform_ref", lambda: self._transform(source_config=self.ref_config, source_name='pds'), 1),
+            ("transform_all", lambda: self._transform(source_name='pds'), 1),
+            ("handle_when", handle_when, when_calls),
+            ("picklist_transform", picklist_transform, len(picklist_values)),
+            ("key_in_nested_dict", key_in_nested_dict, len(people) * len(self.references)),
+            ("validate", validate, len(self.validations))
+        ]
+
+    def run(self, names: list=None) -> dict:
+        results = {
+            "started": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": self.seed,
+            "people": len(self.people),
+            "repeat": self.repeat,
+            "cases": []
+        }
+        for (name, function, calls) in self.cases():
+            if names and name not in names:
+                continue
+            seconds = _best_time(function, self.repeat)
+            results['cases'].append({
+                "name": name,
+                "calls": calls,
+                "records": len(self.people),
+                "seconds": round(seconds, 6),
+                "per_call_us": round(seconds / calls * 1e6, 3) if calls else None,
+                "per_record_us": round(seconds / len(self.people) * 1e6, 3) if len(self.people) else None
+            })
+        return results
+
+
+def compare_microbenchmarks(baseline: dict, results: dict, threshold: float=0.2) -> list:
+    """
+    Compares the time per call of each case to a baseline (earlier results)
+    A case that takes more than threshold (a fraction) longer per call than the baseline is a regression
+    """
+    baseline_times = {case['name']: case.get('per_call_us') for case in baseline.get('cases', [])}
+    comparisons = []
+    for case in results['cases']:
+        baseline_time = baseline_times.get(case['name'])
+        if not baseline_time or not case.get('per_call_us'):
+            continue
+        change = case['per_call_us'] / baseline_time - 1
+        comparisons.append({
+            "name": case['name'],
+            "per_call_us": case['per_call_us'],
+            "baseline_per_call_us": baseline_time,
+            "change": round(change, 3),
+            "regression": change > threshold
+        })
+    return comparisons
+
+
+def run_microbenchmark() -> dict:
+    """
+    The microbenchmark action, set up from the env (see the README)
+    Returns the results, with the comparison to the baseline if there is one
+    """
+    state_dir = get_state_dir()
+    names = [name.strip() for name in (os.getenv("MICROBENCHMARK_CASES") or "").split(",") if name.strip()]
+    baseline = os.getenv("MICROBENCHMARK_BASELINE") or os.path.join(state_dir, "microbenchmark_baseline.json")
+    threshold = float(os.getenv("MICROBENCHMARK_REGRESSION_THRESHOLD") or 0.2)
+
+    microbenchmark = Microbenchmark(
+        people=int(os.getenv("MICROBENCHMARK_PEOPLE") or 500),
+        seed=int(os.getenv("MICROBENCHMARK_SEED") or 0),
+        repeat=int(os.getenv("MICROBENCHMARK_REPEAT") or 5)
+    )
+    results = microbenchmark.run(names=names or None)
+    for case in results['cases']:
+        logger.info(f"Microbenchmark {case['name']}: {case['per_call_us']}us per call ({case['calls']} calls), {case['per_record_us']}us per record")
+
+    if os.path.exists(baseline):
+        with open(baseline) as f:
+            results['comparison'] = compare_microbenchmarks(json.load(f), results, threshold=threshold)
+        for comparison in results['comparison']:
+            if comparison['regression']:
+                logger.warning(f"Microbenchmark regression: {comparison['name']}: {comparison['per_call_us']}us per call, was {comparison['baseline_per_call_us']}us ({comparison['change']:+.0%})")
+    else:
+        logger.info(f"No microbenchmark baseline found ({baseline})")
+
+    output = os.getenv("MICROBENCHMARK_OUTPUT") or os.path.join(state_dir, f"microbenchmark_{datetime.now().strftime('%Y%m%d%H%M%S')}.json")
+    files = [output]
+    if os.getenv("MICROBENCHMARK_SAVE_BASELINE") == "True":
+        files.append(baseline)
+    for filename in files:
+        directory = os.path.dirname(filename)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(filename, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+        logger.info(f"Microbenchmark results written to {filename}")
+    return results
+
+
+def _best_time(function, repeat: int) -> float:
+    best = None
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i in range(max(1, repeat)):
+            started = time.perf_counter()
+            function()
+            seconds = time.perf_counter() - started
+            if best is None or seconds < best:
+                best = seconds
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return best
+
+
+def _example_file(name: str) -> str:
+    # the example files are in the root of the repo (the tests and the app run from src)
+    if os.path.exists(name):
+        return name
+    return os.path.join("..", name)
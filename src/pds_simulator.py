@@ -0,0 +1,663 @@
+from common import logger
+from salesforce_simulator import LatencyModel
+
+import json
+import queue
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from dotmap import DotMap
+
+
+FIRST_NAMES = ["Ada", "Alan", "Barbara", "Charles", "Claude", "Dorothy", "Edsger", "Frances", "Grace", "Guido", "Hedy", "Ivan", "Jean", "John", "Katherine", "Ken", "Linus", "Margaret", "Niklaus", "Radia", "Shafi", "Sophie", "Tim", "Vint", "Whitfield", "Yukihiro"]
+MIDDLE_NAMES = ["A", "B", "C", "D", "E", "J", "L", "M", "R", "S", None, None, None]
+LAST_NAMES = ["Allen", "Backus", "Borg", "Cerf", "Dijkstra", "Diffie", "Goldwasser", "Hamilton", "Hopper", "Johnson", "Kay", "Knuth", "Lamarr", "Liskov", "Lovelace", "McCarthy", "O'Neil", "Perlman", "Ritchie", "Sammet", "Shannon", "Thompson", "Turing", "van Rossum", "Wilson", "Wirth"]
+CITIES = [("Cambridge", "MA", "02138"), ("Boston", "MA", "02115"), ("Allston", "MA", "02134"), ("Somerville", "MA", "02143"), ("New York", "NY", "10001"), ("Chicago", "IL", "60601"), ("Seattle", "WA", "98101")]
+STREETS = ["Massachusetts Ave", "Oxford St", "Kirkland St", "Quincy St", "Brattle St", "Garden St", "Western Ave"]
+TITLES = ["Research Fellow", "Lecturer", "Professor", "Program Coordinator", "Software Engineer", "Visiting Scholar", "Administrator"]
+AFFILIATIONS = [("FAS", "Faculty of Arts and Sciences"), ("HMS", "Harvard Medical School"), ("HBS", "Harvard Business School"), ("SEAS", "School of Engineering and Applied Sciences"), ("HUIT", "Harvard University Information Technology")]
+
+
+class PDSSessionTimeout(Exception):
+    pass
+
+
+class PersonGenerator():
+    """
+    Makes synthetic PDS person documents (the shape of the PDS results) for load testing
+
+    A person is generated from their index (and the seed), so the same person is the same every time
+      and any part of a population can be made without the rest of it (a 1M person population isn't kept in memory)
+
+    population: the number of people
+    skew: the fraction of people with a lot of branch records (heavy_count names, emails, addresses, etc instead of 1-3)
+      real populations have a long tail of people with many roles and old addresses, and those are the slow ones
+    updated_fraction: the fraction of people with a cacheUpdateDate in the day before `now` (the rest are older),
+      so a person-updates watermark of a day ago picks up about that many
+    inactive_fraction: the fraction of people (and branch records) that aren't active (effectiveStatus I)
+    department_count: the number of departments the employee roles are spread over (hrDeptId)
+    """
+    def __init__(self, population: int=1000, seed: int=0, skew: float=0.05, heavy_count: int=12, updated_fraction: float=0.01, inactive_fraction: float=0.02, department_count: int=200, now: datetime=None):
+        self.population = population
+        self.seed = seed
+        self.skew = skew
+        self.heavy_count = heavy_count
+        self.updated_fraction = updated_fraction
+        self.inactive_fraction = inactive_fraction
+        self.department_count = department_count
+        self.now = now or datetime(2024, 6, 1)
+
+    def person_key(self, index: int) -> str:
+        return f"{self.seed % 65536:04x}{index:012x}"
+
+    def univid(self, index: int) -> str:
+        return f"{10000000 + index:08d}"
+
+    def department_id(self, number: int) -> str:
+        return f"{100000 + number:06d}"
+
+    def department_description(self, number: int) -> str:
+        return f"{AFFILIATIONS[number % len(AFFILIATIONS)][0]} Department {number}"
+
+    def department(self, number: int) -> dict:
+        # a department from the Person Reference API (the ones the employee roles are in)
+        rng = random.Random(self.seed * 1000003 - number - 1)
+        (affiliation_code, affiliation_description) = AFFILIATIONS[number % len(AFFILIATIONS)]
+        updated = self.now - timedelta(days=_randint(rng, 0, 3650))
+        return {
+            "hrDeptId": self.department_id(number),
+            "hrDeptDesc": f"{affiliation_code} Dept {number}",
+            "hrDeptLongDesc": f"{affiliation_description} Department {number}",
+            "hrDeptOfficialDesc": self.department_description(number),
+            "hrDeptShortDesc": f"{affiliation_code}{number}",
+            "effectiveStatus": self._status(rng),
+            "effectiveDate": self._date(rng, updated),
+            "estabId": f"{affiliation_code}00",
+            "facultyCode": affiliation_code,
+            "majAffiliation": {"code": affiliation_code, "description": affiliation_description},
+            "subAffiliation": {"code": f"{affiliation_code}_SUB", "description": f"{affiliation_description} (sub)"},
+            "updateSource": "HR",
+            "updateDate": updated.isoformat(timespec='seconds')
+        }
+
+    def index_of(self, field: str, value) -> int:
+        # the index of the person with this personKey (or univid), or None if it isn't one of ours
+        try:
+            if field == "personKey" and str(value)[0:4] == f"{self.seed % 65536:04x}":
+                index = int(str(value)[4:], 16)
+            elif field == "univid":
+                index = int(value) - 10000000
+            else:
+                return None
+        except ValueError:
+            return None
+        if 0 <= index < self.population:
+            return index
+        return None
+
+    def person(self, index: int) -> dict:
+        rng = random.Random(self.seed * 1000003 + index)
+        heavy = rng.random() < self.skew
+
+        first = _choice(rng, FIRST_NAMES)
+        last = _choice(rng, LAST_NAMES)
+        person_key = self.person_key(index)
+        netid = f"{first[0]}{last.replace(' ', '').replace(chr(39), '')[0:5]}{index}".lower()
+        updated = rng.random() < self.updated_fraction
+        if updated:
+            cache_update_date = self.now - timedelta(seconds=_randint(rng, 0, 86400))
+        else:
+            cache_update_date = self.now - timedelta(days=_randint(rng, 2, 3650), seconds=_randint(rng, 0, 86400))
+
+        person = {
+            "personKey": person_key,
+            "eppn": person_key.upper(),
+            "netid": netid,
+            "univid": self.univid(index),
+            "uuid": f"{index:08x}-{self.seed % 65536:04x}-4000-8000-{rng.getrandbits(48):012x}",
+            "effectiveStatus": self._status(rng),
+            "effectiveDate": self._date(rng, cache_update_date),
+            "deceasedFlag": False,
+            "privacyFerpaStatus": {"code": rng.random() < 0.05},
+            "privacyFerpaPastStudent": {"code": rng.random() < 0.02},
+            "privacyValue": {"code": _choice(rng, [1, 5, 5, 5, 10])},
+            "cacheUpdateDate": cache_update_date.isoformat(timespec='seconds'),
+            "pronouns": {"pronouns": _choice(rng, ["she/her", "he/him", "they/them", None, None])}
+        }
+
+        def count(low: int, high: int) -> int:
+            return self.heavy_count if heavy else _randint(rng, low, high)
+
+        names = []
+        for n in range(count(1, 3)):
+            names.append({
+                "personNameKey": index * 100 + n,
+                "firstName": first if n < 2 else _choice(rng, FIRST_NAMES),
+                "middleName": _choice(rng, MIDDLE_NAMES),
+                "lastName": last,
+                "personNameType": {"code": ["OFFICIAL", "LISTING"][n] if n < 2 else _choice(rng, ["PREFERRED", "FORMER", "ALIAS"])},
+                "prefix": None,
+                "suffix": _choice(rng, [None, None, None, "Jr.", "III"]),
+                "effectiveStatus": self._status(rng),
+                "effectiveDate": self._date(rng, cache_update_date),
+                "updateDate": self._update_date(rng, cache_update_date)
+            })
+        person['names'] = names
+
+        emails = []
+        for n in range(count(1, 3)):
+            domain = "harvard.edu" if n == 0 else _choice(rng, ["fas.harvard.edu", "hms.harvard.edu", "example.com"])
+            user_name = f"{first}_{last.replace(' ', '')}{'' if n == 0 else n}".lower()
+            emails.append({
+                "personEmailKey": index * 100 + n,
+                "email": f"{user_name}@{domain}",
+                # only the first one is official
+                "officialEmailIndicator": n == 0,
+                "effectiveStatus": self._status(rng),
+                "effectiveDate": self._date(rng, cache_update_date),
+                "emailAddressType": "OFFICIAL" if n == 0 else "PERSONAL",
+                "emailAddressSource": _choice(rng, ["HR", "SIS", "POI"]),
+                "emailDomainName": domain,
+                "emailUserName": user_name,
+                "privacyValue": {"code": _choice(rng, [1, 5, 10])},
+                "updateDate": self._update_date(rng, cache_update_date)
+            })
+        person['emails'] = emails
+
+        addresses = []
+        for n in range(count(0, 2)):
+            (city, state, postal_code) = _choice(rng, CITIES)
+            addresses.append({
+                "addressKey": index * 100 + n,
+                "addressMailRealmCode": _choice(rng, ["HOME", "WORK"]),
+                "addressCategory": {"code": _choice(rng, ["HOME", "OFFICE", "MAIL"])},
+                "addressCity": city,
+                "addressCountry": {"code": "US"},
+                "effectiveStatus": self._status(rng),
+                "effectiveDate": self._date(rng, cache_update_date),
+                "psLocation": {"code": f"{_randint(rng, 1, 999):03d}"},
+                "addressPostalCode": postal_code,
+                "privacyValue": {"code": _choice(rng, [1, 5, 10])},
+                "source": _choice(rng, ["HR", "SIS"]),
+                "addressState": state,
+                "addressStreet1": f"{_randint(rng, 1, 1999)} {_choice(rng, STREETS)}",
+                "addressStreet2": _choice(rng, [None, None, f"Apt {_randint(rng, 1, 40)}"]),
+                "addressStreet3": None,
+                "addrId": index * 100 + n,
+                "updateDate": self._update_date(rng, cache_update_date)
+            })
+        person['addresses'] = addresses
+
+        phones = []
+        for n in range(count(0, 2)):
+            phones.append({
+                "phoneKey": index * 100 + n,
+                "dataValue": f"617-{_randint(rng, 200, 999)}-{_randint(rng, 0, 9999):04d}",
+                "dataExtension": None,
+                "dataSubtype": _choice(rng, ["OFFICE", "MOBILE", "HOME"]),
+                "dataType": "PHONE",
+                "contactDirListingKey": index * 100 + n,
+                "effectiveStatus": self._status(rng),
+                "listingCategory": _choice(rng, ["PRIMARY", "SECONDARY"]),
+                "listingId": index * 100 + n,
+                "privacyValue": {"code": _choice(rng, [1, 5, 10])},
+                "updateDate": self._update_date(rng, cache_update_date)
+            })
+        person['phones'] = phones
+
+        locations = []
+        for n in range(count(0, 1)):
+            locations.append({
+                "personLocationKey": index * 100 + n,
+                "location": f"{_randint(rng, 1, 120)} {_choice(rng, STREETS)}, Room {_randint(rng, 100, 999)}",
+                "locationIdentifier": f"{_randint(rng, 1000, 9999)}",
+                "contactDirListingKey": index * 100 + n,
+                "effectiveStatus": self._status(rng),
+                "effectiveDate": self._date(rng, cache_update_date),
+                "listingCategory": "PRIMARY",
+                "listingId": index * 100 + n,
+                "locationType": {"code": "OFFICE"},
+                "privacyValue": {"code": _choice(rng, [1, 5, 10])},
+                "updateDate": self._update_date(rng, cache_update_date)
+            })
+        person['locations'] = locations
+
+        # most people have one kind of role, some have more
+        role_kinds = [kind for (kind, share) in [("employeeRoles", 0.6), ("studentRoles", 0.35), ("poiRoles", 0.15)] if rng.random() < share]
+        if len(role_kinds) == 0:
+            role_kinds = ["poiRoles"]
+        for (offset, kind) in [(0, "employeeRoles"), (40, "studentRoles"), (70, "poiRoles")]:
+            roles = []
+            if kind in role_kinds:
+                for n in range(count(1, 2)):
+                    roles.append(self._role(rng, kind, index * 100 + offset + n, n == 0, cache_update_date))
+            person[kind] = roles
+
+        return person
+
+    def people(self, start: int=0, end: int=None):
+        # yields the people from start up to (not including) end
+        end = self.population if end is None else min(end, self.population)
+        for index in range(start, end):
+            yield self.person(index)
+
+    def _role(self, rng: random.Random, kind: str, key: int, prime: bool, cache_update_date: datetime) -> dict:
+        start_date = cache_update_date - timedelta(days=_randint(rng, 30, 3650))
+        role = {
+            "personRoleKey": key,
+            "effectiveStatus": self._status(rng),
+            "effectiveDate": start_date.isoformat()[0:10],
+            "updateDate": self._update_date(rng, cache_update_date),
+            "privacyValue": {"code": _choice(rng, [1, 5, 10])},
+            "primeRoleIndicator": prime,
+            "roleStartDate": start_date.isoformat()[0:10],
+            "roleEndDate": (self.now + timedelta(days=_randint(rng, -365, 1460))).isoformat()[0:10],
+            "roleId": f"{kind[0:3].upper()}{key}",
+            "source": {"employeeRoles": "HR", "studentRoles": "SIS", "poiRoles": "POI"}[kind],
+            "roleTitle": _choice(rng, TITLES),
+            "roleType": {"code": {"employeeRoles": "EMPLOYEE", "studentRoles": "STUDENT", "poiRoles": "POI"}[kind]}
+        }
+        (affiliation_code, affiliation_description) = _choice(rng, AFFILIATIONS)
+        if kind == "employeeRoles":
+            department = _randint(rng, 0, self.department_count - 1)
+            role.update({
+                "hrDeptId": self.department_id(department),
+                "hrDeptOfficialDesc": self.department_description(department),
+                "academicPrimeRoleIndicator": prime and rng.random() < 0.3,
+                "supervisorId": self.univid(_randint(rng, 0, self.population - 1)),
+                "appointmentEndDate": None,
+                "departmentEntryDate": start_date.isoformat()[0:10],
+                "employmentClass": {"code": _choice(rng, ["S", "F", "T"])},
+                "employmentStatus": {"code": "A" if rng.random() >= self.inactive_fraction else "T"},
+                "hireDate": start_date.isoformat()[0:10],
+                "addressPeoplesoftLocation": {"code": f"{_randint(rng, 1, 999):03d}"},
+                "rehireDate": None,
+                "terminationDate": None,
+                "unionCode": _choice(rng, [None, "HUCTW", "SEIU"]),
+                "faculty": {"code": affiliation_code},
+                "fulltimeFlag": rng.random() < 0.8,
+                "majAffiliation": {"code": affiliation_code, "description": affiliation_description},
+                "paidFlag": True,
+                "subAffiliation": {"code": f"{affiliation_code}_SUB", "description": f"{affiliation_description} (sub)"}
+            })
+        elif kind == "studentRoles":
+            role.update({
+                "studentDepartment": {"code": affiliation_code},
+                "boardLocationHouse": {"code": None},
+                "boardStatus": {"code": _choice(rng, ["ON", "OFF"])},
+                "degree": {"code": _choice(rng, ["AB", "SM", "PHD", "MBA", "MD"])},
+                "graduationDate": (self.now + timedelta(days=_randint(rng, 0, 1460))).isoformat()[0:10],
+                "lastAttendanceDate": None,
+                "specialProgram": {"code": None},
+                "residentialHouse": {"code": _choice(rng, [None, "ADAMS", "LOWELL", "QUINCY"])},
+                "school": {"code": affiliation_code},
+                "studentStatus": {"code": "A"},
+                "studentTimeStatus": {"code": _choice(rng, ["F", "P"])},
+                "studentYear": {"code": str(_randint(rng, 1, 6))}
+            })
+        else:
+            role.update({
+                "comments": None,
+                "poiCompany": _choice(rng, [None, "Example Corp", "Affiliated Hospital"]),
+                "faculty": {"code": affiliation_code},
+                "shortDescriptionLine1": _choice(rng, TITLES),
+                "shortDescriptionLine2": None
+            })
+        return role
+
+    def _status(self, rng: random.Random) -> dict:
+        if rng.random() < self.inactive_fraction:
+            return {"code": "I", "description": "Inactive"}
+        return {"code": "A", "description": "Active"}
+
+    def _date(self, rng: random.Random, before: datetime) -> str:
+        return (before - timedelta(days=_randint(rng, 0, 3650))).isoformat()[0:10]
+
+    def _update_date(self, rng: random.Random, before: datetime) -> str:
+        # the person's cacheUpdateDate is when the most recent of these changed
+        return (before - timedelta(days=_randint(rng, 0, 365), seconds=_randint(rng, 0, 86400))).isoformat(timespec='seconds')
+
+
+class ReferenceSimulator():
+    """
+    A stand-in for the Person Reference API client (PersonReference), with the generator's departments
+    department_count: the number of departments (default: the generator's department_count)
+    """
+    def __init__(self, generator: PersonGenerator=None, department_count: int=None):
+        self.generator = generator or PersonGenerator()
+        self.department_count = department_count or self.generator.department_count
+        self.calls = Counter()
+
+    def getDepartments(self) -> list:
+        self.calls['departments'] += 1
+        return [self.generator.department(number) for number in range(self.department_count)]
+
+    def getMajorAffiliations(self) -> list:
+        self.calls['major_affiliations'] += 1
+        return [{"code": code, "description": description} for (code, description) in AFFILIATIONS]
+
+    def getSubAffiliations(self) -> list:
+        self.calls['sub_affiliations'] += 1
+        return [{"code": f"{code}_SUB", "description": f"{description} (sub)", "majAffiliation": {"code": code}} for (code, description) in AFFILIATIONS]
+
+    def getSchools(self) -> list:
+        self.calls['schools'] += 1
+        return [{"code": code, "description": description} for (code, description) in AFFILIATIONS]
+
+    def getUnits(self) -> list:
+        self.calls['units'] += 1
+        return [{"code": code, "description": description} for (code, description) in AFFILIATIONS]
+
+
+class PDSSimulator():
+    """
+    An in-process stand-in for the PDS client (pds.People) for load testing without the PDS
+
+    It serves the people from a PersonGenerator through the same calls the app makes:
+      search(query), start_pagination(query, type, wait), next_page_results(), wait_for_pagination(),
+      result_queue, results, total_count, batch_size, max_backlog, make_people(results) and get_people(query)
+    The query's fields pick what's in each result (the same way as the PDS, `names.firstName` is just that field of each name)
+      and its conditions filter the people (top level fields) and their branch records (`names.effectiveStatus.code`),
+      with lists of values, {"value": [...], "exclude": True}, ">"/"<" comparisons (">now"), `not_required` and `or`
+
+    Problems can be injected to reproduce what happens in a long load:
+      page_latency: how long each page takes (see LatencyModel), it sleeps when real_time, otherwise it's added to simulated_seconds
+      session_timeout: the pagination session expires after this many seconds between pages
+      session_timeout_pages: the pagination session expires when getting these page numbers (1 is the first page)
+      total_count_drift: {page number: change} the total_count changes by this much after getting that page
+        (like people being added or removed while paginating)
+    When the session expires, the pagination stops (next_page_results returns [] from then on) and pagination_error is set
+    calls counts the calls made (search, page)
+    """
+    def __init__(self, generator: PersonGenerator=None, apikey: str=None, batch_size: int=500, max_backlog: int=50000, page_latency: LatencyModel=None, real_time: bool=True, session_timeout: float=None, session_timeout_pages: list=None, total_count_drift: dict=None):
+        self.generator = generator or PersonGenerator()
+        self.apikey = apikey
+        self.batch_size = batch_size
+        self.max_backlog = max_backlog
+        self.page_latency = page_latency or LatencyModel()
+        self.real_time = real_time
+        self.session_timeout = session_timeout
+        self.session_timeout_pages = session_timeout_pages or []
+        self.total_count_drift = total_count_drift or {}
+
+        self.result_queue = queue.Queue()
+        self.results = []
+        self.total_count = 0
+        self.count = 0
+        self.is_paginating = False
+        self.pagination_error = None
+
+        self.calls = Counter()
+        self.simulated_seconds = 0.0
+        self._rng = random.Random(self.generator.seed)
+        self._lock = threading.Lock()
+        self._pagination_thread = None
+        # the conditions (as json) -> the indexes of the people who match them
+        self._matching = {}
+        self._stop = threading.Event()
+
+    # ---- the pds.People calls ---------------------------------------------------------
+
+    def search(self, query: dict, paginate: bool=False) -> dict:
+        """
+        Returns the first page (batch_size) of people matching the query, like the PDS:
+          {"count": ..., "total_count": ..., "results": [...]}
+        """
+        self._wait(1)
+        with self._lock:
+            self.calls['search'] += 1
+        matching = self._matching_indexes(query)
+        results = self._page(matching[0:self.batch_size], query)
+        with self._lock:
+            self.calls['results'] += len(results)
+        return {"count": len(results), "total_count": len(matching), "results": results}
+
+    def start_pagination(self, query: dict, type: str="queue", wait: bool=False):
+        """
+        Starts paging through the people matching the query in the background
+          type queue: each page (a list of people) is put on the result_queue for next_page_results()
+          type list: the people are added to results
+        """
+        self.wait_for_pagination()
+        self._stop.clear()
+        self.result_queue = queue.Queue()
+        self.results = []
+        self.count = 0
+        self.pagination_error = None
+
+        matching = self._matching_indexes(query)
+        self.total_count = len(matching)
+        self.is_paginating = True
+
+        self._pagination_thread = threading.Thread(target=self._paginate, args=(query, matching, type), name="pds-simulator", daemon=True)
+        self._pagination_thread.start()
+        if wait:
+            self.wait_for_pagination()
+
+    def next_page_results(self) -> list:
+        # the next page of results, or [] once the pagination is done
+        while True:
+            try:
+                return self.result_queue.get(timeout=0.1)
+            except queue.Empty:
+                if not self.is_paginating and self.result_queue.empty():
+                    return []
+
+    def wait_for_pagination(self):
+        while self._pagination_thread is not None and self._pagination_thread.is_alive():
+            if self.result_queue.qsize() * self.batch_size >= self.max_backlog:
+                # nobody is going to take the pages it's waiting to add
+                self._stop.set()
+            self._pagination_thread.join(0.1)
+
+    def stop_pagination(self):
+        self._stop.set()
+        self.wait_for_pagination()
+
+    def make_people(self, results: list) -> list:
+        return [DotMap(result) for result in results]
+
+    def get_people(self, query: dict) -> list:
+        return self.make_people(self.search(query)['results'])
+
+    # ---- internals ----------------------------------------------------------------------
+
+    def _paginate(self, query: dict, matching: list, type: str):
+        page_number = 0
+        last_page = time.monotonic()
+        simulated_idle = 0.0
+        try:
+            for start in range(0, len(matching), self.batch_size):
+                # the PDS stops paginating while the backlog is full
+                while type == "queue" and self.result_queue.qsize() * self.batch_size >= self.max_backlog:
+                    if self._stop.wait(0.05):
+                        return
+
+                if self._stop.is_set():
+                    return
+                page_number += 1
+                indexes = matching[start:start + self.batch_size]
+
+                idle = time.monotonic() - last_page + simulated_idle
+                if page_number in self.session_timeout_pages or (self.session_timeout is not None and page_number > 1 and idle > self.session_timeout):
+                    raise PDSSessionTimeout(f"PDS pagination session expired on page {page_number} ({self.count}/{self.total_count})")
+
+                simulated_idle = self._wait(len(indexes))
+                page = self._page(indexes, query)
+                with self._lock:
+                    self.calls['page'] += 1
+                    self.calls['results'] += len(page)
+                last_page = time.monotonic()
+
+                self.count += len(page)
+                if page_number in self.total_count_drift:
+                    self.total_count += self.total_count_drift[page_number]
+
+                if type == "list":
+                    self.results.extend(page)
+                else:
+                    self.result_queue.put(page)
+        except Exception as e:
+            logger.error(f"PDS simulator pagination failed: {e}")
+            self.pagination_error = e
+        finally:
+            self.is_paginating = False
+
+    def _wait(self, record_count: int) -> float:
+        seconds = self.page_latency.seconds(record_count, self._rng)
+        with self._lock:
+            self.simulated_seconds += seconds
+        if self.real_time and seconds > 0:
+            time.sleep(seconds)
+            return 0.0
+        return seconds
+
+    def _page(self, indexes: list, query: dict) -> list:
+        # the results for these people (only the fields asked for, and only the branch records that match)
+        conditions = self._conditions(query)
+        fields = (query or {}).get('fields')
+        tree = _field_tree(fields) if fields else True
+        return [_project(self._filter_branches(self.generator.person(index), conditions), tree) for index in indexes]
+
+    def _matching_indexes(self, query: dict) -> list:
+        # counting the matching people means making each of them, so the matches are kept for the next time
+        key = json.dumps((query or {}).get('conditions'), sort_keys=True, default=str)
+        conditions = self._conditions(query)
+        with self._lock:
+            if key in self._matching:
+                return self._matching[key]
+        matching = self._find_matching_indexes(conditions)
+        with self._lock:
+            self._matching[key] = matching
+        return matching
+
+    def _find_matching_indexes(self, conditions: list) -> list:
+        # a list of personKeys (or univids) only has to look at those people
+        indexes = range(self.generator.population)
+        for (field, value) in conditions:
+            if field in ["personKey", "univid"] and isinstance(value, frozenset):
+                indexes = sorted({self.generator.index_of(field, item) for item in value} - {None})
+                break
+        if len(conditions) == 0:
+            return list(indexes)
+        return [index for index in indexes if self._matches(self.generator.person(index), conditions)]
+
+    def _conditions(self, query: dict) -> list:
+        # the conditions as (field, value) pairs, from either a dict or a list of single key dicts
+        #   (with the lists of values as sets, they can be thousands of ids long)
+        conditions = (query or {}).get('conditions') or {}
+        if isinstance(conditions, list):
+            pairs = []
+            for condition in conditions:
+                pairs.extend(condition.items())
+        else:
+            pairs = list(conditions.items())
+        return [(field, value if field == "not_required" else _compiled(value)) for (field, value) in pairs]
+
+    def _matches(self, person: dict, conditions: list) -> bool:
+        not_required = []
+        for (field, value) in conditions:
+            if field == "not_required":
+                not_required.extend(value)
+        for (field, value) in conditions:
+            if field == "not_required":
+                continue
+            if field == "or":
+                if not any(self._matches(person, alternative + [("not_required", not_required)]) for alternative in value):
+                    return False
+                continue
+            branch = field.split(".")[0]
+            if isinstance(person.get(branch), list):
+                entries = [entry for entry in person[branch] if _matches_value(_value_at(entry, field.split(".")[1:]), value, self.generator.now)]
+                # a branch with no matching records rules the person out (unless it's not required)
+                if len(entries) == 0 and branch not in not_required:
+                    return False
+            elif not _matches_value(_value_at(person, field.split(".")), value, self.generator.now):
+                return False
+        return True
+
+    def _filter_branches(self, person: dict, conditions: list) -> dict:
+        # the branch records that don't match the conditions on their branch aren't returned
+        for (field, value) in conditions:
+            branch = field.split(".")[0]
+            if field in ["not_required", "or"] or not isinstance(person.get(branch), list):
+                continue
+            person[branch] = [entry for entry in person[branch] if _matches_value(_value_at(entry, field.split(".")[1:]), value, self.generator.now)]
+        return person
+
+
+
+# these are faster than random's choice and randint (which make sure every value is exactly as likely),
+#   and there are a lot of them for a million people
+def _choice(rng: random.Random, values: list):
+    return values[int(rng.random() * len(values))]
+
+
+def _randint(rng: random.Random, low: int, high: int) -> int:
+    return low + int(rng.random() * (high - low + 1))
+
+
+def _compiled(value):
+    if isinstance(value, list):
+        if all(isinstance(item, dict) for item in value) and len(value) > 0:
+            # the alternatives of an "or"
+            return [[(field, _compiled(item_value)) for field, item_value in item.items()] for item in value]
+        return frozenset(value)
+    if isinstance(value, dict) and 'value' in value:
+        return dict(value, value=_compiled(value['value']))
+    return value
+
+
+def _field_tree(fields: list) -> dict:
+    # ["names.firstName", "personKey"] -> {"names": {"firstName": True}, "personKey": True}
+    tree = {}
+    for field in fields:
+        node = tree
+        pieces = field.split(".")
+        for piece in pieces[:-1]:
+            if node.get(piece) is True:
+                break
+            node = node.setdefault(piece, {})
+        else:
+            node[pieces[-1]] = True
+    return tree
+
+
+def _project(value, tree):
+    if tree is True:
+        return value
+    if isinstance(value, list):
+        return [_project(entry, tree) for entry in value]
+    if isinstance(value, dict):
+        return {key: _project(value[key], subtree) for key, subtree in tree.items() if key in value}
+    return value
+
+
+def _value_at(value, pieces: list):
+    for piece in pieces:
+        if not isinstance(value, dict):
+            return None
+        value = value.get(piece)
+    return value
+
+
+def _matches_value(value, condition, now: datetime) -> bool:
+    if isinstance(condition, dict) and 'value' in condition:
+        matches = _matches_value(value, condition['value'], now)
+        return not matches if condition.get('exclude') else matches
+    if isinstance(condition, frozenset):
+        try:
+            return value in condition
+        except TypeError:
+            # (not a plain value)
+            return False
+    if isinstance(condition, str) and condition[0:1] in [">", "<"]:
+        comparison = condition[1:]
+        if comparison == "now":
+            comparison = now.isoformat()[0:10]
+        if value is None:
+            return False
+        return str(value) > comparison if condition[0] == ">" else str(value) < comparison
+    return value == condition
@@ -0,0 +1,154 @@
+from common import logger
+from metrics import metrics
+
+import queue
+import threading
+
+
+# marks the end of the stream as it moves through the stages
+_END_OF_STREAM = object()
+
+
+class PipelineStage():
+    def __init__(self, name: str, handler, workers: int=1, queue_size: int=2):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        # the queue feeding this stage, the bound on this queue is what gives us backpressure
+        self.input = queue.Queue(maxsize=queue_size)
+        self.threads = []
+        self.finished_workers = 0
+        self.processed_count = 0
+        self.lock = threading.Lock()
+
+
+class Pipeline():
+    """
+    A staged streaming pipeline where each stage runs on its own worker thread(s)
+      and the stages are joined by bounded queues.
+
+    When a slow stage's queue fills up, the stage in front of it blocks on put(),
+      and that continues back to the source, so the source is only read as fast as the slowest stage can keep up.
+      The number of items in flight is bounded by the queue sizes plus the number of workers.
+
+    Each stage's handler takes an item and returns the item for the next stage (returning None drops it).
+    The first exception in any stage (or the source) stops the pipeline and is re-raised by run().
+    """
+    def __init__(self, name: str="pipeline"):
+        self.name = name
+        self.stages = []
+        self._aborted = threading.Event()
+        self._finished = threading.Event()
+        self._exception = None
+        self._exception_lock = threading.Lock()
+
+    def add_stage(self, name: str, handler, workers: int=1, queue_size: int=2):
+        self.stages.append(PipelineStage(name=name, handler=handler, workers=workers, queue_size=queue_size))
+        return self
+
+    def queue_depths(self) -> dict:
+        return {stage.name: stage.input.qsize() for stage in self.stages}
+
+    def run(self, source, timeout: float=None):
+        """
+        Feeds every item from the source (any iterable, usually a generator) through the stages
+        This blocks until the last stage has finished with the last item
+        timeout: the max number of seconds to wait for the stages to finish after the source is exhausted
+        """
+        if len(self.stages) == 0:
+            raise Exception(f"Error: pipeline {self.name} has no stages")
+
+        for index, stage in enumerate(self.stages):
+            for worker in range(stage.workers):
+                thread = threading.Thread(target=self._work, args=(index,), name=f"{self.name}-{stage.name}-{worker}", daemon=True)
+                thread.start()
+                stage.threads.append(thread)
+
+        try:
+            for item in source:
+                if not self._put(self.stages[0].input, item):
+                    break
+        except Exception as e:
+            self._fail(e)
+
+        self._put(self.stages[0].input, _END_OF_STREAM)
+
+        if not self._finished.wait(timeout):
+            self._fail(TimeoutError(f"Pipeline {self.name} did not finish within {timeout} seconds"))
+
+        if self._exception is not None:
+            raise self._exception
+
+        for stage in self.stages:
+            for thread in stage.threads:
+                thread.join()
+
+    def _work(self, index: int):
+        stage = self.stages[index]
+        next_queue = None
+        if index + 1 < len(self.stages):
+            next_queue = self.stages[index + 1].input
+
+        while True:
+            item = self._get(stage.input)
+            if item is None:
+                # the pipeline was stopped
+                return
+
+            if item is _END_OF_STREAM:
+                with stage.lock:
+                    stage.finished_workers += 1
+                    last_worker = stage.finished_workers == stage.workers
+                if not last_worker:
+                    # pass it along to the other workers on this stage
+                    self._put(stage.input, _END_OF_STREAM)
+                elif next_queue is not None:
+                    self._put(next_queue, _END_OF_STREAM)
+                else:
+                    self._finished.set()
+                return
+
+            if metrics.enabled:
+                # how many items were waiting behind this one
+                metrics.observe("queue_depth", stage.input.qsize(), pipeline=self.name, stage=stage.name)
+
+            try:
+                with metrics.timer("stage", pipeline=self.name, stage=stage.name):
+                    result = stage.handler(item)
+            except Exception as e:
+                logger.error(f"Error in {self.name} stage {stage.name}: {e}")
+                self._fail(e)
+                return
+
+            with stage.lock:
+                stage.processed_count += 1
+
+            if next_queue is not None and result is not None:
+                if not self._put(next_queue, result):
+                    return
+
+    def _fail(self, exception: Exception):
+        with self._exception_lock:
+            if self._exception is None:
+                self._exception = exception
+        self._aborted.set()
+        self._finished.set()
+
+    # put/get wake up every so often to see if the pipeline has been stopped,
+    #   otherwise a stage blocked on a full (or empty) queue would never notice that another stage failed
+    def _put(self, stage_queue: queue.Queue, item) -> bool:
+        while not self._aborted.is_set():
+            try:
+                stage_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, stage_queue: queue.Queue):
+        while not self._aborted.is_set():
+            try:
+                return stage_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+        return None
@@ -0,0 +1,147 @@
+from common import logger
+
+import copy
+
+
+# PDS_FIELD_PROJECTION modes
+projection_modes = ["off", "warn", "rewrite", "strict"]
+
+
+def plan_pds_fields(config: dict, source_name: str="pds") -> list:
+    """
+    Walks the transformation config and returns the PDS fields the transform needs for the source's objects
+      - the source ids (`Id`)
+      - the value references of the `fields` (including picklist values)
+      - the `when` references (a reference without the branch name is on the branch of the field's value)
+      - the `ref.source_value_ref`s
+      - `<branch>.updateDate` for flat fields on a branch (the latest matching branch is used)
+    `sf.*` references (deprecated) and static values don't come from the PDS
+    The fields are in the order they're first referenced
+    """
+    fields = []
+    def add(reference):
+        if isinstance(reference, str) and len(reference) > 0 and reference.split(".")[0] != 'sf' and reference not in fields:
+            fields.append(reference)
+
+    objects = {object_name: object_config for object_name, object_config in config.items() if object_config.get('source') == source_name}
+
+    # the branches (lists on the person) are what the branched objects are keyed on and what the `when`s pick from
+    branches = set()
+    for object_config in objects.values():
+        for field_source in object_config.get('fields', {}).values():
+            if isinstance(field_source, dict) and isinstance(field_source.get('when'), dict):
+                for values in _value_references(field_source):
+                    if "." in values:
+                        branches.add(values.split(".")[0])
+        if not object_config.get('flat'):
+            for source_id in _listify(object_config['Id'].get('source', object_config['Id'].get(source_name))):
+                if isinstance(source_id, str) and "." in source_id:
+                    branches.add(source_id.split(".")[0])
+
+    for object_config in objects.values():
+        for source_id in _listify(object_config['Id'].get('source', object_config['Id'].get(source_name))):
+            add(source_id)
+
+        for field_source in object_config.get('fields', {}).values():
+            if not field_source:
+                continue
+            if isinstance(field_source, dict) and field_source.get('static') == True:
+                continue
+            if isinstance(field_source, dict) and 'ref' in field_source:
+                for source_value_ref in _listify(field_source['ref'].get('source_value_ref')):
+                    add(source_value_ref)
+                continue
+
+            value_references = _value_references(field_source)
+            for value_reference in value_references:
+                add(value_reference)
+                first = value_reference.split(".")[0]
+                if object_config.get('flat') and first in branches and "." in value_reference:
+                    add(f"{first}.updateDate")
+
+            if isinstance(field_source, dict) and isinstance(field_source.get('when'), dict):
+                value_firsts = [value_reference.split(".")[0] for value_reference in value_references if "." in value_reference]
+                for when_reference in field_source['when'].keys():
+                    if when_reference.split(".")[0] in value_firsts or len(value_firsts) == 0:
+                        add(when_reference)
+                    else:
+                        for first in value_firsts:
+                            add(f"{first}.{when_reference}")
+
+    return fields
+
+
+def compare_pds_fields(planned: list, fields: list) -> tuple:
+    """
+    Compares the planned fields with a (hand maintained) list of fields
+    Returns (missing, extra):
+      - missing: planned fields that aren't in the list (or under a field in the list, like `effectiveStatus` for `effectiveStatus.code`)
+      - extra: fields in the list that none of the planned fields need
+    """
+    missing = [field for field in planned if not any(_covers(listed, field) for listed in fields)]
+    extra = [listed for listed in fields if not any(_covers(listed, field) or _covers(field, listed) for field in planned)]
+    return (missing, extra)
+
+
+def project_pds_query(pds_query: dict, config: dict, mode: str="warn", source_name: str="pds", keep: list=[]) -> dict:
+    """
+    Checks (and with rewrite, replaces) the pds_query's fields against what the config needs
+      - warn: logs the fields the query has that aren't needed (and the ones it's missing)
+      - rewrite: returns a copy of the query with just the fields that are needed
+      - strict: raises an exception if the query has fields that aren't needed or is missing some
+    keep (optional) are fields to always ask for, even if the config doesn't use them
+    Missing fields are always a warning, the transform would fail without them
+    """
+    if mode not in projection_modes:
+        raise ValueError(f"Error: unknown PDS field projection mode: {mode} (should be one of {projection_modes})")
+    if mode == "off" or pds_query is None:
+        return pds_query
+
+    planned = plan_pds_fields(config, source_name=source_name)
+    for field in keep:
+        if field not in planned:
+            planned.append(field)
+    fields = pds_query.get('fields') or []
+    (missing, extra) = compare_pds_fields(planned, fields)
+
+    if len(missing) > 0:
+        logger.warning(f"Warning: the pds_query fields are missing fields the config uses: {missing}")
+    if len(extra) > 0:
+        if mode == "rewrite":
+            # (they're taken out of the query, so that's not a problem)
+            logger.info(f"The pds_query has {len(extra)} fields the config doesn't use: {extra}")
+        else:
+            logger.warning(f"Warning: the pds_query has {len(extra)} fields the config doesn't use: {extra}")
+
+    if mode == "strict" and (len(missing) > 0 or len(extra) > 0):
+        raise Exception(f"Error: the pds_query fields don't match the config (missing: {missing}, not used: {extra})")
+
+    if mode == "rewrite":
+        pds_query = copy.deepcopy(pds_query)
+        pds_query['fields'] = planned
+        logger.info(f"Projected the pds_query to {len(planned)} fields (from {len(fields)})")
+
+    return pds_query
+
+
+def _covers(listed: str, field: str) -> bool:
+    # asking for `listed` gets you `field` (it's the same field or the field is under it)
+    return field == listed or field.startswith(listed + ".")
+
+
+def _listify(value) -> list:
+    if value is None:
+        return []
+    if isinstance(value, list):
+        return value
+    return [value]
+
+
+def _value_references(field_source) -> list:
+    if isinstance(field_source, str):
+        return [field_source]
+    if isinstance(field_source, list):
+        return [value for value in field_source if isinstance(value, str)]
+    if isinstance(field_source, dict):
+        return [value for value in _listify(field_source.get('value')) if isinstance(value, str)]
+    return []
@@ -0,0 +1,152 @@
+from common import logger
+
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class IdReconciler():
+    """
+    Finds the Salesforce external ids that are no longer in the PDS results (for cleanup_updateds)
+
+    Each object's ids are kept in a set, so checking off an id found in the PDS results is O(1)
+      (instead of `in` and `remove()` on a list, which is O(n) for each id)
+    The number of ids we started with is kept too, so the sanity check doesn't have to get them all again
+    """
+    def __init__(self):
+        # object name -> set of external ids that haven't been found in the PDS results (yet)
+        self.remaining_ids = {}
+        # object name -> number of external ids we started with
+        self.starting_counts = {}
+        # (pds field, object name, branch, sub id) for each of the pds id fields
+        self.fields = []
+
+    def add_object(self, object_name: str, ids: list):
+        self.remaining_ids[object_name] = set(ids)
+        self.starting_counts[object_name] = len(self.remaining_ids[object_name])
+
+    def add_field(self, pds_field: str, object_name: str):
+        # pds fields are things like personKey or names.personNameKey
+        if '.' in pds_field:
+            (branch, sub_id) = pds_field.split('.')[0:2]
+        else:
+            branch = None
+            sub_id = pds_field
+        self.fields.append((pds_field, object_name, branch, sub_id))
+
+    def reconcile(self, people: list) -> int:
+        """
+        Checks off the ids in this page of PDS results
+        Returns the number of ids that were found
+        """
+        found = 0
+        for person in people:
+            for (pds_field, object_name, branch, sub_id) in self.fields:
+                remaining_ids = self.remaining_ids.get(object_name)
+                if remaining_ids is None:
+                    continue
+
+                if branch:
+                    # if the branch of this id isn't in the results for this person, skip it
+                    if branch not in person.keys():
+                        continue
+                    for b in person[branch]:
+                        # if the sub_id of this id isn't in the results for this person, skip it (not really sure this can happen)
+                        if sub_id not in b.keys():
+                            continue
+                        sub_id_value = str(b[sub_id])
+                        if sub_id_value in remaining_ids:
+                            remaining_ids.discard(sub_id_value)
+                            found += 1
+                else:
+                    if sub_id not in person.keys():
+                        continue
+                    if person[sub_id] in remaining_ids:
+                        remaining_ids.discard(person[sub_id])
+                        found += 1
+        return found
+
+    def remaining(self, object_name: str) -> list:
+        # sorted so the flag batches are the same from run to run
+        return sorted(self.remaining_ids[object_name], key=str)
+
+    def remaining_count(self, object_name: str) -> int:
+        return len(self.remaining_ids[object_name])
+
+    def starting_count(self, object_name: str) -> int:
+        return self.starting_counts[object_name]
+
+    def log_summary(self):
+        for object_name, remaining_ids in self.remaining_ids.items():
+            logger.info(f"{object_name}: {self.starting_counts[object_name] - len(remaining_ids)}/{self.starting_counts[object_name]} ids found in PDS")
+
+
+def lookup_with_retries(lookup, chunk, retries: int=3, backoff: float=2):
+    """
+    Calls lookup(chunk), retrying up to retries times with an exponential backoff (with jitter) between tries
+    """
+    attempt = 0
+    while True:
+        try:
+            return lookup(chunk)
+        except Exception as e:
+            if attempt >= retries:
+                raise e
+            wait_time = backoff * (2 ** attempt) * (0.5 + random.random() / 2)
+            attempt += 1
+            logger.warning(f"Warning: lookup failed ({e}), retry {attempt}/{retries} in {wait_time:.1f}s")
+            time.sleep(wait_time)
+
+
+def run_lookups(lookup, chunks: list, on_result, worker_count: int=1, ordered: bool=False, retries: int=3, backoff: float=2) -> int:
+    """
+    Runs lookup(chunk) for each chunk on worker_count threads and calls on_result(index, result) for each one
+    on_result is always called from this (the calling) thread, so it doesn't need to be thread safe
+      - ordered: results are handed to on_result in chunk order
+      - unordered: results are handed to on_result as soon as they come in
+    Only a few chunks are ever in flight (or waiting to be handed over in order), so memory stays flat
+    A chunk that still fails after its retries raises here (the chunks that haven't started are cancelled)
+
+    Returns the number of chunks looked up
+    """
+    if worker_count <= 1:
+        for index, chunk in enumerate(chunks):
+            on_result(index, lookup_with_retries(lookup, chunk, retries=retries, backoff=backoff))
+        return len(chunks)
+
+    # how far ahead of the next chunk to hand over we let the workers get (when ordered)
+    window = worker_count * 2
+    finished = {}
+    next_index = 0
+    next_to_submit = 0
+    futures = {}
+
+    with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="lookup") as executor:
+        try:
+            while next_index < len(chunks):
+                # keep the workers busy
+                while next_to_submit < len(chunks) and len(futures) < worker_count and (not ordered or next_to_submit < next_index + window):
+                    future = executor.submit(lookup_with_retries, lookup, chunks[next_to_submit], retries=retries, backoff=backoff)
+                    futures[future] = next_to_submit
+                    next_to_submit += 1
+
+                done, _ = wait(futures.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index = futures.pop(future)
+                    result = future.result()
+                    if ordered:
+                        finished[index] = result
+                    else:
+                        on_result(index, result)
+                        next_index += 1
+
+                if ordered:
+                    while next_index in finished:
+                        on_result(next_index, finished.pop(next_index))
+                        next_index += 1
+        except Exception as e:
+            for future in futures:
+                future.cancel()
+            raise e
+
+    return len(chunks)
@@ -10,24 +10,43 @@ import psutil
 
 
 from common import logger
+from bulk_governor import bulk_job_governor
+from bulk2 import Bulk2Ingest
+from describe_cache import DescribeCache
+from metrics import metrics
+from field_validators import build_validator, build_column_validator
 logging.getLogger("simple_salesforce").setLevel(logging.WARNING)
 
 class HarvardSalesforce:
     # initailize by connecting to salesforce
-    def __init__(self, domain, username, password, consumer_key=None, consumer_secret=None, token=None):
+    # sf: an already connected simple_salesforce (or a SalesforceSimulator), instead of logging in
+    def __init__(self, domain, username, password, consumer_key=None, consumer_secret=None, token=None, sf=None):
         self.domain = domain
         self.username = username
         # list of job references
         self.jobs = []
         self.unique_ids = {}
 
+        # an (optional) IdIndex that getUniqueIds will use instead of querying for the ids
+        self.id_index = None
+
+        # (optional) RecordFingerprints of the records pushed, so unchanged records can be skipped
+        self.fingerprints = None
+
+        # object name -> Bulk API version (from the config's bulkApiVersion), objects not in here use the classic Bulk API (1)
+        self.bulk_api_versions = {}
+        self._bulk2 = None
+
         # set of unresolved errors encountered
         self.errors = {}
         self.error_count = 0
 
         try: 
             logger.debug(f"Salesforce initializing to {self.domain} as {self.username}")
-            if(token is not None):
+            if(sf is not None):
+                self.sf = sf
+
+            elif(token is not None):
                 self.sf = Salesforce(
                     username=self.username,
                     password=password,
@@ -52,6 +71,14 @@ class HarvardSalesforce:
         # this should be set once we have a list of objects to query
         # through self.getTypeMap()
         self.type_data = {}
+        # the validators for each object's fields (see validate())
+        self.validators = {}
+        self.column_validators = {}
+        self._validators_type_data = self.type_data
+
+        # the describe() metadata for getTypeMap, validateConfig and get_record_type_ids
+        # (in memory only, replace it with one that has a ttl_hours to keep it between runs)
+        self.describe_cache = DescribeCache(self.sf)
 
     def get_record_type_ids(self, object_name):
         """
@@ -59,7 +86,7 @@ class HarvardSalesforce:
         """
         record_type_ids = {}
         try:
-            description = self.sf.__getattr__(object_name).describe()
+            description = self.describe_cache.get(object_name)
             for record_type in description['recordTypeInfos']:
                 record_type_ids[record_type['name']] = record_type['recordTypeId']
         except Exception as e:
@@ -101,7 +128,14 @@ class HarvardSalesforce:
 
             while(retries > 0):
 
-                responses = self.sf.bulk.__getattr__(object).upsert(data, external_id_field=id_name)
+                with metrics.timer("bulk_upsert", records=len(data), object=object):
+                    if self.bulk_api_versions.get(object) == 2:
+                        # the results come back in the same format as the classic Bulk API (each job holds its own slot)
+                        responses = self.bulk2.upsert(object, data, external_id_field=id_name)
+                    else:
+                        # only the bulk job itself holds a slot, the duplicate handling below calls back into pushBulk
+                        with bulk_job_governor.job(object):
+                            responses = self.sf.bulk.__getattr__(object).upsert(data, external_id_field=id_name)
 
                 # Keeping this in here as a way to work with async pushes in the future
                 # logger.info(f"{responses}")
@@ -112,85 +146,9 @@ class HarvardSalesforce:
                 #         logger.warning(f"Bulk response with no job id: {response}")
                 # self.log_jobs()
 
-
-                created_count = 0
-                updated_count = 0
-                error_count = 0
-                dupe_data_batch = []
-                errored_data_batch = []
-                created_ids = {}
-
-                if object not in self.unique_ids or 'id_name' not in self.unique_ids[object]:
-                    logger.warning(f"Warning: no unique ids found for {object}")
-                    self.unique_ids[object] = self.getUniqueIds({object: data})
-                else:
-                    pds_external_id_name = self.unique_ids[object]['id_name']
-
-                    created_ids = {
-                        "object": object,
-                        "external_id_field": pds_external_id_name,
-                        "ids": []
-                    }
-                for index, response in enumerate(responses):
-                    if response['success'] != True:
-                        
-                        errored_data = data[index]
-                        logger.debug(f"Record failure in bulk data load: {response['errors']} ({errored_data})")
-
-                        error_name = response['errors'][0]['statusCode']
-
-                        if error_name == 'DUPLICATES_DETECTED':
-                            if dupe:
-                                logger.error(f"Error: DUPLICATE DETECTED (unresoved): {errored_data}")
-                            else:
-                                logger.error(f"Error: DUPLICATE DETECTED Errored Data: {errored_data}")
-                                dupe_data_batch.append(errored_data)
-                        # if it's invalid and the message is about an external id not existing, we want to ignore it
-                        elif error_name == 'INVALID_FIELD':
-                            if response['errors'][0]['message'].startswith("Foreign key external ID"): 
-                                # we want to ignore this error as it happens if the Contact didn't make it
-                                logger.debug(f"Warning: INVALID_FIELD (external id): {response['errors'][0]['message']}")
-                            else:
-                                logger.warning(f"Warning: INVALID_FIELD: {response['errors'][0]['message']}")
-
-                        else:
-                        
-                            if error_name == 'FIELD_CUSTOM_VALIDATION_EXCEPTION':
-                                logger.error(f"Error: FIELD_CUSTOM_VALIDATION_EXCEPTION: {object}.{id_name}: {errored_data[id_name]}")
-                            elif error_name == 'STRING_TOO_LONG':
-                                logger.error(f"Error: STRING_TOO_LONG: {object}.{id_name}: {errored_data[id_name]}")
-                            else: 
-                                logger.error(f"Error: {response['errors'][0]['statusCode']}: {errored_data}")
-                                # errored_data_batch.append(errored_data)
-
-                            # if response['errors'][0]['statusCode'] == 'CANNOT_INSERT_UPDATE_ACTIVATE_ENTITY':
-                            #     # get errored ids
-                            #     pass
-                            #     # self.pushBulk(object_name, [errored_data_object], retry=True)
-                            
-                    else:
-                        if response['created']:
-                            created_count += 1
-                        else:
-                            updated_count += 1
-                        logger.debug(response)
-
-
-                if len(dupe_data_batch) > 0:
-                    # let's only deal with duplicates on Contact
-                    if object == 'Contact':
-                        dupe_errors = self.check_duplicate(object, dupe_data_batch, id_name=id_name)
-                    error_count += dupe_errors
-
-                if 'ids' in created_ids and len(created_ids['ids']) > 0:
-                    logger.info(created_ids)
-
-                if updated_count > 0:
-                    logger.info(f"Updated {object} Records: {updated_count}")
-                if created_count > 0:
-                    logger.info(f"Created {object} Records: {created_count}")
-                if error_count > 0:
-                    logger.info(f"Errored {object} Records: {error_count}")
+                with metrics.timer("bulk_results", records=len(data), object=object):
+                    results = self.handle_bulk_responses(object, data, responses, id_name=id_name, dupe=dupe)
+                errored_data_batch = results['errored_data_batch']
 
                 if len(errored_data_batch) > 0 and retries > 0:
 
@@ -219,6 +177,121 @@ class HarvardSalesforce:
 
         return True
     
+    def handle_bulk_responses(self, object, data, responses, id_name='Id', dupe=False) -> dict:
+        """
+        Goes through the results of a bulk upsert (one response per record of data, in the same order)
+          logs the created/updated/errored counts, resolves duplicates (on Contact) and keeps the id index (and fingerprints) up to date
+        This is shared by pushBulk and the job tracker (which gets the results after the job is done)
+        Returns the counts and the records that should be tried again (errored_data_batch)
+        """
+        created_count = 0
+        updated_count = 0
+        error_count = 0
+        dupe_data_batch = []
+        errored_data_batch = []
+        created_ids = {}
+        pushed_ids = {}
+        pushed_records = []
+
+        if object not in self.unique_ids or 'id_name' not in self.unique_ids[object]:
+            logger.warning(f"Warning: no unique ids found for {object}")
+            self.unique_ids[object] = self.getUniqueIds({object: data})
+        else:
+            pds_external_id_name = self.unique_ids[object]['id_name']
+
+            created_ids = {
+                "object": object,
+                "external_id_field": pds_external_id_name,
+                "ids": []
+            }
+        for index, response in enumerate(responses):
+            if response['success'] != True:
+                
+                errored_data = data[index]
+                logger.debug(f"Record failure in bulk data load: {response['errors']} ({errored_data})")
+
+                error_name = response['errors'][0]['statusCode']
+
+                if error_name == 'DUPLICATES_DETECTED':
+                    if dupe:
+                        logger.error(f"Error: DUPLICATE DETECTED (unresoved): {errored_data}")
+                    else:
+                        logger.error(f"Error: DUPLICATE DETECTED Errored Data: {errored_data}")
+                        dupe_data_batch.append(errored_data)
+                # if it's invalid and the message is about an external id not existing, we want to ignore it
+                elif error_name == 'INVALID_FIELD':
+                    if response['errors'][0]['message'].startswith("Foreign key external ID"): 
+                        # we want to ignore this error as it happens if the Contact didn't make it
+                        logger.debug(f"Warning: INVALID_FIELD (external id): {response['errors'][0]['message']}")
+                    else:
+                        logger.warning(f"Warning: INVALID_FIELD: {response['errors'][0]['message']}")
+
+                else:
+                
+                    if error_name == 'FIELD_CUSTOM_VALIDATION_EXCEPTION':
+                        logger.error(f"Error: FIELD_CUSTOM_VALIDATION_EXCEPTION: {object}.{id_name}: {errored_data[id_name]}")
+                    elif error_name == 'STRING_TOO_LONG':
+                        logger.error(f"Error: STRING_TOO_LONG: {object}.{id_name}: {errored_data[id_name]}")
+                    else: 
+                        logger.error(f"Error: {response['errors'][0]['statusCode']}: {errored_data}")
+                        # errored_data_batch.append(errored_data)
+
+                    # if response['errors'][0]['statusCode'] == 'CANNOT_INSERT_UPDATE_ACTIVATE_ENTITY':
+                    #     # get errored ids
+                    #     pass
+                    #     # self.pushBulk(object_name, [errored_data_object], retry=True)
+                    
+            else:
+                if response['created']:
+                    created_count += 1
+                else:
+                    updated_count += 1
+                logger.debug(response)
+
+                if self.id_index is not None and id_name != 'Id' and response.get('id') and data[index].get(id_name) is not None:
+                    pushed_ids[data[index][id_name]] = response['id']
+                if self.fingerprints is not None and id_name != 'Id':
+                    pushed_records.append(data[index])
+
+        # keep the id index up to date with the records we just created
+        if len(pushed_ids) > 0:
+            self.id_index.update(object, pushed_ids)
+        # and remember what they look like in Salesforce now
+        if len(pushed_records) > 0:
+            self.fingerprints.record(object, id_name, pushed_records)
+
+
+        if len(dupe_data_batch) > 0:
+            # let's only deal with duplicates on Contact
+            if object == 'Contact':
+                dupe_errors = self.check_duplicate(object, dupe_data_batch, id_name=id_name)
+            else:
+                dupe_errors = len(dupe_data_batch)
+            error_count += dupe_errors
+
+        if 'ids' in created_ids and len(created_ids['ids']) > 0:
+            logger.info(created_ids)
+
+        if updated_count > 0:
+            logger.info(f"Updated {object} Records: {updated_count}")
+        if created_count > 0:
+            logger.info(f"Created {object} Records: {created_count}")
+        if error_count > 0:
+            logger.info(f"Errored {object} Records: {error_count}")
+
+        return {
+            "created": created_count,
+            "updated": updated_count,
+            "errors": error_count,
+            "errored_data_batch": errored_data_batch
+        }
+
+    @property
+    def bulk2(self) -> Bulk2Ingest:
+        if self._bulk2 is None:
+            self._bulk2 = Bulk2Ingest(self.sf)
+        return self._bulk2
+
     def log_jobs(self):
         # this will check for outstanding jobs and log them if they're done
         # this does NOT work to get results
@@ -290,6 +363,7 @@ class HarvardSalesforce:
                     data_object[external_id] = id
                     data_object[flag_name] = value
                     data.append(data_object)
+                # pushBulk goes through the bulk job governor
                 self.pushBulk(object=object_name, data=data, id_name=external_id)
 
             except Exception as e:
@@ -407,7 +481,8 @@ class HarvardSalesforce:
                 'Id': id
             })
         if data:
-            responses = self.sf.bulk.__getattr__(object_name).delete(data,batch_size=10000,use_serial=True)
+            with bulk_job_governor.job(object_name):
+                responses = self.sf.bulk.__getattr__(object_name).delete(data,batch_size=10000,use_serial=True)
             logger.warn(f"WARNING: DELETED ids from {object_name} with response: {responses}")
         return True
 
@@ -422,7 +497,8 @@ class HarvardSalesforce:
             obj[deleted_flag] = True
             data.append(obj)
 
-        responses = self.sf.bulk.__getattr__(object).upsert(data, external_id_field=id_type)
+        with bulk_job_governor.job(object):
+            responses = self.sf.bulk.__getattr__(object).upsert(data, external_id_field=id_type)
         logger.warn(responses)
 
         for response in responses:
@@ -471,8 +547,10 @@ class HarvardSalesforce:
             if not dry_run:
                 try:
                     config_field = None
+                    self.describe_cache.prefetch(list(config.keys()))
                     for object in config:
-                        description = self.sf.__getattr__(object).describe()
+                        field_names = self.describe_cache.field_names(object)
+                        relationship_names = self.describe_cache.relationship_names(object)
 
                         config_objects = config[object]
 
@@ -481,9 +559,9 @@ class HarvardSalesforce:
 
                         for config_obj in config_objects:
                             for config_field in config_obj['fields'].keys():
-                                if config_field not in [f['name'] for f in description.get('fields')]:
+                                if config_field not in field_names:
                                     # also make sure it's not a relationship name
-                                    if config_field not in [f['relationshipName'] for f in description.get('fields')]:
+                                    if config_field not in relationship_names:
                                         raise Exception(f"Error: {config_field} not found in {object}")
 
 
@@ -503,9 +581,11 @@ class HarvardSalesforce:
     # for example: { "Contact": { "Name": "string", "Email": "email", "Birthdate": "date" } }
     def getTypeMap(self, objects=[]):
         self.type_data = {}
+        # describes the objects that aren't cached yet in parallel
+        self.describe_cache.prefetch(objects)
         for object in objects:
             self.type_data[object] = {}
-            description = self.sf.__getattr__(object).describe()
+            description = self.describe_cache.get(object)
             for field in description.get('fields'):
                 self.type_data[object][field['name']] = {}
                 self.type_data[object][field['name']]['type'] = field['type'] 
@@ -514,144 +594,63 @@ class HarvardSalesforce:
                 self.type_data[object][field['name']]['externalId'] = field['externalId']
                 self.type_data[object][field['name']]['unique'] = field['externalId']
 
+        # build the validators now instead of while the records are being transformed
+        self.reset_validators()
+        for object in objects:
+            for field in self.type_data[object]:
+                self.get_validator(object, field)
+
         return self.type_data
     
     # this will try to make sure the data going to the sf object is the right type
+    #   (the checks for each field are built once, see field_validators.py)
     def validate(self, object, field, value, identifier):
         # logger.debug(f"validating the value ({value}) for the field: {object}.{field} from {identifier}")
+        if self.type_data is not self._validators_type_data:
+            self.reset_validators()
+        try:
+            validator = self.validators[object][field]
+        except KeyError:
+            validator = self.get_validator(object, field)
+        return validator(value, identifier)
+
+    def validate_column(self, object, field, values: list, identifiers: list=None) -> list:
+        """
+        Validates a whole column of values for one field at once
+        Returns the values validate() would return for each of them (in order)
+        """
+        if self.type_data is not self._validators_type_data:
+            self.reset_validators()
+        column_validator = self.column_validators.get((object, field))
+        if column_validator is None:
+            validator = self.get_validator(object, field)
+            column_validator = build_column_validator(object, field, self.type_data[object][field], validator=validator)
+            self.column_validators[(object, field)] = column_validator
+        if identifiers is None:
+            identifiers = [None] * len(values)
+        return column_validator(values, identifiers)
+
+    def get_validator(self, object, field):
+        # the validator for a field, built from its type data the first time it's needed
+        if object in self.validators and field in self.validators[object]:
+            return self.validators[object][field]
+
         if object not in self.type_data:
             logger.warn("Warning: no type data found, run getTypeMap() first for better performance")
             self.type_data([object])
 
         if field not in self.type_data[object]:
             raise Exception(f"Error: field ({field}) not found in type_data, please ensure this field is on that object")
-        if 'type' not in self.type_data[object][field]:
-            raise Exception(f"Error: field ({field}) does not have an associated `type`")
-        if 'updateable' not in self.type_data[object][field]:
-            raise Exception(f"Error: field ({field}) does not have an associated `updateable`")
-
-        if value is None:
-            if self.type_data[object][field]['type'] in ["boolean"]:
-                return False
-            return None
-        
-        # NOTE: adding this test to handle empty DotMaps
-        if bool(value) == False and self.type_data[object][field]['type'] not in ["boolean"]:
-            if value != False:
-                return None
-
-        if not isinstance(value, (str, bool, int)):
-            value_type = type(value)
-            logger.error(f"Error: value ({value}) for {object}.{field} is not a valid type ({value_type}). Identifier: {identifier}")
-            return None
-
-        # if this is false, it means it's not a field we can update
-        #   `Id` isn't something we can even try to edit
-        if not self.type_data[object][field]['updateable'] and field != "Id":
-            raise Exception(f"Error: field ({object}.{field}) is not editable")
-
-        field_type = self.type_data[object][field]['type']
-        if field_type in ["textarea", "string", "url"]:
-            length = self.type_data[object][field]['length']
-            if isinstance(value, bool):
-                if value:
-                    return 1
-                else:
-                    return 0
-
-            value = str(value)
-            if value is None:
-                return None
-            else:
-                if len(value) > length:
-                    value = value[:length]
-                return str(value)
-        elif field_type in ["picklist", "multipicklist"]:
-            # not really sure I want to validate what the picklist values are
-            return str(value)
-        elif field_type in ["phone"]:
-            # this regex: 
-            #   possible leading +
-            #   numbers (\d) and spaces (\s)
-            #   open and close parens ()
-            #   dashes
-            if re.match(r"^\+?[\d\s\(\)\-]+$", value):
-                return str(value)
-            else:
-                logger.warning(f"Warning: {value} is not a valid phone number. Identifier: {identifier}")
-                return None
-        elif field_type in ["email"]:   
-            # if the value is a valid email, return it
-            # otherwise, log the error and return None
-            if re.match(r"[^@]+@[^@]+\.[^@]+", value):
-                return str(value)
-            else:
-                logger.warning(f"Warning: {value} is not a valid email. Identifier: {identifier}")
-                return None
-        elif field_type in ["id", "reference"]:
-            return value
-        elif field_type in ["date"]:
-            # NOTE: Salesforce only liked dates from the year of our lord 1700-2400
-            #       Salesforce also wants the date in an iso-8861 string
-            #       It does not handle datetime as a date, so the 00:00:00 needs to be stripped off of datetimes
-            value = value.split("T")[0].split(" ")[0]
-            try:
-                if value:
-                    valid_date = datetime.strptime(value, '%Y-%m-%d').date()
-                    if not (date(1700, 1, 1) <= valid_date <= date(2400, 1, 1)):
-                        # raise ValueError(f"Error: date out of range: {value}")
-                        logger.error(f"Error: date out of range: {value}. Indentifier: {identifier}")
-                        return None
-            except ValueError as e:
-                logger.error(f"Error: {e}. Indentifier: {identifier}")
-                return None
-            return value
-        elif field_type in ["datetime"]:
-            try:
-                if value:
-                    # we want to try both formats for datetime
-                    try:
-                        valid_date = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S').date()
-                    except:
-                        value = value.replace(" ", "T")
-                        value = value.split(".")[0]
-                        value = value.split("Z")[0]
-                        valid_date = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S').date()
-                    if not (date(1700, 1, 1) <= valid_date <= date(2400, 1, 1)):
-                        logger.error(f"Error: date out of range: {value}. Indentifier: {identifier}")
-                        return None
-            except ValueError as e:
-                logger.error(f"Error: {e}. Indentifier: {identifier}")
-                return None
-            
-            # # if valid_date has a time of exactly midnight (T00:00:00)
-            # if valid_date.time() == datetime.min.time():
-            #     # we want to move the time forward 5 hours to make it 5am
-            #     # this is because salesforce will assume the date is in UTC if it doesn't have a timezone qualifier
-            #     # and we want to make sure it's in EST
-            #     # Open to suggestions if someone has a better way to handle this
-            #     valid_date = valid_date + timedelta(hours=5)
 
+        validator = build_validator(object, field, self.type_data[object][field])
+        self.validators.setdefault(object, {})[field] = validator
+        return validator
 
-            return value
-
-        elif field_type in ["double"]:
-            try: 
-                if bool(value) == False:
-                    return None
-                return float(value)
-            except ValueError as e:
-                logger.error(f"Error converting {object}.{field} ({value}) to double/float: {e}. Identifier: {identifier}")
-                return None
-        elif field_type in ["boolean"]:
-            if isinstance(value, bool):
-                return value
-            else:
-                # logger.error(f"Error: field {field} is a boolean, must be True or False. Tried value: {value}")
-                return False
-        else:
-            logger.error(f"Error: unhandled field_type: {field_type}. Please check config and target Salesforce instance")
-            return None
+    def reset_validators(self):
+        # the validators are built from type_data, so they're thrown out when it's replaced
+        self.validators = {}
+        self.column_validators = {}
+        self._validators_type_data = self.type_data
 
     # getUniqueIds 
     # output format should look like:
@@ -751,6 +750,11 @@ class HarvardSalesforce:
 
 
 
+                        if self.id_index is not None and self.id_index.has(object, salesforce_id_name):
+                            # the index is kept up to date, so an id that isn't in it isn't in salesforce
+                            self.unique_ids[object]['Ids'].update(self.id_index.lookup(object, ids))
+                            continue
+
                         batch_size = 500
                         for i in range(0, len(ids), batch_size):
                             try:
@@ -862,7 +866,18 @@ class HarvardSalesforce:
     # this method is trying to find an Id for a record that failed as a dupe
     # the `errored_data_object` should be of the same record that triggered the error
     def check_duplicate(self, object_name, errored_data_objects, id_name='Id', dry_run=False):
-
+        """
+        Tries to find the existing records that the errored (DUPLICATES_DETECTED) records are duplicates of
+          and re-pushes the ones we can resolve (with the Id of the existing record) in one bulk job
+        A record is matched to existing records by:
+          - all of its unique/externalId fields (that are in type data)
+          - Email + FirstName + LastName (on Contact, this is the most common breaking of the standard contact duplicate rule)
+            see: https://help.salesforce.com/s/articleView?language=en_US&id=sf.matching_rules_standard_contact_rule.htm&type=5
+          and it's resolved if that matches exactly one record
+        The lookups are batched: a few `IN` queries (sized to stay under the SOQL length limit) get the candidates 
+          for all of the records and they're matched up here
+        Returns the number of records that couldn't be resolved
+        """
 
         error_count = len(errored_data_objects)
 
@@ -871,53 +886,45 @@ class HarvardSalesforce:
             # first we get all of the externalids/uniques for the object that we collected in type data
             unique_object_fields = [i for i, obj in self.type_data[object_name].items() if obj['unique'] or obj['externalId']]
 
-            retryable_data_objects = []
+            # the ways each record can be matched: a list of (fields, values) for each record
+            match_keys = []
             for errored_data_object in errored_data_objects:
+                keys = []
+                unique_fields = tuple(field for field in unique_object_fields if field in errored_data_object)
+                if len(unique_fields) > 0 and all(errored_data_object[field] is not None for field in unique_fields):
+                    keys.append((unique_fields, tuple(errored_data_object[field] for field in unique_fields)))
 
-                # build the where clause
-                whereses = []
-                where_clause = ""
-
-                for field in unique_object_fields:
-                    if field in errored_data_object:
-                        field_value = errored_data_object[field]
-                        whereses.append(f"{field} = '{field_value}'")
-                
-                where_clause = "(" + " and ".join(whereses) + ")"
-                
-                # reset whereses
-                whereses = []
-
-                # this is to handle the standard contact duplicate matching rule, or at least the most common breaking of it
-                # see: https://help.salesforce.com/s/articleView?language=en_US&id=sf.matching_rules_standard_contact_rule.htm&type=5
                 if object_name == 'Contact':
-                    standard_contact_rule_string = ''
-                    email = None
-                    first_name = None
-                    last_name = None
-                    if 'Email' in errored_data_object and 'FirstName' in errored_data_object and 'LastName' in errored_data_object:
-                        email = errored_data_object['Email']
-                        first_name = errored_data_object['FirstName']
-                        last_name = errored_data_object['LastName']
-                        standard_contact_rule_string = f"(Email = '{email}' and LastName = '{last_name}' and FirstName = '{first_name}')"
-                        
-                        whereses.append(f"{standard_contact_rule_string}")
-                
-                where_clause += " or ".join(whereses)
+                    contact_rule_fields = ('Email', 'LastName', 'FirstName')
+                    if all(errored_data_object.get(field) is not None for field in contact_rule_fields):
+                        keys.append((contact_rule_fields, tuple(errored_data_object[field] for field in contact_rule_fields)))
+                match_keys.append(keys)
+
+            # find the candidates for each set of fields, all at once
+            keys_by_fields = {}
+            for keys in match_keys:
+                for (fields, values) in keys:
+                    keys_by_fields.setdefault(fields, set()).add(values)
+            found = {}
+            for fields, values in keys_by_fields.items():
+                found[fields] = self.find_records_by_fields(object_name, fields, values)
 
-                select_string = f"SELECT {object_name}.Id FROM {object_name} WHERE {where_clause}"
-                logger.debug(select_string)
-                sf_data = self.sf.query_all(select_string)
-                logger.debug(f"got this data from salesforce: {sf_data['records']}")
-
-                if len(sf_data['records']) > 1:
-                    found_ids = [record['Id'] for record in sf_data['records']]
-
-                    logger.error(f"Failed resolving duplicate! : too many records found on object {object_name} with this select: {select_string}")
-                elif len(sf_data['records']) < 1:
+            retryable_data_objects = []
+            for errored_data_object, keys in zip(errored_data_objects, match_keys):
+                if len(keys) == 0:
+                    logger.error(f"Error: nothing to match a duplicate on for object {object_name} with this data: {errored_data_object}")
+                    continue
+
+                found_ids = set()
+                for (fields, values) in keys:
+                    found_ids.update(found[fields].get(self._match_key(values), []))
+
+                if len(found_ids) > 1:
+                    logger.error(f"Failed resolving duplicate! : too many records found on object {object_name} ({sorted(found_ids)}) with this data: {errored_data_object}")
+                elif len(found_ids) < 1:
                     logger.error(f"Error: no records found on object {object_name} with this data: {errored_data_object}")
                 else:
-                    found_id = sf_data['records'][0]['Id']
+                    found_id = found_ids.pop()
                     logger.info(f"Success resolving duplicate! id: {found_id} trying to re-push record")
                     error_count -= 1
                     errored_data_object['Id'] = found_id
@@ -931,12 +938,49 @@ class HarvardSalesforce:
             logger.error(f"Error with duplicate resolution: {e}")
             return error_count
 
+    def find_records_by_fields(self, object_name: str, fields: tuple, values: set, max_query_length: int=15000) -> dict:
+        """
+        Finds the records where all of the fields match one of the sets of values
+        Returns a dict of match key (see _match_key) -> list of Ids
 
+        This queries on the first field with `IN` (as many values as fit under max_query_length per query)
+          and checks the rest of the fields here, so it's a few queries instead of one per set of values
+        """
+        results = {}
+        first_values = sorted({str(value_set[0]) for value_set in values})
+        select_string = f"SELECT Id, {', '.join(fields)} FROM {object_name} WHERE {fields[0]} IN "
+
+        for in_clause in self._soql_in_clauses(first_values, max_length=max_query_length - len(select_string)):
+            query = select_string + in_clause
+            logger.debug(query)
+            sf_data = self.sf.query_all(query)
+            for record in sf_data['records']:
+                key = self._match_key(tuple(record.get(field) for field in fields))
+                results.setdefault(key, []).append(record['Id'])
 
-            # then we use those ids to see if there's an Id for the record we're looking for
-            # we can do that in a single soql call
-            #   select Id from object_name where externalid1 = X || externalid2 = Y || email = Z and firstname and lastname ....
-        
+        return results
+
+    def _match_key(self, values: tuple) -> tuple:
+        # SOQL comparisons on text are case insensitive, so the matching here is too
+        return tuple(str(value).lower() for value in values)
+
+    def _soql_in_clauses(self, values: list, max_length: int):
+        """
+        Yields ('a','b',...) clauses for the values, each no longer than max_length (at least one value each)
+        """
+        clause_values = []
+        length = 2
+        for value in values:
+            # quotes and backslashes need to be escaped in SOQL strings
+            quoted = "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+            if len(clause_values) > 0 and length + len(quoted) + 1 > max_length:
+                yield "(" + ",".join(clause_values) + ")"
+                clause_values = []
+                length = 2
+            clause_values.append(quoted)
+            length += len(quoted) + 1
+        if len(clause_values) > 0:
+            yield "(" + ",".join(clause_values) + ")"
 
     def get_accounts_hash(self, id_name, ids: list):
         logger.info(f"get_accounts with the following {id_name} external ids: {ids}")
@@ -1016,8 +1060,9 @@ class HarvardSalesforce:
         
         return ids
     
+    # removes the None values from a record (or each record in a list of records)
+    #   so the upsert leaves those fields alone instead of blanking them out
     def trim_nones(self, data):
-        for key, value in data.items():
-            if value is None:
-                del data[key]
-        return data
\ No newline at end of file
+        if isinstance(data, list):
+            return [self.trim_nones(record) for record in data]
+        return {key: value for key, value in data.items() if value is not None}
\ No newline at end of file
@@ -1,13 +1,27 @@
 from logging import LogRecord
-from common import logger, stack, AppConfig, ThreadExcept
+from common import logger, stack, AppConfig, BatchExecutor
 import pds
 from salesforce import HarvardSalesforce
 from transformer import SalesforceTransformer
 from person_reference import PersonReference
+from log_shipper import SalesforceLogShipper
+from pipeline import Pipeline
+from checkpoint import LoadCheckpoint
+from sharding import split_pds_query, shard_range, run_shards
+from bulk_governor import bulk_job_governor, bulk_job_limit
+from id_index import IdIndex
+from fingerprints import RecordFingerprints
+from job_tracker import BulkJobTracker
+from reconciler import IdReconciler, run_lookups
+from duplicates import DuplicateDetector, DuplicateReport
+from describe_cache import DescribeCache
+from projection import project_pds_query
+from metrics import metrics
 
 import os
 import copy
 import json
+import threading
 import logging
 import time
 import math
@@ -28,6 +42,24 @@ else:
 pds_batch_size_override = os.getenv("PDS_BATCH_SIZE") or None
 batch_size_override = os.getenv("BATCH_SIZE") or None
 batch_thread_count_override = os.getenv("BATCH_THREAD_COUNT") or None
+pipeline_queue_size_override = os.getenv("PIPELINE_QUEUE_SIZE") or None
+shard_count_override = os.getenv("SHARD_COUNT") or None
+shard_start_override = os.getenv("SHARD_START") or None
+id_index_enabled = os.getenv("ID_INDEX") == "True"
+async_bulk_enabled = os.getenv("ASYNC_BULK") == "True"
+delta_push_mode = os.getenv("DELTA_PUSH") or None
+delta_max_age_days_override = os.getenv("DELTA_MAX_AGE_DAYS") or None
+describe_cache_ttl_hours_override = os.getenv("DESCRIBE_CACHE_TTL_HOURS") or None
+pds_field_projection = os.getenv("PDS_FIELD_PROJECTION") or "off"
+cleanup_worker_count_override = os.getenv("CLEANUP_WORKER_COUNT") or None
+cleanup_ordered = os.getenv("CLEANUP_ORDERED") == "True"
+columnar_transform_enabled = os.getenv("COLUMNAR_TRANSFORM") == "True"
+cleanup_retries_override = os.getenv("CLEANUP_RETRIES") or None
+cleanup_retry_backoff_override = os.getenv("CLEANUP_RETRY_BACKOFF") or None
+log_batch_size_override = os.getenv("LOG_BATCH_SIZE") or None
+log_flush_interval_override = os.getenv("LOG_FLUSH_INTERVAL") or None
+log_queue_size_override = os.getenv("LOG_QUEUE_SIZE") or None
+log_overflow_policy_override = os.getenv("LOG_OVERFLOW_POLICY") or None
 LOCAL = os.getenv("LOCAL") or False
 ####################################
 
@@ -72,7 +104,8 @@ if stack == 'developer':
 
 
 class SalesforcePersonUpdates:
-    def __init__(self, local=False):
+    # hsf and pds_client: an already set up HarvardSalesforce and PDS client to use instead of connecting (like the benchmark's simulators)
+    def __init__(self, local=False, hsf=None, pds_client=None):
         try:
             self.salesforce_instance_id = os.getenv("SALESFORCE_INSTANCE_ID", None)
             self.table_name = os.getenv("TABLE_NAME", None)
@@ -88,6 +121,7 @@ class SalesforcePersonUpdates:
             eastern = pytz.timezone('US/Eastern')
             current_time_mash = datetime.now(eastern).strftime('%Y%m%d%H%M')
             self.run_id = f"{self.action}_{current_time_mash}"
+            metrics.run_id = self.run_id
 
 
             if local == "True":
@@ -114,14 +148,17 @@ class SalesforcePersonUpdates:
 
 
             
-            self.hsf = HarvardSalesforce(
-                domain = self.app_config.salesforce_domain,
-                username = self.app_config.salesforce_username,
-                password = self.app_config.salesforce_password,
-                token = self.app_config.salesforce_token,
-                consumer_key = self.app_config.salesforce_client_key,
-                consumer_secret = self.app_config.salesforce_client_secret
-            )
+            if hsf is not None:
+                self.hsf = hsf
+            else:
+                self.hsf = HarvardSalesforce(
+                    domain = self.app_config.salesforce_domain,
+                    username = self.app_config.salesforce_username,
+                    password = self.app_config.salesforce_password,
+                    token = self.app_config.salesforce_token,
+                    consumer_key = self.app_config.salesforce_client_key,
+                    consumer_secret = self.app_config.salesforce_client_secret
+                )
 
             second_salesforce_username = os.getenv('SF_USERNAME2', None)
             if second_salesforce_username:
@@ -137,6 +174,30 @@ class SalesforcePersonUpdates:
                 )
 
 
+            # objects can be pushed with Bulk API 2.0 instead of the classic Bulk API
+            bulk_api_versions = {}
+            for object_name, object_config in self.app_config.config.items():
+                object_configs = object_config if isinstance(object_config, list) else [object_config]
+                for config_item in object_configs:
+                    if 'bulkApiVersion' in config_item:
+                        bulk_api_versions[object_name] = config_item['bulkApiVersion']
+            self.hsf.bulk_api_versions = bulk_api_versions
+            if len(bulk_api_versions) > 0:
+                logger.info(f"Bulk API versions: {bulk_api_versions}")
+
+            # the object descriptions can be kept between runs (and only checked for changes once they're older than the ttl)
+            if describe_cache_ttl_hours_override is not None and float(describe_cache_ttl_hours_override) > 0:
+                self.hsf.describe_cache = DescribeCache(
+                    self.hsf.sf,
+                    name=self.salesforce_instance_id or "local",
+                    ttl_hours=float(describe_cache_ttl_hours_override)
+                )
+
+            # validate is called for every field of every record, so its time is added up for each batch instead
+            if metrics.enabled:
+                self.hsf.validate = metrics.accumulate("validate", self.hsf.validate)
+                self.hsf.validate_column = metrics.accumulate("validate", self.hsf.validate_column)
+
             # check salesforce for required objects for push and get a map of the types
             self.hsf.getTypeMap(self.app_config.config.keys())
             logger.debug(f"Object Metadata: {self.hsf.type_data}")
@@ -149,6 +210,10 @@ class SalesforcePersonUpdates:
             except Exception as e:
                 logger.error(f"Config validation failed for {self.salesforce_instance_id} with error: {e}")
                 raise e
+
+            # check the pds_query's fields against what the config uses (and with "rewrite", only ask the PDS for those)
+            #   the cacheUpdateDate is kept, it's what the updates are based on
+            self.app_config.pds_query = project_pds_query(self.app_config.pds_query, self.app_config.config, mode=pds_field_projection, keep=["cacheUpdateDate"])
             
             # initialize storage for updated ids
             self.updated_ids = []
@@ -166,7 +231,10 @@ class SalesforcePersonUpdates:
                 self.pds_batch_size = int(pds_batch_size_override)
             else:
                 self.pds_batch_size = 500
-            self.pds = pds.People(apikey=self.app_config.pds_apikey, batch_size=self.pds_batch_size)
+            if pds_client is not None:
+                self.pds = pds_client
+            else:
+                self.pds = self.new_pds_client()
 
             if batch_size_override:
                 self.batch_size = int(batch_size_override)
@@ -178,15 +246,83 @@ class SalesforcePersonUpdates:
                 self.batch_thread_count = int(batch_thread_count_override)
             else:
                 self.batch_thread_count = 3
-            self.batch_threads = []
+
+            # the number of batches that can wait between each stage of the people pipeline
+            if pipeline_queue_size_override:
+                self.pipeline_queue_size = int(pipeline_queue_size_override)
+            else:
+                self.pipeline_queue_size = 2
+
+            # the number of processes a full load is split between (1 is not sharded)
+            if shard_count_override:
+                self.shard_count = int(shard_count_override)
+            else:
+                self.shard_count = 1
+
+            # the number of PDS lookups cleanup_updateds runs at the same time
+            if cleanup_worker_count_override:
+                self.cleanup_worker_count = int(cleanup_worker_count_override)
+            else:
+                self.cleanup_worker_count = 4
+            # the reconciliation doesn't depend on the order, but ordered makes the runs easier to compare
+            self.cleanup_ordered = cleanup_ordered
+            # a failed cleanup lookup is retried this many times (with backoff) before the cleanup fails
+            if cleanup_retries_override:
+                self.cleanup_retries = int(cleanup_retries_override)
+            else:
+                self.cleanup_retries = 3
+            if cleanup_retry_backoff_override:
+                self.cleanup_retry_backoff = float(cleanup_retry_backoff_override)
+            else:
+                self.cleanup_retry_backoff = 2
 
             self.transformer = SalesforceTransformer(config=self.app_config.config, hsf=self.hsf)
 
+            # this gets set up in setup_logging()
+            self.log_shipper = None
+
+            # this gets set by find_duplicates(), the remove actions use it instead of checking again
+            self.duplicate_report = None
+
+            # with COLUMNAR_TRANSFORM, the flat objects (like Contact) are transformed a batch at a time (see transform_people())
+            self.columnar_transform = columnar_transform_enabled
+
+            # with ASYNC_BULK, people loads submit their bulk jobs and move on (the tracker handles the results)
+            self.async_bulk = async_bulk_enabled
+            self.job_tracker = None
+
+            # the id index replaces the per batch id lookups (it's refreshed at the start of each people load)
+            if id_index_enabled:
+                self.hsf.id_index = IdIndex(hsf=self.hsf, name=self.salesforce_instance_id or "local")
+                restored = self.hsf.id_index.restore(self.transformer.getSourceConfig('pds').keys())
+                logger.info(f"Restored id index for: {restored}")
+            # a shard of a sharded load only reads the index, the parent process refreshes (and saves) it once for all of them
+            self.id_index_read_only = False
+
+            # with DELTA_PUSH, records that haven't changed since they were last pushed are left out of the pushes
+            #   ("fields" also leaves out the fields of each record that haven't changed)
+            self.fingerprints = None
+            if delta_push_mode in ["True", "fields"]:
+                self.fingerprints = RecordFingerprints(
+                    name=self.salesforce_instance_id or "local",
+                    max_age_days=int(delta_max_age_days_override or 7),
+                    fields=delta_push_mode == "fields"
+                )
+                restored = self.fingerprints.restore(self.app_config.config.keys())
+                logger.info(f"Restored record fingerprints for: {restored}")
+                self.hsf.fingerprints = self.fingerprints
+            else:
+                # this run doesn't record what it pushes, so the fingerprints from an earlier DELTA_PUSH run are out of date
+                self.discard_fingerprints()
 
         except Exception as e:
             logger.error(f"Run failed: id: {self.salesforce_instance_id}, action: {self.action},  with error: {e}")
             raise e
 
+    # a new PDS client (the pagination state is per client, so threads can't share one)
+    def new_pds_client(self, batch_size: int=None):
+        return pds.People(apikey=self.app_config.pds_apikey, batch_size=batch_size or self.pds_batch_size)
+
     # this will make logs come out as json and send logs elsewhere
     def setup_logging(self, logger=logging.getLogger(__name__)):
 
@@ -219,6 +355,11 @@ class SalesforcePersonUpdates:
                 except Exception as e:
                     log_data['log_error'] = str(e)
 
+                # shipping happens in the background, so surface the last shipping error here
+                if self.sfpu.log_shipper is not None and self.sfpu.log_shipper.last_error is not None:
+                    log_data['log_error'] = self.sfpu.log_shipper.last_error
+                    self.sfpu.log_shipper.last_error = None
+
                 # return super().format(record)
                 return json.dumps(log_data)
                                     
@@ -226,6 +367,17 @@ class SalesforcePersonUpdates:
         for handler in logger.handlers[:]:
             logger.removeHandler(handler)
 
+        # logs going to salesforce are queued and sent in batches by the log shipper
+        #   so a log statement doesn't cost an api call on the hot path
+        if self.log_shipper is None:
+            self.log_shipper = SalesforceLogShipper(
+                hsf=self.hsf,
+                batch_size=int(log_batch_size_override or 200),
+                flush_interval=float(log_flush_interval_override or 5),
+                max_queue_size=int(log_queue_size_override or 10000),
+                overflow_policy=log_overflow_policy_override or "drop_newest"
+            )
+
         stream_handler = logging.StreamHandler()
         formatter = JSONFormatter(run_id=self.run_id, sfpu=self)
         stream_handler.setFormatter(formatter)
@@ -243,10 +395,19 @@ class SalesforcePersonUpdates:
             "huit__Datetime__c": datetime
         }
         try:
-            response = self.hsf.sf.__getattr__(log_object).create(data)
+            if self.log_shipper is not None and log_object == self.log_shipper.log_object:
+                self.log_shipper.enqueue(data)
+            else:
+                response = self.hsf.sf.__getattr__(log_object).create(data)
         except Exception as e: 
             raise Exception(f"Logging failed: {data} :: {e}")
 
+    # this sends any logs still waiting to go to salesforce
+    # NOTE: do not add a logger statement in this function, it will cause an infinite loop
+    def close_logging(self):
+        if self.log_shipper is not None:
+            self.log_shipper.close()
+
 
     def accounts_data_load(self):
         logger.info(f"Starting account data load")
@@ -279,55 +440,71 @@ class SalesforcePersonUpdates:
 
 
     def process_people_batch(self, people: list=[], trim_nons=False):
-
-        hashed_ids = self.hsf.getUniqueIds(
-            config=self.transformer.getTargetConfig('Contact'), 
-            source_data=people
-        )
-        # this will overwrite the existing hashed_ids
-        if 'Contact' in self.transformer.hashed_ids:
-            self.transformer.hashed_ids['Contact'] = hashed_ids['Contact']
+        # this processes a single batch of people from start to finish (ids -> transform -> push)
+        # the Contacts are pushed first and the ids are looked up again after,
+        #   so the deprecated `sf.*` references can find Contacts created by this batch
+        hashed_ids = self.resolve_people_ids(people, config=self.transformer.getTargetConfig('Contact'))
 
         if 'Contact' in self.app_config.config:
-            logger.info(f"Processing {len(people)} Contact records")
-            data = {}
-            data_gen = self.transformer.transform(source_data=people, target_object='Contact')
-            for d in data_gen:
-                for i, v in d.items():
-                    if i not in data:
-                        data[i] = []
-                    if 'updatedFlag' in self.app_config.config[i]:
-                        updated_flag = self.app_config.config[i]['updatedFlag']
-                        v[updated_flag] = True
-                    data[i].append(v)
+            data = self.transform_people(people, hashed_ids=hashed_ids, target_object='Contact')
+            self.push_people_data(people, data, trim_nons=trim_nons)
 
-            contact_external_id = self.app_config.config['Contact']['Id']['salesforce']
-            for object, object_data in data.items():
-                logger.debug(f"Upserting to {object} with {len(object_data)} records")
-                if trim_nons is True:
-                    object_data = self.hsf.trim_nones(object_data)
-                self.hsf.pushBulk(object, object_data, id_name=contact_external_id)
+        hashed_ids = self.resolve_people_ids(people)
+        data = self.transform_people(people, hashed_ids=hashed_ids, exclude_target_objects=['Contact'])
+        self.push_records(data=data)
 
+    def resolve_people_ids(self, people: list, config: dict=None) -> dict:
+        """
+        Looks up the Salesforce Ids of the people's records (for all pds objects unless a config is given)
+        Returns a copy of the ids for just these people, so it's safe to hold on to while other batches are looked up
+        """
+        if config is None:
+            config = self.transformer.getSourceConfig('pds')
 
-        hashed_ids = self.hsf.getUniqueIds(
-            config=self.transformer.getSourceConfig('pds'), 
-            source_data=people
-        )
-        # this will overwrite the existing hashed_ids
-        for object_name in hashed_ids.keys():
-            self.transformer.hashed_ids[object_name] = hashed_ids[object_name]
+        with metrics.timer("get_unique_ids", records=len(people)):
+            unique_ids = self.hsf.getUniqueIds(config=config, source_data=people)
 
+        # getUniqueIds keeps its results on the hsf object and replaces them on every call
+        hashed_ids = {}
+        for object_name in config.keys():
+            if object_name in unique_ids:
+                hashed_ids[object_name] = dict(unique_ids[object_name])
+        return hashed_ids
+
+    def transform_people(self, people: list, hashed_ids: dict, target_object: str=None, exclude_target_objects: list=[]) -> dict:
+        """
+        Transforms the people into Salesforce records
+        Returns a dict where the keys are the object names and the values are lists of records
+        """
         data = {}
-        # data is a dict where the keys are the object names and the values are lists of records
-
-        # data = self.transformer.transform(source_data=people, target_object='Contact')
-        data_gen = self.transformer.transform(source_data=people, source_name='pds', exclude_target_objects=['Contact'])
-        for data_element in data_gen:
-            # logger.info(pformat(data_element))
-            data_elements = []
-            if not isinstance(data_element, list):
-                data_elements = [data_element]
-            for d in data_elements:
+        # with COLUMNAR_TRANSFORM, the flat objects are transformed for the whole batch at once (the same records)
+        columnar_objects = []
+        if self.columnar_transform:
+            if target_object is not None:
+                source_config = self.transformer.getTargetConfig(target_object)
+            else:
+                source_config = {object_name: object_config for object_name, object_config in self.transformer.getSourceConfig('pds').items() if object_name not in exclude_target_objects}
+            columnar_objects = self.transformer.columnar_objects(source_config)
+
+        data_gen = []
+        if target_object is not None:
+            if target_object not in columnar_objects:
+                data_gen = self.transformer.transform(source_data=people, target_object=target_object, hashed_ids=hashed_ids)
+        else:
+            data_gen = self.transformer.transform(source_data=people, source_name='pds', exclude_target_objects=list(exclude_target_objects) + columnar_objects, hashed_ids=hashed_ids)
+
+        with metrics.timer("transform", records=len(people)):
+            for object_name in columnar_objects:
+                records = self.transformer.transform_columns(people, object_name, source_config=source_config)
+                if len(records) == 0:
+                    continue
+                if 'updatedFlag' in self.app_config.config[object_name]:
+                    updated_flag = self.app_config.config[object_name]['updatedFlag']
+                    for record in records:
+                        record[updated_flag] = True
+                data[object_name] = records
+
+            for d in data_gen:
                 for i, v in d.items():
                     if i not in data:
                         data[i] = []
@@ -335,34 +512,95 @@ class SalesforcePersonUpdates:
                         updated_flag = self.app_config.config[i]['updatedFlag']
                         v[updated_flag] = True
                     data[i].append(v)
-                        
-        del data_gen
 
-        self.push_records(data=data)
-        data = {}
+        if metrics.enabled:
+            # the validate time is part of the transform time
+            metrics.flush("validate", records=len(people))
+            for object_name, records in data.items():
+                metrics.observe("transformed_records", len(records), object=object_name)
+        return data
+
+    def push_people_data(self, people: list, data: dict, trim_nons=False, on_pushed=None):
+        # the Contacts need to be pushed (and finished) first, everything else references them
+        # on_pushed (optional) is called with the object name after each object's push finishes
+        if 'Contact' in data:
+            logger.info(f"Processing {len(people)} Contact records")
+            contact_data = data.pop('Contact')
+            contact_external_id = self.app_config.config['Contact']['Id']['salesforce']
+            logger.debug(f"Upserting to Contact with {len(contact_data)} records")
+            if trim_nons is True:
+                contact_data = self.hsf.trim_nones(contact_data)
+            contact_data = self.drop_unchanged('Contact', contact_data)
+            if len(contact_data) == 0:
+                logger.debug(f"No changed Contact records to push")
+            elif self.tracks_jobs('Contact'):
+                # everything else references the Contacts, so this one still waits
+                self.job_tracker.submit('Contact', contact_data, id_name=contact_external_id).result()
+            else:
+                self.hsf.pushBulk('Contact', contact_data, id_name=contact_external_id)
+            if on_pushed is not None:
+                on_pushed('Contact')
+
+        self.push_records(data=data, on_pushed=on_pushed)
 
-    def push_records(self, data: dict):
+    def push_records(self, data: dict, on_pushed=None):
         # this will push each object's data to Salesforce in a separate thread
         # the data is a dict where the keys are the object names and the values are lists of records
-        branch_threads = []
-
-        for object, object_data in data.items():
-            logger.debug(f"Upserting to {object} with {len(object_data)} records")
+        # on_pushed (optional) is called with the object name after each object's push finishes (without an error)
+        if self.fingerprints is not None:
+            changed_data = {}
+            for object, object_data in data.items():
+                object_data = self.drop_unchanged(object, object_data)
+                if len(object_data) > 0:
+                    changed_data[object] = object_data
+                elif on_pushed is not None:
+                    # nothing to push, so it's done
+                    on_pushed(object)
+            data = changed_data
+
+        if len(data) == 0:
+            return
+
+        # the jobs are submitted and left to the tracker, on_pushed is called when each object's results are in
+        tracked_objects = [object for object in data.keys() if self.tracks_jobs(object)]
+        for object in tracked_objects:
             external_id = self.app_config.config[object]['Id']['salesforce']
+            self.job_tracker.submit(object, data[object], external_id, on_done=on_pushed)
+        data = {object: object_data for object, object_data in data.items() if object not in tracked_objects}
+        if len(data) == 0:
+            return
 
-            # unthreaded:
-            # self.hsf.pushBulk(object, object_data)    
+        with BatchExecutor(max_workers=len(data), name="push") as push_executor:
+            for object, object_data in data.items():
+                logger.debug(f"Upserting to {object} with {len(object_data)} records")
+                external_id = self.app_config.config[object]['Id']['salesforce']
 
-            thread = ThreadExcept(target=self.hsf.pushBulk, args=(object, object_data, external_id))
-            thread.start()
-            branch_threads.append(thread)
-        
-        # it's okat to join them all here as this will generally be done in a sub-thread, 
-        #   so they won't block the main thread
-        for thread in branch_threads:
-            thread.join()
-            if thread.exception:
-                raise thread.exception
+                # unthreaded:
+                # self.hsf.pushBulk(object, object_data)    
+
+                callback = None
+                if on_pushed is not None:
+                    callback = lambda future, object_name=object: on_pushed(object_name) if not future.cancelled() and future.exception() is None else None
+                push_executor.submit(self.hsf.pushBulk, object, object_data, external_id, callback=callback)
+            
+            # it's okay to wait on them all here as this will generally be done in a sub-thread, 
+            #   so they won't block the main thread
+            push_executor.wait()
+
+    def tracks_jobs(self, object_name: str) -> bool:
+        # with ASYNC_BULK, the tracker's jobs are Bulk API 2.0 jobs,
+        #   so an object with another bulkApiVersion is still pushed (and waited on) with pushBulk
+        if self.job_tracker is None:
+            return False
+        return self.hsf.bulk_api_versions.get(object_name, 2) == 2
+
+    def drop_unchanged(self, object_name: str, records: list) -> list:
+        # with DELTA_PUSH, returns just the records that changed since they were last pushed
+        #   (with DELTA_PUSH="fields", just the fields that changed and the external id)
+        if self.fingerprints is None:
+            return records
+        external_id = self.app_config.config[object_name]['Id']['salesforce']
+        return self.fingerprints.changed(object_name, external_id, records)
 
     def update_single_person(self, huids):
         pds_query = copy.deepcopy(self.app_config.pds_query)
@@ -373,17 +611,8 @@ class SalesforcePersonUpdates:
 
         # self.process_people_batch(people=people)
 
+        # people_data_load waits for its batch jobs to finish (and raises their errors)
         self.people_data_load(pds_query=pds_query)
-        
-        if len(self.batch_threads) > 0:
-            logger.debug(f"Waiting for batch jobs to finish.")	
-            while(self.batch_threads):	
-                for thread in self.batch_threads.copy():	
-                    if not thread.is_alive():	
-                        self.batch_threads.remove(thread)
-                    if thread.exception:
-                        raise thread.exception
-
 
         logger.info(f"Finished spot data load: {self.run_id}")
 
@@ -516,7 +745,12 @@ class SalesforcePersonUpdates:
         else:
             logger.info(f"No updates found since {watermark}. No records updated in Salesforce.")
 
-    def full_people_data_load(self, dry_run=False, updates_only=False):
+    def full_people_data_load(self, dry_run=False, updates_only=False, resume=False):
+        """
+        Loads everyone in the configured PDS query
+        The progress is checkpointed as it goes, with resume=True this will skip the records that were already pushed
+          by the last (failed) full load
+        """
         logger.info(f"Processing full data load")
 
         try:
@@ -550,14 +784,12 @@ class SalesforcePersonUpdates:
                 logger.warning(f"Running in a test/sandbox Salesforce instance with PDS security category D. Limiting records to last 5 years of updates ({five_years_ago_string}).")
             
             
-            self.people_data_load(dry_run=dry_run, pds_query=pds_query)
-
-            logger.debug(f"Waiting for batch jobs to finish.")
-            while(self.batch_threads):
-                #  logger.info(f"{len(self.batch_threads)} remaining threads")
-                for thread in self.batch_threads.copy():
-                    if not thread.is_alive():
-                        self.batch_threads.remove(thread)
+            if dry_run:
+                self.people_data_load(dry_run=dry_run, pds_query=pds_query)
+            elif self.shard_count > 1:
+                self.sharded_people_data_load(pds_query=pds_query, resume=resume)
+            else:
+                self.checkpointed_people_data_load(pds_query=pds_query, checkpoint_name="full_person_load", resume=resume)
 
             self.app_config.update_watermark("person")
             logger.info(f"Finished full data load: {self.run_id}")
@@ -565,17 +797,97 @@ class SalesforcePersonUpdates:
             logger.error(f"Error with full data load")
             raise e
 
-    def people_data_load(self, dry_run=False, pds_query=None, trim_nons=False):
-        # This method creates a thread for each batch, this may seem like a lot, but it is necessitated by the following factors:
-        #   1. If we rely on the async of a bulk push, we cannot get the results (created/updated/error results)
-        #      (as I was unable to get the API to return results. If this changes in the future, we could rethink that)
-        #      Without the results, we cannot resolve duplicate errors or have good logging
+    def checkpointed_people_data_load(self, pds_query: dict, checkpoint_name: str, resume=False, progress_callback=None) -> int:
+        """
+        Runs the people_data_load with a checkpoint, with resume=True it will pick up from the stored checkpoint (if there is one)
+        The checkpoint is cleared when the load finishes, and saved when it fails
+        """
+        checkpoint = LoadCheckpoint(app_config=self.app_config, name=checkpoint_name, objects=self.transformer.getSourceConfig('pds').keys())
+        if resume and not checkpoint.load():
+            logger.info(f"No {checkpoint_name} checkpoint found, starting from the beginning")
+
+        try:
+            # people_data_load waits for its batch jobs to finish (and raises their errors)
+            count = self.people_data_load(pds_query=pds_query, checkpoint=checkpoint, progress_callback=progress_callback)
+            checkpoint.clear()
+            return count
+        except Exception as e:
+            # make sure the last of the progress is saved for the resume
+            try:
+                checkpoint.save(force=True)
+                logger.info(f"Saved {checkpoint_name} checkpoint: {checkpoint.summary()}")
+            except Exception as checkpoint_exception:
+                logger.error(f"Error saving {checkpoint_name} checkpoint: {checkpoint_exception}")
+            raise e
+
+    def discard_fingerprints(self):
+        """
+        Forgets the stored record fingerprints (and the ones in memory), for when records are pushed without recording them
+        """
+        if self.fingerprints is not None:
+            fingerprints = self.fingerprints
+        else:
+            fingerprints = RecordFingerprints(name=self.salesforce_instance_id or "local")
+        cleared = fingerprints.clear(self.app_config.config.keys())
+        if len(cleared) > 0:
+            logger.info(f"Discarded the record fingerprints for: {cleared}")
+
+    def sharded_people_data_load(self, pds_query: dict, resume=False) -> int:
+        """
+        Splits the pds_query into shard_count cacheUpdateDate ranges and loads each one in its own process
+          (with its own Salesforce session and PDS pagination), so the transforms aren't stuck on one core.
+        Each shard has its own checkpoint, so a resume only redoes the unfinished parts of the shards.
+          (the shard range is checkpointed too, so a resume splits the query the same way)
+        """
+        shard_start = None
+        if shard_start_override:
+            shard_start = datetime.strptime(shard_start_override, '%Y-%m-%dT%H:%M:%S')
+
+        # the shards don't record what they push (they'd overwrite each other's fingerprints), so the stored ones are out of date
+        self.discard_fingerprints()
+
+        # the shards restore the index this saves, instead of each of them running the same refresh (and writing the same files)
+        if self.hsf.id_index is not None:
+            self.refresh_id_index()
+
+        range_checkpoint_name = f"full_person_load_shards_of_{self.shard_count}"
+        (shard_start, shard_end) = shard_range(self.app_config, range_checkpoint_name, pds_query, start=shard_start, resume=resume)
+        shard_queries = split_pds_query(pds_query, shard_count=self.shard_count, start=shard_start, end=shard_end)
+        shards = []
+        for index, shard_query in enumerate(shard_queries):
+            shards.append({
+                "index": index,
+                "count": self.shard_count,
+                "pds_query": shard_query,
+                "resume": resume,
+                "run_id": self.run_id
+            })
+            logger.info(f"Shard {index}: {shard_query['conditions']}")
+
+        counts = run_shards(run_people_shard, shards)
+        self.app_config.clear_checkpoint(range_checkpoint_name)
+
+        total = sum(counts.values())
+        logger.info(f"Finished sharded data load: {total} records in {len(shards)} shards ({counts})")
+        return total
+
+    def people_data_load(self, dry_run=False, pds_query=None, trim_nons=False, checkpoint: LoadCheckpoint=None, progress_callback=None):
+        # The load is a pipeline of stages, each running in its own thread(s):
+        #   fetch (PDS pagination) -> make_people -> resolve ids -> transform -> push
+        # The stages are joined by small bounded queues. When Salesforce is slow the push stage backs up, 
+        #   the queues fill up, and we stop pulling pages from the PDS (the pds lib pauses its own pagination when its backlog is full).
+        #   That keeps the number of batches in memory bounded by the size of the queues (not by how fast Salesforce is that day).
+        # With ASYNC_BULK off, a push blocks until its bulk results are back, so the push stage has batch_thread_count workers:
+        #   1. We need the results (created/updated/error results) to resolve duplicate errors and have good logging
         #   2. It needs to be async in some way to make sure the PDS pagination timeout does not happen
-        #   3. If we collect results and THEN process, that is too memory intensive and requires sizing up the instance
-        #   (update): 2 and 3 have been further mitigated by the addition of async pagination and memory management in the pds lib
+        # With ASYNC_BULK on, the push stage submits the jobs and moves on, and the BulkJobTracker reads the results back
+        #   (and handles them) when the jobs finish, so the push stage doesn't block on them
         # NOTE: we don't allow more than 3 parent threads to run at a time
         #       and the max bulk load jobs Salesforce will handle at once is 5.
         #       Some batch jobs will take an excessively long time (20 minutes) most will take 30 seconds.
+        # Each batch carries the range of PDS records it holds ([start, end)) so the checkpoint (if there is one)
+        #   can record what was pushed, and skip what was already pushed when resuming
+        # progress_callback (optional) is called with (current_count, total_count) after every PDS page
         logger.debug(f"Starting data load")
 
         # without the pds_query, it uses the "full" configured query
@@ -584,171 +896,222 @@ class SalesforcePersonUpdates:
 
         logger.debug(f"{pds_query}")
 
-        try:
-            self.pds.start_pagination(pds_query)
+        progress = {
+            "current_count": 0,
+            "total_count": 0
+        }
 
-            size = self.pds.batch_size
-            total_count = self.pds.total_count
-            current_count = 0
-            batch_count = 1
-            max_count = math.ceil(total_count / size)
+        if not dry_run and self.hsf.id_index is not None and not self.id_index_read_only:
+            self.refresh_id_index()
 
-            logger.info(f"pds_batch_size: {size}, total_count: {total_count}, max_count: {max_count}")
+        if not dry_run and self.async_bulk:
+            self.job_tracker = BulkJobTracker(hsf=self.hsf)
 
-            if self.record_limit:
-                total_count = self.record_limit
+        pipeline = Pipeline(name="people")
+        pipeline.add_stage("make_people", self._make_people_stage, queue_size=self.pipeline_queue_size)
+        if not dry_run:
+            if self.transformer.uses_sf_references('pds'):
+                # the deprecated `sf.*` references need the Contacts pushed before the ids are looked up
+                #   so each batch is processed start to finish on one of the workers
+                logger.warning(f"Warning: source 'sf.*' syntax is deprecated, use external ids")
+                pipeline.add_stage("process", lambda batch: self._process_stage(batch, trim_nons=trim_nons, checkpoint=checkpoint), workers=self.batch_thread_count, queue_size=self.pipeline_queue_size)
+            else:
+                pipeline.add_stage("resolve_ids", self._resolve_ids_stage, queue_size=self.pipeline_queue_size)
+                pipeline.add_stage("transform", lambda batch: self._transform_stage(batch, checkpoint=checkpoint), queue_size=self.pipeline_queue_size)
+                pipeline.add_stage("push", lambda batch: self._push_stage(batch, trim_nons=trim_nons, checkpoint=checkpoint), workers=self.batch_thread_count, queue_size=self.pipeline_queue_size)
+        else:
+            logger.info(f"dry_run active: No processing happening.")
 
-            backlog = []
-            while True:
+        reasonable_duration = 60 * 60 * 2 # 2 hours
 
-                logger.debug(f"Getting next batch: {batch_count} ({current_count}/{total_count}) -- backlog: {len(backlog)}")
+        try:
+            try:
+                pipeline.run(self._pds_batches(pds_query, progress, pipeline, checkpoint, progress_callback), timeout=reasonable_duration)
+                if self.job_tracker is not None:
+                    # the last jobs are still running
+                    self.job_tracker.wait_all(timeout=reasonable_duration)
+            except TimeoutError:
+                raise Exception(f"Something went wrong with the processing. It took too long.")
+
+            logger.info(f"Successfully finished data load: {self.run_id}")
+            return progress['current_count']
 
+        except Exception as e:
+            logger.error(f"Something went wrong with the processing. ({e})")
+            self.pds.wait_for_pagination()
+            raise
+        finally:
+            if self.job_tracker is not None:
+                self.job_tracker.close()
+                self.job_tracker = None
+            # the ids of the records we created are good either way
+            if not dry_run and self.hsf.id_index is not None and not self.id_index_read_only:
+                self.hsf.id_index.snapshot()
+            # and so are the fingerprints of the records that were pushed
+            if not dry_run and self.fingerprints is not None:
+                self.fingerprints.log_summary()
+                self.fingerprints.snapshot()
+
+    def refresh_id_index(self):
+        # brings the id index up to date for the objects we get from the pds
+        for object_name, object_config in self.transformer.getSourceConfig('pds').items():
+            if 'Id' in object_config:
+                self.hsf.id_index.refresh(object_name, object_config['Id']['salesforce'])
+        self.hsf.id_index.snapshot()
+
+    # this is the fetch stage of the people_data_load pipeline
+    # it pages through the PDS and yields (start, end, results) where results is a list of raw results 
+    #   that is batch_size long (except for the last one) and start/end is its position in the pagination
+    def _pds_batches(self, pds_query: dict, progress: dict, pipeline: Pipeline=None, checkpoint: LoadCheckpoint=None, progress_callback=None):
+        self.pds.start_pagination(pds_query)
+
+        size = self.pds.batch_size
+        pds_total_count = self.pds.total_count
+        total_count = pds_total_count
+        batch_count = 1
+        max_count = math.ceil(total_count / size)
+
+        logger.info(f"pds_batch_size: {size}, total_count: {total_count}, max_count: {max_count}")
+
+        if self.record_limit:
+            total_count = self.record_limit
+        progress['total_count'] = total_count
+
+        if checkpoint is not None:
+            checkpoint.start(pds_query, pds_total_count)
+
+        # the position of the first record in the backlog
+        backlog_start = 0
+        skipped_count = 0
+        backlog = []
+        while True:
+            current_count = progress['current_count']
+            logger.debug(f"Getting next batch: {batch_count} ({current_count}/{total_count}) -- backlog: {len(backlog)}")
+
+            with metrics.timer("pds_page") as timer:
                 results = self.pds.next_page_results()
-                current_run_result_count = len(results)
-
-                if len(backlog) > 0:
-                    # if we have a backlog, we need to add it to the results
-                    logger.debug(f"Adding backlog to results: {len(backlog)}")
-                    results = backlog + results
-                    backlog = []
-
-                current_count += current_run_result_count
-                if current_run_result_count > 0 and len(results) < self.batch_size and current_count < total_count:
-                    # if we have less than a full batch, we need to keep the results for the next batch
-                    logger.debug(f"Adding results to backlog: {len(results)}")
-                    backlog = results
+                timer.records = len(results)
+            current_run_result_count = len(results)
+            current_count += current_run_result_count
+            progress['current_count'] = current_count
+            backlog.extend(results)
+
+            if self.record_limit and current_count > self.record_limit:
+                # if we hit the record limit, we need to cut off the results, 
+                #   otherwise they'll just be the next multiple of the batch size
+                logger.info(f"Record limit reached: {self.record_limit}")
+                difference = current_count - self.record_limit
+                del backlog[len(backlog) - difference:]
+                current_count = self.record_limit
+                progress['current_count'] = current_count
+
+            if pds_total_count != self.pds.total_count:
+                raise Exception(f"total_count changed from {pds_total_count} to {self.pds.total_count}. The PDS pagination failed.")
+
+            if checkpoint is not None:
+                checkpoint.fetched(current_count)
+            if progress_callback is not None:
+                progress_callback(current_count, total_count)
+
+            finished = current_run_result_count == 0 or current_count >= total_count
+            if current_run_result_count == 0:
+                logger.info(f"Finished getting all records from the PDS: {current_count}/{total_count} records")
+            if current_count > total_count:
+                logger.warning(f"Count exceeds total_count {current_count}/{total_count}. The PDS pagination may have failed.")
+
+            # hand off full batches, and whatever is left once we have everything
+            while len(backlog) >= self.batch_size or (finished and len(backlog) > 0):
+                results = backlog[:self.batch_size]
+                del backlog[:self.batch_size]
+                start = backlog_start
+                end = start + len(results)
+                backlog_start = end
+
+                if checkpoint is not None and checkpoint.is_complete(start, end):
+                    # the PDS can't start the pagination part way through, but there's no need to process these again
+                    logger.debug(f"Skipping records {start}-{end}, already completed")
+                    skipped_count += len(results)
                     continue
-                
-                # if the results are larger than the batch size, we need to keep the overflow for next run
-                if len(results) > self.batch_size:
-                    backlog = results[self.batch_size:]
-                    results = results[:self.batch_size]
-                
-                if self.record_limit:
-                    if current_count > self.record_limit:
-                        # if we hit the record limit, we need to cut off the results, 
-                        #   otherwise they'll just be the next multiple of the batch size
-                        logger.info(f"Record limit reached: {self.record_limit}")
-                        difference = current_count - self.record_limit
-                        results = results[:-difference]
-
-                logger.debug(f"Processing batch {batch_count}: {len(results)} records")
-                if current_run_result_count == 0:
-                    logger.info(f"Finished getting all records from the PDS: {current_count}/{total_count} records")
-
-                if len(results) > 0:
-
-                    people = self.pds.make_people(results)
-
-                    # check memory usage
-                    memory_use_percent = psutil.virtual_memory().percent  # percentage of memory use
-                    # memory_avail = psutil.virtual_memory().available * 0.000001  # memory available in MB
-                    # memory_total = psutil.virtual_memory().total * 0.000001
-
-                    # this will get the current backlog of pds results
-                    current_pds_backlog = self.pds.result_queue.qsize() * self.pds.batch_size
-                    logger.info(f"Memory usage: {memory_use_percent}%  current pds backlog: {current_pds_backlog}/{self.pds.max_backlog} pds records {current_count}/{self.pds.total_count}")
-                    
-                    if stack != "developer":
-                        if (memory_use_percent > 50) and not LOCAL:
-                            logger.warning(f"Memory usage is high: {memory_use_percent}%")
-                            memory_use_percent = psutil.virtual_memory().percent  # percentage of memory use
-
-                        if (memory_use_percent > 55) and not LOCAL:
-                            raise Exception(f"Out of memory ({memory_use_percent}): Kicking job before Fargate silently kicks it.")
-                
 
-                if total_count != self.pds.total_count:
-                    raise Exception(f"total_count changed from {total_count} to {self.pds.total_count}. The PDS pagination failed.")
+                # check memory usage
+                memory_use_percent = psutil.virtual_memory().percent  # percentage of memory use
 
-                if len(results) == 0:
-                    logger.info(f"Finished getting records from the PDS: {current_count}/{total_count} records")
-                    break
+                # this will get the current backlog of pds results
+                current_pds_backlog = self.pds.result_queue.qsize() * self.pds.batch_size
+                metrics.observe("pds_backlog", current_pds_backlog)
+                queue_depths = pipeline.queue_depths() if pipeline is not None else {}
+                logger.info(f"Memory usage: {memory_use_percent}%  current pds backlog: {current_pds_backlog}/{self.pds.max_backlog} pds records {current_count}/{self.pds.total_count} queued batches: {queue_depths}")
 
-                if current_count > total_count:
-                    logger.warning(f"Count exceeds total_count {current_count}/{total_count}. The PDS pagination may have failed.")
-                    break
-                
-                logger.info(f"Starting batch {batch_count}: {current_count}/{total_count} ({len(self.batch_threads)} threads in process).")
+                if stack != "developer":
+                    if (memory_use_percent > 50) and not LOCAL:
+                        logger.warning(f"Memory usage is high: {memory_use_percent}%")
+
+                    if (memory_use_percent > 55) and not LOCAL:
+                        raise Exception(f"Out of memory ({memory_use_percent}): Kicking job before Fargate silently kicks it.")
+
+                logger.info(f"Starting batch {batch_count}: {current_count}/{total_count}")
                 batch_count += 1
                 if batch_count > (max_count + 50):
                     logger.error(f"Something may have wrong with the batching. Max estimated batch count ({max_count}) exceeded current batch count: {batch_count}")
                     raise Exception(f"estimated max_count: {max_count}, batch_size: {size}, batch_count: {batch_count}, total_count: {total_count}")
 
-                if not dry_run:
-                    # self.process_people_batch(people)
-                    logger.info(f"Starting a process thread")
-                    thread = ThreadExcept(target=self.process_people_batch, args=(people,trim_nons))
-                    thread.start()
-                    self.batch_threads.append(thread)
-
-                    if self.action == 'person-updates':
-                        # we need a record of updated ids
-                        # NOTE: v1.0.4: this may not be needed anymore since the external_id is now used more directly for the reference
-                        external_id = self.app_config.config['Contact']['Id']['pds']
-                        self.updated_ids += [person[external_id] for person in people]
-
-
-                    while len(self.batch_threads) >= self.batch_thread_count:
-                        time.sleep(10)
-                        for thread in self.batch_threads.copy():
-                            # logger.info(f"{len(self.batch_threads)} unresolved threads")
-                            if not thread.is_alive():
-                                self.batch_threads.remove(thread)
-                            if thread.exception:
-                                raise thread.exception
-
-                else:
-                    logger.info(f"dry_run active: No processing happening.")
-
-
-                # this will close off threads that are done, once closed, the threads will be able to bubble logs up
-                for thread in self.batch_threads.copy():
-                    if not thread.is_alive():
-                        self.batch_threads.remove(thread)
-                    if thread.exception:
-                        raise thread.exception
-
-            
-                if current_count >= total_count:
-                    break
-
-            # get current timestamp
-            eastern = pytz.timezone('US/Eastern')
-            current_time = datetime.now(eastern)
-            reasonable_duration = 60 * 60 * 2 # 2 hours
-            if len(self.batch_threads) > 0:
-                logger.info(f"Finishing remaining processing threads: {len(self.batch_threads)}")
-            while(self.batch_threads):
-                if (datetime.now(eastern) - current_time).total_seconds() > reasonable_duration:
-                    raise Exception(f"Something went wrong with the processing. It took too long.")
-                for thread in self.batch_threads.copy():
-                    if not thread.is_alive():
-                        self.batch_threads.remove(thread)
-
-            return current_count
-
-        except Exception as e:
-            logger.error(f"Something went wrong with the processing. ({e})")
-            self.pds.wait_for_pagination()
-            raise
-
-        # while(self.batch_threads):
-        #     for thread in self.batch_threads.copy():
-        #         if not thread.is_alive():
-        #             self.batch_threads.remove(thread)
-
-        if len(self.batch_threads) > 0:
-            logger.info(f"Waiting for batch jobs to finish.")	
-            while(self.batch_threads):	
-                for thread in self.batch_threads.copy():	
-                    if not thread.is_alive():	
-                        self.batch_threads.remove(thread)
-                    if thread.exception:
-                        raise thread.exception
-
-
-        logger.info(f"Successfully finished data load: {self.run_id}")
+                # this will block while the pipeline is full
+                yield (start, end, results)
+
+            if finished:
+                logger.info(f"Finished getting records from the PDS: {current_count}/{total_count} records")
+                if skipped_count > 0:
+                    logger.info(f"Skipped {skipped_count} records that were completed by the last run")
+                break
+
+    def _make_people_stage(self, batch: tuple) -> tuple:
+        (start, end, results) = batch
+        with metrics.timer("make_people", records=len(results)):
+            people = self.pds.make_people(results)
+
+        if self.action == 'person-updates':
+            # we need a record of updated ids
+            # NOTE: v1.0.4: this may not be needed anymore since the external_id is now used more directly for the reference
+            external_id = self.app_config.config['Contact']['Id']['pds']
+            self.updated_ids += [person[external_id] for person in people]
+
+        return (start, end, people)
+
+    def _resolve_ids_stage(self, batch: tuple) -> tuple:
+        (start, end, people) = batch
+        return (start, end, people, self.resolve_people_ids(people))
+
+    def _transform_stage(self, batch: tuple, checkpoint: LoadCheckpoint=None) -> tuple:
+        (start, end, people, hashed_ids) = batch
+        # when resuming, some objects might have already been pushed for these records
+        completed_objects = []
+        if checkpoint is not None:
+            completed_objects = checkpoint.completed_objects(start, end)
+        return (start, end, people, self.transform_people(people, hashed_ids=hashed_ids, exclude_target_objects=completed_objects))
+
+    def _push_stage(self, batch: tuple, trim_nons=False, checkpoint: LoadCheckpoint=None):
+        (start, end, people, data) = batch
+        on_pushed = None
+        if checkpoint is not None:
+            on_pushed = lambda object_name: checkpoint.complete(object_name, start, end)
+        pushed_objects = list(data.keys())
+
+        self.push_people_data(people, data, trim_nons=trim_nons, on_pushed=on_pushed)
+
+        if checkpoint is not None:
+            # the objects with no records in this batch are done too
+            #   (the others are done when their push is, which might be later with ASYNC_BULK)
+            for object_name in checkpoint.objects:
+                if object_name not in pushed_objects:
+                    checkpoint.complete(object_name, start, end)
+
+    def _process_stage(self, batch: tuple, trim_nons=False, checkpoint: LoadCheckpoint=None):
+        (start, end, people) = batch
+        self.process_people_batch(people, trim_nons)
+
+        if checkpoint is not None:
+            for object_name in checkpoint.objects:
+                checkpoint.complete(object_name, start, end)
 
     def delete_people(self, dry_run: bool=True, huids: list=[]):
         # This is intended for debug use only.
@@ -780,11 +1143,10 @@ class SalesforcePersonUpdates:
     def cleanup_updateds(self, is_testing=False):
 
         # 1. Get all objects that have an updatedFlag
-        # and set up a hash for all of the ids we find in salesforce
-        all_sf_ids = {}
+        # and set up a set for all of the ids we find in salesforce (the reconciler)
+        reconciler = IdReconciler()
         # and fields needed for the pds query
         fields_needed = []
-        field_object_map = {}
 
         # 2. Get all (external) IDs from Salesforce
         # not sure if this should be limited to contacts with updatedFlag = True
@@ -806,15 +1168,15 @@ class SalesforcePersonUpdates:
                     for pds_id in pds_id_name:
                         if pds_id not in fields_needed:
                             fields_needed.append(pds_id)
-                            field_object_map[pds_id] = object_name
+                            reconciler.add_field(pds_id, object_name)
                 else:
                     if pds_id_name not in fields_needed: 
                         fields_needed.append(pds_id_name)
-                        field_object_map[pds_id_name] = object_name
+                        reconciler.add_field(pds_id_name, object_name)
                 
                 if not is_testing:
-                    all_sf_ids[object_name] = self.hsf.get_all_external_ids(object_name=object_name, external_id=external_id, updated_flag_name=updated_flag, updated_flag_value=updated_flag_value)
-                    logger.info(f"{object_name}: {len(all_sf_ids[object_name])} records to check")
+                    reconciler.add_object(object_name, self.hsf.get_all_external_ids(object_name=object_name, external_id=external_id, updated_flag_name=updated_flag, updated_flag_value=updated_flag_value))
+                    logger.info(f"{object_name}: {reconciler.starting_count(object_name)} records to check")
 
 
         # 3. Call PDS with the IDs from Contact with the fields gathered from the config
@@ -845,12 +1207,20 @@ class SalesforcePersonUpdates:
         self.pds.batch_size = 800
         # step through the sf ids 800 at a time
 
-        # need to deepcopy because we're going to be modifying all_sf_ids
-        all_contact_ids = copy.deepcopy(all_sf_ids['Contact'])
+        # a copy of the contact ids, because the reconciler checks them off as they're found
+        all_contact_ids = reconciler.remaining('Contact')
+        contact_id_batches = [all_contact_ids[i:i+self.pds.batch_size] for i in range(0, len(all_contact_ids), self.pds.batch_size)]
 
-        for i in range(0, len(all_contact_ids), self.pds.batch_size):
+        # the pds client isn't shared between threads, each lookup worker gets its own
+        pds_clients = threading.local()
 
-            contact_ids_batch = all_contact_ids[i:i+self.pds.batch_size]
+        def lookup(contact_ids_batch):
+            if self.cleanup_worker_count <= 1:
+                pds_client = self.pds
+            else:
+                if not hasattr(pds_clients, 'pds'):
+                    pds_clients.pds = self.new_pds_client(batch_size=self.pds.batch_size)
+                pds_client = pds_clients.pds
 
             # deepcopy needed because even though "pointers don't exist in python", lists and dicts are mutable
             batch_query = copy.deepcopy(temp_pds_query)
@@ -858,62 +1228,56 @@ class SalesforcePersonUpdates:
 
             try:
                 logger.debug(f"composite query: {batch_query}")
-                results = self.pds.search(batch_query)
-                if 'results' not in results:
-                    logger.error(f"Error getting pds ids: {results}")
-                    break
-
+                results = pds_client.search(batch_query)
             except Exception as e:
                 logger.error(f"Error getting pds ids: {e}, pds_query: {batch_query}")
                 raise e
+            # a batch we couldn't check would look like it's not updating, so this can't be skipped
+            if 'results' not in results:
+                logger.error(f"Error getting pds ids: {results}")
+                raise Exception(f"Error getting pds ids: {results}")
+            return results['results']
+
+        # one pass through each page of results checks off every id that's still in PDS
+        #   (this always happens on this thread, so the reconciler doesn't need a lock)
+        def reconcile(index, people):
+            reconciler.reconcile(people)
+            logger.debug(f"Checked cleanup batch {index + 1}/{len(contact_id_batches)}")
+
+        logger.info(f"Looking up {len(contact_id_batches)} batches of Contact ids in PDS with {self.cleanup_worker_count} workers")
+        run_lookups(
+            lookup,
+            contact_id_batches,
+            reconcile,
+            worker_count=self.cleanup_worker_count,
+            ordered=self.cleanup_ordered,
+            retries=self.cleanup_retries,
+            backoff=self.cleanup_retry_backoff
+        )
 
-
-            for person in results['results']:
-
-                for pds_field in fields_needed:                    
-                    object_name = field_object_map[pds_field]
-                    if '.' in pds_field:
-                        branch = pds_field.split('.')[0]
-                        sub_id = pds_field.split('.')[1]
-                    else:
-                        branch = None
-                        sub_id = pds_field
-
-                    if branch:
-                        # if the branch of this id isn't in the results for this person, skip it
-                        if branch not in person.keys():
-                            continue
-                        # if the branch is there, we need to loop through all items
-                        for b in person[branch]:
-                            # if the sub_id of this id isn't in the results for this person, skip it (not really sure this can happen)
-                            if sub_id not in b.keys():
-                                continue
-                            sub_id_value = str(b[sub_id])
-
-                            # if the id is in the list of sf ids for this object, remove it from the list
-                            if sub_id_value in all_sf_ids[object_name]:
-                                all_sf_ids[object_name].remove(sub_id_value)
-                                
-                    else:
-                        if sub_id not in person.keys():
-                            continue
-                        if person[sub_id] in all_sf_ids[object_name]:
-                            all_sf_ids[object_name].remove(person[sub_id])
-
-        # 4. Any IDs remaining in the hash are no longer in the PDS results, so we need to update them
-        for object_name in all_sf_ids.keys():
-            if 'updatedFlag' not in self.app_config.config[object_name]:
-                continue
-            if len(all_sf_ids[object_name]) == 0:
-                logger.info(f"No {object_name} records to update")
-                continue
-            if len(all_sf_ids[object_name]) == len(self.hsf.get_all_external_ids(object_name=object_name, external_id=self.app_config.config[object_name]['Id']['salesforce'], updated_flag_name=self.app_config.config[object_name]['updatedFlag'], updated_flag_value=True)):
-                raise Exception(f"Something went wrong, all {object_name} records are not updating: {len(all_sf_ids[object_name])}")
-            logger.info(f"Found {len(all_sf_ids[object_name])} ids in {object_name} that are no longer updating")
-            # logger.info(all_sf_ids)
-            external_id = self.app_config.config[object_name]['Id']['salesforce']
-            updated_flag = self.app_config.config[object_name]['updatedFlag']
-            self.hsf.flag_field(object_name=object_name, external_id=external_id, flag_name=updated_flag, value=False, ids=all_sf_ids[object_name])
+        # 4. Any IDs remaining in the reconciler are no longer in the PDS results, so we need to update them
+        reconciler.log_summary()
+        try:
+            for object_name in reconciler.remaining_ids.keys():
+                if 'updatedFlag' not in self.app_config.config[object_name]:
+                    continue
+                remaining_count = reconciler.remaining_count(object_name)
+                if remaining_count == 0:
+                    logger.info(f"No {object_name} records to update")
+                    continue
+                # the ids for objects with an updatedFlag were only the ones still flagged as updated,
+                #   so if none of them were found, something is wrong with the PDS query
+                if remaining_count == reconciler.starting_count(object_name):
+                    raise Exception(f"Something went wrong, all {object_name} records are not updating: {remaining_count}")
+                logger.info(f"Found {remaining_count} ids in {object_name} that are no longer updating")
+                external_id = self.app_config.config[object_name]['Id']['salesforce']
+                updated_flag = self.app_config.config[object_name]['updatedFlag']
+                self.hsf.flag_field(object_name=object_name, external_id=external_id, flag_name=updated_flag, value=False, ids=reconciler.remaining(object_name))
+        finally:
+            # the flags are pushed with the external ids, so the fingerprints have them now (the load's snapshot doesn't),
+            #   without this a person who comes back unchanged would be skipped and keep the updatedFlag off
+            if self.fingerprints is not None:
+                self.fingerprints.snapshot()
 
 
     def compare_records(self):
@@ -982,25 +1346,38 @@ class SalesforcePersonUpdates:
                 response = os.remove(filename)
             workbook.save(filename)
 
-    def check_for_defunct_accounts(self):
-        # get all accounts that have our external id
-        external_id = self.app_config.config['Account']['Id']['salesforce']
-        result = self.hsf.sf.query_all(f"SELECT Id, {external_id}, LastModifiedDate FROM Account WHERE {external_id} != null ORDER BY LastModifiedDate DESC")
-
-        ids_to_remove = []
-        seen_external_ids = []
-        for record in result['records']:
-            if record[external_id] in seen_external_ids:
-                ids_to_remove.append(record['Id'])
-            else:
-                seen_external_ids.append(record[external_id])
+    def find_duplicates(self, object_names: list=None) -> DuplicateReport:
+        """
+        Checks these objects (all of the configured objects by default) for records that share an external id
+        The report is kept (self.duplicate_report), so the remove actions can use it without querying again
+        """
+        if object_names is None:
+            object_names = list(self.app_config.config.keys())
+        objects = {object_name: self.app_config.config[object_name]['Id']['salesforce'] for object_name in object_names}
+
+        detector = DuplicateDetector(hsf=self.hsf, max_workers=self.batch_thread_count)
+        if self.duplicate_report is None:
+            self.duplicate_report = DuplicateReport()
+        return detector.detect(objects, report=self.duplicate_report)
+
+    def _duplicate_losers(self, object_name: str, report: DuplicateReport=None) -> list:
+        # use the report if we have one for this object, otherwise check now
+        if report is None:
+            report = self.duplicate_report
+        if report is None or not report.has(object_name):
+            report = self.find_duplicates([object_name])
+        return report.losers(object_name)
+
+    def check_for_defunct_accounts(self, report: DuplicateReport=None):
+        # accounts that share our external id with a more recently modified account
+        ids_to_remove = self._duplicate_losers('Account', report=report)
 
         # logger.info(f"{ids_to_remove}")
         logger.info(f"Found {len(ids_to_remove)} accounts")
         return ids_to_remove
 
-    def remove_defunct_accounts(self):
-        ids_to_remove = self.check_for_defunct_accounts()
+    def remove_defunct_accounts(self, report: DuplicateReport=None):
+        ids_to_remove = self.check_for_defunct_accounts(report=report)
 
 
         self.hsf.delete_records(object_name='Account', ids=ids_to_remove)
@@ -1014,18 +1391,9 @@ class SalesforcePersonUpdates:
 
         logger.info(f"remove_defunct_accounts action finished")
             
-    def check_for_defunct_contacts(self):
-        # get all contacts that have our external id
-        external_id = self.app_config.config['Contact']['Id']['salesforce']
-        result = self.hsf.sf.query_all(f"SELECT Id, {external_id}, LastModifiedDate FROM Contact WHERE {external_id} != null ORDER BY LastModifiedDate DESC")
-
-        ids_to_remove = []
-        seen_external_ids = []
-        for record in result['records']:
-            if record[external_id] in seen_external_ids:
-                ids_to_remove.append(record['Id'])
-            else:
-                seen_external_ids.append(record[external_id])
+    def check_for_defunct_contacts(self, report: DuplicateReport=None):
+        # contacts that share our external id with a more recently modified contact
+        ids_to_remove = self._duplicate_losers('Contact', report=report)
         logger.info(f"Found {len(ids_to_remove)} contacts with duplicate external ids")
 
         # get all contacts that are "huit updated" but have no external id
@@ -1039,34 +1407,27 @@ class SalesforcePersonUpdates:
         logger.info(f"Found {len(ids_to_remove)} contacts")
         return ids_to_remove
     
-    def remove_defunct_contacts(self):
-        ids_to_remove = self.check_for_defunct_contacts()
+    def remove_defunct_contacts(self, report: DuplicateReport=None):
+        ids_to_remove = self.check_for_defunct_contacts(report=report)
 
 
         self.hsf.delete_records(object_name='Contact', ids=ids_to_remove)
 
         logger.info(f"remove_defunct_contacts action finished")
 
-    def check_for_duplicate_records(self, object_name):
-        # get all contacts that have our external id
-        external_id = self.app_config.config[object_name]['Id']['salesforce']
-        result = self.hsf.sf.query_all(f"SELECT Id, {external_id}, LastModifiedDate FROM {object_name} WHERE {external_id} != null ORDER BY LastModifiedDate DESC")
-
-        ids_to_remove = []
-        seen_external_ids = []
-        for record in result['records']:
-            if record[external_id] in seen_external_ids:
-                ids_to_remove.append(record['Id'])
-            else:
-                seen_external_ids.append(record[external_id])
+    def check_for_duplicate_records(self, object_name, report: DuplicateReport=None):
+        ids_to_remove = self._duplicate_losers(object_name, report=report)
         logger.info(f"Found {len(ids_to_remove)} {object_name} with duplicate external ids")
 
 
         return ids_to_remove
     
-    def full_duplicate_check(self):
-        for object_name, object_config in self.app_config.config.items():
-            ids_to_remove = self.check_for_duplicate_records(object_name)
+    def full_duplicate_check(self) -> DuplicateReport:
+        # all of the configured objects, checked at the same time
+        report = self.find_duplicates()
+        for object_name, summary in report.summary().items():
+            logger.info(f"{object_name}: {summary['duplicate_records']} duplicate records ({summary['duplicated_external_ids']} external ids, {summary['records']} records)")
+        return report
 
 
 
@@ -1080,3 +1441,40 @@ class SalesforcePersonUpdates:
 
         pds_query['conditions']['cacheUpdateDate'] = ">" + watermark.strftime('%Y-%m-%dT%H:%M:%S')
         people = self.pds.get_people(pds_query)
+
+
+# this is the worker for a sharded full load, it runs in its own (spawned) process
+#   so it sets up its own SalesforcePersonUpdates (and Salesforce session, and PDS client)
+def run_people_shard(shard: dict) -> int:
+    sfpu = SalesforcePersonUpdates(local=LOCAL)
+    sfpu.run_id = f"{shard['run_id']}_shard{shard['index']}"
+    metrics.run_id = sfpu.run_id
+    if not os.getenv("SIMPLE_LOGS"):
+        sfpu.setup_logging(logger=logger)
+
+    # the shards would overwrite each other's fingerprints, so a sharded load pushes everything
+    sfpu.fingerprints = None
+    sfpu.hsf.fingerprints = None
+    # and the parent process keeps the id index up to date
+    sfpu.id_index_read_only = True
+
+    # the bulk job limit is for the whole org, so the shards split it
+    bulk_job_governor.max_jobs = max(1, bulk_job_limit // shard['count'])
+
+    progress_queue = shard.get('progress_queue')
+    progress_callback = None
+    if progress_queue is not None:
+        progress_callback = lambda current_count, total_count: progress_queue.put((shard['index'], current_count, total_count))
+
+    try:
+        return sfpu.checkpointed_people_data_load(
+            pds_query=shard['pds_query'],
+            checkpoint_name=f"full_person_load_shard_{shard['index']}_of_{shard['count']}",
+            resume=shard['resume'],
+            progress_callback=progress_callback
+        )
+    finally:
+        bulk_job_governor.log_summary()
+        metrics.log_summary()
+        metrics.close()
+        sfpu.close_logging()
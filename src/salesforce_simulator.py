@@ -0,0 +1,626 @@
+from common import logger
+
+import re
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from simple_salesforce import exceptions
+
+
+class LatencyModel():
+    """
+    How long a simulated call takes: base seconds + per_record seconds for each record (the throughput)
+      + up to jitter seconds (random, but repeatable with the simulator's seed)
+    """
+    def __init__(self, base: float=0.0, per_record: float=0.0, jitter: float=0.0):
+        self.base = base
+        self.per_record = per_record
+        self.jitter = jitter
+
+    def seconds(self, record_count: int, rng: random.Random) -> float:
+        seconds = self.base + self.per_record * record_count
+        if self.jitter > 0:
+            seconds += rng.random() * self.jitter
+        return seconds
+
+
+def schema_from_config(config: dict) -> dict:
+    """
+    Builds a simulator schema ({object name: {field name: field description}}) from a transformation config
+      - the config's `fields` (refs become a reference field and its relationship name, ex: Contact__r -> Contact__c)
+      - the `Id.salesforce` is an external id
+      - the `updatedFlag` is a boolean
+    Every object also gets the standard fields the app queries (Id, Name, LastModifiedDate, SystemModstamp, etc)
+    And there's a huit__Log__c object for the Salesforce logs
+    """
+    schema = {}
+    for object_name, object_configs in config.items():
+        if not isinstance(object_configs, list):
+            object_configs = [object_configs]
+        fields = schema.setdefault(object_name, standard_fields(object_name))
+        for object_config in object_configs:
+            for target, source in object_config.get('fields', {}).items():
+                if isinstance(source, dict) and 'ref' in source:
+                    field_name = re.sub(r"__r$", "__c", target)
+                    fields[field_name] = field_description(field_name, "reference", relationship_name=target, reference_to=source['ref']['object'])
+                elif target not in fields:
+                    fields[target] = field_description(target, "string")
+            if 'Id' in object_config and 'salesforce' in object_config['Id']:
+                external_id = object_config['Id']['salesforce']
+                fields[external_id] = field_description(external_id, "string", external_id=True)
+            if 'updatedFlag' in object_config:
+                fields[object_config['updatedFlag']] = field_description(object_config['updatedFlag'], "boolean")
+
+    log_fields = schema.setdefault("huit__Log__c", standard_fields("huit__Log__c"))
+    for field_name in ["huit__Message__c", "huit__Source__c", "huit__Level__c", "huit__RunId__c", "huit__Datetime__c"]:
+        log_fields[field_name] = field_description(field_name, "string", length=131072)
+    return schema
+
+
+def standard_fields(object_name: str) -> dict:
+    fields = {
+        "Id": field_description("Id", "id", length=18, updateable=False),
+        "Name": field_description("Name", "string"),
+        "CreatedDate": field_description("CreatedDate", "datetime", updateable=False),
+        "LastModifiedDate": field_description("LastModifiedDate", "datetime", updateable=False),
+        "SystemModstamp": field_description("SystemModstamp", "datetime", updateable=False),
+        "IsDeleted": field_description("IsDeleted", "boolean", updateable=False),
+        "RecordTypeId": field_description("RecordTypeId", "reference", length=18),
+    }
+    if object_name == "Contact":
+        for field_name in ["FirstName", "LastName", "Email", "Department"]:
+            fields[field_name] = field_description(field_name, "email" if field_name == "Email" else "string")
+    if object_name == "Account":
+        fields["ParentId"] = field_description("ParentId", "reference", length=18, relationship_name="Parent", reference_to="Account")
+    return fields
+
+
+def field_description(name: str, type: str, length: int=255, external_id: bool=False, updateable: bool=True, relationship_name: str=None, reference_to: str=None) -> dict:
+    # the parts of a describe() field the app uses
+    return {
+        "name": name,
+        "type": type,
+        "length": length if type not in ["boolean", "datetime", "date"] else 0,
+        "externalId": external_id,
+        "updateable": updateable,
+        "relationshipName": relationship_name,
+        "referenceTo": [reference_to] if reference_to else []
+    }
+
+
+class _SimulatedSObject():
+    # sf.<object> (describe and single record create)
+    def __init__(self, simulator, object_name: str):
+        self.simulator = simulator
+        self.object_name = object_name
+
+    def describe(self, headers=None):
+        return self.simulator.describe_object(self.object_name)
+
+    def create(self, data: dict, headers=None):
+        return self.simulator.create(self.object_name, data)
+
+
+class _SimulatedBulkType():
+    # sf.bulk.<object>
+    def __init__(self, simulator, object_name: str):
+        self.simulator = simulator
+        self.object_name = object_name
+
+    def upsert(self, data: list, external_id_field: str, batch_size: int=10000, use_serial: bool=False, bypass_results: bool=False, **kwargs):
+        return self.simulator.bulk_upsert(self.object_name, data, external_id_field)
+
+    def insert(self, data: list, batch_size: int=10000, use_serial: bool=False, bypass_results: bool=False, **kwargs):
+        return self.simulator.bulk_upsert(self.object_name, data, "Id")
+
+    def update(self, data: list, batch_size: int=10000, use_serial: bool=False, bypass_results: bool=False, **kwargs):
+        return self.simulator.bulk_upsert(self.object_name, data, "Id", update_only=True)
+
+    def delete(self, data: list, batch_size: int=10000, use_serial: bool=False, bypass_results: bool=False, **kwargs):
+        return self.simulator.bulk_delete(self.object_name, data)
+
+
+class _SimulatedBulk():
+    # sf.bulk
+    def __init__(self, simulator):
+        self.simulator = simulator
+
+    def __getattr__(self, object_name: str):
+        if object_name.startswith("__"):
+            raise AttributeError(object_name)
+        return _SimulatedBulkType(self.simulator, object_name)
+
+
+class SalesforceSimulator():
+    """
+    An in-process stand-in for the simple_salesforce connection (HarvardSalesforce.sf), for load testing without an org
+
+    It keeps the records in memory and covers what the app uses:
+      - query_all / query_all_iter: SELECT fields FROM object [WHERE conditions joined with AND] [ORDER BY field] [LIMIT n]
+        with =, !=, <, >, <=, >= and IN (...) (and null, true/false, quoted strings, numbers and datetimes)
+      - sf.<object>.describe() and describe() (built from the schema, see schema_from_config)
+      - sf.bulk.<object>.upsert/insert/update/delete with a result for each record, like the classic Bulk API
+        (external id upserts, references by external id (`Contact__r: {external id: value}`), unknown fields, lengths)
+      - sf.<object>.create() and restful("composite/sobjects") for the Salesforce logs (huit__Log__c)
+
+    Errors can be injected (the rates are per record, with a seeded random so a run can be repeated exactly):
+      - duplicate_rate: a new record fails with DUPLICATES_DETECTED
+        (duplicate_rules {object: [fields]} does the same for a new record matching an existing record on all of those fields)
+      - lock_rate: a record fails with UNABLE_TO_LOCK_ROW
+
+    lean: only keep the fields the app looks records up by (Id, the external ids, the flags and the timestamps),
+      so a load of millions of records fits in memory (the other fields are still checked, just not kept)
+
+    The latency models (query, bulk and rest) say how long each call takes, and max_concurrent_jobs how many bulk
+      jobs are worked on at once (the rest wait their turn). With real_time=False the calls don't actually wait,
+      the time they would have taken is added up in simulated_seconds instead.
+    calls counts the calls made to each API (query, bulk_upsert, describe, etc)
+    """
+    def __init__(self, schema: dict=None, seed: int=0, query_latency: LatencyModel=None, bulk_latency: LatencyModel=None, rest_latency: LatencyModel=None, max_concurrent_jobs: int=5, real_time: bool=True, duplicate_rate: float=0.0, lock_rate: float=0.0, duplicate_rules: dict=None, lean: bool=False, sf_instance: str="simulator.my.salesforce.com", sf_version: str="59.0"):
+        self.schema = schema or {}
+        self.query_latency = query_latency or LatencyModel()
+        self.bulk_latency = bulk_latency or LatencyModel()
+        self.rest_latency = rest_latency or LatencyModel()
+        self.real_time = real_time
+        self.duplicate_rate = duplicate_rate
+        self.lock_rate = lock_rate
+        self.duplicate_rules = duplicate_rules or {}
+        self.lean = lean
+
+        # the attributes of a real connection some of the app reads
+        self.sf_instance = sf_instance
+        self.sf_version = sf_version
+        self.base_url = f"https://{sf_instance}/services/data/v{sf_version}/"
+        self.headers = {"Authorization": "Bearer simulated", "Content-Type": "application/json"}
+        self.session_id = "simulated"
+        self.bulk = _SimulatedBulk(self)
+
+        # object name -> {Id: record}
+        self.records = {}
+        # object name -> {Id: record} for deleted records (they show up with include_deleted)
+        self.deleted = {}
+        # (object name, field name) -> {value: Id}, for the fields records are looked up by
+        self._indexes = {}
+        # object name -> the fields kept when lean
+        self._kept_fields = {}
+
+        self.calls = Counter()
+        self.simulated_seconds = 0.0
+        self._rng = random.Random(seed)
+        self._id_counter = 0
+        self._clock = datetime(2024, 1, 1)
+        self._lock = threading.RLock()
+        self._jobs = threading.Semaphore(max_concurrent_jobs)
+
+    def __getattr__(self, object_name: str):
+        # sf.<object>
+        if object_name.startswith("_"):
+            raise AttributeError(object_name)
+        return _SimulatedSObject(self, object_name)
+
+    # ---- seeding and inspecting --------------------------------------------------------
+
+    def load(self, object_name: str, records: list) -> list:
+        """
+        Adds records directly (no latency, no errors), returns their Ids
+        """
+        ids = []
+        with self._lock:
+            for record in records:
+                record = dict(record)
+                record['Id'] = record.get('Id') or self._new_id(object_name)
+                self._save(object_name, record, created=True)
+                ids.append(record['Id'])
+        return ids
+
+    def get(self, object_name: str, field_name: str, value) -> dict:
+        # the record with this value in the field (or None)
+        with self._lock:
+            record_id = self._index(object_name, field_name).get(self._index_value(value))
+            return self.records.get(object_name, {}).get(record_id)
+
+    def count(self, object_name: str) -> int:
+        with self._lock:
+            return len(self.records.get(object_name, {}))
+
+    # ---- REST ---------------------------------------------------------------------------
+
+    def describe(self, headers=None):
+        self._call("describe", self.rest_latency, 1)
+        return {"sobjects": [{"name": object_name} for object_name in self.schema]}
+
+    def describe_object(self, object_name: str) -> dict:
+        self._call("describe", self.rest_latency, 1)
+        if object_name not in self.schema:
+            raise exceptions.SalesforceResourceNotFound(f"{self.base_url}sobjects/{object_name}/describe", 404, object_name, b"NOT_FOUND")
+        return {
+            "name": object_name,
+            "fields": [dict(field) for field in self.schema[object_name].values()],
+            "recordTypeInfos": [{"name": "Master", "recordTypeId": "012000000000000AAA"}]
+        }
+
+    def create(self, object_name: str, data: dict) -> dict:
+        self._call("create", self.rest_latency, 1)
+        with self._lock:
+            result = self._upsert_record(object_name, data, "Id", update_only=False, inject=False)
+        if not result['success']:
+            raise exceptions.SalesforceMalformedRequest(f"{self.base_url}sobjects/{object_name}", 400, object_name, json.dumps(result['errors']).encode("utf-8"))
+        return {"id": result['id'], "success": True, "errors": []}
+
+    def restful(self, path: str, params: dict=None, method: str="GET", **kwargs):
+        if path == "composite/sobjects" and method == "POST":
+            payload = json.loads(kwargs.get('data') or "{}")
+            records = payload.get('records') or []
+            self._call("composite", self.rest_latency, len(records))
+            results = []
+            with self._lock:
+                for record in records:
+                    record = dict(record)
+                    object_name = record.pop('attributes')['type']
+                    result = self._upsert_record(object_name, record, "Id", update_only=False, inject=False)
+                    results.append({"id": result['id'], "success": result['success'], "errors": result['errors']})
+            return results
+        raise exceptions.SalesforceResourceNotFound(f"{self.base_url}{path}", 404, path, b"NOT_FOUND (not simulated)")
+
+    # ---- queries ------------------------------------------------------------------------
+
+    def query_all(self, query: str, include_deleted: bool=False, **kwargs) -> dict:
+        records = list(self.query_all_iter(query, include_deleted=include_deleted))
+        return {"totalSize": len(records), "done": True, "records": records}
+
+    def query(self, query: str, include_deleted: bool=False, **kwargs) -> dict:
+        return self.query_all(query, include_deleted=include_deleted)
+
+    def query_all_iter(self, query: str, include_deleted: bool=False, **kwargs):
+        parsed = self._parse_query(query)
+        object_name = parsed['object']
+        with self._lock:
+            candidates = self._candidates(object_name, parsed['conditions'], include_deleted)
+            matches = [record for record in candidates if all(self._matches(record, condition) for condition in parsed['conditions'])]
+            if parsed['order'] is not None:
+                (order_field, descending) = parsed['order']
+                present = [record for record in matches if record.get(order_field) is not None]
+                missing = [record for record in matches if record.get(order_field) is None]
+                matches = sorted(present, key=lambda record: record[order_field], reverse=descending) + missing
+            if parsed['limit'] is not None:
+                matches = matches[:parsed['limit']]
+            results = [self._select(object_name, record, parsed['fields']) for record in matches]
+
+        self._call("query", self.query_latency, len(results))
+        for record in results:
+            yield record
+
+    # ---- bulk ---------------------------------------------------------------------------
+
+    def bulk_upsert(self, object_name: str, data: list, external_id_field: str, update_only: bool=False) -> list:
+        with self._jobs:
+            self._call("bulk_upsert", self.bulk_latency, len(data))
+            with self._lock:
+                return [self._upsert_record(object_name, record, external_id_field, update_only=update_only, inject=True) for record in data]
+
+    def bulk_delete(self, object_name: str, data: list) -> list:
+        with self._jobs:
+            self._call("bulk_delete", self.bulk_latency, len(data))
+            results = []
+            with self._lock:
+                for record in data:
+                    existing = self.records.get(object_name, {}).get(record.get('Id'))
+                    if existing is None:
+                        results.append(self._error("ENTITY_IS_DELETED", "entity is deleted", []))
+                        continue
+                    self._remove(object_name, existing)
+                    results.append({"success": True, "created": False, "id": existing['Id'], "errors": []})
+            return results
+
+    # ---- internals ----------------------------------------------------------------------
+
+    def _call(self, api: str, latency: LatencyModel, record_count: int):
+        with self._lock:
+            self.calls[api] += 1
+            seconds = latency.seconds(record_count, self._rng)
+            self.simulated_seconds += seconds
+        if self.real_time and seconds > 0:
+            time.sleep(seconds)
+
+    def _upsert_record(self, object_name: str, data: dict, external_id_field: str, update_only: bool, inject: bool) -> dict:
+        # (with the lock held)
+        if inject and self.lock_rate > 0 and self._rng.random() < self.lock_rate:
+            return self._error("UNABLE_TO_LOCK_ROW", "unable to obtain exclusive access to this record or 1 records", [])
+
+        fields = self.schema.get(object_name)
+        values = {}
+        for field_name, value in data.items():
+            if isinstance(value, dict):
+                # a reference by external id
+                (resolved_name, resolved, error) = self._resolve_reference(object_name, field_name, value)
+                if error is not None:
+                    return error
+                values[resolved_name] = resolved
+                continue
+            if fields is not None:
+                if field_name not in fields:
+                    return self._error("INVALID_FIELD", f"No such column '{field_name}' on entity '{object_name}'", [field_name])
+                length = fields[field_name].get('length') or 0
+                if length > 0 and isinstance(value, str) and len(value) > length:
+                    return self._error("STRING_TOO_LONG", f"{field_name}: data value too large: {value[:20]} (max length={length})", [field_name])
+            values[field_name] = value
+
+        existing = None
+        if external_id_field == 'Id':
+            existing = self.records.get(object_name, {}).get(data.get('Id'))
+            if data.get('Id') and existing is None:
+                return self._error("INVALID_CROSS_REFERENCE_KEY", "invalid cross reference id", ['Id'])
+        else:
+            if data.get(external_id_field) is None:
+                return self._error("MISSING_ARGUMENT", f"{external_id_field} not specified", [external_id_field])
+            existing_id = self._index(object_name, external_id_field).get(self._index_value(data[external_id_field]))
+            existing = self.records.get(object_name, {}).get(existing_id)
+
+        if existing is None:
+            if update_only:
+                return self._error("MISSING_ARGUMENT", "Id not specified in an update call", ['Id'])
+            if inject and self._is_duplicate(object_name, values):
+                return self._error("DUPLICATES_DETECTED", "Use one of these records?", [])
+            record = dict(values)
+            record['Id'] = self._new_id(object_name)
+            self._save(object_name, record, created=True)
+            return {"success": True, "created": True, "id": record['Id'], "errors": []}
+
+        values.pop('Id', None)
+        self._unindex(object_name, existing)
+        existing.update(values)
+        self._save(object_name, existing, created=False)
+        return {"success": True, "created": False, "id": existing['Id'], "errors": []}
+
+    def _resolve_reference(self, object_name: str, relationship_name: str, reference: dict) -> tuple:
+        # Contact__r: {external id: value} -> (Contact__c, the Contact's Id, None) or (None, None, an error)
+        field_name = relationship_name
+        reference_to = None
+        for field in (self.schema.get(object_name) or {}).values():
+            if field.get('relationshipName') == relationship_name:
+                field_name = field['name']
+                reference_to = (field.get('referenceTo') or [None])[0]
+                break
+        if reference_to is None:
+            return (None, None, self._error("INVALID_FIELD", f"No such relation '{relationship_name}' on entity '{object_name}'", [relationship_name]))
+
+        (external_id, value) = next(iter(reference.items()))
+        referenced_id = self._index(reference_to, external_id).get(self._index_value(value))
+        if referenced_id is None:
+            return (None, None, self._error("INVALID_FIELD", f"Foreign key external ID: {value} not found for field {external_id} in entity {reference_to}", []))
+        return (field_name, referenced_id, None)
+
+    def _is_duplicate(self, object_name: str, values: dict) -> bool:
+        if self.duplicate_rate > 0 and self._rng.random() < self.duplicate_rate:
+            return True
+        rule = self.duplicate_rules.get(object_name)
+        if not rule or any(values.get(field) is None for field in rule):
+            return False
+        key = tuple(str(values[field]).lower() for field in rule)
+        for record in self.records.get(object_name, {}).values():
+            if tuple(str(record.get(field)).lower() for field in rule) == key:
+                return True
+        return False
+
+    def _new_id(self, object_name: str) -> str:
+        self._id_counter += 1
+        prefixes = {"Account": "001", "Contact": "003"}
+        prefix = prefixes.get(object_name) or ("a" + format(sum(ord(c) for c in object_name) % 100, "02d"))
+        return f"{prefix}{self._id_counter:015d}"
+
+    def _now(self) -> str:
+        # each change is a millisecond after the last, so the SystemModstamps are in order
+        self._clock += timedelta(milliseconds=1)
+        return self._clock.strftime('%Y-%m-%dT%H:%M:%S.') + f"{self._clock.microsecond // 1000:03d}+0000"
+
+    def _save(self, object_name: str, record: dict, created: bool):
+        now = self._now()
+        if created:
+            record.setdefault('CreatedDate', now)
+        record['LastModifiedDate'] = now
+        record['SystemModstamp'] = now
+        record['IsDeleted'] = False
+        if self.lean:
+            kept_fields = self._lean_fields(object_name)
+            record = {key: value for key, value in record.items() if key in kept_fields}
+        self.records.setdefault(object_name, {})[record['Id']] = record
+        self.deleted.get(object_name, {}).pop(record['Id'], None)
+        for (index_object, field_name), index in self._indexes.items():
+            if index_object == object_name and record.get(field_name) is not None:
+                index[self._index_value(record[field_name])] = record['Id']
+
+    def _lean_fields(self, object_name: str) -> set:
+        if object_name not in self._kept_fields:
+            kept_fields = {"Id", "IsDeleted", "LastModifiedDate", "SystemModstamp"}
+            for field in (self.schema.get(object_name) or {}).values():
+                if field.get('externalId') or field.get('type') == "boolean":
+                    kept_fields.add(field['name'])
+            kept_fields.update(self.duplicate_rules.get(object_name) or [])
+            self._kept_fields[object_name] = kept_fields
+        return self._kept_fields[object_name]
+
+    def _remove(self, object_name: str, record: dict):
+        self._unindex(object_name, record)
+        del self.records[object_name][record['Id']]
+        record['IsDeleted'] = True
+        record['SystemModstamp'] = self._now()
+        self.deleted.setdefault(object_name, {})[record['Id']] = record
+
+    def _unindex(self, object_name: str, record: dict):
+        for (index_object, field_name), index in self._indexes.items():
+            if index_object == object_name and record.get(field_name) is not None:
+                if index.get(self._index_value(record[field_name])) == record['Id']:
+                    del index[self._index_value(record[field_name])]
+
+    def _index(self, object_name: str, field_name: str) -> dict:
+        # (with the lock held) built the first time a field is looked up, kept up to date by _save
+        key = (object_name, field_name)
+        if key not in self._indexes:
+            index = {}
+            for record in self.records.get(object_name, {}).values():
+                if record.get(field_name) is not None:
+                    index[self._index_value(record[field_name])] = record['Id']
+            self._indexes[key] = index
+        return self._indexes[key]
+
+    def _index_value(self, value) -> str:
+        return str(value)
+
+    def _candidates(self, object_name: str, conditions: list, include_deleted: bool) -> list:
+        # an IN (or =) on an indexed field (or Id) only has to look at the matching records
+        records = self.records.get(object_name, {})
+        for condition in conditions:
+            (field_name, operator, value) = condition
+            if operator in ["IN", "="] and value is not None and not include_deleted:
+                values = value if operator == "IN" else [value]
+                if field_name == 'Id':
+                    return [records[record_id] for record_id in values if record_id in records]
+                if (object_name, field_name) in self._indexes or self._is_external_id(object_name, field_name):
+                    index = self._index(object_name, field_name)
+                    return [records[index[self._index_value(v)]] for v in values if self._index_value(v) in index]
+        candidates = list(records.values())
+        if include_deleted:
+            candidates += list(self.deleted.get(object_name, {}).values())
+        return candidates
+
+    def _is_external_id(self, object_name: str, field_name: str) -> bool:
+        field = (self.schema.get(object_name) or {}).get(field_name)
+        return field is not None and field.get('externalId')
+
+    def _matches(self, record: dict, condition: tuple) -> bool:
+        (field_name, operator, value) = condition
+        stored = record.get(field_name)
+        if operator == "IN":
+            return stored is not None and self._index_value(stored) in {self._index_value(v) for v in value}
+        if operator == "NOT IN":
+            return stored is None or self._index_value(stored) not in {self._index_value(v) for v in value}
+        if value is None:
+            return (stored is None) == (operator == "=")
+        if isinstance(value, bool):
+            stored = stored in [True, "true", "True"]
+            return (stored == value) == (operator == "=")
+        if operator in ["=", "!="]:
+            return (stored is not None and self._index_value(stored) == self._index_value(value)) == (operator == "=")
+        if stored is None:
+            return False
+        # dates (compared to the second) and numbers
+        if isinstance(value, str):
+            (stored, value) = (str(stored)[:19], value[:19])
+        else:
+            stored = float(stored)
+        return {"<": stored < value, ">": stored > value, "<=": stored <= value, ">=": stored >= value}[operator]
+
+    def _select(self, object_name: str, record: dict, fields: list) -> dict:
+        result = {"attributes": {"type": object_name, "url": f"/services/data/v{self.sf_version}/sobjects/{object_name}/{record['Id']}"}}
+        if fields == ["FIELDS(ALL)"]:
+            result.update(record)
+            return result
+        for field_name in fields:
+            result[field_name] = record.get(field_name)
+        return result
+
+    def _parse_query(self, query: str) -> dict:
+        match = re.match(r"^\s*SELECT\s+(?P<fields>.+?)\s+FROM\s+(?P<object>\w+)(?:\s+WHERE\s+(?P<where>.+?))?(?:\s+ORDER\s+BY\s+(?P<order>[\w.]+)(?:\s+(?P<direction>ASC|DESC))?)?(?:\s+LIMIT\s+(?P<limit>\d+))?\s*$", query, re.IGNORECASE | re.DOTALL)
+        if match is None:
+            raise exceptions.SalesforceMalformedRequest(f"{self.base_url}query", 400, "query", f"MALFORMED_QUERY (not simulated): {query}".encode("utf-8"))
+        object_name = match.group('object')
+
+        fields = []
+        for field_name in match.group('fields').split(","):
+            field_name = self._field_name(object_name, field_name.strip())
+            fields.append("FIELDS(ALL)" if field_name.upper() == "FIELDS(ALL)" else field_name)
+
+        conditions = []
+        if match.group('where'):
+            for clause in _split_and(match.group('where')):
+                condition = re.match(r"^\s*(?P<field>[\w.]+)\s*(?P<operator>NOT\s+IN|IN|!=|<=|>=|=|<|>)\s*(?P<value>.+?)\s*$", clause, re.IGNORECASE | re.DOTALL)
+                if condition is None:
+                    raise exceptions.SalesforceMalformedRequest(f"{self.base_url}query", 400, "query", f"MALFORMED_QUERY (not simulated): {clause}".encode("utf-8"))
+                operator = re.sub(r"\s+", " ", condition.group('operator').upper())
+                value = condition.group('value')
+                if operator in ["IN", "NOT IN"]:
+                    value = [_literal(item) for item in _split_list(value.strip()[1:-1])]
+                else:
+                    value = _literal(value)
+                conditions.append((self._field_name(object_name, condition.group('field')), operator, value))
+
+        order = None
+        if match.group('order'):
+            order = (self._field_name(object_name, match.group('order')), (match.group('direction') or "").upper() == "DESC")
+
+        return {
+            "object": object_name,
+            "fields": fields,
+            "conditions": conditions,
+            "order": order,
+            "limit": int(match.group('limit')) if match.group('limit') else None
+        }
+
+    def _field_name(self, object_name: str, field_name: str) -> str:
+        # Contact.Id -> Id, and the schema's capitalization (SOQL isn't case sensitive)
+        if field_name.lower().startswith(object_name.lower() + "."):
+            field_name = field_name[len(object_name) + 1:]
+        for known_name in (self.schema.get(object_name) or {}):
+            if known_name.lower() == field_name.lower():
+                return known_name
+        return field_name
+
+    def _error(self, status_code: str, message: str, fields: list) -> dict:
+        return {"success": False, "created": False, "id": None, "errors": [{"statusCode": status_code, "message": message, "fields": fields}]}
+
+
+def _split_and(where: str) -> list:
+    # splits the conditions on AND (outside of quotes and parentheses)
+    return [clause for clause in _split_outside(where, r"\s+AND\s+") if clause.strip()]
+
+
+def _split_list(values: str) -> list:
+    return [value for value in _split_outside(values, r"\s*,\s*") if value.strip()]
+
+
+def _split_outside(text: str, separator: str) -> list:
+    parts = []
+    depth = 0
+    quoted = False
+    start = 0
+    index = 0
+    while index < len(text):
+        character = text[index]
+        if quoted:
+            if character == "\\":
+                index += 2
+                continue
+            if character == "'":
+                quoted = False
+        elif character == "'":
+            quoted = True
+        elif character == "(":
+            depth += 1
+        elif character == ")":
+            depth -= 1
+        elif depth == 0:
+            match = re.match(separator, text[index:], re.IGNORECASE)
+            if match is not None and match.end() > 0:
+                parts.append(text[start:index])
+                index += match.end()
+                start = index
+                continue
+        index += 1
+    parts.append(text[start:])
+    return parts
+
+
+def _literal(value: str):
+    value = value.strip()
+    if value.startswith("'") and value.endswith("'"):
+        return re.sub(r"\\(.)", r"\1", value[1:-1])
+    if value.lower() == "null":
+        return None
+    if value.lower() in ["true", "false"]:
+        return value.lower() == "true"
+    if re.match(r"^-?\d+(\.\d+)?$", value):
+        return float(value)
+    return value
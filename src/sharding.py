@@ -0,0 +1,166 @@
+from common import logger
+
+import copy
+import hashlib
+import json
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+import pytz
+
+
+# cacheUpdateDate ranges use the PDS's range syntax: "start>end"
+date_format = '%Y-%m-%dT%H:%M:%S'
+
+
+def split_pds_query(pds_query: dict, shard_count: int, field: str="cacheUpdateDate", start: datetime=None, end: datetime=None) -> list:
+    """
+    Splits the pds_query into shard_count queries that each cover a range of the field (a date field, like cacheUpdateDate)
+    Together the ranges cover everything:
+      - the first shard also gets everything before start
+      - the last shard is open-ended (everything after its start)
+    Each range ends a second after the next one starts, so a record right on a boundary is always in a shard
+      (it may be in two, which just means it's upserted twice)
+    """
+    if shard_count < 1:
+        raise ValueError(f"Error: shard_count must be at least 1 ({shard_count})")
+
+    (start, end) = _resolve_range(start, end)
+
+    width = (end - start) / shard_count
+    boundaries = [start + width * i for i in range(1, shard_count)]
+
+    # the conditions need to be in the list format to have more than one condition on the same field
+    base_conditions = pds_query.get('conditions') or []
+    if isinstance(base_conditions, dict):
+        base_conditions = [{key: value} for key, value in base_conditions.items()]
+    for condition in base_conditions:
+        if field in condition:
+            raise ValueError(f"Error: can't shard a pds_query that already has a {field} condition")
+
+    shard_queries = []
+    for index in range(shard_count):
+        if index == 0:
+            lower = datetime(1900, 1, 1)
+        else:
+            lower = boundaries[index - 1]
+
+        if index == shard_count - 1:
+            range_condition = ">" + lower.strftime(date_format)
+            if index == 0:
+                # there's only one shard, it doesn't need a range
+                range_condition = None
+        else:
+            upper = boundaries[index] + timedelta(seconds=1)
+            range_condition = lower.strftime(date_format) + ">" + upper.strftime(date_format)
+
+        shard_query = copy.deepcopy(pds_query)
+        shard_query['conditions'] = copy.deepcopy(base_conditions)
+        if range_condition is not None:
+            shard_query['conditions'].append({field: range_condition})
+        shard_queries.append(shard_query)
+
+    return shard_queries
+
+
+def shard_range(app_config, name: str, pds_query: dict, start: datetime=None, end: datetime=None, resume: bool=False) -> tuple:
+    """
+    Returns the (start, end) to split the pds_query with, for a sharded load
+    The end defaults to now, so the range is stored as a checkpoint (through the app_config) when the load starts,
+      and a resume uses the stored range: the shard queries (and so their checkpoints) are the same as the first run's
+    A stored range is only used for the same query (and the same start, if one was given)
+    The stored range is cleared with app_config.clear_checkpoint(name) when the load finishes
+    """
+    query_hash = hashlib.sha256(json.dumps(pds_query, sort_keys=True, default=str).encode()).hexdigest()
+
+    if resume:
+        stored = app_config.get_checkpoint(name)
+        if stored:
+            stored_start = datetime.strptime(stored['start'], date_format)
+            stored_end = datetime.strptime(stored['end'], date_format)
+            if stored.get('query_hash') != query_hash:
+                logger.warning(f"Warning: {name} checkpoint is for a different query, using a new shard range")
+            elif start is not None and start != stored_start:
+                logger.warning(f"Warning: {name} checkpoint start ({stored_start}) does not match the shard start ({start}), using a new shard range")
+            else:
+                logger.info(f"Resuming with the shard range from the {name} checkpoint: {stored_start} to {stored_end}")
+                return (stored_start, stored_end)
+        else:
+            logger.info(f"No {name} checkpoint found, using a new shard range")
+
+    (start, end) = _resolve_range(start, end)
+    # (to the second, like the ranges in the queries)
+    start = start.replace(microsecond=0)
+    end = end.replace(microsecond=0)
+    app_config.save_checkpoint(name, {
+        "query_hash": query_hash,
+        "start": start.strftime(date_format),
+        "end": end.strftime(date_format)
+    })
+    return (start, end)
+
+
+def _resolve_range(start: datetime=None, end: datetime=None) -> tuple:
+    eastern = pytz.timezone('US/Eastern')
+    if end is None:
+        end = datetime.now(eastern).replace(tzinfo=None)
+    if start is None:
+        start = end - timedelta(days=365*10)
+    if start >= end:
+        raise ValueError(f"Error: shard start ({start}) must be before the end ({end})")
+    return (start, end)
+
+
+def run_shards(worker, shards: list, progress_interval: float=60) -> dict:
+    """
+    Runs worker(shard) for each shard in its own process (spawned, so nothing is shared with this process)
+    Each shard dict gets a progress_queue the worker can put (index, current_count, total_count) on,
+      the progress of all shards is merged and logged here every progress_interval seconds
+
+    Returns a dict of shard index -> the count returned by the worker
+    Raises an Exception (after all of the shards have stopped) if any shards failed
+    """
+    context = multiprocessing.get_context("spawn")
+    counts = {}
+    failures = {}
+
+    with context.Manager() as manager:
+        progress_queue = manager.Queue()
+        progress = {}
+
+        with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+            futures = {}
+            for shard in shards:
+                shard = dict(shard, progress_queue=progress_queue)
+                futures[executor.submit(worker, shard)] = shard['index']
+
+            pending = set(futures.keys())
+            while len(pending) > 0:
+                done, pending = wait(pending, timeout=progress_interval, return_when=FIRST_COMPLETED)
+
+                # take all of the progress updates that came in
+                while True:
+                    try:
+                        (index, current_count, total_count) = progress_queue.get_nowait()
+                        progress[index] = (current_count, total_count)
+                    except queue.Empty:
+                        break
+
+                for future in done:
+                    index = futures[future]
+                    try:
+                        counts[index] = future.result()
+                        logger.info(f"Shard {index} finished with {counts[index]} records")
+                    except Exception as e:
+                        failures[index] = e
+                        logger.error(f"Shard {index} failed: {e}")
+
+                current_total = sum(current for current, total in progress.values())
+                expected_total = sum(total for current, total in progress.values())
+                logger.info(f"Sharded load progress: {current_total}/{expected_total} records, {len(counts)}/{len(shards)} shards finished, {len(failures)} failed")
+
+    if len(failures) > 0:
+        raise Exception(f"{len(failures)}/{len(shards)} shards failed: {failures}")
+
+    return counts
@@ -0,0 +1,93 @@
+import threading
+import time
+import unittest
+
+from common import BatchExecutor
+
+
+class BatchExecutorTest(unittest.TestCase):
+
+    def test_runs_all_jobs(self):
+        results = []
+        lock = threading.Lock()
+
+        def job(value):
+            with lock:
+                results.append(value)
+
+        with BatchExecutor(max_workers=3) as executor:
+            for i in range(10):
+                executor.submit(job, i)
+            executor.wait()
+
+        self.assertEqual(sorted(results), list(range(10)))
+
+    def test_never_exceeds_max_workers(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def job():
+            with lock:
+                running.append(1)
+                peak.append(len(running))
+            time.sleep(0.01)
+            with lock:
+                running.pop()
+
+        with BatchExecutor(max_workers=2) as executor:
+            for i in range(8):
+                executor.submit(job)
+            executor.wait()
+
+        self.assertLessEqual(max(peak), 2)
+
+    def test_callback_is_called(self):
+        finished = []
+        with BatchExecutor(max_workers=2) as executor:
+            executor.submit(lambda: "done", callback=lambda future: finished.append(future.result()))
+            executor.wait()
+        self.assertEqual(finished, ["done"])
+
+    def test_exception_propagates_from_wait(self):
+        def job():
+            raise ValueError("batch failed")
+
+        executor = BatchExecutor(max_workers=2)
+        executor.submit(job)
+        with self.assertRaises(ValueError):
+            executor.wait()
+        executor.shutdown()
+
+    def test_exception_fails_fast(self):
+        release = threading.Event()
+        started = []
+
+        def failing_job():
+            raise ValueError("batch failed")
+
+        def slow_job(i):
+            started.append(i)
+            release.wait(1)
+
+        executor = BatchExecutor(max_workers=1)
+        executor.submit(failing_job)
+        with self.assertRaises(ValueError):
+            for i in range(5):
+                executor.submit(slow_job, i)
+        release.set()
+        executor.shutdown()
+        self.assertEqual(started, [])
+
+    def test_wait_timeout(self):
+        release = threading.Event()
+        executor = BatchExecutor(max_workers=1)
+        executor.submit(release.wait, 5)
+        with self.assertRaises(TimeoutError):
+            executor.wait(timeout=0.05)
+        release.set()
+        executor.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
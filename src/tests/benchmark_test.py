@@ -0,0 +1,87 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmark import Benchmark, compare_results, benchmark_scenarios
+from metrics import metrics
+
+
+class BenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        for name in ['benchmark.logger', 'salesforce_person_updates.logger', 'salesforce.logger', 'account_handler.logger']:
+            patcher = mock.patch(name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {"STATE_DIR": self.directory.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_run(self):
+        output = os.path.join(self.directory.name, "benchmark.json")
+        results = Benchmark(scales=[150], output=output).run()
+
+        with open(output) as f:
+            self.assertEqual(json.load(f)['results'], results['results'])
+        self.assertFalse(metrics.enabled)
+
+        self.assertEqual([result['scenario'] for result in results['results']], benchmark_scenarios)
+        for result in results['results']:
+            self.assertNotIn('error', result)
+            self.assertEqual(result['scale'], 150)
+            self.assertGreater(result['records'], 0)
+            self.assertGreater(result['records_per_sec'], 0)
+            self.assertGreater(result['peak_rss_mb'], 0)
+
+        (full_load, updates, cleanup, accounts) = results['results']
+        self.assertGreater(full_load['api_calls']['salesforce']['bulk_upsert'], 0)
+        self.assertEqual(full_load['api_calls']['pds']['results'], full_load['records'])
+        self.assertIn("transform", [stage['metric'] for stage in full_load['stages']])
+        self.assertLess(updates['records'], full_load['records'])
+        self.assertGreater(cleanup['api_calls']['pds']['search'], 0)
+        self.assertEqual(accounts['salesforce_records']['Account'], 150)
+
+    @mock.patch('fingerprints.logger')
+    @mock.patch('salesforce_person_updates.delta_push_mode', "True")
+    @mock.patch('salesforce_person_updates.id_index_enabled', True)
+    def test_state_is_kept_apart(self, mock_fingerprints_logger):
+        # the real state (the org's id index and fingerprints) isn't used or overwritten
+        fingerprints = os.path.join(self.directory.name, "local_fingerprints_Contact.json")
+        with open(fingerprints, 'w') as f:
+            f.write("{}")
+        output = os.path.join(self.directory.name, "benchmark.json")
+
+        results = Benchmark(scales=[50], scenarios=["full_load"], output=output).run()
+        self.assertNotIn('error', results['results'][0])
+        with open(fingerprints) as f:
+            self.assertEqual(f.read(), "{}")
+        # (the metrics still go there)
+        self.assertEqual([name for name in os.listdir(self.directory.name) if "fingerprints" in name or "id_index" in name], ["local_fingerprints_Contact.json"])
+
+    def test_compare_results(self):
+        baseline = {"results": [
+            {"scale": 10, "scenario": "full_load", "records_per_sec": 100.0},
+            {"scale": 10, "scenario": "updates", "records_per_sec": 100.0},
+            {"scale": 10, "scenario": "cleanup", "records_per_sec": None}
+        ]}
+        results = {"results": [
+            {"scale": 10, "scenario": "full_load", "records_per_sec": 90.0},
+            {"scale": 10, "scenario": "updates", "records_per_sec": 50.0},
+            {"scale": 10, "scenario": "cleanup", "records_per_sec": 10.0},
+            {"scale": 20, "scenario": "full_load", "records_per_sec": 10.0}
+        ]}
+        comparisons = compare_results(baseline, results, threshold=0.2)
+        self.assertEqual([(c['scenario'], c['regression']) for c in comparisons], [("full_load", False), ("updates", True)])
+        self.assertEqual(comparisons[1]['change'], -0.5)
+
+        with self.assertRaises(ValueError):
+            Benchmark(scenarios=["full_load", "not a scenario"])
+
+
+if __name__ == '__main__':
+    unittest.main()
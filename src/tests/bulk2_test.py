@@ -0,0 +1,117 @@
+import csv
+import io
+import unittest
+from unittest import mock
+
+from bulk2 import Bulk2Ingest, flatten_record, parse_error
+from salesforce import HarvardSalesforce
+
+
+class Bulk2IngestTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('bulk2.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('bulk2.time.sleep')
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.mock_sf = mock.MagicMock()
+        self.mock_sf.base_url = "https://example.my.salesforce.com/services/data/v59.0/"
+        self.mock_sf.headers = {"Authorization": "Bearer token"}
+        self.uploads = []
+        self.results = {
+            "successfulResults": "sf__Id,sf__Created,personKey__c,LastName\n003B,false,2,Two\n003A,true,1,One\n",
+            "failedResults": 'sf__Id,sf__Error,personKey__c,LastName\n,DUPLICATES_DETECTED:Use one of these records?:--,3,Three\n'
+        }
+
+        def restful(path, method="GET", data=None):
+            if path == "jobs/ingest" and method == "POST":
+                return {"id": "750A"}
+            if method == "PATCH":
+                return None
+            return {"state": "JobComplete", "numberRecordsProcessed": 3}
+        self.mock_sf.restful.side_effect = restful
+
+        def request(method, url, headers=None, data=None, stream=False):
+            response = mock.MagicMock()
+            response.status_code = 201
+            response.encoding = "utf-8"
+            if method == "PUT":
+                self.uploads.append(data.decode("utf-8"))
+            else:
+                result_name = url.split("/")[-1]
+                response.iter_lines.return_value = iter(self.results[result_name].split("\n"))
+            return response
+        self.mock_sf.session.request.side_effect = request
+
+        self.data = [
+            {"personKey__c": "1", "LastName": "One", "Birthdate": None},
+            {"personKey__c": "2", "LastName": "Two", "Contact__r": {"personKey__c": "9"}},
+            {"personKey__c": "3", "LastName": "Three"}
+        ]
+
+    def test_upsert_matches_results_to_records(self):
+        bulk2 = Bulk2Ingest(self.mock_sf)
+        responses = bulk2.upsert("Contact", self.data, external_id_field="personKey__c")
+
+        self.assertEqual(responses[0], {"success": True, "created": True, "id": "003A", "errors": []})
+        self.assertEqual(responses[1], {"success": True, "created": False, "id": "003B", "errors": []})
+        self.assertFalse(responses[2]['success'])
+        self.assertEqual(responses[2]['errors'][0]['statusCode'], "DUPLICATES_DETECTED")
+
+        rows = list(csv.DictReader(io.StringIO(self.uploads[0])))
+        # None is a null, a missing column is left alone
+        self.assertEqual(rows[0]['Birthdate'], "#N/A")
+        self.assertEqual(rows[1]['Birthdate'], "")
+        self.assertEqual(rows[1]['Contact__r.personKey__c'], "9")
+
+    def test_upsert_splits_jobs(self):
+        bulk2 = Bulk2Ingest(self.mock_sf, max_records=2)
+        bulk2.upsert("Contact", self.data, external_id_field="personKey__c")
+        self.assertEqual(len(self.uploads), 2)
+
+        bulk2 = Bulk2Ingest(self.mock_sf, max_bytes=10)
+        self.uploads = []
+        bulk2.upsert("Contact", self.data, external_id_field="personKey__c")
+        self.assertEqual(len(self.uploads), 3)
+
+    def test_unprocessed_records_fail(self):
+        self.results['successfulResults'] = "sf__Id,sf__Created,personKey__c\n"
+        self.results['failedResults'] = "sf__Id,sf__Error,personKey__c\n"
+        responses = Bulk2Ingest(self.mock_sf).upsert("Contact", self.data[0:1], external_id_field="personKey__c")
+        self.assertEqual(responses[0]['errors'][0]['statusCode'], "UNPROCESSED_RECORD")
+
+    def test_parse_error(self):
+        error = parse_error("INVALID_FIELD:Foreign key external ID: 123 not found for field personKey__c in entity Contact:--")
+        self.assertEqual(error['statusCode'], "INVALID_FIELD")
+        self.assertTrue(error['message'].startswith("Foreign key external ID: 123"))
+        self.assertEqual(error['fields'], [])
+
+        self.assertEqual(parse_error("STRING_TOO_LONG:Last Name: data value too large:LastName")['fields'], ["LastName"])
+
+    def test_flatten_record(self):
+        self.assertEqual(flatten_record({"A": True, "B": ["x", "y"], "C__r": {"D": 1}}), {"A": "true", "B": "x;y", "C__r.D": "1"})
+
+    @mock.patch('salesforce.logger')
+    @mock.patch('salesforce.Salesforce')
+    def test_push_bulk_uses_bulk2(self, mock_connection, mock_salesforce_logger):
+        hsf = HarvardSalesforce(domain="", username="", password="", token="faketoken")
+        hsf.bulk_api_versions = {"Name__c": 2}
+        hsf.unique_ids = {"Name__c": {"id_name": "personKey__c"}}
+        hsf._bulk2 = Bulk2Ingest(self.mock_sf)
+
+        hsf.pushBulk("Name__c", self.data, id_name="personKey__c")
+
+        hsf.sf.bulk.__getattr__("Name__c").upsert.assert_not_called()
+        messages = [call[0][0] for call in mock_salesforce_logger.info.call_args_list]
+        self.assertIn("Updated Name__c Records: 1", messages)
+        self.assertIn("Created Name__c Records: 1", messages)
+        # duplicates are only resolved on Contact
+        self.assertIn("Errored Name__c Records: 1", messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import threading
+import time
+import unittest
+
+from bulk_governor import BulkJobGovernor
+
+
+class BulkJobGovernorTest(unittest.TestCase):
+
+    def test_never_exceeds_max_jobs(self):
+        governor = BulkJobGovernor(max_jobs=2)
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def job(object_name):
+            with governor.job(object_name):
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.01)
+                with lock:
+                    running.pop()
+
+        threads = [threading.Thread(target=job, args=(f"Object{i % 3}",)) for i in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+
+        self.assertLessEqual(max(peak), 2)
+        self.assertEqual(governor.running_count, 0)
+        self.assertEqual(sum(metrics['jobs'] for metrics in governor.summary().values()), 12)
+
+    def test_objects_take_turns(self):
+        governor = BulkJobGovernor(max_jobs=1)
+        order = []
+        threads = []
+
+        # hold the only slot while the waiters queue up
+        governor.acquire("Blocker")
+        for object_name in ["Contact", "Contact", "Contact", "hed__Affiliation__c"]:
+            thread = threading.Thread(target=lambda name=object_name: (governor.acquire(name), order.append(name), governor.release(name)))
+            thread.start()
+            threads.append(thread)
+            # make sure they queue in this order
+            time.sleep(0.05)
+        governor.release("Blocker")
+        for thread in threads:
+            thread.join(5)
+
+        self.assertEqual(order, ["Contact", "hed__Affiliation__c", "Contact", "Contact"])
+
+    def test_metrics(self):
+        governor = BulkJobGovernor(max_jobs=1)
+        with governor.job("Contact"):
+            time.sleep(0.02)
+
+        metrics = governor.summary()['Contact']
+        self.assertEqual(metrics['jobs'], 1)
+        self.assertGreaterEqual(metrics['run_seconds'], 0.02)
+        self.assertLess(metrics['wait_seconds'], metrics['run_seconds'])
+
+    def test_slot_released_on_exception(self):
+        governor = BulkJobGovernor(max_jobs=1)
+        with self.assertRaises(ValueError):
+            with governor.job("Contact"):
+                raise ValueError("bulk job failed")
+        self.assertEqual(governor.running_count, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from common import AppConfig
+from checkpoint import LoadCheckpoint
+
+
+class LoadCheckpointTest(unittest.TestCase):
+
+    def setUp(self):
+        self.stored = {}
+        self.mock_app_config = mock.MagicMock()
+        self.mock_app_config.get_checkpoint.side_effect = lambda name: self.stored.get(name)
+        self.mock_app_config.save_checkpoint.side_effect = lambda name, checkpoint: self.stored.update({name: checkpoint})
+        self.mock_app_config.clear_checkpoint.side_effect = lambda name: self.stored.pop(name, None)
+
+        self.query = {"fields": ["univid"], "conditions": {}}
+
+    def _checkpoint(self):
+        return LoadCheckpoint(app_config=self.mock_app_config, name="test_load", objects=["Contact", "hed__Affiliation__c"], save_interval=0)
+
+    def test_completed_ranges_are_merged(self):
+        checkpoint = self._checkpoint()
+        checkpoint.start(self.query, total_count=300)
+        checkpoint.complete("Contact", 0, 100)
+        checkpoint.complete("Contact", 200, 300)
+        checkpoint.complete("Contact", 100, 200)
+
+        self.assertEqual(checkpoint.completed["Contact"], [[0, 300]])
+        # a different batch size on the resume still lines up
+        self.assertEqual(checkpoint.completed_objects(50, 250), ["Contact"])
+        self.assertFalse(checkpoint.is_complete(50, 250))
+
+        checkpoint.complete("hed__Affiliation__c", 0, 300)
+        self.assertTrue(checkpoint.is_complete(50, 250))
+
+    def test_resume_keeps_progress(self):
+        checkpoint = self._checkpoint()
+        checkpoint.start(self.query, total_count=300)
+        checkpoint.fetched(200)
+        checkpoint.complete("Contact", 0, 100)
+
+        resumed = self._checkpoint()
+        self.assertTrue(resumed.load())
+        resumed.start(self.query, total_count=300)
+        self.assertEqual(resumed.fetched_count, 200)
+        self.assertEqual(resumed.completed_objects(0, 100), ["Contact"])
+
+    def test_resume_with_changed_total_starts_over(self):
+        checkpoint = self._checkpoint()
+        checkpoint.start(self.query, total_count=300)
+        checkpoint.complete("Contact", 0, 100)
+
+        resumed = self._checkpoint()
+        resumed.load()
+        resumed.start(self.query, total_count=301)
+        self.assertEqual(resumed.completed_objects(0, 100), [])
+
+    def test_resume_with_changed_query_starts_over(self):
+        checkpoint = self._checkpoint()
+        checkpoint.start(self.query, total_count=300)
+        checkpoint.complete("Contact", 0, 100)
+
+        resumed = self._checkpoint()
+        resumed.load()
+        resumed.start({"fields": ["univid"], "conditions": {"univid": "1234"}}, total_count=300)
+        self.assertEqual(resumed.completed_objects(0, 100), [])
+
+    def test_no_checkpoint_without_resume(self):
+        checkpoint = self._checkpoint()
+        checkpoint.start(self.query, total_count=300)
+        checkpoint.complete("Contact", 0, 100)
+
+        # a new run that doesn't load() the checkpoint overwrites it
+        fresh = self._checkpoint()
+        fresh.start(self.query, total_count=300)
+        self.assertEqual(self.stored["test_load"]["completed"], {})
+
+    def test_saves_are_throttled(self):
+        checkpoint = LoadCheckpoint(app_config=self.mock_app_config, name="test_load", objects=["Contact"], save_interval=60)
+        checkpoint.start(self.query, total_count=300)
+        for i in range(10):
+            checkpoint.complete("Contact", i * 10, (i + 1) * 10)
+        self.assertEqual(self.mock_app_config.save_checkpoint.call_count, 1)
+
+        checkpoint.save(force=True)
+        self.assertEqual(self.stored["test_load"]["completed"], {"Contact": [[0, 100]]})
+
+    def test_clear(self):
+        checkpoint = self._checkpoint()
+        checkpoint.start(self.query, total_count=300)
+        checkpoint.clear()
+        self.assertNotIn("test_load", self.stored)
+
+    @mock.patch.object(AppConfig, '__init__', return_value=None)
+    def test_local_checkpoint_file(self, mock_init):
+        app_config = AppConfig(id=None, table_name=None, local=True)
+        app_config.local = True
+        app_config.id = None
+
+        with tempfile.TemporaryDirectory() as state_dir:
+            with mock.patch.dict(os.environ, {"STATE_DIR": state_dir}):
+                self.assertIsNone(app_config.get_checkpoint("test_load"))
+                app_config.save_checkpoint("test_load", {"fetched_count": 10})
+                self.assertEqual(app_config.get_checkpoint("test_load"), {"fetched_count": 10})
+                # (the temp file is gone)
+                self.assertEqual(os.listdir(state_dir), ["local_test_load_checkpoint.json"])
+                app_config.clear_checkpoint("test_load")
+                self.assertIsNone(app_config.get_checkpoint("test_load"))
+
+
+if __name__ == '__main__':
+    unittest.main()
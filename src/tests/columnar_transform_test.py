@@ -0,0 +1,66 @@
+import copy
+import unittest
+from unittest import mock
+
+from microbenchmark import Microbenchmark
+
+
+class ColumnarTransformTest(unittest.TestCase):
+
+    def setUp(self):
+        for name in ['microbenchmark.logger', 'salesforce.logger', 'transformer.logger', 'field_validators.logger']:
+            patcher = mock.patch(name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.microbenchmark = Microbenchmark(people=200, seed=4, repeat=1)
+        self.transformer = self.microbenchmark.transformer
+        self.hsf = self.microbenchmark.hsf
+
+    def transform_both(self, object_name: str) -> tuple:
+        row_people = copy.deepcopy(self.microbenchmark.people)
+        column_people = copy.deepcopy(self.microbenchmark.people)
+        rows = [record[object_name] for record in self.transformer.transform(source_data=row_people, target_object=object_name, hashed_ids=self.microbenchmark.hashed_ids)]
+        columns = self.transformer.transform_columns(column_people, object_name)
+        # (the transforms add the missing keys they look for to the people the same way)
+        self.assertEqual(row_people, column_people)
+        return (rows, columns)
+
+    def test_same_records(self):
+        (rows, columns) = self.transform_both('Contact')
+        self.assertGreater(len(rows), 0)
+        self.assertEqual(columns, rows)
+        self.assertEqual([list(record) for record in columns], [list(record) for record in rows])
+
+    def test_same_records_edge_cases(self):
+        fields = {
+            "Multi__c": ["netid", "nothere.code", "effectiveStatus.nope"],
+            "Description": {"value": "columnar", "static": True},
+            "ReportsTo__r": {"ref": {"object": "Contact", "ref_external_id": "HUDA__hud_MULE_UNIQUE_PERSON_KEY__c", "source_value_ref": ["nope.x", "personKey"]}},
+            "Title": {"value": "names.firstName", "when": {"names.personNameType.code": "LISTING"}},
+            "Official__c": {"value": "emails.officialEmailIndicator", "when": {"emails.effectiveStatus.code": "A"}},
+            "Phone": "phones.phoneNumber"
+        }
+        types = {"Official__c": "boolean", "Phone": "phone"}
+        self.transformer.config['Contact']['fields'].update(fields)
+        type_data = copy.deepcopy(self.hsf.type_data)
+        for field in fields:
+            type_data['Contact'].setdefault(field, {"type": types.get(field, "string"), "updateable": True, "length": 40, "externalId": False, "unique": False})
+        self.hsf.type_data = type_data
+
+        (rows, columns) = self.transform_both('Contact')
+        self.assertEqual(columns, rows)
+        self.assertEqual([list(record) for record in columns], [list(record) for record in rows])
+        self.assertTrue(all(record['Description'] == "columnar" for record in columns))
+
+    def test_columnar_objects(self):
+        config = {
+            "Contact": self.transformer.config['Contact'],
+            "HUDA__hud_Name__c": self.transformer.config['HUDA__hud_Name__c'],
+            "Account": {"flat": True, "source": "pds", "Id": {"salesforce": "Id"}, "fields": {"Name": ["sf.Contact.Name"]}}
+        }
+        self.assertEqual(self.transformer.columnar_objects(config), ["Contact"])
+
+
+if __name__ == '__main__':
+    unittest.main()
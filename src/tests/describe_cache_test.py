@@ -0,0 +1,93 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from simple_salesforce import exceptions
+
+from describe_cache import DescribeCache
+from salesforce import HarvardSalesforce
+
+
+def description(extra_field=None):
+    fields = [
+        {"name": "Id", "type": "id", "updateable": False, "length": 18, "externalId": False, "relationshipName": None},
+        {"name": "LastName", "type": "string", "updateable": True, "length": 80, "externalId": False, "relationshipName": None},
+        {"name": "Contact__c", "type": "reference", "updateable": True, "length": 18, "externalId": False, "relationshipName": "Contact__r"},
+    ]
+    if extra_field is not None:
+        fields.append({"name": extra_field, "type": "string", "updateable": True, "length": 10, "externalId": False, "relationshipName": None})
+    return {"fields": fields, "recordTypeInfos": [{"name": "Master", "recordTypeId": "012A"}]}
+
+
+class DescribeCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('describe_cache.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.mock_sf = mock.MagicMock()
+        self.mock_sf.sf_instance = "example.my.salesforce.com"
+        self.mock_sf.sf_version = "59.0"
+        self.mock_sf.__getattr__("Contact").describe.side_effect = lambda headers=None: description()
+
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+
+    def test_objects_are_described_once(self):
+        cache = DescribeCache(self.mock_sf)
+        cache.prefetch(["Contact"])
+        cache.get("Contact")
+        self.assertEqual(cache.field_names("Contact"), {"Id", "LastName", "Contact__c"})
+        self.assertEqual(cache.relationship_names("Contact"), {"Contact__r"})
+        self.assertEqual(self.mock_sf.__getattr__("Contact").describe.call_count, 1)
+        # nothing is written without a ttl
+        self.assertFalse(os.path.exists(os.path.join(self.state_dir.name, "salesforce_describe_cache.json")))
+
+    def test_persisted_cache_is_used_until_it_expires(self):
+        cache = DescribeCache(self.mock_sf, state_dir=self.state_dir.name, ttl_hours=1)
+        cache.prefetch(["Contact"])
+        self.assertEqual(cache.describe_count, 1)
+
+        cache = DescribeCache(self.mock_sf, state_dir=self.state_dir.name, ttl_hours=1)
+        cache.prefetch(["Contact"])
+        self.assertEqual(cache.describe_count, 0)
+        self.assertEqual(cache.field_names("Contact"), {"Id", "LastName", "Contact__c"})
+
+        # an expired description is revalidated, a 304 keeps it
+        cache.descriptions["Contact"]['fetched'] = time.time() - 2 * 60 * 60
+        self.mock_sf.__getattr__("Contact").describe.side_effect = exceptions.SalesforceGeneralError("url", 304, "Contact", b"")
+        cache.prefetch(["Contact"])
+        self.assertEqual(cache.not_modified_count, 1)
+        headers = self.mock_sf.__getattr__("Contact").describe.call_args.kwargs['headers']
+        self.assertIn("If-Modified-Since", headers)
+
+        # a changed object replaces the cached description
+        cache.descriptions["Contact"]['fetched'] = time.time() - 2 * 60 * 60
+        self.mock_sf.__getattr__("Contact").describe.side_effect = lambda headers=None: description(extra_field="Nickname__c")
+        self.assertIn("Nickname__c", cache.field_names("Contact"))
+
+    def test_cache_for_another_instance_is_ignored(self):
+        DescribeCache(self.mock_sf, state_dir=self.state_dir.name, ttl_hours=1).prefetch(["Contact"])
+        self.mock_sf.sf_version = "60.0"
+        cache = DescribeCache(self.mock_sf, state_dir=self.state_dir.name, ttl_hours=1)
+        cache.prefetch(["Contact"])
+        self.assertEqual(cache.describe_count, 1)
+
+    @mock.patch('salesforce.logger')
+    @mock.patch('salesforce.Salesforce')
+    def test_type_map_and_validation_share_descriptions(self, mock_connection, mock_salesforce_logger):
+        hsf = HarvardSalesforce(domain="", username="", password="", token="faketoken")
+        hsf.sf.__getattr__("Contact").describe.side_effect = lambda headers=None: description()
+
+        type_data = hsf.getTypeMap(["Contact"])
+        self.assertEqual(type_data["Contact"]["LastName"], {"type": "string", "updateable": True, "length": 80, "externalId": False, "unique": False})
+        self.assertTrue(hsf.validateConfig({"Contact": {"flat": True, "sourceType": "pds", "Id": {"salesforce": "Id", "pds": "personKey"}, "fields": {"LastName": "names.lastName", "Contact__r": "personKey"}}}))
+        self.assertEqual(hsf.get_record_type_ids("Contact"), {"Master": "012A"})
+        self.assertEqual(hsf.sf.__getattr__("Contact").describe.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
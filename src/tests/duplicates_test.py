@@ -0,0 +1,69 @@
+import unittest
+from unittest import mock
+
+from duplicates import DuplicateDetector, DuplicateReport
+
+
+class DuplicateDetectorTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('duplicates.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.mock_hsf = mock.MagicMock()
+        self.records = {
+            "Contact": [
+                {"Id": "003C", "personKey__c": "1"},
+                {"Id": "003B", "personKey__c": "2"},
+                {"Id": "003A", "personKey__c": "1"},
+                {"Id": "0039", "personKey__c": "1"},
+                {"Id": "0038", "personKey__c": "3"}
+            ],
+            "Account": [
+                {"Id": "001B", "deptId__c": "10"},
+                {"Id": "001A", "deptId__c": "11"}
+            ]
+        }
+
+        def query_all_iter(select_string):
+            object_name = select_string.split(" FROM ")[1].split(" ")[0]
+            return iter(self.records[object_name])
+        self.mock_hsf.sf.query_all_iter.side_effect = query_all_iter
+
+    def test_detect_object_keeps_most_recent(self):
+        detector = DuplicateDetector(hsf=self.mock_hsf)
+        (record_count, groups) = detector.detect_object("Contact", "personKey__c")
+
+        self.assertEqual(record_count, 5)
+        self.assertEqual(groups, {"1": {"keeper": "003C", "losers": ["003A", "0039"]}})
+        self.assertIn("ORDER BY LastModifiedDate DESC", self.mock_hsf.sf.query_all_iter.call_args[0][0])
+
+    def test_detect_all_objects(self):
+        detector = DuplicateDetector(hsf=self.mock_hsf, max_workers=2)
+        report = detector.detect({"Contact": "personKey__c", "Account": "deptId__c"})
+
+        self.assertEqual(report.losers("Contact"), ["003A", "0039"])
+        self.assertEqual(report.losers("Account"), [])
+        self.assertEqual(report.summary(), {
+            "Contact": {"records": 5, "duplicated_external_ids": 1, "duplicate_records": 2},
+            "Account": {"records": 2, "duplicated_external_ids": 0, "duplicate_records": 0}
+        })
+
+    def test_detect_raises_query_errors(self):
+        self.mock_hsf.sf.query_all_iter.side_effect = Exception("INVALID_FIELD")
+        detector = DuplicateDetector(hsf=self.mock_hsf, max_workers=2)
+        with self.assertRaises(Exception):
+            detector.detect({"Contact": "personKey__c", "Account": "deptId__c"})
+
+    def test_report_adds_to_existing(self):
+        report = DuplicateReport()
+        report.add_object("Account", "deptId__c", 0, {})
+        DuplicateDetector(hsf=self.mock_hsf).detect({"Contact": "personKey__c"}, report=report)
+
+        self.assertTrue(report.has("Account"))
+        self.assertTrue(report.has("Contact"))
+
+
+if __name__ == '__main__':
+    unittest.main()
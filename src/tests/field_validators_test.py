@@ -0,0 +1,107 @@
+import unittest
+from unittest import mock
+from dotmap import DotMap
+
+from field_validators import build_validator, build_column_validator
+from salesforce import HarvardSalesforce
+
+
+class FieldValidatorsTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('field_validators.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def validator(self, field_type: str, updateable: bool=True, length: int=10, field_name: str="Field__c"):
+        return build_validator("Contact", field_name, {"type": field_type, "updateable": updateable, "length": length})
+
+    def test_types(self):
+        cases = [
+            ("string", "a" * 12, "a" * 10),
+            ("string", 5, "5"),
+            ("string", True, 1),
+            ("string", False, 0),
+            ("string", "", None),
+            ("string", None, None),
+            ("string", DotMap(), None),
+            ("textarea", "text", "text"),
+            ("picklist", 5, "5"),
+            ("phone", "+1 (617) 555-1212", "+1 (617) 555-1212"),
+            ("phone", "555-CALL", None),
+            ("email", "someone@harvard.edu", "someone@harvard.edu"),
+            ("email", "someone@", None),
+            ("reference", "0035e00000ABCDE", "0035e00000ABCDE"),
+            ("date", "2020-01-05", "2020-01-05"),
+            ("date", "2020-01-05T10:11:12", "2020-01-05"),
+            ("date", "2020-1-5", "2020-1-5"),
+            ("date", "2020-02-30", None),
+            ("date", "1699-12-31", None),
+            ("datetime", "2020-01-05T10:11:12", "2020-01-05T10:11:12"),
+            ("datetime", "2020-01-05 10:11:12.000Z", "2020-01-05T10:11:12"),
+            ("datetime", "2020-01-05T25:11:12", None),
+            ("datetime", "2401-01-05T10:11:12", None),
+            ("double", "1.5", 1.5),
+            ("double", 0, None),
+            ("double", "one", None),
+            ("boolean", True, True),
+            ("boolean", None, False),
+            ("boolean", "yes", False),
+            ("currency", "1", None)
+        ]
+        for (field_type, value, expected) in cases:
+            with self.subTest(field_type=field_type, value=value):
+                self.assertEqual(self.validator(field_type)(value, None), expected)
+
+    def test_invalid_values(self):
+        self.assertIsNone(self.validator("string")(DotMap(code="A"), "identifier"))
+        self.assertIn("is not a valid type", self.mock_logger.error.call_args[0][0])
+
+        with self.assertRaises(Exception):
+            self.validator("string", updateable=False)("value", None)
+        # Id isn't updateable, but it's allowed
+        self.assertEqual(self.validator("id", updateable=False, field_name="Id")("0035e00000ABCDE", None), "0035e00000ABCDE")
+        # nothing to update isn't a problem either
+        self.assertIsNone(self.validator("string", updateable=False)(None, None))
+
+        with self.assertRaises(Exception):
+            build_validator("Contact", "Field__c", {"updateable": True})
+
+    def test_column_validator(self):
+        values = ["2020-01-05", "a" * 12, "", None, DotMap(), "2020-02-30", "someone@harvard.edu"]
+        identifiers = list(range(len(values)))
+        for field_type in ["string", "picklist", "reference", "boolean", "email", "date", "double"]:
+            with self.subTest(field_type=field_type):
+                validator = self.validator(field_type)
+                column_validator = build_column_validator("Contact", "Field__c", {"type": field_type, "updateable": True, "length": 10}, validator=validator)
+                self.assertEqual(column_validator(values, identifiers), [validator(value, identifier) for value, identifier in zip(values, identifiers)])
+
+        # bools and numbers, for the types that take them
+        values = [5, True, False, "yes", None]
+        for field_type in ["string", "picklist", "boolean"]:
+            with self.subTest(field_type=field_type):
+                validator = self.validator(field_type)
+                column_validator = build_column_validator("Contact", "Field__c", {"type": field_type, "updateable": True, "length": 10}, validator=validator)
+                self.assertEqual(column_validator(values, [None] * len(values)), [validator(value, None) for value in values])
+
+        # the usual values don't skip the updateable check
+        column_validator = build_column_validator("Contact", "Field__c", {"type": "string", "updateable": False, "length": 10})
+        with self.assertRaises(Exception):
+            column_validator(["value"], [None])
+
+    @mock.patch('salesforce.Salesforce')
+    def test_harvard_salesforce(self, mock_connection):
+        hsf = HarvardSalesforce(domain="", username="", password="", token="faketoken")
+        hsf.type_data = {"Contact": {"Email": {"type": "email", "updateable": True, "length": 80}}}
+        self.assertEqual(hsf.validate(object="Contact", field="Email", value="a@b.edu", identifier=None), "a@b.edu")
+        self.assertEqual(hsf.validate_column("Contact", "Email", ["a@b.edu", "nope"]), ["a@b.edu", None])
+        with self.assertRaises(Exception):
+            hsf.validate(object="Contact", field="Birthdate", value="2020-01-05", identifier=None)
+
+        # the validators are rebuilt for new type data
+        hsf.type_data = {"Contact": {"Email": {"type": "string", "updateable": True, "length": 3}}}
+        self.assertEqual(hsf.validate(object="Contact", field="Email", value="a@b.edu", identifier=None), "a@b")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import json
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from fingerprints import RecordFingerprints, fingerprint
+from salesforce import HarvardSalesforce
+
+
+class RecordFingerprintsTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('fingerprints.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+
+        self.records = [
+            {"personKey__c": "1", "LastName": "One", "Contact__r": {"personKey__c": "9"}},
+            {"personKey__c": "2", "LastName": "Two"}
+        ]
+
+    def test_fingerprint_ignores_key_order(self):
+        self.assertEqual(fingerprint({"A": 1, "B": {"C": 2, "D": None}}), fingerprint({"B": {"D": None, "C": 2}, "A": 1}))
+        self.assertNotEqual(fingerprint({"A": 1}), fingerprint({"A": "1 "}))
+
+    def test_unchanged_records_are_skipped(self):
+        fingerprints = RecordFingerprints(state_dir=self.state_dir.name)
+        self.assertEqual(fingerprints.changed("Contact", "personKey__c", self.records), self.records)
+
+        fingerprints.record("Contact", "personKey__c", self.records)
+        changed = [{"personKey__c": "1", "LastName": "Uno", "Contact__r": {"personKey__c": "9"}}, dict(self.records[1])]
+        self.assertEqual(fingerprints.changed("Contact", "personKey__c", changed), changed[0:1])
+
+        self.assertEqual(fingerprints.skip_rates()["Contact"], {"checked": 4, "skipped": 1, "rate": 0.25})
+
+    def test_snapshot_and_restore(self):
+        fingerprints = RecordFingerprints(state_dir=self.state_dir.name)
+        fingerprints.record("Contact", "personKey__c", self.records)
+        fingerprints.snapshot()
+
+        restored = RecordFingerprints(state_dir=self.state_dir.name)
+        self.assertEqual(restored.restore(["Contact", "hed__Affiliation__c"]), ["Contact"])
+        self.assertEqual(restored.changed("Contact", "personKey__c", self.records), [])
+        # a different external id starts over
+        self.assertEqual(len(restored.changed("Contact", "LastName", self.records)), 2)
+
+    def test_old_fingerprints_are_not_restored(self):
+        fingerprints = RecordFingerprints(state_dir=self.state_dir.name, max_age_days=7)
+        fingerprints.record("Contact", "personKey__c", self.records)
+        fingerprints.objects["Contact"]['created'] = (datetime.utcnow() - timedelta(days=8)).isoformat()
+        fingerprints.snapshot()
+
+        self.assertEqual(RecordFingerprints(state_dir=self.state_dir.name, max_age_days=7).restore(["Contact"]), [])
+
+    def test_fields_mode_sends_changed_fields(self):
+        fingerprints = RecordFingerprints(state_dir=self.state_dir.name, fields=True)
+        fingerprints.record("Contact", "personKey__c", self.records)
+
+        updated = [
+            {"personKey__c": "1", "LastName": "Uno", "Contact__r": {"personKey__c": "9"}},
+            {"personKey__c": "2", "LastName": "Two"},
+            {"personKey__c": "3", "LastName": "Three"}
+        ]
+        changed = fingerprints.changed("Contact", "personKey__c", updated)
+        # just what changed (and the external id), new records are sent whole
+        self.assertEqual(changed, [{"personKey__c": "1", "LastName": "Uno"}, {"personKey__c": "3", "LastName": "Three"}])
+
+        # the fields that weren't sent keep their hashes
+        fingerprints.record("Contact", "personKey__c", changed)
+        self.assertEqual(fingerprints.changed("Contact", "personKey__c", updated), [])
+        self.assertEqual(fingerprints.skip_rates()["Contact"]['fields_skipped'], 6)
+
+        # the hashes from the other mode aren't used
+        fingerprints.snapshot()
+        self.assertEqual(RecordFingerprints(state_dir=self.state_dir.name).restore(["Contact"]), [])
+
+    def test_fields_mode_flag_changed_outside_the_load(self):
+        records = [dict(record, huit__Updated__c=True) for record in self.records]
+        fingerprints = RecordFingerprints(state_dir=self.state_dir.name, fields=True)
+        fingerprints.record("Contact", "personKey__c", records)
+        fingerprints.snapshot()
+
+        # the cleanup turns the flag off for one of them (after the load's snapshot)
+        fingerprints.record("Contact", "personKey__c", [{"personKey__c": "2", "huit__Updated__c": False}])
+        fingerprints.snapshot()
+
+        restored = RecordFingerprints(state_dir=self.state_dir.name, fields=True)
+        restored.restore(["Contact"])
+        self.assertEqual(restored.changed("Contact", "personKey__c", records), [{"personKey__c": "2", "huit__Updated__c": True}])
+
+    @mock.patch('salesforce.logger')
+    @mock.patch('salesforce.Salesforce')
+    def test_only_successful_pushes_are_recorded(self, mock_connection, mock_salesforce_logger):
+        hsf = HarvardSalesforce(domain="", username="", password="", token="faketoken")
+        hsf.unique_ids = {"Contact": {"id_name": "personKey__c"}}
+        hsf.fingerprints = RecordFingerprints(state_dir=self.state_dir.name)
+        responses = [
+            {"success": True, "created": True, "id": "003A", "errors": []},
+            {"success": False, "created": False, "id": None, "errors": [{"statusCode": "STRING_TOO_LONG", "message": "", "fields": []}]}
+        ]
+        hsf.handle_bulk_responses("Contact", self.records, responses, id_name="personKey__c")
+
+        self.assertEqual(hsf.fingerprints.changed("Contact", "personKey__c", self.records), self.records[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
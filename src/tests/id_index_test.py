@@ -0,0 +1,90 @@
+import tempfile
+import unittest
+from unittest import mock
+from datetime import datetime
+
+from id_index import IdIndex
+from salesforce import HarvardSalesforce
+
+
+class IdIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('id_index.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+
+        self.mock_hsf = mock.MagicMock()
+        self.now = datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.000+0000')
+
+    def _record(self, salesforce_id, external_id, deleted=False):
+        return {"Id": salesforce_id, "personKey__c": external_id, "SystemModstamp": self.now, "IsDeleted": deleted}
+
+    def test_refresh_builds_then_updates(self):
+        index = IdIndex(hsf=self.mock_hsf, state_dir=self.state_dir.name)
+        self.mock_hsf.sf.query_all_iter.return_value = iter([self._record("003A", "1"), self._record("003B", "2")])
+        index.refresh("Contact", "personKey__c")
+
+        self.assertEqual(index.lookup("Contact", ["1", "2", "3"]), {"1": "003A", "2": "003B"})
+        first_query = self.mock_hsf.sf.query_all_iter.call_args[0][0]
+        self.assertNotIn("SystemModstamp >=", first_query)
+
+        # B is deleted and A's external id changed
+        self.mock_hsf.sf.query_all_iter.return_value = iter([self._record("003B", "2", deleted=True), self._record("003A", "4")])
+        index.refresh("Contact", "personKey__c")
+
+        self.assertEqual(index.lookup("Contact", ["1", "2", "4"]), {"4": "003A"})
+        second_query = self.mock_hsf.sf.query_all_iter.call_args[0][0]
+        self.assertIn(f"SystemModstamp >= {self.now[:19]}Z", second_query)
+        self.assertEqual(self.mock_hsf.sf.query_all_iter.call_args[1], {"include_deleted": True})
+
+    def test_old_index_is_rebuilt(self):
+        index = IdIndex(hsf=self.mock_hsf, state_dir=self.state_dir.name, max_age_days=14)
+        self.mock_hsf.sf.query_all_iter.return_value = iter([])
+        index.refresh("Contact", "personKey__c")
+        index.objects["Contact"]["last_sync"] = "2020-01-01T00:00:00.000+0000"
+
+        index.refresh("Contact", "personKey__c")
+        self.assertNotIn("SystemModstamp >=", self.mock_hsf.sf.query_all_iter.call_args[0][0])
+
+    def test_update_and_snapshot_restore(self):
+        index = IdIndex(hsf=self.mock_hsf, state_dir=self.state_dir.name)
+        self.mock_hsf.sf.query_all_iter.return_value = iter([self._record("003A", "1")])
+        index.refresh("Contact", "personKey__c")
+        index.update("Contact", {"2": "003B"})
+        # objects that aren't indexed are ignored
+        index.update("hed__Affiliation__c", {"3": "a0C"})
+        index.snapshot()
+
+        restored_index = IdIndex(hsf=self.mock_hsf, state_dir=self.state_dir.name)
+        self.assertEqual(restored_index.restore(["Contact", "hed__Affiliation__c"]), ["Contact"])
+        self.assertTrue(restored_index.has("Contact", "personKey__c"))
+        self.assertFalse(restored_index.has("Contact", "otherKey__c"))
+        self.assertEqual(restored_index.lookup("Contact", ["1", "2"]), {"1": "003A", "2": "003B"})
+
+    @mock.patch('salesforce.logger')
+    @mock.patch('salesforce.Salesforce')
+    def test_get_unique_ids_uses_index(self, mock_connection, mock_logger):
+        hsf = HarvardSalesforce(domain="", username="", password="", token="faketoken")
+        hsf.id_index = IdIndex(hsf=hsf, state_dir=self.state_dir.name)
+        hsf.sf.query_all_iter.return_value = iter([self._record("003A", "1")])
+        hsf.id_index.refresh("Contact", "personKey__c")
+
+        config = {
+            "Contact": {
+                "source": "pds",
+                "Id": {"pds": "personKey", "salesforce": "personKey__c"},
+                "fields": {}
+            }
+        }
+        unique_ids = hsf.getUniqueIds(config=config, source_data=[{"personKey": "1"}, {"personKey": "2"}])
+
+        self.assertEqual(unique_ids["Contact"]["Ids"], {"1": "003A"})
+        hsf.sf.query_all.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
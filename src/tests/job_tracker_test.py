@@ -0,0 +1,89 @@
+import threading
+import unittest
+from unittest import mock
+
+from bulk_governor import bulk_job_governor
+from job_tracker import BulkJobTracker
+
+
+class BulkJobTrackerTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('job_tracker.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.mock_hsf = mock.MagicMock()
+        self.bulk2 = self.mock_hsf.bulk2
+        self.bulk2.chunks.side_effect = lambda data: iter([(0, data)])
+        self.bulk2.is_finished.side_effect = lambda status: status['state'] in ['JobComplete', 'Failed', 'Aborted']
+        self.bulk2.get_results.side_effect = lambda job_id, records, id_name: [{"success": True, "created": True, "id": "003A", "errors": []} for record in records]
+        self.mock_hsf.handle_bulk_responses.return_value = {"created": 1, "updated": 0, "errors": 0, "errored_data_batch": []}
+
+        self.job_count = 0
+        def submit_job(object_name, records, id_name):
+            self.job_count += 1
+            return f"750{self.job_count}"
+        self.bulk2.submit_job.side_effect = submit_job
+
+        # the job isn't done until the test says so
+        self.job_done = threading.Event()
+        self.states = []
+        def get_status(job_id):
+            state = "JobComplete" if self.job_done.is_set() else "InProgress"
+            self.states.append(state)
+            return {"id": job_id, "state": state}
+        self.bulk2.get_status.side_effect = get_status
+
+        self.tracker = BulkJobTracker(hsf=self.mock_hsf, min_interval=0.01, max_interval=0.05)
+        self.addCleanup(self.tracker.close)
+
+    def test_submit_returns_before_the_job_is_done(self):
+        done_objects = []
+        future = self.tracker.submit("Contact", [{"personKey__c": "1"}], "personKey__c", on_done=done_objects.append)
+
+        self.assertFalse(future.done())
+        self.assertEqual(self.tracker.running_count, 1)
+        self.assertEqual(bulk_job_governor.running_count, 1)
+
+        self.job_done.set()
+        self.tracker.wait_all(timeout=5)
+
+        self.assertEqual(future.result()['created'], 1)
+        self.assertEqual(done_objects, ["Contact"])
+        self.mock_hsf.handle_bulk_responses.assert_called_once()
+        self.assertEqual(self.mock_hsf.handle_bulk_responses.call_args[0][0], "Contact")
+        self.assertEqual(bulk_job_governor.running_count, 0)
+
+    def test_polling_backs_off(self):
+        self.tracker.submit("Contact", [{"personKey__c": "1"}], "personKey__c")
+        while len(self.states) < 4:
+            threading.Event().wait(0.01)
+        job = list(self.tracker._jobs.values())[0]
+        # the state hasn't changed since the first poll, so it's being polled less often
+        self.assertGreater(job.interval, 0.01)
+        self.assertLessEqual(job.interval, 0.05)
+
+        self.job_done.set()
+        self.tracker.wait_all(timeout=5)
+
+    def test_failed_results_are_raised(self):
+        self.mock_hsf.handle_bulk_responses.side_effect = Exception("INVALID_SESSION_ID")
+        done_objects = []
+        self.tracker.submit("Contact", [{"personKey__c": "1"}], "personKey__c", on_done=done_objects.append)
+
+        self.job_done.set()
+        with self.assertRaises(Exception):
+            self.tracker.wait_all(timeout=5)
+        self.assertEqual(done_objects, [])
+
+    def test_close_gives_back_slots(self):
+        self.tracker.submit("Contact", [{"personKey__c": "1"}], "personKey__c")
+        self.tracker.close()
+        self.assertEqual(bulk_job_governor.running_count, 0)
+        with self.assertRaises(Exception):
+            self.tracker.wait_all(timeout=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import json
+import unittest
+from unittest import mock
+
+from log_shipper import SalesforceLogShipper
+
+
+class SalesforceLogShipperTest(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_hsf = mock.MagicMock()
+        self.mock_hsf.sf.restful.side_effect = self._restful_side_effect
+        self.sent_batches = []
+
+    def _restful_side_effect(self, path, method='GET', data=None, **kwargs):
+        records = json.loads(data)['records']
+        self.sent_batches.append(records)
+        return [{'success': True, 'errors': []} for record in records]
+
+    def _log(self, message, level="INFO"):
+        return {
+            "huit__Message__c": message,
+            "huit__Source__c": "HUD",
+            "huit__Level__c": level,
+            "huit__RunId__c": "test_run",
+            "huit__Datetime__c": None
+        }
+
+    def test_flush_sends_batches(self):
+        shipper = SalesforceLogShipper(hsf=self.mock_hsf, batch_size=2, flush_interval=60)
+        for i in range(5):
+            shipper.enqueue(self._log(f"message {i}"))
+        shipper.close()
+
+        self.assertEqual(shipper.shipped_count, 5)
+        self.assertTrue(all(len(batch) <= 2 for batch in self.sent_batches))
+        self.assertEqual(self.sent_batches[0][0]['attributes']['type'], 'huit__Log__c')
+        self.mock_hsf.sf.restful.assert_called_with("composite/sobjects", method="POST", data=mock.ANY)
+
+    def test_drop_newest_when_full(self):
+        shipper = SalesforceLogShipper(hsf=self.mock_hsf, batch_size=200, flush_interval=60, max_queue_size=2)
+        # stop the worker from draining so the queue fills up
+        with shipper._flush_lock:
+            results = [shipper.enqueue(self._log(f"message {i}")) for i in range(4)]
+        self.assertEqual(results, [True, True, False, False])
+        self.assertEqual(shipper.dropped_count, 2)
+        shipper.close()
+
+        messages = [record['huit__Message__c'] for batch in self.sent_batches for record in batch]
+        self.assertIn("message 0", messages)
+        self.assertIn("Dropped 2 log records because the log queue was full", messages)
+
+    def test_drop_oldest_when_full(self):
+        shipper = SalesforceLogShipper(hsf=self.mock_hsf, batch_size=200, flush_interval=60, max_queue_size=2, overflow_policy="drop_oldest")
+        with shipper._flush_lock:
+            for i in range(4):
+                shipper.enqueue(self._log(f"message {i}"))
+        shipper.close()
+
+        messages = [record['huit__Message__c'] for batch in self.sent_batches for record in batch]
+        self.assertNotIn("message 0", messages)
+        self.assertIn("message 3", messages)
+
+    def test_failed_send_is_recorded(self):
+        self.mock_hsf.sf.restful.side_effect = Exception("no api calls left")
+        shipper = SalesforceLogShipper(hsf=self.mock_hsf, batch_size=200, flush_interval=60)
+        shipper.enqueue(self._log("message"))
+        shipper.close()
+
+        self.assertEqual(shipper.failed_count, 1)
+        self.assertIn("no api calls left", shipper.last_error)
+
+    def test_enqueue_after_close_is_dropped(self):
+        shipper = SalesforceLogShipper(hsf=self.mock_hsf, flush_interval=60)
+        shipper.close()
+        self.assertFalse(shipper.enqueue(self._log("too late")))
+
+
+if __name__ == '__main__':
+    unittest.main()
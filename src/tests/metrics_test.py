@@ -0,0 +1,101 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from metrics import Metrics, percentile
+from pipeline import Pipeline
+
+
+class MetricsTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('metrics.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.state_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.state_dir.cleanup)
+        self.path = os.path.join(self.state_dir.name, "metrics.jsonl")
+
+    def read_events(self) -> list:
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_off_does_nothing(self):
+        metrics = Metrics(enabled=False, path=self.path)
+        with metrics.timer("transform", records=10) as timer:
+            timer.records = 5
+        metrics.observe("queue_depth", 1)
+        function = lambda value: value
+        self.assertIs(metrics.accumulate("validate", function), function)
+        metrics.close()
+
+        self.assertEqual(metrics.summary(), [])
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_timers_and_summary(self):
+        metrics = Metrics(enabled=True, path=self.path, run_id="test_run")
+        for records in [10, 20]:
+            with metrics.timer("transform", records=records, object="Contact"):
+                pass
+        with metrics.timer("pds_page") as timer:
+            timer.records = 500
+        metrics.observe("queue_depth", 2, stage="push")
+        metrics.close()
+
+        events = self.read_events()
+        self.assertEqual([event.get('metric') for event in events[0:4]], ["transform", "transform", "pds_page", "queue_depth"])
+        self.assertEqual(events[0]['run_id'], "test_run")
+        self.assertEqual(events[0]['object'], "Contact")
+        self.assertEqual(events[2]['records'], 500)
+
+        summary = {(item['metric'], item.get('object')): item for item in events[-1]['summary']}
+        self.assertEqual(summary[("transform", "Contact")]['count'], 2)
+        self.assertEqual(summary[("transform", "Contact")]['records'], 30)
+        self.assertEqual(summary[("queue_depth", None)]['max'], 2)
+
+    def test_accumulate_per_thread(self):
+        metrics = Metrics(enabled=True, path=self.path)
+        validate = metrics.accumulate("validate", lambda value: value)
+        self.assertEqual(validate(1), 1)
+
+        def other_thread():
+            validate(2)
+            metrics.flush("validate", records=1, thread="other")
+        thread = threading.Thread(target=other_thread)
+        thread.start()
+        thread.join()
+        validate(3)
+        metrics.flush("validate", records=2)
+        metrics.close()
+
+        flushed = [event for event in self.read_events() if event.get('metric') == "validate"]
+        self.assertEqual([event['records'] for event in flushed], [1, 2])
+        self.assertTrue(all(event['value'] >= 0 for event in flushed))
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([7], 90), 7)
+        self.assertIsNone(percentile([], 50))
+
+    def test_pipeline_stages_are_timed(self):
+        metrics = Metrics(enabled=True, path=self.path)
+        with mock.patch('pipeline.metrics', metrics):
+            pipeline = Pipeline(name="test")
+            pipeline.add_stage("double", lambda item: item * 2)
+            pipeline.run(range(3), timeout=5)
+        metrics.close()
+
+        stages = [event for event in self.read_events() if event.get('metric') == "stage"]
+        self.assertEqual(len(stages), 3)
+        self.assertEqual(stages[0]['stage'], "double")
+        self.assertEqual(stages[0]['pipeline'], "test")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest import mock
+
+from microbenchmark import Microbenchmark, compare_microbenchmarks, run_microbenchmark
+
+
+class MicrobenchmarkTest(unittest.TestCase):
+
+    def setUp(self):
+        for name in ['microbenchmark.logger', 'salesforce.logger', 'transformer.logger']:
+            patcher = mock.patch(name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_fixtures(self):
+        microbenchmark = Microbenchmark(people=40, seed=2, repeat=1)
+        # the same people every time
+        self.assertEqual(microbenchmark.people, Microbenchmark(people=40, seed=2, repeat=1).people)
+        self.assertGreater(len(microbenchmark.people), 0)
+        self.assertGreater(len(microbenchmark.validations), len(microbenchmark.people))
+        self.assertIn("names.firstName", microbenchmark.references)
+
+        branched_fields = microbenchmark.branched_config['HUDA__hud_Name__c']['fields']
+        self.assertNotIn("HUDA__Name_Contact__r", branched_fields)
+        self.assertIn("HUDA__Name_Contact__r", microbenchmark.ref_config['HUDA__hud_Name__c']['fields'])
+
+        results = microbenchmark.run()
+        self.assertEqual([case['name'] for case in results['cases']], ["transform_flat", "transform_columns", "transform_branched", "transform_ref", "transform_all", "handle_when", "picklist_transform", "key_in_nested_dict", "validate"])
+        for case in results['cases']:
+            self.assertGreater(case['calls'], 0)
+            self.assertGreater(case['per_call_us'], 0)
+            self.assertEqual(case['records'], len(microbenchmark.people))
+
+        self.assertEqual([case['name'] for case in microbenchmark.run(names=["validate"])['cases']], ["validate"])
+
+    def test_compare(self):
+        baseline = {"cases": [{"name": "validate", "per_call_us": 1.0}, {"name": "handle_when", "per_call_us": 10.0}]}
+        results = {"cases": [{"name": "validate", "per_call_us": 1.5}, {"name": "handle_when", "per_call_us": 11.0}, {"name": "transform_flat", "per_call_us": 5.0}]}
+        comparisons = compare_microbenchmarks(baseline, results, threshold=0.2)
+        self.assertEqual([(c['name'], c['regression']) for c in comparisons], [("validate", True), ("handle_when", False)])
+
+    def test_baseline(self):
+        env = {
+            "STATE_DIR": self.directory.name,
+            "MICROBENCHMARK_PEOPLE": "20",
+            "MICROBENCHMARK_REPEAT": "1",
+            "MICROBENCHMARK_CASES": "validate,handle_when",
+            "MICROBENCHMARK_SAVE_BASELINE": "True"
+        }
+        with mock.patch.dict(os.environ, env):
+            results = run_microbenchmark()
+            self.assertNotIn("comparison", results)
+            baseline = os.path.join(self.directory.name, "microbenchmark_baseline.json")
+            with open(baseline) as f:
+                self.assertEqual(json.load(f)['cases'], results['cases'])
+
+            results = run_microbenchmark()
+            self.assertEqual([comparison['name'] for comparison in results['comparison']], ["handle_when", "validate"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import json
+import unittest
+from unittest import mock
+
+from pds_simulator import PersonGenerator, PDSSimulator, PDSSessionTimeout
+from salesforce_simulator import LatencyModel
+
+
+class PDSSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('pds_simulator.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.generator = PersonGenerator(population=300, seed=3, skew=0.1, updated_fraction=0.1)
+
+    def paginate(self, pds: PDSSimulator) -> list:
+        pages = []
+        while True:
+            results = pds.next_page_results()
+            if len(results) == 0:
+                return pages
+            pages.append(results)
+
+    def test_generator(self):
+        person = self.generator.person(7)
+        # the same person every time
+        self.assertEqual(person, PersonGenerator(population=300, seed=3, skew=0.1, updated_fraction=0.1).person(7))
+        self.assertNotEqual(person, self.generator.person(8))
+        self.assertEqual(self.generator.index_of("personKey", person['personKey']), 7)
+        self.assertEqual(self.generator.index_of("univid", person['univid']), 7)
+        self.assertIsNone(self.generator.index_of("personKey", "not a key"))
+
+        for branch in ["names", "emails"]:
+            self.assertGreater(len(person[branch]), 0)
+            self.assertIn("updateDate", person[branch][0])
+        self.assertTrue(person['emails'][0]['officialEmailIndicator'])
+        self.assertEqual(person['names'][0]['personNameType']['code'], "OFFICIAL")
+
+        # the skewed people have a lot more names
+        name_counts = sorted(len(p['names']) for p in self.generator.people())
+        self.assertEqual(name_counts[-1], self.generator.heavy_count)
+        self.assertLessEqual(name_counts[len(name_counts) // 2], 3)
+
+    def test_search_fields_and_conditions(self):
+        pds = PDSSimulator(generator=self.generator, batch_size=50)
+        query = {
+            "fields": ["personKey", "names.firstName", "emails.email", "effectiveStatus"],
+            "conditions": {
+                "emails.officialEmailIndicator": True,
+                "cacheUpdateDate": ">" + (self.generator.now.replace(day=1, month=1)).strftime('%Y-%m-%dT%H:%M:%S'),
+                "addresses.effectiveStatus.code": "A",
+                "not_required": ["addresses"]
+            }
+        }
+        response = pds.search(query)
+        updated = [p for p in self.generator.people() if p['cacheUpdateDate'] > "2024-01-01" and p['emails'][0]['officialEmailIndicator']]
+        self.assertEqual(response['total_count'], len(updated))
+        self.assertGreater(response['total_count'], 0)
+
+        person = response['results'][0]
+        self.assertEqual(set(person.keys()), {"personKey", "names", "emails", "effectiveStatus"})
+        self.assertEqual(set(person['names'][0].keys()), {"firstName"})
+        # only the official email is left
+        self.assertEqual(len(person['emails']), 1)
+
+        keys = [self.generator.person_key(5), self.generator.person_key(9), "ffff000000000000"]
+        response = pds.search({"fields": ["personKey"], "conditions": [{"personKey": keys}]})
+        self.assertEqual([p['personKey'] for p in response['results']], keys[0:2])
+
+        excluded = pds.search({"fields": ["personKey"], "conditions": {"personKey": {"value": keys, "exclude": True}}})
+        self.assertEqual(excluded['total_count'], 298)
+
+    def test_pagination(self):
+        pds = PDSSimulator(generator=self.generator, batch_size=40, max_backlog=80, real_time=False, page_latency=LatencyModel(base=0.5, per_record=0.01))
+        pds.start_pagination({"fields": ["personKey"]})
+        self.assertEqual(pds.total_count, 300)
+
+        pages = self.paginate(pds)
+        self.assertEqual([len(page) for page in pages], [40] * 7 + [20])
+        self.assertEqual(len({p['personKey'] for page in pages for p in page}), 300)
+        self.assertEqual(pds.calls['page'], 8)
+        self.assertAlmostEqual(pds.simulated_seconds, 8 * 0.5 + 300 * 0.01)
+
+        people = pds.make_people(pages[0])
+        self.assertEqual(people[0].personKey, pages[0][0]['personKey'])
+
+        pds.start_pagination({"fields": ["personKey"]}, wait=True, type="list")
+        self.assertEqual(len(pds.results), 300)
+
+    def test_injected_failures(self):
+        pds = PDSSimulator(generator=self.generator, batch_size=100, session_timeout_pages=[3], total_count_drift={2: -5})
+        pds.start_pagination({"fields": ["personKey"]})
+        pages = self.paginate(pds)
+
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pds.total_count, 295)
+        self.assertIsInstance(pds.pagination_error, PDSSessionTimeout)
+
+        # the backlog isn't read, but it can still be stopped
+        pds = PDSSimulator(generator=self.generator, batch_size=10, max_backlog=20)
+        pds.start_pagination({"fields": ["personKey"]})
+        pds.wait_for_pagination()
+        self.assertFalse(pds.is_paginating)
+
+    def test_example_query(self):
+        try:
+            f = open('example_pds_query.json')
+        except:
+            f = open('../example_pds_query.json')
+        pds_query = json.load(f)
+        f.close()
+        pds = PDSSimulator(generator=PersonGenerator(population=200), batch_size=50)
+        response = pds.search(pds_query)
+        self.assertGreater(response['total_count'], 100)
+        for person in response['results']:
+            self.assertTrue(all(name['personNameType']['code'] in ["LISTING", "OFFICIAL"] for name in person['names']))
+            self.assertTrue(all(email['officialEmailIndicator'] for email in person['emails']))
+
+
+if __name__ == '__main__':
+    unittest.main()
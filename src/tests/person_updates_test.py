@@ -1,8 +1,10 @@
 import json
 import os
+import tempfile
 import unittest
 from unittest import mock, skip
 from salesforce_person_updates import SalesforcePersonUpdates, logger
+from fingerprints import RecordFingerprints
 
 
 class SalesforcePersonUpdatesTest(unittest.TestCase):
@@ -354,6 +356,135 @@ class SalesforcePersonUpdatesTest(unittest.TestCase):
         correct_amount = len(self._get_ids_side_effect('hed__Affiliation__c')) - 2
         self.mock_logger.info.assert_called_with(f"Found {correct_amount} ids in hed__Affiliation__c that are no longer updating")
 
+    @mock.patch('duplicates.logger')
+    def test_remove_defunct_contacts_uses_duplicate_report(self, mock_duplicates_logger):
+        def query_all_iter(select_string):
+            # SELECT Id, <external id>, LastModifiedDate FROM <object> ...
+            external_id = select_string.split(", ")[1]
+            if " FROM Contact " not in select_string:
+                return iter([])
+            return iter([{"Id": "003B", external_id: "1"}, {"Id": "003A", external_id: "1"}])
+        self.mock_hsf_instance.sf = mock.MagicMock()
+        self.mock_hsf_instance.sf.query_all_iter.side_effect = query_all_iter
+
+        report = self.sfpu.full_duplicate_check()
+        self.assertEqual(report.losers('Contact'), ["003A"])
+        query_count = self.mock_hsf_instance.sf.query_all_iter.call_count
+        self.assertEqual(query_count, len(self.sfpu.app_config.config))
+
+        self.sfpu.remove_defunct_contacts()
+        # the report from the check is used, nothing is queried again
+        self.assertEqual(self.mock_hsf_instance.sf.query_all_iter.call_count, query_count)
+        self.mock_hsf_instance.delete_records.assert_called_with(object_name='Contact', ids=["003A"])
+
+    @mock.patch('salesforce_person_updates.run_shards')
+    def test_sharded_load_refreshes_the_id_index_once(self, mock_run_shards):
+        mock_run_shards.return_value = {0: 1, 1: 2}
+        self.sfpu.shard_count = 2
+        self.sfpu.hsf.id_index = mock.MagicMock()
+
+        with tempfile.TemporaryDirectory() as state_dir, mock.patch.dict(os.environ, {"STATE_DIR": state_dir}), mock.patch('sharding.logger'):
+            self.assertEqual(self.sfpu.sharded_people_data_load(pds_query={"fields": ["personKey"], "conditions": {}}), 3)
+
+        # the parent refreshes (and saves) the index for the shards, which only read it
+        objects_with_ids = [name for name, config in self.sfpu.transformer.getSourceConfig('pds').items() if 'Id' in config]
+        self.assertEqual(self.sfpu.hsf.id_index.refresh.call_count, len(objects_with_ids))
+        self.sfpu.hsf.id_index.snapshot.assert_called_once()
+        self.assertEqual(len(mock_run_shards.call_args[0][1]), 2)
+
+    @mock.patch('fingerprints.logger')
+    @mock.patch('salesforce_person_updates.run_shards')
+    def test_pushes_without_fingerprints_discard_them(self, mock_run_shards, mock_fingerprints_logger):
+        mock_run_shards.return_value = {0: 1, 1: 2}
+        external_id = self.sfpu.app_config.config['Contact']['Id']['salesforce']
+        records = [{external_id: "1", "LastName": "One"}]
+
+        with tempfile.TemporaryDirectory() as state_dir, mock.patch.dict(os.environ, {"STATE_DIR": state_dir}), mock.patch('sharding.logger'):
+            # a sharded load: the shards push everything without recording it
+            self.sfpu.fingerprints = RecordFingerprints(state_dir=state_dir)
+            self.sfpu.fingerprints.record('Contact', external_id, records)
+            self.sfpu.fingerprints.snapshot()
+            self.sfpu.shard_count = 2
+            self.sfpu.hsf.id_index = None
+            self.sfpu.sharded_people_data_load(pds_query={"fields": ["personKey"], "conditions": {}})
+            self.assertEqual(self.sfpu.fingerprints.changed('Contact', external_id, records), records)
+            self.assertEqual(RecordFingerprints(state_dir=state_dir).restore(['Contact']), [])
+
+            # a run without DELTA_PUSH
+            name = self.sfpu.salesforce_instance_id or "local"
+            fingerprints = RecordFingerprints(name=name, state_dir=state_dir)
+            fingerprints.record('Contact', external_id, records)
+            fingerprints.snapshot()
+            SalesforcePersonUpdates(local="True")
+            self.assertEqual(RecordFingerprints(name=name, state_dir=state_dir).restore(['Contact']), [])
+
+    @mock.patch('fingerprints.logger')
+    def test_cleanup_updateds_saves_the_flag_fingerprints(self, mock_fingerprints_logger):
+        # only the Contact is flagged
+        for obj in self.sfpu.app_config.config.keys():
+            if obj != 'Contact' and 'updatedFlag' in self.sfpu.app_config.config[obj]:
+                self.sfpu.app_config.config[obj].pop('updatedFlag')
+        external_id = self.sfpu.app_config.config['Contact']['Id']['salesforce']
+        updated_flag = self.sfpu.app_config.config['Contact']['updatedFlag']
+        contact_ids = self._get_ids_side_effect('Contact')
+        records = [{external_id: contact_id, "LastName": f"Person {contact_id}", updated_flag: True} for contact_id in contact_ids]
+
+        self.mock_hsf_instance.get_all_external_ids.side_effect = self._get_ids_side_effect
+        # 1-5 are still in the pds, 6-10 get their updatedFlag turned off
+        self.mock_pds_instance.search.return_value = {"count": 5, "total_count": 5, "results": [{"personKey": contact_id} for contact_id in contact_ids[0:5]]}
+
+        for fields in [False, True]:
+            with self.subTest(fields=fields), tempfile.TemporaryDirectory() as state_dir:
+                # the load pushed everyone (and saved their fingerprints)
+                self.sfpu.fingerprints = RecordFingerprints(state_dir=state_dir, fields=fields)
+                self.sfpu.fingerprints.record('Contact', external_id, records)
+                self.sfpu.fingerprints.snapshot()
+
+                # the flags are pushed by external id, and their bulk results are recorded like any other push
+                def flag_field(object_name, external_id, flag_name, value, ids):
+                    self.sfpu.fingerprints.record(object_name, external_id, [{external_id: flagged_id, flag_name: value} for flagged_id in ids])
+                self.mock_hsf_instance.flag_field.side_effect = flag_field
+                self.sfpu.cleanup_updateds()
+
+                # the next run: the people who come back unchanged are pushed again (with the updatedFlag on)
+                fingerprints = RecordFingerprints(state_dir=state_dir, fields=fields)
+                self.assertEqual(fingerprints.restore(['Contact']), ['Contact'])
+                changed = fingerprints.changed('Contact', external_id, records)
+                self.assertEqual([record[external_id] for record in changed], contact_ids[5:])
+                self.assertTrue(all(record[updated_flag] for record in changed))
+                if fields:
+                    # just the flag the cleanup turned off
+                    self.assertEqual(changed[0], {external_id: contact_ids[5], updated_flag: True})
+
+    def test_push_records_keeps_the_bulk_api_version_with_async_bulk(self):
+        (classic_object, object_name) = [name for name in self.sfpu.app_config.config.keys() if name != 'Contact'][0:2]
+        self.sfpu.hsf.bulk_api_versions = {classic_object: 1}
+        self.sfpu.job_tracker = mock.MagicMock()
+        data = {name: [{self.sfpu.app_config.config[name]['Id']['salesforce']: "1"}] for name in [classic_object, object_name]}
+
+        self.sfpu.push_records(data=dict(data))
+        # the classic Bulk API object isn't sent as a Bulk API 2.0 job
+        self.sfpu.job_tracker.submit.assert_called_once_with(object_name, data[object_name], self.sfpu.app_config.config[object_name]['Id']['salesforce'], on_done=None)
+        self.mock_hsf_instance.pushBulk.assert_called_once_with(classic_object, data[classic_object], self.sfpu.app_config.config[classic_object]['Id']['salesforce'])
+
+    @mock.patch('fingerprints.logger')
+    def test_push_records_skips_unchanged_records(self, mock_fingerprints_logger):
+        self.sfpu.fingerprints = RecordFingerprints(state_dir="unused")
+        object_name = [name for name in self.sfpu.app_config.config.keys() if name != 'Contact'][0]
+        external_id = self.sfpu.app_config.config[object_name]['Id']['salesforce']
+        records = [{external_id: "1", "Name": "One"}, {external_id: "2", "Name": "Two"}]
+        self.sfpu.fingerprints.record(object_name, external_id, records)
+
+        pushed = []
+        self.sfpu.push_records(data={object_name: [dict(records[0])]}, on_pushed=pushed.append)
+        # nothing changed, so nothing is pushed, but the object is still done
+        self.mock_hsf_instance.pushBulk.assert_not_called()
+        self.assertEqual(pushed, [object_name])
+
+        changed = [{external_id: "1", "Name": "Uno"}, dict(records[1])]
+        self.sfpu.push_records(data={object_name: changed})
+        self.mock_hsf_instance.pushBulk.assert_called_once_with(object_name, changed[0:1], external_id)
+
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
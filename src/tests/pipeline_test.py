@@ -0,0 +1,91 @@
+import threading
+import time
+import unittest
+
+from pipeline import Pipeline
+
+
+class PipelineTest(unittest.TestCase):
+
+    def test_items_go_through_all_stages(self):
+        results = []
+        lock = threading.Lock()
+
+        def collect(item):
+            with lock:
+                results.append(item)
+
+        pipeline = Pipeline(name="test")
+        pipeline.add_stage("double", lambda item: item * 2)
+        pipeline.add_stage("add", lambda item: item + 1, workers=3)
+        pipeline.add_stage("collect", collect)
+        pipeline.run(range(20))
+
+        self.assertEqual(sorted(results), sorted([i * 2 + 1 for i in range(20)]))
+
+    def test_none_drops_item(self):
+        results = []
+        pipeline = Pipeline(name="test")
+        pipeline.add_stage("filter", lambda item: item if item % 2 == 0 else None)
+        pipeline.add_stage("collect", results.append)
+        pipeline.run(range(10))
+
+        self.assertEqual(results, [0, 2, 4, 6, 8])
+
+    def test_backpressure_limits_source(self):
+        release = threading.Event()
+        read = []
+
+        def source():
+            for i in range(100):
+                read.append(i)
+                yield i
+
+        def slow(item):
+            release.wait(5)
+
+        pipeline = Pipeline(name="test")
+        pipeline.add_stage("slow", slow, queue_size=2)
+        thread = threading.Thread(target=pipeline.run, args=(source(),))
+        thread.start()
+        time.sleep(0.2)
+
+        # one item in the worker, two in the queue, and one blocked on put
+        self.assertLessEqual(len(read), 4)
+        release.set()
+        thread.join(5)
+        self.assertEqual(len(read), 100)
+
+    def test_stage_exception_is_raised(self):
+        def fail(item):
+            if item == 5:
+                raise ValueError("bad item")
+            return item
+
+        pipeline = Pipeline(name="test")
+        pipeline.add_stage("fail", fail)
+        pipeline.add_stage("noop", lambda item: item)
+        with self.assertRaises(ValueError):
+            pipeline.run(range(1000))
+
+    def test_source_exception_is_raised(self):
+        def source():
+            yield 1
+            raise ValueError("pagination failed")
+
+        pipeline = Pipeline(name="test")
+        pipeline.add_stage("noop", lambda item: item)
+        with self.assertRaises(ValueError):
+            pipeline.run(source())
+
+    def test_timeout(self):
+        release = threading.Event()
+        pipeline = Pipeline(name="test")
+        pipeline.add_stage("slow", lambda item: release.wait(5))
+        with self.assertRaises(TimeoutError):
+            pipeline.run([1], timeout=0.1)
+        release.set()
+
+
+if __name__ == '__main__':
+    unittest.main()
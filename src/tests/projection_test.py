@@ -0,0 +1,109 @@
+import json
+import unittest
+from unittest import mock
+
+from projection import plan_pds_fields, compare_pds_fields, project_pds_query
+
+
+class ProjectionTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('projection.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.config = {
+            "Contact": {
+                "flat": True,
+                "source": "pds",
+                "Id": {"pds": "personKey", "salesforce": "personKey__c"},
+                "fields": {
+                    "Status__c": "effectiveStatus.code",
+                    "FirstName": {"value": "names.firstName", "when": {"names.personNameType.code": ["LISTING", "OFFICIAL"]}},
+                    "Source__c": {"value": "PDS", "static": True},
+                    "Old__c": "sf.contact.id",
+                    "Unmapped__c": ""
+                }
+            },
+            "Name__c": {
+                "flat": False,
+                "source": "pds",
+                "Id": {"pds": "names.personNameKey", "salesforce": "personNameKey__c"},
+                "fields": {
+                    "Contact__r": {"ref": {"object": "Contact", "ref_external_id": "personKey__c", "source_value_ref": "personKey"}},
+                    "Type__c": {"value": "names.personNameType.code", "picklist": {"Listing": ["LISTING"]}, "when": {"effectiveStatus.code": "A"}}
+                }
+            },
+            "Account": {
+                "flat": True,
+                "source": "departments",
+                "Id": {"departments": "hrDeptId", "salesforce": "deptId__c"},
+                "fields": {"Name": "hrDeptDesc"}
+            }
+        }
+
+    def test_plan_pds_fields(self):
+        self.assertEqual(plan_pds_fields(self.config), [
+            "personKey",
+            "effectiveStatus.code",
+            "names.firstName",
+            "names.updateDate",
+            "names.personNameType.code",
+            "names.personNameKey",
+            # the when without the branch name is on the branch
+            "names.effectiveStatus.code"
+        ])
+
+    def test_compare_pds_fields(self):
+        planned = ["personKey", "effectiveStatus.code", "names.firstName"]
+        (missing, extra) = compare_pds_fields(planned, ["personKey", "effectiveStatus", "names.lastName", "names.firstName", "cacheUpdateDate"])
+        self.assertEqual(missing, [])
+        self.assertEqual(extra, ["names.lastName", "cacheUpdateDate"])
+
+        (missing, extra) = compare_pds_fields(planned, ["personKey", "names"])
+        self.assertEqual(missing, ["effectiveStatus.code"])
+        self.assertEqual(extra, [])
+
+    def test_project_pds_query(self):
+        pds_query = {"fields": ["personKey", "effectiveStatus", "names", "uuid"], "conditions": {"names.effectiveStatus.code": "A"}}
+
+        self.assertIs(project_pds_query(pds_query, self.config, mode="off"), pds_query)
+        self.assertIs(project_pds_query(pds_query, self.config, mode="warn"), pds_query)
+        # a broader list of fields is a warning
+        self.assertIn("['uuid']", self.mock_logger.warning.call_args[0][0])
+        self.mock_logger.warning.reset_mock()
+
+        projected = project_pds_query(pds_query, self.config, mode="rewrite", keep=["cacheUpdateDate"])
+        # (the extra fields are just taken out)
+        self.assertFalse(any("doesn't use" in call[0][0] for call in self.mock_logger.warning.call_args_list))
+        self.assertEqual(projected['fields'], plan_pds_fields(self.config) + ["cacheUpdateDate"])
+        self.assertEqual(projected['conditions'], pds_query['conditions'])
+        # the original isn't changed
+        self.assertEqual(pds_query['fields'], ["personKey", "effectiveStatus", "names", "uuid"])
+
+        with self.assertRaises(Exception):
+            project_pds_query(pds_query, self.config, mode="strict")
+        with self.assertRaises(ValueError):
+            project_pds_query(pds_query, self.config, mode="sometimes")
+
+    def test_example_config_is_covered(self):
+        # the example query has everything the example config uses, except for a few fields that aren't in it
+        try:
+            f = open('example_config.json')
+        except:
+            f = open('../example_config.json')
+        config = json.load(f)
+        f.close()
+        try:
+            f = open('example_pds_query.json')
+        except:
+            f = open('../example_pds_query.json')
+        pds_query = json.load(f)
+        f.close()
+        (missing, extra) = compare_pds_fields(plan_pds_fields(config), pds_query['fields'])
+        self.assertIn("cacheUpdateDate", extra)
+        self.assertNotIn("personKey", missing)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+from unittest import mock
+
+from reconciler import IdReconciler, run_lookups
+
+
+class IdReconcilerTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('reconciler.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.reconciler = IdReconciler()
+        self.reconciler.add_object('Contact', ['1', '2', '3'])
+        self.reconciler.add_object('hed__Affiliation__c', ['11', '12', '13'])
+        self.reconciler.add_field('personKey', 'Contact')
+        self.reconciler.add_field('employeeRoles.personRoleKey', 'hed__Affiliation__c')
+        self.reconciler.add_field('studentRoles.personRoleKey', 'hed__Affiliation__c')
+
+    def test_reconcile_checks_off_found_ids(self):
+        people = [
+            {"personKey": "1", "employeeRoles": [{"personRoleKey": 11}, {"personRoleKey": 12}]},
+            {"personKey": "2", "studentRoles": [{"otherKey": 13}]},
+            {"personKey": "4"}
+        ]
+        found = self.reconciler.reconcile(people)
+
+        self.assertEqual(found, 4)
+        self.assertEqual(self.reconciler.remaining('Contact'), ['3'])
+        self.assertEqual(self.reconciler.remaining('hed__Affiliation__c'), ['13'])
+        # the starting counts are kept for the sanity check
+        self.assertEqual(self.reconciler.starting_count('Contact'), 3)
+
+    def test_reconcile_across_pages(self):
+        self.reconciler.reconcile([{"personKey": "1"}])
+        # an id found twice is only counted once
+        self.assertEqual(self.reconciler.reconcile([{"personKey": "1"}, {"personKey": "3"}]), 1)
+        self.assertEqual(self.reconciler.remaining_count('Contact'), 1)
+
+    def test_objects_without_ids_are_skipped(self):
+        self.reconciler.add_field('names.personNameKey', 'Names__c')
+        found = self.reconciler.reconcile([{"personKey": "1", "names": [{"personNameKey": 21}]}])
+        self.assertEqual(found, 1)
+        self.assertNotIn('Names__c', self.reconciler.remaining_ids)
+
+
+class RunLookupsTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('reconciler.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch('reconciler.time.sleep')
+        self.mock_sleep = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _double_lookup(self, chunk):
+        return [value * 2 for value in chunk]
+
+    def test_ordered_results(self):
+        chunks = [[i] for i in range(20)]
+        results = []
+        count = run_lookups(self._double_lookup, chunks, lambda index, result: results.append((index, result)), worker_count=4, ordered=True)
+
+        self.assertEqual(count, 20)
+        self.assertEqual(results, [(i, [i * 2]) for i in range(20)])
+
+    def test_unordered_results(self):
+        chunks = [[i] for i in range(20)]
+        results = {}
+        run_lookups(self._double_lookup, chunks, lambda index, result: results.update({index: result}), worker_count=4)
+
+        self.assertEqual(results, {i: [i * 2] for i in range(20)})
+
+    def test_failed_chunks_are_retried(self):
+        attempts = []
+
+        def flaky_lookup(chunk):
+            attempts.append(chunk)
+            if len(attempts) < 3:
+                raise Exception("PDS timeout")
+            return chunk
+
+        results = []
+        run_lookups(flaky_lookup, [["a"]], lambda index, result: results.append(result), retries=3, backoff=1)
+
+        self.assertEqual(results, [["a"]])
+        self.assertEqual(len(attempts), 3)
+        # the backoff doubles
+        waits = [call[0][0] for call in self.mock_sleep.call_args_list]
+        self.assertTrue(0.5 <= waits[0] <= 1 and 1 <= waits[1] <= 2)
+
+    def test_failures_are_raised(self):
+        def bad_lookup(chunk):
+            raise Exception("PDS is down")
+
+        with self.assertRaises(Exception):
+            run_lookups(bad_lookup, [[1], [2], [3]], lambda index, result: None, worker_count=2, retries=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
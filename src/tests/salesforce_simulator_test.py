@@ -0,0 +1,123 @@
+import json
+import unittest
+from unittest import mock
+
+from simple_salesforce import exceptions
+
+from salesforce import HarvardSalesforce
+from salesforce_simulator import SalesforceSimulator, LatencyModel, schema_from_config
+
+
+class SalesforceSimulatorTest(unittest.TestCase):
+
+    def setUp(self):
+        patcher = mock.patch('salesforce.logger')
+        self.mock_logger = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.config = {
+            "Contact": {
+                "flat": True,
+                "source": "pds",
+                "Id": {"pds": "personKey", "salesforce": "personKey__c"},
+                "fields": {"FirstName": "names.firstName", "Email": "emails.email"},
+                "updatedFlag": "huit__Updated__c"
+            },
+            "Name__c": {
+                "flat": False,
+                "source": "pds",
+                "Id": {"pds": "names.personNameKey", "salesforce": "personNameKey__c"},
+                "fields": {
+                    "Contact__r": {"ref": {"object": "Contact", "ref_external_id": "personKey__c", "source_value_ref": "personKey"}},
+                    "Name__c": "names.firstName"
+                }
+            }
+        }
+        self.simulator = SalesforceSimulator(schema=schema_from_config(self.config), seed=1)
+        self.hsf = HarvardSalesforce(domain="", username="", password="", sf=self.simulator)
+
+    def test_schema_from_config(self):
+        schema = schema_from_config(self.config)
+        self.assertTrue(schema['Contact']['personKey__c']['externalId'])
+        self.assertEqual(schema['Contact']['huit__Updated__c']['type'], "boolean")
+        self.assertEqual(schema['Name__c']['Contact__c']['relationshipName'], "Contact__r")
+        self.assertEqual(schema['Name__c']['Contact__c']['referenceTo'], ["Contact"])
+        self.assertIn("huit__Message__c", schema['huit__Log__c'])
+
+        # getTypeMap works off of its describe
+        type_map = self.hsf.getTypeMap(["Contact"])
+        self.assertEqual(type_map['Contact']['personKey__c']['type'], "string")
+        self.assertEqual(self.simulator.calls['describe'], 1)
+
+    def test_push_and_query(self):
+        self.hsf.unique_ids = {"Contact": {"id_name": "personKey", "Ids": {}}, "Name__c": {"id_name": "names.personNameKey", "Ids": {}}}
+        contacts = [{"personKey__c": "a1", "FirstName": "Ada"}, {"personKey__c": "b2", "FirstName": "Grace"}]
+        self.assertTrue(self.hsf.pushBulk("Contact", contacts, id_name="personKey__c"))
+        self.assertTrue(self.hsf.pushBulk("Contact", [{"personKey__c": "a1", "FirstName": "Augusta"}], id_name="personKey__c"))
+        self.assertEqual(self.simulator.count("Contact"), 2)
+        self.assertEqual(self.simulator.get("Contact", "personKey__c", "a1")['FirstName'], "Augusta")
+
+        # a reference by external id
+        responses = self.simulator.bulk.Name__c.upsert([
+            {"personNameKey__c": "n1", "Contact__r": {"personKey__c": "a1"}},
+            {"personNameKey__c": "n2", "Contact__r": {"personKey__c": "missing"}},
+            {"personNameKey__c": "n3", "Unknown__c": "x"}
+        ], external_id_field="personNameKey__c")
+        self.assertTrue(responses[0]['created'])
+        self.assertEqual(self.simulator.get("Name__c", "personNameKey__c", "n1")['Contact__c'], self.simulator.get("Contact", "personKey__c", "a1")['Id'])
+        self.assertTrue(responses[1]['errors'][0]['message'].startswith("Foreign key external ID"))
+        self.assertEqual(responses[2]['errors'][0]['statusCode'], "INVALID_FIELD")
+
+        unique_ids = self.hsf.getUniqueIds(self.config, source_data=[{"personKey": "a1"}, {"personKey": "c3"}], target_object="Contact")
+        self.assertEqual(list(unique_ids['Contact']['Ids'].keys()), ["a1"])
+
+        records = self.simulator.query_all("SELECT Id, personKey__c FROM Contact WHERE personKey__c != null AND FirstName IN('Grace', 'O\\'Neil') ORDER BY LastModifiedDate DESC LIMIT 5")['records']
+        self.assertEqual([record['personKey__c'] for record in records], ["b2"])
+
+        with self.assertRaises(exceptions.SalesforceMalformedRequest):
+            self.simulator.query_all("DELETE FROM Contact")
+
+    def test_delete_and_include_deleted(self):
+        ids = self.simulator.load("Contact", [{"personKey__c": "a1"}, {"personKey__c": "b2"}])
+        self.hsf.delete_records("Contact", [ids[0]])
+        self.assertEqual(self.simulator.count("Contact"), 1)
+
+        query = "SELECT Id, personKey__c, SystemModstamp, IsDeleted FROM Contact WHERE SystemModstamp >= 2024-01-01T00:00:00Z"
+        self.assertEqual(len(self.simulator.query_all(query)['records']), 1)
+        records = list(self.simulator.query_all_iter(query, include_deleted=True))
+        self.assertEqual({record['Id']: record['IsDeleted'] for record in records}, {ids[0]: True, ids[1]: False})
+
+    def test_error_injection(self):
+        simulator = SalesforceSimulator(schema=schema_from_config(self.config), seed=7, lock_rate=0.5, duplicate_rules={"Contact": ["Email"]})
+        simulator.load("Contact", [{"personKey__c": "a1", "Email": "ada@example.edu"}])
+
+        responses = simulator.bulk.Contact.upsert([{"personKey__c": f"k{i}"} for i in range(100)], external_id_field="personKey__c")
+        locked = [response for response in responses if not response['success']]
+        self.assertTrue(0 < len(locked) < 100)
+        self.assertEqual({response['errors'][0]['statusCode'] for response in locked}, {"UNABLE_TO_LOCK_ROW"})
+
+        # the same seed fails the same records
+        again = SalesforceSimulator(schema=schema_from_config(self.config), seed=7, lock_rate=0.5)
+        again_responses = again.bulk.Contact.upsert([{"personKey__c": f"k{i}"} for i in range(100)], external_id_field="personKey__c")
+        self.assertEqual([response['success'] for response in responses], [response['success'] for response in again_responses])
+
+        simulator.lock_rate = 0
+        responses = simulator.bulk.Contact.upsert([{"personKey__c": "b2", "Email": "ADA@example.edu"}], external_id_field="personKey__c")
+        self.assertEqual(responses[0]['errors'][0]['statusCode'], "DUPLICATES_DETECTED")
+
+    def test_latency_and_logs(self):
+        simulator = SalesforceSimulator(schema=schema_from_config(self.config), real_time=False, bulk_latency=LatencyModel(base=2.0, per_record=0.01), query_latency=LatencyModel(base=0.5))
+        simulator.bulk.Contact.upsert([{"personKey__c": f"k{i}"} for i in range(100)], external_id_field="personKey__c")
+        simulator.query_all("SELECT Id FROM Contact")
+        self.assertAlmostEqual(simulator.simulated_seconds, 3.5)
+        self.assertEqual(simulator.calls['bulk_upsert'], 1)
+        self.assertEqual(simulator.calls['query'], 1)
+
+        payload = {"allOrNone": False, "records": [{"attributes": {"type": "huit__Log__c"}, "huit__Message__c": "hello", "huit__Level__c": "INFO"}]}
+        responses = simulator.restful("composite/sobjects", method="POST", data=json.dumps(payload))
+        self.assertTrue(responses[0]['success'])
+        self.assertEqual(simulator.count("huit__Log__c"), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -330,7 +330,8 @@ class HarvardSalesforceTest(unittest.TestCase):
     def test_check_duplicate_success(self):
         self.sf.sf.query_all.return_value = {
             "records": [{
-                'Id': '012345678'
+                'Id': '012345678',
+                'EPPN': '1234'
             }]
         }
 
@@ -340,6 +341,51 @@ class HarvardSalesforceTest(unittest.TestCase):
 
         self.assertEqual(response, 0)
 
+    def test_check_duplicate_batches_queries(self):
+        existing_records = [
+            {'Id': '003A', 'EPPN': 'a1', 'HUID': '1'},
+            {'Id': '003B', 'EPPN': 'b2', 'HUID': '2'},
+            {'Id': '003C', 'Email': 'c@x.edu', 'LastName': 'Cee', 'FirstName': 'Jo'},
+            {'Id': '003D', 'Email': 'd@x.edu', 'LastName': 'Dee', 'FirstName': 'Jo'},
+            {'Id': '003E', 'EPPN': 'e5', 'HUID': '5'},
+            {'Id': '003F', 'Email': 'E@x.edu', 'LastName': 'Eee', 'FirstName': 'Jo'}
+        ]
+
+        def query_all(query):
+            fields = query.split("SELECT Id, ")[1].split(" FROM ")[0].split(", ")
+            return {"records": [record for record in existing_records if all(field in record for field in fields)]}
+        self.sf.sf.query_all.side_effect = query_all
+
+        errored_data_objects = [
+            {"EPPN": "a1", "HUID": "1"},
+            {"EPPN": "B2", "HUID": "2"},
+            {"EPPN": "zz", "HUID": "9", "Email": "c@x.edu", "LastName": "Cee", "FirstName": "Jo"},
+            {"EPPN": "x", "HUID": "0"},
+            # matches two different records
+            {"EPPN": "e5", "HUID": "5", "Email": "e@x.edu", "LastName": "Eee", "FirstName": "Jo"},
+            {"LastName": "no keys"}
+        ]
+        response = self.sf.check_duplicate(object_name='Contact', errored_data_objects=errored_data_objects, dry_run=True)
+
+        # one query for the external ids and one for the contact rule
+        self.assertEqual(self.sf.sf.query_all.call_count, 2)
+        self.assertEqual(response, 3)
+        self.assertEqual([record.get('Id') for record in errored_data_objects], ['003A', '003B', '003C', None, None, None])
+
+    def test_soql_in_clauses(self):
+        values = [f"value{i}" for i in range(100)] + ["O'Brien"]
+        clauses = list(self.sf._soql_in_clauses(values, max_length=100))
+
+        self.assertGreater(len(clauses), 1)
+        self.assertTrue(all(len(clause) <= 100 for clause in clauses))
+        self.assertIn("'O\\'Brien'", clauses[-1])
+        self.assertEqual(sum(clause.count("value") for clause in clauses), 100)
+
+    def test_trim_nones(self):
+        records = [{"Id": "1", "Email": None, "HomePhone": ""}, {"Id": "2", "Email": "a@b.c"}]
+        self.assertEqual(self.sf.trim_nones(records), [{"Id": "1", "HomePhone": ""}, {"Id": "2", "Email": "a@b.c"}])
+        self.assertEqual(self.sf.trim_nones({"Id": "1", "Email": None}), {"Id": "1"})
+
 
 
 
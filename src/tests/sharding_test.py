@@ -0,0 +1,102 @@
+import unittest
+from unittest import mock
+from datetime import datetime
+
+from sharding import split_pds_query, shard_range, run_shards
+from checkpoint import LoadCheckpoint
+
+
+def fake_now(now: datetime):
+    # a datetime whose now() is fixed (shard_range and split_pds_query default the end to now)
+    class FakeDatetime(datetime):
+        @classmethod
+        def now(cls, tz=None):
+            return now
+    return FakeDatetime
+
+
+class ShardingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pds_query = {
+            "fields": ["univid"],
+            "conditions": {
+                "names.name.nameTypeCode": "LISTING"
+            }
+        }
+        self.start = datetime(2020, 1, 1)
+        self.end = datetime(2020, 1, 5)
+
+    def test_split_covers_everything(self):
+        shard_queries = split_pds_query(self.pds_query, shard_count=4, start=self.start, end=self.end)
+
+        self.assertEqual(len(shard_queries), 4)
+        ranges = [query['conditions'][-1]['cacheUpdateDate'] for query in shard_queries]
+        self.assertEqual(ranges, [
+            "1900-01-01T00:00:00>2020-01-02T00:00:01",
+            "2020-01-02T00:00:00>2020-01-03T00:00:01",
+            "2020-01-03T00:00:00>2020-01-04T00:00:01",
+            ">2020-01-04T00:00:00"
+        ])
+
+    def test_split_keeps_conditions(self):
+        shard_queries = split_pds_query(self.pds_query, shard_count=2, start=self.start, end=self.end)
+
+        for query in shard_queries:
+            self.assertEqual(query['fields'], ["univid"])
+            self.assertEqual(query['conditions'][0], {"names.name.nameTypeCode": "LISTING"})
+        # the original query isn't changed
+        self.assertEqual(self.pds_query['conditions'], {"names.name.nameTypeCode": "LISTING"})
+
+    def test_single_shard_is_unchanged(self):
+        shard_queries = split_pds_query(self.pds_query, shard_count=1, start=self.start, end=self.end)
+        self.assertEqual(shard_queries[0]['conditions'], [{"names.name.nameTypeCode": "LISTING"}])
+
+    def test_split_rejects_existing_range(self):
+        self.pds_query['conditions']['cacheUpdateDate'] = ">2020-01-01T00:00:00"
+        with self.assertRaises(ValueError):
+            split_pds_query(self.pds_query, shard_count=2, start=self.start, end=self.end)
+
+    def test_resume_uses_the_stored_range(self):
+        stored = {}
+        mock_app_config = mock.MagicMock()
+        mock_app_config.get_checkpoint.side_effect = lambda name: stored.get(name)
+        mock_app_config.save_checkpoint.side_effect = lambda name, checkpoint: stored.update({name: checkpoint})
+        mock_app_config.clear_checkpoint.side_effect = lambda name: stored.pop(name, None)
+
+        def split(now, resume):
+            with mock.patch('sharding.datetime', fake_now(now)), mock.patch('sharding.logger'):
+                (start, end) = shard_range(mock_app_config, "full_person_load_shards_of_3", self.pds_query, resume=resume)
+                return split_pds_query(self.pds_query, shard_count=3, start=start, end=end)
+
+        first_queries = split(datetime(2020, 1, 5, 10, 0, 0), resume=False)
+        checkpoint = LoadCheckpoint(app_config=mock_app_config, name="full_person_load_shard_1_of_3", objects=["Contact"], save_interval=0)
+        checkpoint.start(first_queries[1], total_count=300)
+        checkpoint.complete("Contact", 0, 100)
+
+        # the resume is an hour later, but the shards are the same
+        resumed_queries = split(datetime(2020, 1, 5, 11, 0, 0), resume=True)
+        self.assertEqual(resumed_queries, first_queries)
+        checkpoint = LoadCheckpoint(app_config=mock_app_config, name="full_person_load_shard_1_of_3", objects=["Contact"], save_interval=0)
+        self.assertTrue(checkpoint.load())
+        with mock.patch('checkpoint.logger'):
+            checkpoint.start(resumed_queries[1], total_count=300)
+        self.assertEqual(checkpoint.completed, {"Contact": [[0, 100]]})
+
+        # without resume (or after the load clears it) the range is new
+        self.assertNotEqual(split(datetime(2020, 1, 5, 11, 0, 0), resume=False), first_queries)
+
+    def test_run_shards_merges_counts(self):
+        shards = [{"index": i, "extra": "x" * i} for i in range(2)]
+        # len() of the shard dict: index, extra and progress_queue
+        counts = run_shards(len, shards, progress_interval=1)
+        self.assertEqual(counts, {0: 3, 1: 3})
+
+    def test_run_shards_raises_failures(self):
+        shards = [{"index": 0}]
+        with self.assertRaises(Exception):
+            run_shards(int, shards, progress_interval=1)
+
+
+if __name__ == '__main__':
+    unittest.main()
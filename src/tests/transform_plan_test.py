@@ -0,0 +1,100 @@
+import unittest
+
+from transform_plan import ObjectPlan, PicklistMap, compile_when
+
+
+class TransformPlanTest(unittest.TestCase):
+
+    def setUp(self):
+        self.object_config = {
+            "Id": {
+                "pds": "names.personNameKey",
+                "salesforce": "Name_Key__c"
+            },
+            "fields": {
+                "Name_Type__c": {
+                    "value": "names.name.nameTypeCode",
+                    "picklist": {
+                        "Legal": ["LEGAL"],
+                        "Listing": ["LISTING", "default"],
+                        "Other": ["LEGAL", "OTHER"]
+                    }
+                },
+                "First_Name__c": "names.name.firstName",
+                "Last_Name__c": ["names.name.lastName", "names.lastName"],
+                "Contact__c": {
+                    "ref": {
+                        "object": "Contact",
+                        "ref_external_id": "personKey__c",
+                        "source_value_ref": "personKey"
+                    }
+                },
+                "Source__c": {
+                    "value": "pds",
+                    "static": True
+                },
+                "Notes__c": None
+            }
+        }
+
+    def test_picklist_map_matches_picklist_transform(self):
+        picklist = PicklistMap(self.object_config['fields']['Name_Type__c']['picklist'])
+        self.assertTrue(picklist.usable)
+        # the first salesforce value listing it wins
+        self.assertEqual(picklist.transform("LEGAL"), "Legal")
+        self.assertEqual(picklist.transform("OTHER"), "Other")
+        self.assertEqual(picklist.transform("UNKNOWN"), "Listing")
+
+        picklist = PicklistMap({"Yes": [True], "No": [False]})
+        self.assertEqual(picklist.transform("maybe"), "maybe")
+
+        # strings aren't lookups
+        self.assertFalse(PicklistMap({"Yes": "Y"}).usable)
+
+    def test_object_plan_fields(self):
+        plan = ObjectPlan("Name__c", self.object_config, "pds")
+
+        self.assertEqual(plan.salesforce_id_name, "Name_Key__c")
+        self.assertEqual(plan.source_id_firsts, ["names"])
+        self.assertFalse(plan.is_flat)
+
+        fields = {field.target: field for field in plan.fields}
+        # fields with no source are skipped
+        self.assertNotIn("Notes__c", fields)
+        self.assertEqual(fields['First_Name__c'].kind, "values")
+        self.assertEqual(fields['First_Name__c'].value_references[0][1], ["names", "name", "firstName"])
+        self.assertEqual(fields['First_Name__c'].value_references[0][2], "name.firstName")
+        self.assertEqual(len(fields['Last_Name__c'].value_references), 2)
+        self.assertEqual(fields['Contact__c'].kind, "ref")
+        self.assertEqual(fields['Contact__c'].ref_pieces, ["personKey"])
+        self.assertEqual(fields['Source__c'].kind, "static")
+        self.assertEqual(fields['Source__c'].static_value, "pds")
+
+        self.assertIn("Name_Type__c", plan.picklists)
+        branch_fields = {field.target: field for field in plan.branch_fields}
+        self.assertTrue(branch_fields['Contact__c'].is_ref)
+        self.assertTrue(branch_fields['Name_Type__c'].is_picklist)
+
+    def test_object_plan_requires_source_id(self):
+        self.object_config['Id'] = {"salesforce": "Name_Key__c"}
+        with self.assertRaises(Exception):
+            ObjectPlan("Name__c", self.object_config, "pds")
+
+    def test_fingerprint_changes_with_config(self):
+        fingerprint = ObjectPlan.make_fingerprint(self.object_config, "pds")
+        self.assertEqual(fingerprint, ObjectPlan("Name__c", self.object_config, "pds").fingerprint)
+
+        self.object_config['fields']['First_Name__c'] = "names.name.middleName"
+        self.assertNotEqual(fingerprint, ObjectPlan.make_fingerprint(self.object_config, "pds"))
+
+    def test_compile_when(self):
+        conditions = compile_when({"names.name.nameTypeCode": ["LISTING", "LEGAL"], "names.primary": True})
+
+        self.assertEqual(conditions[0].short_ref, "name.nameTypeCode")
+        self.assertTrue(conditions[0].is_list)
+        self.assertEqual(conditions[1].short_pieces, ["primary"])
+        self.assertTrue(conditions[1].is_single)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,201 @@
+import json
+
+
+# These are the config pieces the transformer needs for each object, parsed once instead of for every record:
+#   dotted references are split, `when`s are parsed, picklists are turned into lookups, etc.
+# The transformer (SalesforceTransformer.transform) runs the plans, this only reads the config.
+
+
+class WhenCondition():
+    # a single `ref: value(s)` of a `when`
+    def __init__(self, ref: str, value):
+        self.ref = ref
+        self.pieces = ref.split(".")
+        # the ref without the first piece, this allows for `names.name` and `name` to work
+        self.short_ref = ".".join(self.pieces[1:])
+        self.short_pieces = self.short_ref.split(".")
+        self.value = value
+        self.is_list = isinstance(value, list)
+        self.is_single = isinstance(value, (str, bool, int))
+
+
+def compile_when(when: dict) -> list:
+    return [WhenCondition(ref, value) for ref, value in when.items()]
+
+
+class PicklistMap():
+    """
+    The picklist config ({salesforce value: [source values]}) as a lookup of source value -> salesforce value
+    The first salesforce value listing a source value wins, and a source value that isn't listed
+      gets the (last) salesforce value listing "default", or stays as it is
+    """
+    def __init__(self, picklist: dict):
+        self.lookup = {}
+        self.default = None
+        self.has_default = False
+        # `in` on anything but a list (like a string) doesn't work as a lookup, those use picklist_transform
+        self.usable = all(isinstance(values, list) for values in picklist.values())
+        if not self.usable:
+            return
+
+        try:
+            for key, values in picklist.items():
+                for value in values:
+                    if value not in self.lookup:
+                        self.lookup[value] = key
+                if "default" in values:
+                    self.default = key
+                    self.has_default = True
+        except TypeError:
+            # unhashable source values
+            self.usable = False
+
+    def transform(self, value):
+        # raises a TypeError for values that can't be looked up (like dicts)
+        if value in self.lookup:
+            return self.lookup[value]
+        if self.has_default:
+            return self.default
+        return value
+
+
+class FieldPlan():
+    """
+    One target field of an object
+    kind is one of:
+      - values: value_references are looked up on the source record (or its branches)
+      - static: static_value is used for every record
+      - ref: a reference to another object by its external id
+      - unhandled: the config is not something we can use
+    """
+    def __init__(self, target: str, source_object):
+        self.target = target
+        self.source_object = source_object
+        self.kind = "values"
+        self.when = None
+        # (value_reference, pieces, branch_field, branch_field_pieces)
+        self.value_references = []
+
+        self.static_value = None
+
+        self.ref_external_id_name = None
+        self.source_value_ref = None
+        # (source_value_ref, pieces) for each of the possible source_value_refs if it's a list
+        self.ref_candidates = None
+        self.ref_pieces = None
+
+        value_references = []
+        if isinstance(source_object, list):
+            value_references = source_object
+        elif isinstance(source_object, dict):
+            if 'value' in source_object:
+                if isinstance(source_object['value'], list):
+                    value_references = source_object['value']
+                else:
+                    value_references = [source_object['value']]
+            if 'when' in source_object:
+                self.when = source_object['when']
+            if 'static' in source_object and source_object['static'] == True:
+                self.kind = "static"
+                self.static_value = source_object['value']
+            elif 'ref' in source_object:
+                self.kind = "ref"
+                self.ref_external_id_name = source_object['ref']['ref_external_id']
+                self.source_value_ref = source_object['ref']['source_value_ref']
+                if isinstance(self.source_value_ref, list):
+                    self.ref_candidates = [(ref, ref.split(".")) for ref in self.source_value_ref]
+                else:
+                    self.ref_pieces = self.source_value_ref.split(".")
+        elif isinstance(source_object, str):
+            value_references = [source_object]
+        else:
+            self.kind = "unhandled"
+
+        if self.kind == "values":
+            for value_reference in value_references:
+                pieces = value_reference.split(".")
+                branch_field = ".".join(pieces[1:])
+                self.value_references.append((value_reference, pieces, branch_field, branch_field.split(".")))
+
+        self.when_conditions = None
+        if isinstance(self.when, dict):
+            self.when_conditions = compile_when(self.when)
+
+
+class BranchFieldPlan():
+    # one target field of an object, for filling in the best branches
+    def __init__(self, target: str, source_value, sources):
+        self.target = target
+        self.is_ref = isinstance(source_value, dict) and 'ref' in source_value.keys()
+        self.is_picklist = isinstance(source_value, dict) and 'picklist' in source_value
+        self.ref_external_id_name = source_value['ref']['ref_external_id'] if self.is_ref else None
+        # (source, pieces) for each of the sources
+        #   sources is None when there's nothing to go on (a dict with no ref or picklist before any other field,
+        #   or a field with no source), that's only an error if the object is branched
+        self.sources = None
+        if sources is not None and all(isinstance(source, str) for source in sources):
+            self.sources = [(source, source.split(".")) for source in sources]
+
+
+class ObjectPlan():
+    """
+    Everything the transformer needs to know about an object's config
+    """
+    def __init__(self, object_name: str, object_config: dict, source_name: str, full_object_config: dict=None):
+        self.object_name = object_name
+        self.source_name = source_name
+        self.fingerprint = ObjectPlan.make_fingerprint(object_config, source_name, full_object_config)
+
+        # if it's flat, that means there's only one per "person"
+        #   (otherwise, it's intention is to get a branch with multiple values per "person",
+        #   like names, emails, etc etc)
+        self.is_flat = object_config.get('flat') or False
+
+        if 'source' in object_config['Id']:
+            source_id_name = object_config['Id']['source']
+        elif source_name in object_config['Id']:
+            source_id_name = object_config['Id'][source_name]
+        else:
+            raise Exception(f"Error: Source Id not found in config for {object_name}")
+        self.salesforce_id_name = object_config['Id']['salesforce']
+
+        if not isinstance(source_id_name, list):
+            source_id_names = [source_id_name]
+        else:
+            source_id_names = source_id_name
+        # the first piece of each source id is what needs to be on the record
+        self.source_id_firsts = [source_id.split(".")[0] for source_id in source_id_names]
+
+        # the fields for the first pass through the record
+        #   (fields with no source are skipped, they're there to remind us that we _can_ populate them)
+        self.fields = [FieldPlan(target, source_object) for target, source_object in object_config['fields'].items() if source_object]
+
+        # the fields for filling in the best branches
+        self.branch_fields = []
+        sources = None
+        for target, source_value in object_config['fields'].items():
+            if isinstance(source_value, dict):
+                if 'ref' in source_value.keys():
+                    sources = source_value['ref']['source_value_ref']
+                    if not isinstance(sources, list):
+                        sources = [sources]
+                elif 'picklist' in source_value.keys():
+                    sources = source_value['value']
+                # otherwise, this uses the sources of the field before it
+            elif isinstance(source_value, list):
+                sources = source_value
+            else:
+                sources = [source_value]
+            self.branch_fields.append(BranchFieldPlan(target, source_value, sources))
+
+        # picklists come from the full config
+        self.picklists = {}
+        picklist_config = full_object_config if full_object_config is not None else object_config
+        for target, source_value in picklist_config.get('fields', {}).items():
+            if isinstance(source_value, dict) and source_value.get('picklist'):
+                self.picklists[target] = PicklistMap(source_value['picklist'])
+
+    @staticmethod
+    def make_fingerprint(object_config: dict, source_name: str, full_object_config: dict=None) -> str:
+        # the plan is only good as long as the config hasn't changed
+        return json.dumps([object_config, source_name, full_object_config], sort_keys=True, default=str)
@@ -1,5 +1,7 @@
 from common import logger
+from transform_plan import ObjectPlan, compile_when
 from datetime import datetime
+import json
 import re
 
 class SalesforceTransformer:
@@ -7,6 +9,8 @@ class SalesforceTransformer:
         self.config = config
         self.hsf = hsf
         self.hashed_ids = {}
+        # the compiled config of each object (see get_plan())
+        self.plans = {}
 
     # This method helps sort out the config to get a subsection of the config for a specific source
     def getSourceConfig(self, source: str) -> dict: 
@@ -17,6 +21,25 @@ class SalesforceTransformer:
                     split_config[object_name] = self.config[object_name]
         return split_config
 
+    # returns True if any of the source's objects use the deprecated `sf.*` reference syntax
+    #   those need the Contact to be pushed before their Contact ids can be looked up
+    def uses_sf_references(self, source: str) -> bool:
+        for object_name, object_config in self.getSourceConfig(source).items():
+            if self._object_uses_sf_references(object_config):
+                return True
+        return False
+
+    def _object_uses_sf_references(self, object_config: dict) -> bool:
+        for target, source_object in object_config['fields'].items():
+            if isinstance(source_object, dict):
+                source_object = source_object.get('value')
+            if not isinstance(source_object, list):
+                source_object = [source_object]
+            for value_reference in source_object:
+                if isinstance(value_reference, str) and value_reference.startswith("sf."):
+                    return True
+        return False
+
     def getTargetConfig(self, target_object: str) -> dict:
         split_config = {}
         for object_name in self.config:
@@ -29,7 +52,7 @@ class SalesforceTransformer:
     # target_object is used to filter down to a single target object in the config (ex: Contact)
     # exlude_target_objects is a list of Objects you want to specifically ignore on this run 
     #   For example, if you ran the Contacts a minute ago (to get ids), you may not want to run them again
-    def transform(self, source_data, source_name=None, target_object=None, exclude_target_objects=[], source_config=None):
+    def transform(self, source_data, source_name=None, target_object=None, exclude_target_objects=[], source_config=None, hashed_ids=None):
         """
         This method will take a variety of inputs and transform them into a format that can be used to update Salesforce
         Required:
@@ -44,6 +67,9 @@ class SalesforceTransformer:
             source_config: the config to use for the transformation, if not provided, 
                 it will use the config provided in the constructor
                 trimmed based on the above optional params
+            hashed_ids: the ids from HarvardSalesforce.getUniqueIds() to use for this transformation,
+                if not provided, it will use self.hashed_ids
+                (passing these in lets batches be transformed at the same time in different threads)
         """
         logger.debug(f"Starting transfom")
 
@@ -57,22 +83,30 @@ class SalesforceTransformer:
             else:
                 source_config = self.config
         
+        if hashed_ids is None:
+            hashed_ids = self.hashed_ids
+
         data = {}
         best_branches = {}
         count = 1
 
+        # the plans for each object (the config, already parsed), these are built when an object is first needed
+        plans = {}
+        # the source id name for the branches of each object, by the first piece of the value reference
+        branch_id_names = {}
+
         for source_data_object in source_data:
             # source_data_object is the full data source object of a single record
 
 
             count += 1
             salesforce_person = {}
-            if 'Contact' in self.hashed_ids:
-                if self.hashed_ids['Contact']['id_name'] in source_data_object and 'Ids' in self.hashed_ids['Contact']:
-                    if source_data_object[self.hashed_ids['Contact']['id_name']] in self.hashed_ids['Contact']['Ids']:
+            if 'Contact' in hashed_ids:
+                if hashed_ids['Contact']['id_name'] in source_data_object and 'Ids' in hashed_ids['Contact']:
+                    if source_data_object[hashed_ids['Contact']['id_name']] in hashed_ids['Contact']['Ids']:
                         salesforce_person = {
                             "contact": {
-                                "id": self.hashed_ids['Contact']['Ids'][source_data_object[self.hashed_ids['Contact']['id_name']]]
+                                "id": hashed_ids['Contact']['Ids'][source_data_object[hashed_ids['Contact']['id_name']]]
                             }
                         }
 
@@ -89,130 +123,88 @@ class SalesforceTransformer:
                 if source_name is None:
                     source_name = source_config[object_name]['source']
 
-                # if it's flat, that means there's only one per "person"
-                #   (otherwise, it's intention is to get a branch with multiple values per "person",
-                #   like names, emails, etc etc)
-                is_flat = source_config[object_name].get('flat') or False    
-                
-                object_config = source_config[object_name]['fields']
-                if 'source' in source_config[object_name]['Id']:
-                    source_id_name = source_config[object_name]['Id']['source']
-                elif source_name in source_config[object_name]['Id']:
-                    source_id_name = source_config[object_name]['Id'][source_name]
-                else:
-                    raise Exception(f"Error: Source Id not found in config for {object_name}")
-                salesforce_id_name = source_config[object_name]['Id']['salesforce']
+                if object_name not in plans:
+                    plans[object_name] = self.get_plan(object_name, source_config[object_name], source_name)
+                plan = plans[object_name]
 
-                is_branched = False
+                is_flat = plan.is_flat
+                salesforce_id_name = plan.salesforce_id_name
 
-                if not isinstance(source_id_name, list):
-                    source_id_names = [source_id_name]
-                else:
-                    source_id_names = source_id_name
+                is_branched = False
 
                 is_external_id_on_source = False
-                for sin in source_id_names:
-                    sin = sin.split(".")[0]
-                    if sin in source_data_object and sin is not None:
+                for sin in plan.source_id_firsts:
+                    if sin in source_data_object:
                         is_external_id_on_source = True
+                        break
 
                 if not is_external_id_on_source:
                     continue
 
-                # logger.debug(f"object: {object_name}")
-
                 # go through all of the target fields we'll be mapping to
                 # target is the field name of the data item in Salesforce
-                for target in object_config:
-                    value_reference = ""
-
-                    # if the source field is not defined, just skip this field
-                    # we might have an empty field to remind us that we _can_ populate it
-                    if not object_config[target]:
-                        continue
-
-                    # logger.debug(f"  target: {target}")
-                    source_object = object_config[target]
+                for field in plan.fields:
+                    target = field.target
 
                     # value that we're sending to SF
                     value = ""
 
+                    if field.kind == "static":
+                        # if it's a static value, just record the value in the current record and move on
+                        # it's going to be the same value all the way through 
+                        if object_name not in current_record:
+                            current_record[object_name] = {}
+                        current_record[object_name][target] = self.hsf.validate(object=object_name, field=target, value=field.static_value, identifier=source_data_object)
+                        continue
 
-                    when = None
-                    # logger.debug(f"  source_object: {source_object}")
-
-                    value_references = []
-
-                    if isinstance(source_object, list): 
-                        value_references = source_object
-                    else: 
-                        if isinstance(source_object, (dict)):
-                            if 'value' in source_object:
-                                if isinstance(source_object['value'], list):
-                                    value_references = source_object['value']
-                                else:
-                                    value_references = [source_object['value']]
-                            if 'when' in source_object:
-                                when = source_object['when']
-                            if 'static' in source_object:
-                                # if it's a static value, just record the value in the current record and move on
-                                # it's going to be the same value all the way through 
-                                if source_object['static'] == True:
-                                    value = source_object['value']
-                                    if object_name not in current_record:
-                                        current_record[object_name] = {}
-                                    current_record[object_name][target] = self.hsf.validate(object=object_name, field=target, value=value, identifier=source_data_object)
-                                    continue
-                            if 'ref' in source_object:
-                                # process salesforce internal reference
-                                ref_object = source_object['ref']['object']
-                                ref_external_id_name = source_object['ref']['ref_external_id']
-                                source_value_ref = source_object['ref']['source_value_ref']
-                                if isinstance(source_value_ref, list):
-                                    for possible_source_value_ref in source_value_ref:
-                                        if is_flat:
-                                            starts_with = 0
-                                        else:
-                                            starts_with = 1
-                                        if self.key_in_nested_dict(possible_source_value_ref, source_data_object, start_with=starts_with):
-                                            source_value_ref = possible_source_value_ref
-                                            break
-                                if '.' in source_value_ref and is_flat:
-                                    source_value = self.ref_to_object_value(source_value_ref, source_data_object)
-                                elif isinstance(source_value_ref, str) and source_value_ref in source_data_object:
-                                    source_value = self.ref_to_object_value(source_value_ref, source_data_object)
-                                else: 
-                                    source_value = None
-                                if source_value is None:
-                                    continue
-                                if object_name not in current_record:
-                                    current_record[object_name] = {}
-                                current_record[object_name][target] = {}
-                                current_record[object_name][target][ref_external_id_name] = source_value
-                                
-                                continue
-                        elif isinstance(source_object, (str)):
-                            value_references = [source_object]
-                        else:
-                            logger.warning(f"Unhandled source_object data type: {type(source_object)} ({source_object})")
+                    if field.kind == "ref":
+                        # process salesforce internal reference
+                        source_value_ref = field.source_value_ref
+                        ref_pieces = field.ref_pieces
+                        if field.ref_candidates is not None:
+                            if is_flat:
+                                starts_with = 0
+                            else:
+                                starts_with = 1
+                            for possible_source_value_ref, possible_pieces in field.ref_candidates:
+                                if self._elements_in_nested_dict(possible_pieces, source_data_object, start_with=starts_with):
+                                    source_value_ref = possible_source_value_ref
+                                    ref_pieces = possible_pieces
+                                    break
+                        if ref_pieces is None:
+                            # none of the possible refs matched
+                            source_value = None
+                        elif '.' in source_value_ref and is_flat:
+                            source_value = self._elements_to_object_value(ref_pieces, source_data_object)
+                        elif source_value_ref in source_data_object:
+                            source_value = self._elements_to_object_value(ref_pieces, source_data_object)
+                        else: 
+                            source_value = None
+                        if source_value is None:
+                            continue
+                        if object_name not in current_record:
+                            current_record[object_name] = {}
+                        current_record[object_name][target] = {}
+                        current_record[object_name][target][field.ref_external_id_name] = source_value
+                        continue
 
-                    for value_reference in value_references:
+                    if field.kind == "unhandled":
+                        logger.warning(f"Unhandled source_object data type: {type(field.source_object)} ({field.source_object})")
+                        continue
 
+                    for value_reference, pieces, branch_field, branch_field_pieces in field.value_references:
 
-                        pieces = value_reference.split(".")
                         first = pieces[0]
+                        source_value = source_data_object[first]
 
-                        # logger.debug(f"    value_reference: {value_reference}:{source_data_object.get(value_reference)}")                     
-                        # logger.debug(f"    when: {when}")
-                                                
                         # check the value referenced in the config
-                        if isinstance(source_data_object[first], (str, bool, int)):
-                            value = source_data_object[first]
-                        elif isinstance(source_data_object[first], dict) and len(pieces) < 2:
-                            value = source_data_object[first]
-                        elif isinstance(source_data_object[first], dict):
+                        if isinstance(source_value, (str, bool, int)):
+                            value = source_value
+                        elif isinstance(source_value, dict) and len(pieces) < 2:
+                            value = source_value
+                        elif isinstance(source_value, dict):
                             # if it's a dict, we need to get the piece further in
-                            if pieces[1] not in source_data_object[first]:
+                            if pieces[1] not in source_value:
                                 if first == 'sf':
                                     # NOTE: this should be deprecated in favor of relying on external ids
                                     source_pieces = pieces[1:]
@@ -225,17 +217,13 @@ class SalesforceTransformer:
                                             current_record[object_name] = {}
                                         current_record[object_name][target] = self.hsf.validate(object=object_name, field=target, value=value, identifier=source_data_object)
                                     else:
-                                        # logger.warn(f"Warning: reference not found in Salesforce object ({first})")
                                         skip_object = True
-                                else:
-                                    pass
-                                    # logger.warn(f"Warning: reference ({pieces[1]}) not found in object ({source_data_object[first]})")
                                 # if it's not in this person, just skip it
                                 continue
-                            if isinstance(source_data_object[first][pieces[1]], dict):
-                                value = source_data_object[first][pieces[1]][pieces[2]]
+                            if isinstance(source_value[pieces[1]], dict):
+                                value = source_value[pieces[1]][pieces[2]]
                             else:
-                                value = source_data_object[first][pieces[1]]
+                                value = source_value[pieces[1]]
 
                             # we are making an assumption here that if it's a sf value, it's required, 
                             #   (otherwise it'll end up orphaned)
@@ -243,11 +231,9 @@ class SalesforceTransformer:
                                 # NOTE: this should be deprecated in favor of relying on external ids
                                 raise Exception(f"Error: this value should not be null")
                             
-                        elif isinstance(source_data_object[first], list):
+                        elif isinstance(source_value, list):
                             is_branched = True
-                            branches = source_data_object[first]
-                            # ignore the first piece of the dotted element
-                            branch_field = ".".join(pieces[1:])
+                            branches = source_value
 
                             # initialize the best branch as None
                             best_branch = None
@@ -257,8 +243,8 @@ class SalesforceTransformer:
 
                                 is_best = True
                                 # if there is a when clause, figure out if this branch matches
-                                if isinstance(when, dict):
-                                    is_best = self.handle_when(when, branch, best_branch)
+                                if field.when_conditions is not None:
+                                    is_best = self._check_when(field.when_conditions, branch, best_branch)
 
                                 # if this branch passed the when tests
                                 if is_best:
@@ -271,20 +257,10 @@ class SalesforceTransformer:
                                         best_branch = branch
 
                                 if not is_flat:
-                                    source_id_name = self.hashed_ids[object_name]['id_name']
-                                    if isinstance(source_id_name, list):
-                                        for current_id_name in self.hashed_ids[object_name]['id_name']:
-                                            # NOTE: I really don't like this, 
-                                            #       but I can't think of a cleaner way to do it right now
-                                            if re.search(rf"^{first}", current_id_name, re.IGNORECASE):
-                                                source_id_name = current_id_name
-                                                break
-                                        # if it's still a list, that means we didn't get a match :(
-                                        if isinstance(source_id_name, list):
-                                            raise Exception(f"Error: branch {branch_name} not found in source id {source_id_name}")
-
-                                    if "." in source_id_name:
-                                        (branch_name, source_id_name) = source_id_name.split(".")
+                                    if (object_name, first) not in branch_id_names:
+                                        branch_id_names[(object_name, first)] = self._branch_id_name(hashed_ids[object_name]['id_name'], first)
+                                    source_id_name = branch_id_names[(object_name, first)]
+
                                     pds_branch_id = str(best_branch[source_id_name])
                                     if pds_branch_id not in best_branches.keys():
                                         best_branches[pds_branch_id] = {}
@@ -294,30 +270,22 @@ class SalesforceTransformer:
 
                                     best_branches[pds_branch_id] = best_branch
 
-                                
-
                             if best_branch:
                                 if is_flat:
-                                    branch_field_pieces = branch_field.split(".")
                                     if len(branch_field_pieces) == 1:
                                         value = best_branch[branch_field]
                                     elif len(branch_field_pieces) == 2:
                                         value = best_branch[branch_field_pieces[0]][branch_field_pieces[1]]
 
-                                    
                             else:
                                 value = None
                         
 
                         if object_name not in current_record:
                             current_record[object_name] = {}
-                        
-                        # if 'picklist' in source_object:
-                        #     value = self.picklist_transform(object_name, target, value)
 
                         if not is_branched:
                             current_record[object_name][target] = self.hsf.validate(object=object_name, field=target, value=value, identifier=source_data_object)
-                        # elif best_branch and is_flat: 
                         elif best_branch: 
                             current_record[object_name][target] = self.hsf.validate(object=object_name, field=target, value=value, identifier=source_data_object)
 
@@ -332,37 +300,21 @@ class SalesforceTransformer:
                     branch_name = branch['branch_name']
                     
                     # if this id is in the hashed_ids, that means it'll be an update and we need to add the Object Id
-                    if 'Ids' in self.hashed_ids[object_name]:
-                        if pds_branch_id in self.hashed_ids[object_name]['Ids']:
-                            sf_id = self.hashed_ids[object_name]['Ids'][pds_branch_id]
+                    if 'Ids' in hashed_ids[object_name]:
+                        if pds_branch_id in hashed_ids[object_name]['Ids']:
+                            sf_id = hashed_ids[object_name]['Ids'][pds_branch_id]
                             current_record[object_name]['Id'] = sf_id
-                        else: 
-                            pass
-                        
                     
-                    for target, source_value in source_config[object_name]['fields'].items():
-                        
-                        if isinstance(source_value, dict):
-                            if 'ref' in source_value.keys():
-                                sources = source_value['ref']['source_value_ref']
-                                if not isinstance(sources, list):
-                                    sources = [sources]
-                            elif 'picklist' in source_value.keys():
-                                sources = source_value['value']
-                        elif isinstance(source_value, list):
-                            sources = source_value
-                        else: 
-                            sources = [source_value]
-                        # source = source_value
+                    for branch_field in plan.branch_fields:
+                        target = branch_field.target
+                        if branch_field.sources is None:
+                            raise Exception(f"Error: no source found for {object_name}.{target}")
 
-                        for source in sources:
-                            # for source in sources:
-                            # logger.debug(f"source: {source}")
+                        for source, source_pieces in branch_field.sources:
                             value = None
-                            source_pieces = source.split(".")
 
                             # this might be needed for affiliations
-                            if (source_pieces[0] not in [branch_name, 'sf']) and len(sources) > 1:
+                            if (source_pieces[0] not in [branch_name, 'sf']) and len(branch_field.sources) > 1:
                                 continue
                             
                             branch_temp = branch
@@ -396,22 +348,21 @@ class SalesforceTransformer:
                                     current_record[object_name][target] = None
                                     continue
                                 
-                                if isinstance(source_value, dict) and 'ref' in source_value.keys():
+                                if branch_field.is_ref:
                                     if value is None:
                                         continue
                                     value_obj = {}
-                                    value_obj[source_value['ref']['ref_external_id']] = value
+                                    value_obj[branch_field.ref_external_id_name] = value
                                     
                                     current_record[object_name][target] = value_obj
 
                                 else:
-                                    if isinstance(source_value, dict) and 'picklist' in source_value:
-                                        value = self.picklist_transform(object_name, target, value)
+                                    if branch_field.is_picklist:
+                                        value = self._picklist_value(plan, object_name, target, value)
                                     current_record[object_name][target] = self.hsf.validate(object=object_name, field=target, value=value, identifier=source_data_object)
                                 # break out of the sources, we already found the one for this target
                                 break
 
-                        # logger.warn(f"Warning: unable to find valid source: ({source})")
                     good_records.append(current_record[object_name])
                     
 
@@ -421,19 +372,13 @@ class SalesforceTransformer:
 
                 if not skip_object:
                     if is_flat:
-                        # current_record = self.setId(source_data_object=source_data_object, object_name=object_name, current_record=current_record)
-                        # data[object_name].append(current_record[object_name])
                         if current_record and salesforce_id_name in current_record[object_name]:
                             yield { object_name: current_record[object_name] }
                     elif not is_branched:
-                        # current_record = self.setId(source_data_object=source_data_object, object_name=object_name, current_record=current_record)
-                        # data[object_name].append(current_record[object_name])
                         if current_record and salesforce_id_name in current_record[object_name]:
                             if current_record[object_name][salesforce_id_name] is not None:
                                 yield { object_name: current_record[object_name] }
                     else:
-                        # data[object_name] = good_records
-                        
                         for good_record in good_records:
                             if salesforce_id_name in good_record:
                                 if good_record[salesforce_id_name] is not None:
@@ -444,6 +389,210 @@ class SalesforceTransformer:
 
         # return data
     
+    # the objects in the config that transform_columns() can do:
+    #   flat objects that don't use the deprecated `sf.*` references (those need the Contact ids for each person)
+    def columnar_objects(self, source_config: dict) -> list:
+        object_names = []
+        for object_name, object_config in source_config.items():
+            if not object_config.get('flat'):
+                continue
+            if self._object_uses_sf_references(object_config):
+                continue
+            object_names.append(object_name)
+        return object_names
+
+    def transform_columns(self, source_data: list, object_name: str, source_config: dict=None, source_name: str=None) -> list:
+        """
+        Transforms a flat object for a whole batch at once, instead of a record at a time
+        Returns the object's records, the same ones (in the same order) transform() would yield for it
+
+        The source value of each field is pulled for everyone first (a column for each field), then each column is
+          validated at once (HarvardSalesforce.validate_column) and the records are put together at the end
+        Like in transform(), a branched field with no best branch means the non-branched fields after it are left off
+          that person's record, and the value of a field with more than one value reference is the last one found
+        Only for the objects from columnar_objects()
+        """
+        if source_config is None:
+            source_config = self.getTargetConfig(object_name)
+        object_config = source_config[object_name]
+        if source_name is None:
+            source_name = object_config['source']
+        plan = self.get_plan(object_name, object_config, source_name)
+        if not plan.is_flat:
+            raise Exception(f"Error: {object_name} is not flat, it can't be transformed by columns")
+
+        # the people that have this object (the first piece of the source id is on them)
+        people = []
+        for source_data_object in source_data:
+            for sin in plan.source_id_firsts:
+                if sin in source_data_object:
+                    people.append(source_data_object)
+                    break
+
+        fields = [field for field in plan.fields if field.kind != "unhandled"]
+        for field in plan.fields:
+            if field.kind == "unhandled":
+                for source_data_object in people:
+                    logger.warning(f"Unhandled source_object data type: {type(field.source_object)} ({field.source_object})")
+        # the `when` of each field as something to tell them apart by (fields with the same branch and `when` have the same best branch)
+        when_keys = [json.dumps(field.when, default=str) if field.when_conditions is not None else None for field in fields]
+
+        # the value of each field for each person (_unset if there isn't one)
+        columns = [[_unset] * len(people) for field in fields]
+        for i, source_data_object in enumerate(people):
+            # a DotMap's own lookups are a lot slower than its items', a missing key still goes through the DotMap
+            #   (so it gets the same empty DotMap it would've in transform())
+            items = getattr(source_data_object, '_map', source_data_object)
+            # the state transform() keeps for each person from one field to the next
+            is_branched = False
+            has_best_branch = False
+            best_branches = {}
+
+            for j, field in enumerate(fields):
+                if field.kind == "static":
+                    columns[j][i] = field.static_value
+                    continue
+
+                if field.kind == "ref":
+                    source_value = self._flat_ref_value(field, source_data_object)
+                    if source_value is not None:
+                        columns[j][i] = {field.ref_external_id_name: source_value}
+                    continue
+
+                value = ""
+                set_value = _unset
+                for value_reference, pieces, branch_field, branch_field_pieces in field.value_references:
+                    first = pieces[0]
+                    source_value = items[first] if first in items else source_data_object[first]
+
+                    if isinstance(source_value, (str, bool, int)):
+                        value = source_value
+                    elif isinstance(source_value, dict) and len(pieces) < 2:
+                        value = source_value
+                    elif isinstance(source_value, dict):
+                        source_items = getattr(source_value, '_map', source_value)
+                        if pieces[1] not in source_items:
+                            continue
+                        piece_value = source_items[pieces[1]]
+                        if isinstance(piece_value, dict):
+                            value = piece_value[pieces[2]]
+                        else:
+                            value = piece_value
+                    elif isinstance(source_value, list):
+                        is_branched = True
+                        best_key = (first, when_keys[j])
+                        if best_key in best_branches:
+                            best_branch = best_branches[best_key]
+                        else:
+                            best_branch = self._best_flat_branch(source_value, field.when_conditions)
+                            best_branches[best_key] = best_branch
+                        has_best_branch = bool(best_branch)
+                        if has_best_branch:
+                            branch_items = getattr(best_branch, '_map', best_branch)
+                            if len(branch_field_pieces) == 1:
+                                value = branch_items[branch_field] if branch_field in branch_items else best_branch[branch_field]
+                            elif len(branch_field_pieces) == 2:
+                                value = best_branch[branch_field_pieces[0]][branch_field_pieces[1]]
+                        else:
+                            value = None
+
+                    if not is_branched or has_best_branch:
+                        if set_value is not _unset:
+                            # only the last value is kept, but each one is validated like in transform()
+                            self.hsf.validate(object=object_name, field=field.target, value=set_value, identifier=source_data_object)
+                        set_value = value
+
+                columns[j][i] = set_value
+
+        for j, field in enumerate(fields):
+            if field.kind == "ref":
+                continue
+            column = columns[j]
+            indexes = [i for i, value in enumerate(column) if value is not _unset]
+            validated = self.hsf.validate_column(object_name, field.target, [column[i] for i in indexes], identifiers=[people[i] for i in indexes])
+            for i, value in zip(indexes, validated):
+                column[i] = value
+
+        targets = [field.target for field in fields]
+        salesforce_id_name = plan.salesforce_id_name
+        records = []
+        for values in zip(*columns):
+            record = {target: value for target, value in zip(targets, values) if value is not _unset}
+            if salesforce_id_name in record:
+                records.append(record)
+        return records
+
+    def _best_flat_branch(self, branches: list, when_conditions: list):
+        # the branch that passes the `when` (the latest one if more than one does), like in transform() for flat objects
+        best_branch = None
+        for branch in branches:
+            is_best = True
+            if when_conditions is not None:
+                is_best = self._check_when(when_conditions, branch, best_branch)
+            if is_best:
+                if best_branch:
+                    if branch['updateDate'] > best_branch['updateDate']:
+                        best_branch = branch
+                else:
+                    best_branch = branch
+        return best_branch
+
+    def _flat_ref_value(self, field, source_data_object):
+        # the value of a ref field on a flat object (see the "ref" fields in transform())
+        source_value_ref = field.source_value_ref
+        ref_pieces = field.ref_pieces
+        if field.ref_candidates is not None:
+            for possible_source_value_ref, possible_pieces in field.ref_candidates:
+                if self._elements_in_nested_dict(possible_pieces, source_data_object, start_with=0):
+                    source_value_ref = possible_source_value_ref
+                    ref_pieces = possible_pieces
+                    break
+        if ref_pieces is None:
+            return None
+        if '.' in source_value_ref or source_value_ref in source_data_object:
+            return self._elements_to_object_value(ref_pieces, source_data_object)
+        return None
+
+    def get_plan(self, object_name: str, object_config: dict, source_name: str) -> ObjectPlan:
+        """
+        Returns the compiled plan for an object's config
+        The plans are kept between transforms and only rebuilt if the config changes
+        """
+        full_object_config = self.config.get(object_name) if isinstance(self.config, dict) else None
+        fingerprint = ObjectPlan.make_fingerprint(object_config, source_name, full_object_config)
+        plan = self.plans.get((object_name, source_name))
+        if plan is None or plan.fingerprint != fingerprint:
+            plan = ObjectPlan(object_name, object_config, source_name, full_object_config=full_object_config)
+            self.plans[(object_name, source_name)] = plan
+        return plan
+
+    def _branch_id_name(self, source_id_name, first: str) -> str:
+        # the name of the id on the branch (ex: personNameKey for names.personNameKey)
+        if isinstance(source_id_name, list):
+            for current_id_name in source_id_name:
+                # NOTE: I really don't like this, 
+                #       but I can't think of a cleaner way to do it right now
+                if re.search(rf"^{first}", current_id_name, re.IGNORECASE):
+                    source_id_name = current_id_name
+                    break
+            # if it's still a list, that means we didn't get a match :(
+            if isinstance(source_id_name, list):
+                raise Exception(f"Error: branch {first} not found in source id {source_id_name}")
+
+        if "." in source_id_name:
+            (branch_name, source_id_name) = source_id_name.split(".")
+        return source_id_name
+
+    def _picklist_value(self, plan: ObjectPlan, object_name: str, target: str, value):
+        picklist = plan.picklists.get(target)
+        if picklist is not None and picklist.usable:
+            try:
+                return picklist.transform(value)
+            except TypeError:
+                # unhashable values can't be looked up
+                pass
+        return self.picklist_transform(object_name, target, value)
+
     # this method will set the id of the current record given the source_data_object record, the object name and the config
     # NOTE: a record should be a single salesforce object name with objects that are not necessarily affiliated 
     #   with the same source_data_object
@@ -514,25 +663,31 @@ class SalesforceTransformer:
     #     return 
         
     def handle_when(self, when, branch, best_branch):
+        return self._check_when(compile_when(when), branch, best_branch)
+
+    def _check_when(self, conditions: list, branch, best_branch):
         is_best = True
-        for ref, val in when.items():
+        for condition in conditions:
 
-            if ref.split(".")[0] not in branch:
-                ref = ".".join(ref.split(".")[1:])
             # if this pds reference is not in the branch, try it without the first element,
             #   this allows for `names.name` and `name` to work
             # if it's still not there, that's a problem, maybe I should just ignore this?
-            if ref.split(".")[0] not in branch:
+            if condition.pieces[0] in branch:
+                ref = condition.ref
+                ref_pieces = condition.pieces
+            else:
+                ref = condition.short_ref
+                ref_pieces = condition.short_pieces
+            if ref_pieces[0] not in branch:
                 raise Exception(f"Error: invalid reference in when: trying to find {ref} in {branch}")
 
+            val = condition.value
             # if the when value is a list, we want to get the "best", this is annoying
-            if isinstance(val, list):
+            if condition.is_list:
                 is_best = False
                 for v in val:
                     # if the best branch already has this value, don't bother with the loop
                     #   this means the current branch isn't better
-                    ref_pieces = ref.split(".")
-
                     if len(ref_pieces) == 1:
                         if best_branch:
                             if best_branch[ref] == v and branch[ref] != v:
@@ -552,9 +707,7 @@ class SalesforceTransformer:
                     else: 
                         raise Exception(f"Error: Reference not recognized: {ref}")
 
-            elif isinstance(val, (str, bool, int)):
-
-                ref_pieces = ref.split(".")
+            elif condition.is_single:
 
                 if len(ref_pieces) == 1:
                     if branch[ref] != val:
@@ -584,7 +737,9 @@ class SalesforceTransformer:
             return value
         
     def key_in_nested_dict(self, value, dict_to_check, start_with=1):
-        elements = value.split(".")
+        return self._elements_in_nested_dict(value.split("."), dict_to_check, start_with=start_with)
+
+    def _elements_in_nested_dict(self, elements: list, dict_to_check, start_with=1):
         element_length = len(elements)
         obj = dict_to_check
         for i in range(start_with, element_length):
@@ -597,7 +752,9 @@ class SalesforceTransformer:
         return False
     
     def ref_to_object_value(self, ref, obj):
-        elements = ref.split(".")
+        return self._elements_to_object_value(ref.split("."), obj)
+
+    def _elements_to_object_value(self, elements: list, obj):
         o = obj
         for element in elements:
             if isinstance(o[element], list):
@@ -605,4 +762,9 @@ class SalesforceTransformer:
             else:
                 o = o[element]
         
-        return o
\ No newline at end of file
+        return o
+
+
+
+# a value that isn't there (None is a value)
+_unset = object()